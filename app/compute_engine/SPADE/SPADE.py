@@ -1,23 +1,35 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import os
+import sys
 import copy 
 import time
 import argparse
 import shutil
 import subprocess
-
-from Bio.Seq import Seq
-from Bio import SeqIO
-from Bio.SeqRecord import SeqRecord
-from Bio.SeqFeature import SeqFeature, FeatureLocation, CompoundLocation
+import tempfile
 
 INFO = "INFO:"
 
-OUT_PATH = None
-
 __version__ = "1.0.0"
 
+SPADE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# the LOCUS parameters after the record in the order of the
+# LOCUS constructor. The names and the defaults are those of
+# the command line options
+DEFAULT_PARAMETERS = [("t", "auto"),
+                      ("Nk", 10), ("Nw", 1000), ("Ng", 200), ("Ns", 20), ("Np", 0.5),
+                      ("Nu", 0.8), ("Nm", 1000), ("Nr", 5), ("Nq", 0.5),
+                      ("Pk", 3), ("Pw", 300), ("Pg", 50), ("Ps", 6), ("Pp", 0.3),
+                      ("Pu", 0.8), ("Pm", 300), ("Pr", 5), ("Pq", 0.5),
+                      ("v", "Y"), ("delete", False),
+                      ("mafft", "--auto"),
+                      ("blastn", '-strand plus -task blastn-short -penalty -2 -outfmt "6 qseqid qseq sseqid '
+                                 'sseq pident qlen length mismatch gapopen qstart qend sstart send gaps evalue bitscore"'),
+                      ("blastp", '-task blastp-short -outfmt "6 qseqid qseq sseqid sseq pident qlen length '
+                                 'mismatch gapopen qstart qend sstart send gaps evalue bitscore"')]
+
 
 def savetxt(file_name, data, delimiter="\t", fmt=":.0f", header=""):
 
@@ -35,9 +47,115 @@ def savetxt(file_name, data, delimiter="\t", fmt=":.0f", header=""):
                 o.write(line.format(*datum) + "\n") 
 
 
+def load_dependencies(visualisation=True):
+    """
+    Import the modules used by LOCUS and HRA in the module
+    namespace. They are imported on demand so that SPADE
+    can be imported as a library
+    """
+
+    global np, mp, signal, vs
+    global Seq, SeqIO, SeqRecord, SeqFeature, FeatureLocation, CompoundLocation
+
+    if SPADE_DIR not in sys.path:
+        sys.path.append(SPADE_DIR)
+
+    # the equivalent of from kmer_count import * and from weblogo import *.
+    # weblogo exports its own Seq and np so the imports below come after
+    import kmer_count as kmer_count_module
+    import weblogo
+    for module in [kmer_count_module, weblogo]:
+        names = getattr(module, "__all__", None)
+        if names is None:
+            names = [name for name in vars(module) if not name.startswith("_")]
+        globals().update((name, getattr(module, name)) for name in names)
+
+    import numpy as np
+    import multiprocessing as mp
+    from scipy import signal
+    from Bio.Seq import Seq
+    from Bio import SeqIO
+    from Bio.SeqRecord import SeqRecord
+    from Bio.SeqFeature import SeqFeature, FeatureLocation, CompoundLocation
+    # from Bio import Alphabet
+
+    if visualisation:
+        import visualisation as vs
+
+
+def collect_repeats(out_dir):
+    """
+    Returns the HRA directories, i.e. nucl_*, in out_dir sorted by
+    name. Every repeat is a dict with the name of the directory and
+    the lines of its weblogo.txt, unit_seq.fasta and
+    align.unit_seq.fasta files or None if a file does not exist
+    """
+
+    repeats = []
+    for name in sorted(os.listdir(out_dir)):
+        path = os.path.join(out_dir, name)
+        if not name.startswith("nucl_") or not os.path.isdir(path):
+            continue
+
+        repeat = {"name": name}
+        for key, file_name in [("weblogo", "weblogo.txt"),
+                               ("unit_seq", "unit_seq.fasta"),
+                               ("align_unit_seq", "align.unit_seq.fasta")]:
+            repeat[key] = None
+            if os.path.isfile(os.path.join(path, file_name)):
+                with open(os.path.join(path, file_name)) as f:
+                    repeat[key] = f.readlines()
+        repeats.append(repeat)
+    return repeats
+
+
+def run_sequence(seq, name, out_dir=None, parameters=None):
+    """
+    Run SPADE on the sequence seq in the current process and
+    return its repeats as given by collect_repeats.
+    The files SPADE creates are kept in out_dir. If out_dir is
+    None they are written in a temporary directory that is
+    removed on return.
+
+    :param seq: the nucleotide sequence
+    :param name: the id of the sequence record
+    :param out_dir: the output directory
+    :param parameters: dict of values overriding DEFAULT_PARAMETERS.
+    The figures are made only if v is Y in parameters
+    """
+
+    values = dict(DEFAULT_PARAMETERS, v="N")
+    if parameters is not None:
+        values.update(parameters)
+
+    load_dependencies(visualisation=values["v"] == "Y")
+
+    tmp_dir = None
+    if out_dir is None:
+        tmp_dir = out_dir = tempfile.mkdtemp(prefix="spade_")
+
+    out_path = os.path.join(os.path.abspath(out_dir), "")
+
+    try:
+        record = SeqRecord(Seq(seq), id=name, description=name,
+                           annotations={"molecule_type": "DNA"})
+        if os.path.exists(out_path + record.id) == False:
+            os.mkdir(out_path + record.id)
+
+        locus = LOCUS(str(record.seq), record,
+                      *([values[key] for key, _ in DEFAULT_PARAMETERS] + ["fasta"]),
+                      out_path=out_path)
+        locus.all()
+        return collect_repeats(out_dir=out_path)
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
 class SPADE(object):
 
-    def __init__(self): 
+    def __init__(self, out_path): 
+        self.out_path = os.path.join(os.path.abspath(out_path), "")
         self.ps = []
         self.num_threads = 1
         self.f_parse = None
@@ -91,15 +209,13 @@ class SPADE(object):
         
             #Single process mode
             if num_threads < 2:
-                global OUT_PATH
-                if os.path.exists(OUT_PATH + record.id) == False:
-                    os.mkdir(OUT_PATH + record.id)
+                if os.path.exists(self.out_path + record.id) == False:
+                    os.mkdir(self.out_path + record.id)
                 else:
                     pass 
-                os.chdir(OUT_PATH + record.id)
-                locus = LOCUS(str(record.seq), record, *(parameters+[self.format_type]))
+                locus = LOCUS(str(record.seq), record, *(parameters+[self.format_type]),
+                              out_path=self.out_path)
                 locus.all()
-                os.chdir("../")
 
             #Multiprocess mode 
             else:
@@ -130,16 +246,13 @@ class SPADE(object):
 
     def thread_run(self, record, parameters):
         #Single process for multiprocess mode.
-        global OUT_PATH
-        if os.path.exists(OUT_PATH + record.id) == False:
-            os.mkdir(OUT_PATH + record.id)
+        if os.path.exists(self.out_path + record.id) == False:
+            os.mkdir(self.out_path + record.id)
         else:
             pass 
-        os.chdir(OUT_PATH + record.id)
         parameters.append(self.format_type)
-        locus = LOCUS(str(record.seq), record,*parameters)
+        locus = LOCUS(str(record.seq), record, *parameters, out_path=self.out_path)
         locus.all()
-        os.chdir("../")
 
 
 class LOCUS(object):
@@ -148,8 +261,11 @@ class LOCUS(object):
                  tk, tp, tb, tm, tr, tq, pk_size, pw_size,
                  pg_size, ptk, ptp, ptb, ptm, ptr, ptq,
                  visualisation, delete, option_mafft,
-                 option_blastn, option_blastp, format_type):
+                 option_blastn, option_blastp, format_type, out_path=""):
 
+        # the output directory ends with the path separator
+        # and the files of the record are in out_path + record.id
+        self.out_path      = out_path
         self.HRA_list      = []
         self.Id            = record.id 
         self.seq           = seq
@@ -207,7 +323,8 @@ class LOCUS(object):
                                                            thresh=self.tk, gap=self.g_size, buf=self.tm,
                                                            seqtype=self.seqtype)
 
-        savetxt(self.Id + "_kmer_count.txt", self.score_array, delimiter="\t", fmt=":.0f") 
+        savetxt(self.out_path + self.Id + "/" + self.Id + "_kmer_count.txt", self.score_array,
+                delimiter="\t", fmt=":.0f") 
 
     def find_protein_HRA(self):
 
@@ -218,7 +335,7 @@ class LOCUS(object):
 
                 hra = HRA(i, "prot", self.pk_size, self.pw_size, self.pg_size, self.ptk, self.ptp, self.ptb, self.ptm,
                           self.ptq, self.ptr, self.option_mafft, self.option_blastn,
-                          self.option_blastp)
+                          self.option_blastp, out_path=self.out_path)
 
                 region_score_array, phra_range_list = kmer_count(feat.qualifiers["translation"][0], self.pk_size,
                                                                  self.pw_size, thresh=self.ptk, gap=self.pg_size,
@@ -230,7 +347,8 @@ class LOCUS(object):
                     for j in range(len(phra_range_list)):
                         hra = HRA(i+j, "prot", self.pk_size, self.pw_size, self.pg_size,
                                   self.ptk, self.ptp, self.ptb, self.ptm, self.ptq, self.ptr, self.option_mafft,
-                                  self.option_blastn, self.option_blastp)
+                                  self.option_blastn, self.option_blastp, out_path=self.out_path)
+                        hra.seq_len = len(self.seq)
                         hra.hra_range = phra_range_list[j]  
                         hra.region_score_array = region_score_array[hra.hra_range[2]:hra.hra_range[3]]
                         hra.feature = feat
@@ -262,19 +380,19 @@ class LOCUS(object):
 
 
     def find_HRA(self):
-        HRA.window_size = self.w_size
-        HRA.seq_len = len(self.seq)
-
         for i, hra_range in enumerate(self.hra_range_list):
 
             if self.seqtype == "nucl":
                 hra = HRA(i, "nucl", self.k_size, self.w_size, self.g_size, self.tk, self.tp,
                           self.tb, self.tm, self.tq, self.tr, self.option_mafft,
-                          self.option_blastn, self.option_blastp)
+                          self.option_blastn, self.option_blastp, out_path=self.out_path)
             else:
                 hra = HRA(i, "prot", self.pk_size, self.pw_size, self.pg_size, self.ptk, self.ptp,
                           self.ptb, self.ptm, self.ptq, self.ptr, self.option_mafft,
-                          self.option_blastn, self.option_blastp)
+                          self.option_blastn, self.option_blastp, out_path=self.out_path)
+
+            hra.window_size = self.w_size
+            hra.seq_len = len(self.seq)
 
             hra.record, hra.features  = hra.extract(self.record,hra_range[2],hra_range[3])  
             hra.region_seq = str(hra.record.seq).upper() 
@@ -287,15 +405,13 @@ class LOCUS(object):
                 hra.w_size = self.w_size
             self.HRA_list.append(hra)
 
-        global OUT_PATH
         for hra in self.HRA_list:
-            #path = os.getcwd()
             if self.process == "find_HRA":
-                record_handle = open(OUT_PATH + hra.output_dir + "/" + hra.output_dir + ".gb","w")
+                record_handle = open(self.out_path + hra.output_dir + "/" + hra.output_dir + ".gb","w")
                 SeqIO.write(hra.record, record_handle, "genbank") 
                 record_handle.close() 
                 subject_name = hra.output_dir + "/subject.fasta"
-                subject = open(OUT_PATH + subject_name, "w")
+                subject = open(self.out_path + subject_name, "w")
                 subject.write(">subject\n")
                 subject.write(hra.region_seq + "\n")
                 subject.close()                  
@@ -305,7 +421,6 @@ class LOCUS(object):
         rm_dir_list = []
         it = 0 
         for hra in self.HRA_list:
-            path = os.getcwd()
             try:
                 hra.kmer_period_matrix() 
                 hra.search_peek()
@@ -326,17 +441,13 @@ class LOCUS(object):
         self.HRA_list = new_hra_list
         new_hra_list = []
 
-        global OUT_PATH
         for hra in self.HRA_list: 
-            path = os.getcwd()
-            if os.path.exists(OUT_PATH + hra.output_dir) == False:
-                os.mkdir(OUT_PATH + hra.output_dir)
+            if os.path.exists(self.out_path + hra.output_dir) == False:
+                os.mkdir(self.out_path + hra.output_dir)
             else: 
                 pass
-            os.chdir(OUT_PATH + hra.output_dir)
             hra.output_data()
             del hra.kmer_position_dict, hra.kmer_period_dict, hra.sorted_kmer_list
-            os.chdir(path)
             new_hra_list.append(hra) 
         self.HRA_list = new_hra_list
 
@@ -346,8 +457,7 @@ class LOCUS(object):
         Run Mafft commands for all HRAs
         """
 
-        global OUT_PATH
-        mafft_file = OUT_PATH + "mafft_coms.sh"
+        mafft_file = self.out_path + "mafft_coms.sh"
         mafft_coms = open(mafft_file, "w")
 
         for hra in self.HRA_list: 
@@ -365,26 +475,18 @@ class LOCUS(object):
 
     def decide_query_all(self):
         for hra in self.HRA_list:
-            path = os.getcwd()
-
             try:
-
-                # TODO: Do we need these?
-                os.chdir("../")
-                os.chdir(hra.output_dir)
                 hra.decide_query() 
             except Exception as e:
 
                 print("Error in decide_query_all. dir", self.Id, hra.output_dir)  
                 print(str(e))
-            os.chdir(path)
     
     def blast_all(self): 
         """
         Run Mafft commands for all HRAs
         """
-        global OUT_PATH
-        blast_coms_file = OUT_PATH + "blast_coms.sh"
+        blast_coms_file = self.out_path + "blast_coms.sh"
         blast_coms = open(blast_coms_file, "w")
 
         for hra in self.HRA_list: 
@@ -402,23 +504,17 @@ class LOCUS(object):
         new_hra_list = []
         rm_dir_list = []
         for hra in self.HRA_list:
-            path = os.getcwd()
             try:
-                # TODO: Do we need these?
-                os.chdir("../")
-                os.chdir(hra.output_dir)
                 hra.make_se_sets()
                 hra.make_motif_array() 
 
                 if len(hra.peak_period_set) > 0:
                     new_hra_list.append(hra)
                 else:
-                    rm_dir_list.append(os.getcwd())
+                    rm_dir_list.append(self.out_path + hra.output_dir)
             except Exception as e:
                 print("Error in make_se_sets_all. dir", self.Id, hra.output_dir)  
                 print(str(e))
-
-            os.chdir(path) 
         
         self.HRA_list = new_hra_list
 
@@ -427,14 +523,7 @@ class LOCUS(object):
         rm_dir_list   = [] 
         start_end_set = []
         for hra in self.HRA_list:
-            path = os.getcwd()
-
             try:
-
-                # TODO: Do we need these?
-                os.chdir("../")
-                os.chdir(hra.output_dir)
-
                 feats = hra.make_feature()
                 if len(feats) > 0:
                     for feat in feats:
@@ -444,29 +533,27 @@ class LOCUS(object):
                         else:
                             pass 
                 else:
-                    rm_dir_list.append(os.getcwd())
+                    rm_dir_list.append(self.out_path + hra.output_dir)
                 keys = list(hra.__dict__.keys())
                 for key in keys:
-                    if key != "thresh" and key != "peak_period_set" and key != "dtype" and key != "output_dir" and key != "k_size" and key != "strand":
+                    if key != "thresh" and key != "peak_period_set" and key != "dtype" and key != "output_dir" and key != "k_size" and key != "strand" and key != "out_path":
                         del hra.__dict__[key]
             except Exception as e:
                 print("Error in make_feature_all. dir", self.Id, hra.output_dir) 
                 print(e) 
-            os.chdir(path)    
         
         self.record.features.extend(spade_list)
         self.record.features.sort(key=lambda x: x.location.start)
-        global OUT_PATH
 
         if make_file == True:
 
             if self.format_type == "genbank":
-                record_handle = open(OUT_PATH + self.record.id + "_SPADE.gb", "w")
+                record_handle = open(self.out_path + self.record.id + "_SPADE.gb", "w")
                 SeqIO.write(self.record, record_handle, "genbank")
                 record_handle.close()
 
             if self.format_type == "fasta":
-                record_handle = open(OUT_PATH + self.record.id + "_SPADE.gb", "w")
+                record_handle = open(self.out_path + self.record.id + "_SPADE.gb", "w")
                 from Bio.Seq import Seq
                 #from Bio.Alphabet import generic_dna, generic_protein
                 seq = Seq(str(self.record.seq))
@@ -495,21 +582,13 @@ class LOCUS(object):
         """
 
         for hra in self.HRA_list:
-            path = os.getcwd()
-
             try:
-
-                # TODO: we really need these
-                os.chdir("../")
-                os.chdir(hra.output_dir)
-
                 hra.make_figure()
                 hra.make_motif_logo()
             except Exception as e:
                 print("Error in visualisation_all. dir", self.Id, hra.output_dir) 
                 print(str(e))
                 #raise e
-            os.chdir(path)
 
     def all(self):
         self.cumulative_kmer_count()
@@ -534,8 +613,10 @@ class HRA(object):
     record      = None
     seq_len     = None
     window_size = 1000
-    def __init__(self, Id, dtype, ksize, wsize, gsize, tk, tp, tb, tm, tq, tr, optionm, optionbn, optionbp): 
+    def __init__(self, Id, dtype, ksize, wsize, gsize, tk, tp, tb, tm, tq, tr, optionm, optionbn, optionbp,
+                 out_path=""): 
         self.Id                 = Id
+        self.out_path           = out_path
         self.output_dir         = ""
         self.hra_range          = []
         self.period_matrix      = []
@@ -584,7 +665,7 @@ class HRA(object):
         #Peak period detection
         maxIds = signal.argrelmax(self.sumx_matrix)[0].tolist()
         maxIds.append(np.argmax(self.sumx_matrix))
-        maxIds = [Id for Id in maxIds if Id < HRA.window_size]
+        maxIds = [Id for Id in maxIds if Id < self.window_size]
         maxIds = list(set(maxIds))
         maxIds.sort()
         maxIds.sort(key=lambda x: -1.0 * self.sumx_matrix[x])  
@@ -702,7 +783,7 @@ class HRA(object):
         if p_max >= self.period_matrix.shape[0]: 
             p_max = self.period_matrix.shape[0]-1
         
-        f = "ppm4vis.tsv"
+        f = self.out_path + self.output_dir + "/ppm4vis.tsv"
         header = "\tPositoin\nPeriod\t"
         header += "\t".join(list(map(str,list(range(1,self.period_matrix.shape[1]+1))))) + "\n"
         savetxt(f, np.concatenate((np.array([list(range(p_min,p_max+1))]).T,
@@ -716,7 +797,7 @@ class HRA(object):
         #3          score   score   score   score   socre   score
         #####
         
-        f = "pdist.tsv"
+        f = self.out_path + self.output_dir + "/pdist.tsv"
         header="Period\tPeriodicity\n"
         savetxt(f, np.concatenate((np.array([list(range(p_min,p_max+1))]).T,
                                    np.array([self.sumx_matrix[p_min:p_max+1]]).T),
@@ -741,7 +822,7 @@ class HRA(object):
         #3          score   score   score   score   socre   score
         #####
         
-        f = "kmer.tsv"
+        f = self.out_path + self.output_dir + "/kmer.tsv"
         header = "Position\tScore\n"
         data   = [] 
         for n, score in enumerate(self.region_score_array):
@@ -755,15 +836,14 @@ class HRA(object):
         #####
 
         #Data output for motif detection
-        global OUT_PATH
         subject_name = "subject.fasta"
-        subject = open(OUT_PATH + self.output_dir + "/" + subject_name, "w")
+        subject = open(self.out_path + self.output_dir + "/" + subject_name, "w")
         subject.write(">subject\n")
         subject.write(self.region_seq + "\n")
         subject.close()  
         for i,period in enumerate(self.peak_period_set):
             fasta_name = "unit_seq.fasta"
-            fasta = open(OUT_PATH + self.output_dir + "/" + fasta_name, 'w')#open(OUT_PATH + fasta_name,"w")
+            fasta = open(self.out_path + self.output_dir + "/" + fasta_name, 'w')
             for j, unit_seq in enumerate(self.unit_seq_list[i]):
                 fasta.write(">motif_" + str(self.unit_poss_list[i][j]) + "\n")
                 fasta.write(unit_seq + "\n")
@@ -774,13 +854,9 @@ class HRA(object):
     def mafft(self, Exec=0):
 
         mafft_coms = []
-        global OUT_PATH
 
         for period in self.peak_period_set:
-            #if os.getcwd().split("/")[-1] == self.output_dir:
-            #fasta_name = OUT_PATH + "unit_seq.fasta"
-            #else:
-            fasta_name = OUT_PATH + self.output_dir + "/unit_seq.fasta"
+            fasta_name = self.out_path + self.output_dir + "/unit_seq.fasta"
             
             if self.dtype == "nucl":
                 mafft_coms.append("mafft {} --quiet --auto {} > {}".format(self.option_mafft, fasta_name,
@@ -797,10 +873,9 @@ class HRA(object):
         self.se_sets_list = []
         self.aligned_positions_list = []
 
-        global OUT_PATH
         for i, period in enumerate(self.peak_period_set[0:1]):
             fasta_name = "align.unit_seq.fasta" 
-            fasta = open(OUT_PATH + self.output_dir + "/" + fasta_name)
+            fasta = open(self.out_path + self.output_dir + "/" + fasta_name)
             seqs  = read_seq_data(fasta)
             fasta.close() 
             #Bit score calcuation using WebLogo package
@@ -811,10 +886,10 @@ class HRA(object):
                 options       = LogoOptions()
                 format        = LogoFormat(data, options)
                 try:
-                    fout = open(OUT_PATH + self.output_dir + "/" + "weblogo.txt","wb")
+                    fout = open(self.out_path + self.output_dir + "/" + "weblogo.txt","wb")
                     fout.write(txt_formatter(data, format).decode("utf-8"))    
                 except:
-                    fout = open(OUT_PATH + self.output_dir + "/" + "weblogo.txt","wb")
+                    fout = open(self.out_path + self.output_dir + "/" + "weblogo.txt","wb")
                     fout.write(txt_formatter(data, format))    
                 fout.close()
             else:
@@ -824,15 +899,15 @@ class HRA(object):
                 options       = LogoOptions()
                 format        = LogoFormat(data, options)
                 try:
-                    fout = open(OUT_PATH + self.output_dir + "/" + "weblogo.txt","wb")
+                    fout = open(self.out_path + self.output_dir + "/" + "weblogo.txt","wb")
                     fout.write(txt_formatter(data, format).decode("utf-8"))    
                 except:
-                    fout = open(OUT_PATH + self.output_dir + "/" + "weblogo.txt","wb")
+                    fout = open(self.out_path + self.output_dir + "/" + "weblogo.txt","wb")
                     fout.write(txt_formatter(data, format))    
                 fout.close()
         
-            fasta         = SeqIO.to_dict(SeqIO.parse(fasta_name,"fasta"))
-            logo_result   = [line.split("\t") for line in open(OUT_PATH + self.output_dir + "/" + "weblogo.txt") if line[0] != "#"]
+            fasta         = SeqIO.to_dict(SeqIO.parse(self.out_path + self.output_dir + "/" + fasta_name, "fasta"))
+            logo_result   = [line.split("\t") for line in open(self.out_path + self.output_dir + "/" + "weblogo.txt") if line[0] != "#"]
             bitscore_list = [float(elements[-4])/0.69 for elements in logo_result] 
             weight_list   = [float(elements[-1]) for elements in logo_result] 
             frequent_seq  = ""
@@ -864,7 +939,7 @@ class HRA(object):
                     query_seq += frequent_seq[candidate[2]:candidate[3]]
             else:    
                 query_seq = frequent_seq[query_candidates[0][2]:query_candidates[0][3]]
-            query = open(OUT_PATH + self.output_dir + "/" + "query.fasta", "w")
+            query = open(self.out_path + self.output_dir + "/" + "query.fasta", "w")
             query.write(">query" + "\n") 
             query.write(query_seq + "\n") 
             query.close()
@@ -878,20 +953,19 @@ class HRA(object):
         self.variable_query_list = []
         self.repeat_num_list     = []
 
-        global OUT_PATH
         for i,period in enumerate(self.peak_period_set[0:1]):
             self.variable_query_list.append(self.query_list[i])
             self.repeat_num_list.append(len(self.se_sets_list[i]))
             if len(self.query_list[i]) > self.k_size:
                 fasta_name  = "align.unit_seq.fasta" 
-                blast_file  = open(OUT_PATH + self.output_dir + "/" + "blast.txt")
-                subject_seq = open(OUT_PATH + self.output_dir + "/" + "subject.fasta").readlines()[1].rstrip()
+                blast_file  = open(self.out_path + self.output_dir + "/" + "blast.txt")
+                subject_seq = open(self.out_path + self.output_dir + "/" + "subject.fasta").readlines()[1].rstrip()
                 blast = [line.rstrip().split("\t") for line in blast_file]
                 blast.sort(key=lambda x:(int(x[11]),float(x[-2])))
                 
                 if len(blast) > 2:
                     #If ovelap region between blast hits was detected, the hit represent less E-value compared to others were selected. 
-                    fasta = open(OUT_PATH + self.output_dir + "/" + fasta_name, "w")
+                    fasta = open(self.out_path + self.output_dir + "/" + fasta_name, "w")
                     blast = [elements for elements in blast if float(elements[-2]) <= 0.001 or float(elements[6])/float(elements[5]) >= 0.5]
                     consensus_motifs = []
                     true_motifs = [] 
@@ -1022,17 +1096,10 @@ class HRA(object):
     def blast(self, Exec=0):
         blast_coms = []
 
-        global OUT_PATH
-
         for i, period in enumerate(self.peak_period_set):
-            #if os.getcwd().split("/")[-1] == self.output_dir:
-            #query_name   = OUT_PATH + "query.fasta"
-            #subject_name = OUT_PATH + "subject.fasta"
-            #blast_name   = OUT_PATH + "blast.txt"
-            #else:
-            query_name = OUT_PATH + self.output_dir + "/query.fasta"
-            subject_name = OUT_PATH + self.output_dir + "/subject.fasta"
-            blast_name = OUT_PATH + self.output_dir + "/blast.txt"
+            query_name = self.out_path + self.output_dir + "/query.fasta"
+            subject_name = self.out_path + self.output_dir + "/subject.fasta"
+            blast_name = self.out_path + self.output_dir + "/blast.txt"
 
             if self.dtype == "nucl":
 
@@ -1140,13 +1207,12 @@ class HRA(object):
     def make_feature(self, make_gb=True, make_tsv=True):
         new_feat_list = []
 
-        global OUT_PATH
         for i, period in zip([0], self.peak_period_set):
             #Present version of SPADE don't care abount the position of blast hits.
             #If repeating motifs are separated by space whose length is times longer than periodd, the repeat would be evaluated as 
             #two different repeats at next version of spade.
             se_sets = [] 
-            for line in open(OUT_PATH + self.output_dir + "/" + "align.unit_seq.fasta"):
+            for line in open(self.out_path + self.output_dir + "/" + "align.unit_seq.fasta"):
                 if line[0] == ">":
                     s = int(line.rstrip().split("_")[-1]) 
                 else:
@@ -1240,13 +1306,13 @@ class HRA(object):
         self.record.features.sort(key=lambda x: x.location.start)
 
         if make_gb == True and len(new_feat_list) > 0: 
-            record_handle = open(OUT_PATH + self.output_dir + "/" + "repeat.gbk", "w")
+            record_handle = open(self.out_path + self.output_dir + "/" + "repeat.gbk", "w")
             self.record.id = self.record.id[0:16]
             SeqIO.write(self.record, record_handle, "genbank")
 
-        os_cmd_str = "rm {0} {1} {2}".format(OUT_PATH + self.output_dir + "/" + 'blast.txt',
-                                             OUT_PATH + self.output_dir + "/" + 'subject.fasta',
-                                             OUT_PATH + self.output_dir + "/" + 'query.fasta')
+        os_cmd_str = "rm {0} {1} {2}".format(self.out_path + self.output_dir + "/" + 'blast.txt',
+                                             self.out_path + self.output_dir + "/" + 'subject.fasta',
+                                             self.out_path + self.output_dir + "/" + 'query.fasta')
         os.system(os_cmd_str)
         return new_feat_list
 
@@ -1275,12 +1341,10 @@ class HRA(object):
         return partial_gb, feat_list
      
     def make_motif_logo(self):
-        global OUT_PATH
-        vs.motif_logo(self.dtype, path=OUT_PATH + self.output_dir + "/")
+        vs.motif_logo(self.dtype, path=self.out_path + self.output_dir + "/")
         
     def make_figure(self):
-        global OUT_PATH
-        vs.load_data(self.dtype, 1, self.k_size, 10, path=OUT_PATH + self.output_dir + "/")
+        vs.load_data(self.dtype, 1, self.k_size, 10, path=self.out_path + self.output_dir + "/")
     
     #def save_region_record(self):
     #    pass
@@ -1292,6 +1356,7 @@ if __name__ == "__main__":
     print("{0} Starting SPADE application".format(INFO))
     print("==========================")
 
+    defaults = dict(DEFAULT_PARAMETERS)
     p = argparse.ArgumentParser(add_help=False)
     p.add_argument("-V", "--version", action="store_true", default=False)
     p.add_argument('-h', "--help", action='store_true', default=False) 
@@ -1300,29 +1365,29 @@ if __name__ == "__main__":
     p.add_argument("-f", type=str, default="auto", choices=("genbank", "fasta", "auto"))
     p.add_argument("-t", type=str, default="auto", choices=("auto", "nucl", "protein"))
 
-    p.add_argument("-Nk", type=int, default=10)
-    p.add_argument("-Nw", type=int, default=1000)
-    p.add_argument("-Ns", type=int, default=20)  
-    p.add_argument("-Nm", type=int, default=1000)
-    p.add_argument("-Ng", type=int, default=200)
-    p.add_argument("-Np", type=float, default=0.5)
-    p.add_argument("-Nq", type=float, default=0.5)
-    p.add_argument("-Nu", type=float, default=0.8)
-    p.add_argument("-Nr", type=int, default=5)
+    p.add_argument("-Nk", type=int, default=defaults["Nk"])
+    p.add_argument("-Nw", type=int, default=defaults["Nw"])
+    p.add_argument("-Ns", type=int, default=defaults["Ns"])  
+    p.add_argument("-Nm", type=int, default=defaults["Nm"])
+    p.add_argument("-Ng", type=int, default=defaults["Ng"])
+    p.add_argument("-Np", type=float, default=defaults["Np"])
+    p.add_argument("-Nq", type=float, default=defaults["Nq"])
+    p.add_argument("-Nu", type=float, default=defaults["Nu"])
+    p.add_argument("-Nr", type=int, default=defaults["Nr"])
     
-    p.add_argument("-Pk", type=int, default=3)
-    p.add_argument("-Pw", type=int, default=300)
-    p.add_argument("-Ps", type=int, default=6)  
-    p.add_argument("-Pm", type=int, default=300)
-    p.add_argument("-Pg", type=int, default=50)
-    p.add_argument("-Pp", type=float, default=0.3)
-    p.add_argument("-Pq", type=float, default=0.5)
-    p.add_argument("-Pu", type=float, default=0.8)
-    p.add_argument("-Pr", type=int, default=5)
+    p.add_argument("-Pk", type=int, default=defaults["Pk"])
+    p.add_argument("-Pw", type=int, default=defaults["Pw"])
+    p.add_argument("-Ps", type=int, default=defaults["Ps"])  
+    p.add_argument("-Pm", type=int, default=defaults["Pm"])
+    p.add_argument("-Pg", type=int, default=defaults["Pg"])
+    p.add_argument("-Pp", type=float, default=defaults["Pp"])
+    p.add_argument("-Pq", type=float, default=defaults["Pq"])
+    p.add_argument("-Pu", type=float, default=defaults["Pu"])
+    p.add_argument("-Pr", type=int, default=defaults["Pr"])
     
-    p.add_argument("--mafft", type=str, default="--auto") 
-    p.add_argument("--blastn", type=str, default='-strand plus -task blastn-short -penalty -2 -outfmt "6 qseqid qseq sseqid sseq pident qlen length mismatch gapopen qstart qend sstart send gaps evalue bitscore"') 
-    p.add_argument("--blastp", type=str, default='-task blastp-short -outfmt "6 qseqid qseq sseqid sseq pident qlen length mismatch gapopen qstart qend sstart send gaps evalue bitscore"')
+    p.add_argument("--mafft", type=str, default=defaults["mafft"]) 
+    p.add_argument("--blastn", type=str, default=defaults["blastn"]) 
+    p.add_argument("--blastp", type=str, default=defaults["blastp"])
     p.add_argument("-n", "--num_threads", type=int, default=1) 
     p.add_argument("-v", type=str, default="Y", choices=("Y","N"))
     p.add_argument("-d", "--delete", action="store_true", default=False)
@@ -1342,18 +1407,10 @@ if __name__ == "__main__":
         raise ValueError("Output directory not specified")
     else:
         print("{0} Output Directory: {1}".format(INFO, args.out_dir))
-        OUT_PATH = args.out_dir
     
-    import numpy as np 
-    import multiprocessing as mp
-    import visualisation as vs
-    from scipy import signal
-    # from Bio import Alphabet
-
-    from kmer_count import *
-    from weblogo import *
+    load_dependencies()
 
-    spade = SPADE() 
+    spade = SPADE(out_path=args.out_dir) 
     if args.input != "None":
         spade.load(args.input) 
     
@@ -1367,7 +1424,7 @@ if __name__ == "__main__":
                                  args.Pp, args.Pu, args.Pm, args.Pr, args.Pq, args.v, args.delete,
                                  args.mafft, args.blastn, args.blastp])
 
-    finish = open(OUT_PATH + "finish.txt", "w")
+    finish = open(spade.out_path + "finish.txt", "w")
     finish.write("finish")
     finish.close()
     print("==========================")
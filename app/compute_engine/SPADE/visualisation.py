@@ -289,16 +289,20 @@ def make_figure(peak_matrix_list, kmer_count_signal, repeat_unit_array,
     cb.outline.set_linewidth(0.5)
     
     if Format == "svg":
-        path = os.getcwd() 
-        shutil.copytree(html_path, path + "/html")
-        os.chdir("html") 
-        plt.savefig(fig_name + "." + Format, transparent=False)
-        svg       = open(fig_name + "." + Format) 
-        url_list  = [url.rstrip() for url in open("../annotaiton_url_list.txt","r")]
+        # the html directory is copied next to the figure and
+        # a relative html_path is relative to the figure directory
+        path      = os.path.dirname(os.path.abspath(fig_name))
+        name      = os.path.basename(fig_name)
+        html_dir  = os.path.join(path, "html")
+        shutil.copytree(os.path.join(path, html_path), html_dir)
+        svg_name  = os.path.join(html_dir, name + "." + Format)
+        plt.savefig(svg_name, transparent=False)
+        svg       = open(svg_name) 
+        url_list  = [url.rstrip() for url in open(os.path.join(path, "annotaiton_url_list.txt"),"r")]
         new_svg   = set_url(svg,url_list)
-        html_temp = open("template.html").read()
-        new_html  = html_temp % (fig_name,new_svg)
-        open(fig_name + ".html","w").write(new_html)  
+        html_temp = open(os.path.join(html_dir, "template.html")).read()
+        new_html  = html_temp % (name,new_svg)
+        open(os.path.join(html_dir, name + ".html"),"w").write(new_html)  
     else:
         plt.savefig(fig_name + "." + Format, transparent=False)
 
@@ -563,7 +567,7 @@ def work_peak_list(peak_list, peak_matrix_list,
 
 def load_data(dtype, strand, ksize ,thresh, path, Format="pdf"):
 
-    dir_list = os.listdir("./")
+    dir_list = os.listdir(path)
     peak_list = []
     unit_length_list = []
     peak_matrix_list = []
@@ -728,12 +732,12 @@ def load_data(dtype, strand, ksize ,thresh, path, Format="pdf"):
         make_figure(peak_matrix_list, kmer_count_signal, rpt_unit_array_list, gap_rpt_unit_array_list,
                     aln_rpt_unit_array_list, unit_length_list, avg_intensity_list,
                     periods, candidate, peak_period_list=peak_list, gb=gbk,
-                    fig_name="periodic_repeat", thresh=thresh, dtype=dtype, Format=Format, k=ksize, strand=strand)
+                    fig_name=path + "periodic_repeat", thresh=thresh, dtype=dtype, Format=Format, k=ksize, strand=strand)
     elif dtype == "prot":
         make_figure(peak_matrix_list, kmer_count_signal, rpt_unit_array_list,
                     gap_rpt_unit_array_list, aln_rpt_unit_array_list, unit_length_list,
                     avg_intensity_list, periods, candidate, peak_period_list=peak_list,
-                    gb=gbk, fig_name="periodic_repeat", thresh=thresh,
+                    gb=gbk, fig_name=path + "periodic_repeat", thresh=thresh,
                     dtype=dtype ,Format=Format, p_start=p_start, p_end=p_end, k=ksize, strand=strand)
     return peak_list
 
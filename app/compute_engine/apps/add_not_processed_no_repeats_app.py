@@ -4,19 +4,19 @@ from pathlib import Path
 import csv
 import sqlite3
 from sqlite3 import Error
-import pysam
 
 from compute_engine.src.file_readers import TufFileReader
 from compute_engine.src.file_readers import DeletionFileReader
 from compute_engine.src.file_readers import DuplicationFileReader
 from compute_engine.src.file_readers import NormalFileReader
-from compute_engine.src.tuf_core_helpers import gcpercent
+from compute_engine.src.gc_profile import GCProfileService
+from compute_engine.src.reference_cache import get_reference_cache
 
 
 
 
 
-def main(input_path_dir: Path, fas_file_name: Path, db_conn) -> None:
+def main(input_path_dir: Path, fas_file_name: Path, db_conn, gc_profile_cache_path: Path=None) -> None:
 
     # table in the db
     sql = "CREATE TABLE IF NOT EXISTS extra_gc (id INTEGER PRIMARY KEY AUTOINCREMENT, " \
@@ -27,7 +27,12 @@ def main(input_path_dir: Path, fas_file_name: Path, db_conn) -> None:
     cursor.execute(sql)
     db_conn.commit()
 
-    fas = pysam.FastaFile(fas_file_name)
+    # the segments are fetched in batches through the reference cache
+    fas = get_reference_cache(fasta_file=fas_file_name)
+
+    # the GC percent of the regions is computed from
+    # the GC profiles of the chromosomes
+    gc_profiles = GCProfileService(fasta_file=fas_file_name, cache_path=gc_profile_cache_path)
 
     # get th directories in the path
     directories = os.listdir(input_path_dir)
@@ -79,20 +84,16 @@ def main(input_path_dir: Path, fas_file_name: Path, db_conn) -> None:
 
             for name in data_dict:
 
-                _data = data_dict[name]
-
-                for data in _data:
-                    chromosome = data[0]
-                    start_idx = int(data[1])
-                    end_idx = int(data[2])
+                intervals = [(data[0], int(data[1]), int(data[2])) for data in data_dict[name]]
+                sequences = fas.fetch_intervals(intervals=intervals)
 
-                    seq = fas.fetch(chromosome, start_idx, end_idx)
-                    gc_str = gcpercent(cseq=seq, chunk_size=100)
+                for (chromosome, start_idx, end_idx), seq in zip(intervals, sequences):
+                    gc, min_gc, max_gc = gc_profiles.gc_percent(chromosome=chromosome, start=start_idx,
+                                                                end=end_idx, chunk_size=100)
 
-                    gc_data = gc_str.split('_')
-                    gc = float(gc_data[0])
-                    min_gc = float(gc_data[1]) if gc_data[1] != 'NA' else gc
-                    max_gc = float(gc_data[2]) if gc_data[2] != 'NA' else gc
+                    gc = float(gc)
+                    min_gc = float(min_gc) if min_gc is not None else gc
+                    max_gc = float(max_gc) if max_gc is not None else gc
 
                     sql = '''INSERT INTO extra_gc(chromosome, start_idx, end_idx, sequence, state_name, gc, gc_min, gc_max) values(?,?,?,?,?,?,?,?)'''
                     values = (chromosome, start_idx, end_idx, seq, name, gc, min_gc, max_gc )
@@ -101,6 +102,7 @@ def main(input_path_dir: Path, fas_file_name: Path, db_conn) -> None:
                     db_conn.commit()
 
     print("Total data ", total)
+    print("Reference cache statistics ", fas.statistics())
 
 
 if __name__ == '__main__':
@@ -109,6 +111,8 @@ if __name__ == '__main__':
     OUTPUT_PATH_DIR = Path('/home/alex/qi3/hmmtuf/computations/viterbi_paths/tmp/out')
     DB_PATH = '/home/alex/qi3/hmmtuf/release_db_v5.sqlite3'
     fas_file_name = Path('/home/alex/qi3/hmmtuf/data/GCA_000001405.15_GRCh38_no_alt_analysis_set.fna')
+    GC_PROFILE_CACHE_PATH = Path('/home/alex/qi3/hmmtuf/computations/gc_profiles')
     conn = sqlite3.connect(DB_PATH)
-    main(input_path_dir=INPUT_PATH_DIR, fas_file_name=fas_file_name, db_conn=conn)
+    main(input_path_dir=INPUT_PATH_DIR, fas_file_name=fas_file_name, db_conn=conn,
+         gc_profile_cache_path=GC_PROFILE_CACHE_PATH)
     conn.close()
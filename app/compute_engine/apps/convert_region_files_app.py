@@ -0,0 +1,52 @@
+"""
+Convert region files saved in the legacy
+text format into the columnar npz format
+"""
+
+import os
+from compute_engine.src.constants import INFO
+from compute_engine.src.region import Region
+
+
+def convert_region_file(input_dir, filename, output_dir):
+    """
+    Convert the given region file. The converted file has
+    the same name with the .npz suffix. Files already in the
+    npz format are skipped. Returns the name of the file written
+    or None
+    """
+
+    if Region.is_npz_file(filename=input_dir + filename):
+        print("{0} {1} is already in npz format".format(INFO, filename))
+        return None
+
+    region = Region.load(filename=input_dir + filename)
+    region.get_mixed_windows()
+
+    name = os.path.splitext(filename)[0]
+    region.save(path=output_dir, filename=name, tips=None, file_format='npz')
+    return name + ".npz"
+
+
+def convert_region_files_app_main(input_dir, output_dir, file_suffix='.txt'):
+
+    filenames = [name for name in os.listdir(input_dir) if name.endswith(file_suffix)]
+
+    print("{0} Number of region files to convert={1}".format(INFO, len(filenames)))
+
+    for filename in filenames:
+        print("{0} Working with filename={1}".format(INFO, filename))
+        outfile = convert_region_file(input_dir=input_dir, filename=filename,
+                                      output_dir=output_dir)
+
+        if outfile is not None:
+            print("{0} Wrote {1}".format(INFO, output_dir + outfile))
+
+
+if __name__ == '__main__':
+
+    INPUT_DIR = "/home/alex/qi3/hmmtuf/regions/"
+    OUTPUT_DIR = "/home/alex/qi3/hmmtuf/regions/"
+
+    convert_region_files_app_main(input_dir=INPUT_DIR, output_dir=OUTPUT_DIR)
+    print("{0} Finished...".format(INFO))
@@ -0,0 +1,65 @@
+"""
+Benchmark the bit-parallel lev and damlev kernels of
+distance_kernels against textdistance on random DNA
+sequences. Both compute the minimum of the normalized
+distances to a sequence and to its reverse complement
+as in compute_distance_app_par
+"""
+
+import time
+import numpy as np
+import textdistance
+
+from compute_engine.src.constants import INFO
+from compute_engine.src.distance_kernels import Levenshtein, DamerauLevenshtein
+from compute_engine.src.sequence_transforms import COMPLEMENT_TABLE, reverse_complement_table
+
+
+def make_pairs(n_pairs, min_length=50, max_length=200, seed=42):
+
+    rng = np.random.RandomState(seed)
+    lengths = rng.randint(min_length, max_length + 1, size=(n_pairs, 2))
+    seqs_a = ["".join(rng.choice(list("ACGT"), size=length)) for length in lengths[:, 0]]
+    seqs_b = ["".join(rng.choice(list("ACGT"), size=length)) for length in lengths[:, 1]]
+    return seqs_a, seqs_b
+
+
+def textdistance_min_reverse(calculator, seqs_a, seqs_b):
+
+    return np.array([min(calculator.normalized_distance(a, b),
+                         calculator.normalized_distance(a, reverse_complement_table(seq=b, tab=COMPLEMENT_TABLE)))
+                     for a, b in zip(seqs_a, seqs_b)])
+
+
+def distance_benchmark_app_main(n_pairs, min_length=50, max_length=200):
+
+    seqs_a, seqs_b = make_pairs(n_pairs=n_pairs, min_length=min_length, max_length=max_length)
+
+    results = []
+    for name, calculator, expected in [("lev", Levenshtein(), textdistance.Levenshtein()),
+                                       ("damlev", DamerauLevenshtein(), textdistance.DamerauLevenshtein())]:
+
+        start = time.perf_counter()
+        distances = calculator.pairwise_min_reverse(seqs_a, seqs_b)
+        kernel_time = time.perf_counter() - start
+        print("{0} {1} n_pairs={2} bit-parallel time={3} secs".format(INFO, name, n_pairs, kernel_time))
+
+        start = time.perf_counter()
+        expected_distances = textdistance_min_reverse(calculator=expected, seqs_a=seqs_a, seqs_b=seqs_b)
+        textdistance_time = time.perf_counter() - start
+
+        same = np.allclose(distances, expected_distances, rtol=0.0, atol=1.0e-12)
+        print("{0} {1} n_pairs={2} textdistance time={3} secs speedup={4} "
+              "identical results={5}".format(INFO, name, n_pairs, textdistance_time,
+                                            textdistance_time / kernel_time, same))
+        results.append((name, kernel_time, textdistance_time, same))
+
+    return results
+
+
+if __name__ == '__main__':
+
+    N_PAIRS = 2000
+
+    distance_benchmark_app_main(n_pairs=N_PAIRS)
+    print("{0} Finished...".format(INFO))
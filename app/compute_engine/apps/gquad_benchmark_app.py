@@ -0,0 +1,76 @@
+"""
+Benchmark the NumPy G-quadruplex scoring of gquadcheck
+against the gquadfinder port i.e. BaseScore, CalScore,
+GetG4 and WriteSeq on random sequences
+"""
+
+import time
+import numpy as np
+
+from compute_engine.src.constants import INFO
+from compute_engine.src.tuf_core_helpers import gquadcheck
+from compute_engine.src.tuf_core_helpers import BaseScore, CalScore, GetG4, WriteSeq
+
+
+def make_sequence(n_bases, gc_fraction=0.6, mean_run_length=3.0, seed=42):
+    """
+    Random sequence made of runs of the same base so
+    that G4 regions occur as in G-rich genome regions
+    """
+
+    rng = np.random.RandomState(seed)
+    p = [gc_fraction / 2.0, gc_fraction / 2.0, (1.0 - gc_fraction) / 2.0, (1.0 - gc_fraction) / 2.0]
+    n_runs = int(2 * n_bases / mean_run_length) + 1
+    bases = rng.choice(list("GCAT"), size=n_runs, p=p)
+    lengths = rng.geometric(1.0 / mean_run_length, size=n_runs)
+    return "".join(np.repeat(bases, lengths))[:n_bases]
+
+
+def gquadfinder_check(sequence, minscore=2, window=50):
+
+    cseq, scores = BaseScore(sequence)
+    score = CalScore(scores, window)
+    outG4 = GetG4(sequence, score, minscore, window, len(scores))
+
+    if len(outG4) == 0:
+        return False, []
+
+    mscore = WriteSeq(sequence, score, outG4, window, len(scores))
+    return len(mscore) != 0, mscore
+
+
+def gquad_benchmark_app_main(sizes, with_gquadfinder=True):
+
+    results = []
+    for n_bases in sizes:
+        sequence = make_sequence(n_bases=n_bases)
+
+        start = time.perf_counter()
+        gquad, mscore = gquadcheck(sequence)
+        numpy_time = time.perf_counter() - start
+        print("{0} n_bases={1} NumPy time={2} secs "
+              "G4 regions={3}".format(INFO, n_bases, numpy_time, len(mscore)))
+
+        if not with_gquadfinder:
+            results.append((n_bases, numpy_time, None, None))
+            continue
+
+        start = time.perf_counter()
+        expected = gquadfinder_check(sequence)
+        gquadfinder_time = time.perf_counter() - start
+
+        same = (gquad, mscore) == expected
+        print("{0} n_bases={1} gquadfinder time={2} secs speedup={3} "
+              "identical results={4}".format(INFO, n_bases, gquadfinder_time,
+                                            gquadfinder_time / numpy_time, same))
+        results.append((n_bases, numpy_time, gquadfinder_time, same))
+
+    return results
+
+
+if __name__ == '__main__':
+
+    SIZES = [10 ** 3, 10 ** 5, 10 ** 6]
+
+    gquad_benchmark_app_main(sizes=SIZES)
+    print("{0} Finished...".format(INFO))
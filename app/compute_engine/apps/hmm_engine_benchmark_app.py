@@ -0,0 +1,77 @@
+"""
+Benchmark the Viterbi decoding of the NumPy HMM engine
+against pomegranate. Observations are sampled uniformly
+over the range of the RD means with a fraction of gap windows
+"""
+
+import time
+import numpy as np
+
+from compute_engine.src.constants import INFO
+from compute_engine.src.hmm_loader import build_hmm, build_numpy_hmm
+from compute_engine.src.numpy_hmm import HAS_NUMBA
+
+
+def make_observations(n_obs, gap_fraction=0.01, max_mean=60.0, seed=42):
+
+    rng = np.random.RandomState(seed)
+    observations = rng.uniform(0.0, max_mean, size=(n_obs, 2))
+    observations[rng.uniform(size=n_obs) < gap_fraction] = -999.0
+    return observations
+
+
+def time_viterbi(hmm_model, observations):
+
+    start = time.perf_counter()
+    log_probability, path = hmm_model.viterbi(observations)
+    return time.perf_counter() - start, log_probability, [idx for idx, _ in path]
+
+
+def hmm_engine_benchmark_app_main(hmm_file, sizes, with_pomegranate=True):
+
+    print("{0} Numba available: {1}".format(INFO, HAS_NUMBA))
+
+    start = time.perf_counter()
+    numpy_hmm = build_numpy_hmm(hmm_file=hmm_file)
+    print("{0} NumPy HMM built in {1} secs".format(INFO, time.perf_counter() - start))
+
+    pomegranate_hmm = None
+    if with_pomegranate:
+        start = time.perf_counter()
+        pomegranate_hmm = build_hmm(hmm_file=hmm_file)
+        print("{0} pomegranate HMM built in {1} secs".format(INFO, time.perf_counter() - start))
+
+    # compile the numba kernel if any
+    numpy_hmm.viterbi(make_observations(n_obs=10))
+
+    results = []
+    for n_obs in sizes:
+        observations = make_observations(n_obs=n_obs)
+
+        numpy_time, numpy_log_prob, numpy_path = time_viterbi(hmm_model=numpy_hmm,
+                                                              observations=observations)
+        print("{0} n_obs={1} NumPy engine time={2} secs".format(INFO, n_obs, numpy_time))
+
+        if pomegranate_hmm is None:
+            results.append((n_obs, numpy_time, None, None))
+            continue
+
+        pom_time, pom_log_prob, pom_path = time_viterbi(hmm_model=pomegranate_hmm,
+                                                        observations=observations)
+        same_path = numpy_path == pom_path
+        print("{0} n_obs={1} pomegranate time={2} secs".format(INFO, n_obs, pom_time))
+        print("{0} n_obs={1} speedup={2} identical paths={3} "
+              "log-probabilities {4} {5}".format(INFO, n_obs, pom_time / numpy_time,
+                                                  same_path, numpy_log_prob, pom_log_prob))
+        results.append((n_obs, numpy_time, pom_time, same_path))
+
+    return results
+
+
+if __name__ == '__main__':
+
+    HMM_FILE = "/home/alex/qi3/hmmtuf/app/default_hmm/HMM_Model_9.json"
+    SIZES = [10 ** 5, 10 ** 6, 10 ** 7]
+
+    hmm_engine_benchmark_app_main(hmm_file=HMM_FILE, sizes=SIZES)
+    print("{0} Finished...".format(INFO))
@@ -1,10 +1,16 @@
 from abc import abstractmethod
+
+from compute_engine.src.constants import INFO, WARNING, ENABLE_SPADE
 from compute_engine.src.enumeration_types import JobResultEnum
 from compute_engine.src.exceptions import Error
+from compute_engine.src.cengine_configuration import VITERBI_BLOCK_SIZE, HMM_ENGINE, VITERBI_PATH_FORMAT
+from compute_engine.src.cengine_configuration import SPADE_N_WORKERS, SPADE_CACHE_PATH
 from compute_engine.src.region import Region
 from compute_engine.src import hmm_loader
 from compute_engine.src import tufdel
+from compute_engine.src import viterbi_segments
 from compute_engine.src import viterbi_calculation_helpers as viterbi_helpers
+from compute_engine.src.process_pools import process_pool_executor
 
 
 
@@ -63,32 +69,67 @@ class ViterbiPathCalulation(ActorBase):
             self.state = JobResultEnum.CREATED
             self.set_output_value("state", self.state)
 
-            region = Region.load(filename=self._input['region_filename'])
+            region = Region.load(filename=self._input['region_filename'], lazy=True)
             region.get_mixed_windows()
 
-            # get the sequence from the region
-            sequence = region.get_region_as_rd_mean_sequences_with_windows(size=None,
-                                                                           window_type='BOTH',
-                                                                           n_seqs=1,
-                                                                           exclude_gaps=False)
+            # get the observations and the window
+            # coordinates from the region
+            observations, coordinates = region.get_rd_mean_observations(exclude_gaps=False)
 
             viterbi_path_filename = self._input['viterbi_path_filename']
             hmm_model_filename = self._input['hmm_model_filename']
             chromosome = self._input['chromosome']
-            hmm_model = hmm_loader.build_hmm(hmm_file=hmm_model_filename)
-
-            viterbi_path, observations, \
-            sequence_viterbi_state = viterbi_helpers.create_viterbi_path(sequence=sequence, hmm_model=hmm_model,
-                                                                         chromosome=chromosome,
-                                                                         filename=viterbi_path_filename,
-                                                                         append_or_write='w')
-
-            tuf_delete_tuf = viterbi_helpers.filter_viterbi_path(path=viterbi_path[1][1:],
-                                                                 wstate='TUF',
-                                                                 limit_state='Deletion',
-                                                                 min_subsequence=1)
-
-            segments = viterbi_helpers.get_start_end_segment(tuf_delete_tuf, sequence)
+            # use the model if this is already built
+            hmm_model = self._input.get('hmm_model', None)
+
+            if hmm_model is None:
+                hmm_model = hmm_loader.load_hmm(hmm_file=hmm_model_filename,
+                                                engine=self._input.get('hmm_engine', HMM_ENGINE))
+
+            block_size = self._input.get('viterbi_block_size', VITERBI_BLOCK_SIZE)
+            file_format = self._input.get('viterbi_path_format', VITERBI_PATH_FORMAT)
+
+            if block_size is None:
+                viterbi_path, observations, \
+                sequence_viterbi_state = \
+                    viterbi_helpers.create_viterbi_path_from_observations(observations=observations,
+                                                                          coordinates=coordinates,
+                                                                          hmm_model=hmm_model,
+                                                                          chromosome=chromosome,
+                                                                          filename=viterbi_path_filename,
+                                                                          append_or_write='w',
+                                                                          file_format=file_format)
+
+                if viterbi_path[1] is None:
+                    raise Error("Viterbi path is impossible for region {0}".format(self._input['region_filename']))
+
+                # the window states without the
+                # start and end states of the path
+                state_ids, state_names = \
+                    viterbi_segments.viterbi_path_state_ids(path=viterbi_path[1][1:len(coordinates) + 1])
+            else:
+                (_, state_ids), observations, \
+                state_names = \
+                    viterbi_helpers.create_viterbi_path_streaming(observations=observations,
+                                                                  coordinates=coordinates,
+                                                                  hmm_model=hmm_model,
+                                                                  chromosome=chromosome,
+                                                                  filename=viterbi_path_filename,
+                                                                  append_or_write='w',
+                                                                  block_size=block_size,
+                                                                  file_format=file_format)
+
+                if state_ids is None:
+                    raise Error("Viterbi path is impossible for region {0}".format(self._input['region_filename']))
+
+            # the TUF-DEL-TUF segments from the runs
+            # of the window states
+            segments = viterbi_segments.tuf_del_tuf_segments(state_ids=state_ids,
+                                                             state_names=state_names,
+                                                             coordinates=coordinates,
+                                                             wstate='TUF',
+                                                             limit_state='Deletion',
+                                                             min_subsequence=1)
 
             filename = self._input['tuf_del_tuf_filename']
             viterbi_helpers.save_segments(segments=segments, chromosome=chromosome, filename=filename)
@@ -102,6 +143,54 @@ class ViterbiPathCalulation(ActorBase):
         return self._output
 
 
+# the HMM shared by the processes that
+# decode the regions of a group
+_GROUP_HMM_MODEL = None
+
+
+def _init_group_viterbi_worker(hmm_model):
+    global _GROUP_HMM_MODEL
+    _GROUP_HMM_MODEL = hmm_model
+
+
+def _group_viterbi_worker(actor_input):
+    actor_input = dict(actor_input)
+    actor_input['hmm_model'] = _GROUP_HMM_MODEL
+
+    viterbi_calculator = ViterbiPathCalulation(input=actor_input)
+    viterbi_calculator.start()
+    return viterbi_calculator.output
+
+
+def compute_group_viterbi_paths(actor_inputs, hmm_model, n_procs):
+    """
+    Compute the Viterbi paths of the regions described by the
+    ViterbiPathCalulation inputs in actor_inputs with the
+    given built HMM. The regions are decoded by a pool of
+    n_procs processes that receive the model once. Returns the
+    ViterbiPathCalulation outputs in the order of actor_inputs
+    """
+
+    if n_procs > 1 and len(actor_inputs) > 1:
+
+        # daemonic processes e.g. Celery workers get a billiard
+        # pool and decode in this process if billiard is missing
+        executor = process_pool_executor(max_workers=n_procs,
+                                         initializer=_init_group_viterbi_worker,
+                                         initargs=(hmm_model,))
+
+        if executor is not None:
+            print("{0} Decoding {1} regions with {2} processes".format(INFO, len(actor_inputs), n_procs))
+            with executor:
+                return list(executor.map(_group_viterbi_worker, actor_inputs))
+
+        print("{0} Cannot start a process pool in a daemonic process. "
+              "Regions are decoded serially".format(WARNING))
+
+    _init_group_viterbi_worker(hmm_model=hmm_model)
+    return [_group_viterbi_worker(actor_input) for actor_input in actor_inputs]
+
+
 class SpadeCalculation(ActorBase):
     """
     Wrap the Spade calculation
@@ -127,13 +216,20 @@ class SpadeCalculation(ActorBase):
             remove_dirs = self._input["remove_dirs"]
             path = self._input["path"]
             test_me = self._input["test_me"]
-            files_created = tufdel.main(path=str(path),
-                                        fas_file_name=str(ref_seq_file),
-                                        chromosome=chromosome,
-                                        chr_idx=chromosome_idx,
-                                        viterbi_file=str(viterbi_path_filename),
-                                        nucleods_path=str(nucleods_path),
-                                        remove_dirs=remove_dirs, test_me=test_me)
+
+            # every region has its own TUF-DEL-TUF instance
+            # so regions can be processed concurrently
+            tuf_del_tuf = tufdel.TufDelTuf(path=str(path),
+                                           fas_file_name=str(ref_seq_file),
+                                           chromosome=chromosome,
+                                           chr_idx=chromosome_idx,
+                                           viterbi_file=str(viterbi_path_filename),
+                                           nucleods_path=str(nucleods_path),
+                                           remove_dirs=remove_dirs, test_me=test_me,
+                                           enable_spade=self._input.get("enable_spade", ENABLE_SPADE),
+                                           spade_n_workers=self._input.get("spade_n_workers", SPADE_N_WORKERS),
+                                           spade_cache_path=self._input.get("spade_cache_path", SPADE_CACHE_PATH))
+            files_created = tuf_del_tuf.run()
 
             self.output["files_created"] = files_created
             self.state = JobResultEnum.SUCCESS
@@ -145,6 +241,39 @@ class SpadeCalculation(ActorBase):
         return self._output
 
 
+def _group_spade_worker(actor_input):
+    spade_calculator = SpadeCalculation(input=actor_input)
+    spade_calculator.start()
+    return spade_calculator.output
+
+
+def compute_group_spade(actor_inputs, n_workers):
+    """
+    Run the SpadeCalculation of the regions described by the
+    inputs in actor_inputs with a pool of n_workers processes.
+    Every region writes in its own path and the caller merges
+    the files created. Returns the SpadeCalculation outputs
+    in the order of actor_inputs
+    """
+
+    if n_workers > 1 and len(actor_inputs) > 1:
+
+        # daemonic processes e.g. Celery workers get a billiard
+        # pool and run the regions serially if billiard is missing
+        executor = process_pool_executor(max_workers=n_workers)
+
+        if executor is not None:
+            print("{0} Running SPADE for {1} regions with {2} processes".format(INFO, len(actor_inputs),
+                                                                                 n_workers))
+            with executor:
+                return list(executor.map(_group_spade_worker, actor_inputs))
+
+        print("{0} Cannot start a process pool in a daemonic process. "
+              "SPADE runs serially for the regions".format(WARNING))
+
+    return [_group_spade_worker(actor_input) for actor_input in actor_inputs]
+
+
 class ViterbiPathActor(ActorBase):
     """
     Actor for computing the Viterbi paths
@@ -8,6 +8,13 @@ import re
 
 from compute_engine.src.windows import Window
 from compute_engine.src.constants import INFO
+from compute_engine.src.exceptions import Error
+from compute_engine.src.utils import partition_range
+from compute_engine.src.reference_cache import get_reference_cache
+from compute_engine.src.cengine_configuration import WINDOW_ARRAYS_BLOCK_SIZE
+
+# backends for computing the window statistics
+STATISTICS_BACKENDS = ['pileup', 'numpy']
 
 
 def extract_windows(chromosome, ref_filename, bam_filename, **args):
@@ -21,32 +28,129 @@ def extract_windows(chromosome, ref_filename, bam_filename, **args):
     """
 
     windowcapacity = args["windowsize"]
-    start_idx = args["start_idx"]
-    end_idx = args["end_idx"]
 
     # the windows list
     windows = []
+    for wcounter, sam_output in enumerate(extract_samdata(chromosome=chromosome,
+                                                          ref_filename=ref_filename,
+                                                          bam_filename=bam_filename,
+                                                          **args)):
+        windows.append(Window(idx=wcounter,
+                              capacity=windowcapacity,
+                              samdata=sam_output))
+
+    return windows
+
+
+def extract_samdata(chromosome, ref_filename, bam_filename, **args):
+    """
+    Returns the list of the samdata dictionaries of the
+    windows of the region [args['start_idx'], args['end_idx'])
+    computed with the backend set in
+    args['sam_read_config']['statistics_backend']
+    """
 
-    with pysam.FastaFile(ref_filename) as fastafile:
-        print("{0} Reference file: {1}".format(INFO, fastafile.filename))
+    backend = args["sam_read_config"].get("statistics_backend", "pileup")
 
-        with pysam.AlignmentFile(bam_filename, "rb") as sam_file:
-            print("{0} Sam file: {1} ".format(INFO, sam_file.filename))
+    if backend not in STATISTICS_BACKENDS:
+        raise Error("Statistics backend '{0}' not in {1}".format(backend, STATISTICS_BACKENDS))
 
-            wcounter = 0
-            while start_idx < end_idx:
-                sam_output = window_sam_file(chromosome=chromosome,
-                                             sam_file=sam_file,
-                                             fastafile=fastafile,
-                                             start=start_idx, end=start_idx + windowcapacity,
-                                             **args)
-                windows.append(Window(idx=wcounter,
-                                      capacity=windowcapacity,
-                                      samdata=sam_output))
+    if backend == 'numpy':
+        region_windows = window_sam_region_arrays
+    else:
+        region_windows = window_sam_region
 
-                start_idx += windowcapacity
-                wcounter += 1
+    # the reference is read through the block cache of the
+    # process so the chunks of the BAM files share the reads
+    fastafile = get_reference_cache(fasta_file=ref_filename)
+    print("{0} Reference file: {1}".format(INFO, fastafile.filename))
+
+    with pysam.AlignmentFile(bam_filename, "rb") as sam_file:
+        print("{0} Sam file: {1} ".format(INFO, sam_file.filename))
+
+        # walk the pileup of the region once and
+        # cut the windows out of the stream
+        samdata = list(region_windows(chromosome=chromosome,
+                                      sam_file=sam_file,
+                                      fastafile=fastafile,
+                                      start=args["start_idx"], end=args["end_idx"],
+                                      windowsize=args["windowsize"],
+                                      sam_read_config=args["sam_read_config"]))
+
+    print("{0} Reference cache statistics {1}".format(INFO, fastafile.statistics()))
+    return samdata
+
+
+def partition_windows(start, end, windowsize, n_chunks):
+    """
+    Partition the windows of the region [start, end) into at
+    most n_chunks contiguous chunks. Chunk boundaries fall on
+    window boundaries so that windowing a chunk gives exactly
+    the windows of the region. Returns a list of
+    (first window index, chunk start, chunk end) tuples
+    """
 
+    if n_chunks <= 0:
+        raise Error("Number of chunks should be positive")
+
+    n_windows = (end - start + windowsize - 1) // windowsize
+    n_chunks = min(n_chunks, n_windows)
+
+    if n_chunks == 0:
+        return []
+
+    chunks = []
+    for w_start, w_end in partition_range(start=0, end=n_windows, npieces=n_chunks):
+        c_start = start + w_start * windowsize
+        c_end = min(start + w_end * windowsize, end)
+        chunks.append((w_start, c_start, c_end))
+    return chunks
+
+
+def extract_windows_concurrently(chromosome, ref_filename, bam_filenames,
+                                 executor, n_chunks, **args):
+    """
+    Extract the windows of every BAM file in bam_filenames
+    over the region [args['start_idx'], args['end_idx']).
+    The region is chunked by coordinate range and the chunks
+    of all the files are submitted to the given
+    concurrent.futures executor before any result is
+    collected. Every worker opens its own file handles.
+    Returns a list of window lists, in the order of
+    bam_filenames, with the windows in region order
+    :param chromosome: chromosome name (str)
+    :param ref_filename: The reference file
+    :param bam_filenames: The BAM files to window
+    :param executor: A concurrent.futures.Executor
+    :param n_chunks: The number of chunks of the region
+    :return: list of lists of Window
+    """
+
+    windowcapacity = args["windowsize"]
+    chunks = partition_windows(start=args["start_idx"], end=args["end_idx"],
+                               windowsize=windowcapacity, n_chunks=n_chunks)
+
+    futures = []
+    for bam_filename in bam_filenames:
+        bam_futures = []
+        for w_start, c_start, c_end in chunks:
+            chunk_args = dict(args)
+            chunk_args["start_idx"] = c_start
+            chunk_args["end_idx"] = c_end
+            bam_futures.append((w_start, executor.submit(extract_samdata, chromosome,
+                                                         ref_filename, bam_filename,
+                                                         **chunk_args)))
+        futures.append(bam_futures)
+
+    windows = []
+    for bam_futures in futures:
+        bam_windows = []
+        for w_start, future in bam_futures:
+            for wcounter, sam_output in enumerate(future.result()):
+                bam_windows.append(Window(idx=w_start + wcounter,
+                                          capacity=windowcapacity,
+                                          samdata=sam_output))
+        windows.append(bam_windows)
     return windows
 
 
@@ -132,61 +236,832 @@ def window_sam_file(chromosome, sam_file, fastafile,
             nalign.append(0)
             start += 1
 
-        # Metrics for read depth
-        allmean = np.mean(nseq)  # metrics, may not need all these
-        qmean = np.mean(nalign)
-        allmedian = np.median(nseq)
-        qmedian = np.median(nalign)
-        allsum = np.sum(nseq)
-        qsum = np.sum(nalign)
-
-        # GC content
-        gcr = (refseq.count('G') + refseq.count('g') + refseq.count('C') + refseq.count('c')) / len(refseq)
-        gapAlert = True if 'N' in refseq or 'n' in refseq else False
-
-        gcmax = 0
-        gcmaxlen = 0
-        gcmin = 0
-        gcminlen = 0
-        for bs in samseq:
-            minelgc = None
-            lenminelgc = None
-            maxelgc = None
-            lenmaxelgc = None
-            for el in bs:
-                el = el.split('-')
-                ellen = len(re.sub('[\+\-_Nn*]', '', el[0]))
-                elgc = len(re.sub('[\+\-_Nn*AaTt]', '', el[0]))
-                if minelgc == None or elgc < minelgc:
-                    minelgc = elgc
-                    lenminelgc = ellen
-                if maxelgc == None or elgc > maxelgc:
-                    maxelgc = elgc
-                    lenmaxelgc = ellen
-            gcmax += maxelgc
-            gcmaxlen += lenmaxelgc
-            gcmin += minelgc
-            gcminlen += lenminelgc
-
-        gcmax = gcmax / gcmaxlen if gcmaxlen > 0 else None
-        gcmin = gcmin / gcminlen if gcminlen > 0 else None
-
-        output = {'gcmax': gcmax,
-                  'gcmin': gcmin,
-                  'gcr': gcr,
-                  'gapAlert': gapAlert,
-                  'allmean': allmean,
-                  'qmean': qmean,
-                  'allmedian': allmedian,
-                  'allsum': allsum,
-                  'qsum': qsum,
-                  'qmedian': qmedian,
-                  'errorAlert': errorAlert,
-                  'head': head,
-                  'start': pos[0],
-                  'end': pos[-1],
-                  'minLen': gcminlen
-                  }
-        return output
+        return window_statistics(refseq=refseq, samseq=samseq, pos=pos,
+                                 nseq=nseq, nalign=nalign, head=head,
+                                 errorAlert=errorAlert)
     except MemoryError as e:
         raise
+
+
+def window_statistics(refseq, samseq, pos, nseq, nalign, head, errorAlert):
+    """
+    Compute the samdata dictionary of a window from the
+    per-base quantities collected while walking the pileup
+    :param refseq: The reference sequence covered by the window
+    :param samseq: Per-base sets of the read bases or '_'
+    :param pos: The reference positions visited
+    :param nseq: Per-base number of reads
+    :param nalign: Per-base number of quality limited reads
+    :param head: Number of reads starting in the window
+    :param errorAlert: Whether reading a pileup column failed
+    :return: The samdata dictionary consumed by Window
+    """
+
+    # Metrics for read depth
+    allmean = np.mean(nseq)  # metrics, may not need all these
+    qmean = np.mean(nalign)
+    allmedian = np.median(nseq)
+    qmedian = np.median(nalign)
+    allsum = np.sum(nseq)
+    qsum = np.sum(nalign)
+
+    # GC content
+    gcr = (refseq.count('G') + refseq.count('g') + refseq.count('C') + refseq.count('c')) / len(refseq)
+    gapAlert = True if 'N' in refseq or 'n' in refseq else False
+
+    gcmax = 0
+    gcmaxlen = 0
+    gcmin = 0
+    gcminlen = 0
+    for bs in samseq:
+        minelgc = None
+        lenminelgc = None
+        maxelgc = None
+        lenmaxelgc = None
+        for el in bs:
+            el = el.split('-')
+            ellen = len(re.sub('[\+\-_Nn*]', '', el[0]))
+            elgc = len(re.sub('[\+\-_Nn*AaTt]', '', el[0]))
+            if minelgc == None or elgc < minelgc:
+                minelgc = elgc
+                lenminelgc = ellen
+            if maxelgc == None or elgc > maxelgc:
+                maxelgc = elgc
+                lenmaxelgc = ellen
+        gcmax += maxelgc
+        gcmaxlen += lenmaxelgc
+        gcmin += minelgc
+        gcminlen += lenminelgc
+
+    gcmax = gcmax / gcmaxlen if gcmaxlen > 0 else None
+    gcmin = gcmin / gcminlen if gcminlen > 0 else None
+
+    output = {'gcmax': gcmax,
+              'gcmin': gcmin,
+              'gcr': gcr,
+              'gapAlert': gapAlert,
+              'allmean': allmean,
+              'qmean': qmean,
+              'allmedian': allmedian,
+              'allsum': allsum,
+              'qsum': qsum,
+              'qmedian': qmedian,
+              'errorAlert': errorAlert,
+              'head': head,
+              'start': pos[0],
+              'end': pos[-1],
+              'minLen': gcminlen
+              }
+    return output
+
+
+class _WindowAccumulator(object):
+    """
+    Collects the per-base quantities of a single
+    window while the region pileup is streamed. The
+    bookkeeping follows window_sam_file so that the
+    produced samdata are identical
+    """
+
+    __slots__ = ('start', 'end', 'cursor', 'samseq', 'pos', 'nseq',
+                 'nalign', 'head', 'failed', 'errorAlert')
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+        # the next reference position to be
+        # visited in the window
+        self.cursor = start
+        self.samseq = []
+        self.pos = []
+        self.nseq = []
+        self.nalign = []
+        self.head = 0
+
+        # positions for which the reference base
+        # is not part of refseq
+        self.failed = []
+        self.errorAlert = False
+
+    def fill_to(self, position):
+        """
+        Fill in the positions that have no reads
+        up to but excluding the given position
+        """
+        n_fill = position - self.cursor
+        if n_fill > 0:
+            self.samseq.extend(['_'] * n_fill)
+            self.pos.extend(range(self.cursor, position))
+            self.nseq.extend([0] * n_fill)
+            self.nalign.extend([0] * n_fill)
+            self.cursor = position
+
+    def add_column(self, pcol, qual, add_indels):
+
+        if qual is not None:
+            pcol.set_min_base_quality(qual)
+
+            # fill in start when there are no reads present
+            self.fill_to(position=pcol.reference_pos)
+
+            # collect metrics for pileup column
+            n_aligned = pcol.get_num_aligned()
+            self.pos.append(self.cursor)
+            self.nseq.append(pcol.nsegments)
+            self.nalign.append(n_aligned)
+
+            for p in pcol.pileups:
+                self.head += p.is_head
+
+            # get bases from reads at pileup column (quality limited)
+            try:
+                if n_aligned == 0:
+                    self.samseq.append('_')
+                else:
+                    x = pcol.get_query_sequences(add_indels=add_indels)
+                    self.samseq.append(set([a.upper() for a in x]))
+            except Exception as e:  # may fail if large number of reads
+                try:
+                    x = pcol.get_query_sequences(add_indels=add_indels)
+                    self.samseq.append(set([a.upper() for a in x]))
+                except Exception as e:
+                    self.failed.append(self.cursor)
+                    self.errorAlert = True
+
+            self.cursor += 1
+
+    def finalize(self, refseq_region, region_start):
+
+        # fill in end if no reads at end of window
+        self.fill_to(position=self.end)
+
+        if len(self.pos) != 0:
+            refseq = refseq_region[self.pos[0] - region_start: self.pos[-1] + 1 - region_start]
+        else:
+            refseq = ''
+
+        if len(self.failed) != 0:
+            refseq = ''.join([base for i, base in enumerate(refseq)
+                              if self.pos[0] + i not in self.failed])
+
+        return window_statistics(refseq=refseq, samseq=self.samseq,
+                                 pos=self.pos, nseq=self.nseq,
+                                 nalign=self.nalign, head=self.head,
+                                 errorAlert=self.errorAlert)
+
+
+def window_sam_region(chromosome, sam_file, fastafile,
+                      start, end, windowsize, **kwargs):
+    """
+    Stream the windows of the region [start, end) by walking
+    the pileup of the region once and fetching the reference
+    slice of the region with a single call. Windows have
+    capacity windowsize and the last window may extend beyond
+    end as in extract_windows. Yields the samdata dictionary
+    of each window in order
+    :param chromosome: chromosome name (str)
+    :param sam_file: An open pysam.AlignmentFile
+    :param fastafile: An open pysam.FastaFile or a ReferenceCache
+    :param start: The start of the region
+    :param end: The end of the region
+    :param windowsize: The capacity of the windows
+    :return: generator of samdata dictionaries
+    """
+
+    ignore_orphans = kwargs['sam_read_config']['ignore_orphans']
+    max_depth = kwargs['sam_read_config']['max_depth']
+    qual = kwargs['sam_read_config'].get('quality_threshold', None)
+    add_indels = kwargs['sam_read_config']['add_indels']
+
+    if end <= start:
+        return
+
+    n_windows = (end - start + windowsize - 1) // windowsize
+    region_end = start + n_windows * windowsize
+
+    refseq_region = fastafile.fetch(chromosome, start, region_end)
+
+    # columns outside the region are never
+    # used so always truncate the pileup
+    columns = sam_file.pileup(chromosome, start, region_end,
+                              truncate=True,
+                              ignore_orphans=ignore_orphans,
+                              max_depth=max_depth)
+
+    w_start = start
+    window = _WindowAccumulator(start=w_start, end=w_start + windowsize)
+    for pcol in columns:
+
+        reference_pos = pcol.reference_pos
+
+        # the column belongs to a later window
+        while reference_pos >= window.end:
+            yield window.finalize(refseq_region=refseq_region, region_start=start)
+            w_start += windowsize
+            window = _WindowAccumulator(start=w_start, end=w_start + windowsize)
+
+        window.add_column(pcol=pcol, qual=qual, add_indels=add_indels)
+
+    while w_start < end:
+        yield window.finalize(refseq_region=refseq_region, region_start=start)
+        w_start += windowsize
+        window = _WindowAccumulator(start=w_start, end=w_start + windowsize)
+
+
+# CIGAR operations of the read bases, of the reads in a
+# pileup column and of the operations consuming the
+# reference and the query
+_CIGAR_MATCH_OPS = [0, 7, 8]
+_CIGAR_PILEUP_OPS = [0, 2, 3, 7, 8]
+_CIGAR_REF_OPS = [0, 2, 3, 7, 8]
+_CIGAR_QUERY_OPS = [0, 1, 4, 7, 8]
+_CIGAR_DEL = 2
+_CIGAR_REF_SKIP = 3
+_CIGAR_INS = 1
+_CIGAR_SOFT_CLIP = 4
+
+# reads the pileup leaves out i.e. unmapped,
+# secondary, QC fail and duplicate reads
+_PILEUP_FLAG_FILTER = 0x4 | 0x100 | 0x200 | 0x400
+_PILEUP_DEFAULT_MAX_DEPTH = 8000
+
+# GC count and length, as in window_statistics,
+# of the read bases by ASCII code
+_BASE_GC = np.ones(256, dtype=np.int64)
+_BASE_GC[np.frombuffer(b'+-_Nn*AaTt', dtype=np.uint8)] = 0
+_BASE_LEN = np.ones(256, dtype=np.int64)
+_BASE_LEN[np.frombuffer(b'+-_Nn*', dtype=np.uint8)] = 0
+
+
+def _region_reads(sam_file, chromosome, start, end, ignore_orphans, max_depth):
+    """
+    Yields the reads of the region [start, end) that the
+    pileup uses in file order. As in bam_plp_push of htslib a
+    read is left out when it is not the first read starting at
+    its position and max_depth reads still cover the position
+    """
+
+    # pysam keeps the default of htslib for a max_depth of 0
+    max_depth = max_depth or _PILEUP_DEFAULT_MAX_DEPTH
+
+    # the ends of the reads kept so far and the last start
+    ends = []
+    last_start = None
+    for read in sam_file.fetch(chromosome, start, end):
+
+        if read.flag & _PILEUP_FLAG_FILTER or read.query_sequence is None:
+            continue
+
+        if ignore_orphans and read.is_paired and not read.is_proper_pair:
+            continue
+
+        if read.reference_start == last_start and len(ends) >= max_depth:
+            ends = [r_end for r_end in ends if r_end >= read.reference_start]
+            if len(ends) >= max_depth:
+                continue
+
+        last_start = read.reference_start
+        ends.append(read.reference_end)
+        yield read
+
+
+def _first_mate_keeps(query_name):
+    """
+    Whether the first mate of the template keeps the quality
+    of the bases the mates agree on. The pileup picks the mate
+    with the Wang hash of the X31 hash of the read name
+    """
+
+    h = ord(query_name[0]) if query_name else 0
+    for c in query_name[1:]:
+        h = (h * 31 + ord(c)) & 0xffffffff
+
+    h = (h + ~(h << 15)) & 0xffffffff
+    h ^= h >> 10
+    h = (h + (h << 3)) & 0xffffffff
+    h ^= h >> 6
+    h = (h + ~(h << 11)) & 0xffffffff
+    h ^= h >> 16
+    return bool(h & 1)
+
+
+def _overlapping_mates(reads):
+    """
+    Returns the (first mate, second mate, first mate keeps)
+    rows of the pairs whose overlap the pileup resolves.
+    See overlap_push of htslib
+    """
+
+    first = {}
+    pairs = []
+    for idx, read in enumerate(reads):
+
+        if read.mate_is_unmapped or not read.is_proper_pair:
+            continue
+
+        if read.next_reference_id >= 0 and read.reference_id != read.next_reference_id:
+            continue
+
+        if abs(read.template_length) >= 2 * read.query_length and \
+                read.next_reference_start >= read.reference_end:
+            continue
+
+        mate = first.pop(read.query_name, None)
+        if mate is not None:
+            pairs.append((mate, idx, int(_first_mate_keeps(query_name=read.query_name))))
+        elif read.next_reference_start >= read.reference_start:
+            first[read.query_name] = idx
+
+    return np.array(pairs, dtype=np.int64).reshape(len(pairs), 3)
+
+
+def _tweak_overlap_qualities(pairs, e_read, e_pos, e_base, codes, quals, walk_start, walk_end):
+    """
+    Change the qualities of the bases where the mates of a
+    pair overlap as the pileup does. When the mates agree one
+    of them, see _first_mate_keeps, gets the sum of the
+    qualities capped at 200, otherwise the mate with the
+    higher quality keeps 80% of it. The other mate gets
+    quality 0. The positions [walk_start, walk_end) of a pair,
+    around its deletions and reference skips, are left to
+    _tweak_pair_qualities
+    """
+
+    if len(pairs) == 0:
+        return
+
+    pair_of = np.full(e_read.max() + 1, -1, dtype=np.int64)
+    pair_of[pairs[:, 0]] = np.arange(len(pairs))
+    pair_of[pairs[:, 1]] = np.arange(len(pairs))
+
+    # the elements of the first mate come before those of the second
+    e_pair = pair_of[e_read]
+    select = np.flatnonzero((e_base >= 0) & (e_pair >= 0))
+    walked = (e_pos[select] >= walk_start[e_pair[select]]) & (e_pos[select] < walk_end[e_pair[select]])
+    select = select[~walked]
+    pos_min = e_pos[select].min() if len(select) != 0 else 0
+    key = pair_of[e_read[select]] * (e_pos.max() - pos_min + 1) + e_pos[select] - pos_min
+    select = select[np.argsort(key, kind='stable')]
+
+    # the bases of the two mates at the same position are next to each other
+    pair = pair_of[e_read[select]]
+    same = np.flatnonzero((pair[1:] == pair[:-1]) & (e_pos[select][1:] == e_pos[select][:-1]))
+    a = e_base[select[same]]
+    b = e_base[select[same + 1]]
+    a_keeps = pairs[pair[same], 2] == 1
+
+    qa = quals[a]
+    qb = quals[b]
+    total = np.minimum(qa + qb, 200)
+    agree = codes[a] == codes[b]
+    a_wins = qa > qb
+    tie = qa == qb
+
+    quals[a] = np.where(agree, np.where(a_keeps, total, 0),
+                        np.where(a_wins | (tie & a_keeps), (0.8 * qa).astype(np.int64), 0))
+    quals[b] = np.where(agree, np.where(a_keeps, 0, total),
+                        np.where(a_wins | (tie & a_keeps), 0, (0.8 * qb).astype(np.int64)))
+
+
+class _MateCursor(object):
+    """
+    Walks the aligned bases of a read in reference order
+    as cigar_iref2iseq_set and cigar_iref2iseq_next of htslib
+    """
+
+    __slots__ = ('cigar', 'k', 'icig', 'iseq', 'iref', 'ret')
+
+    def __init__(self, cigar, iref):
+        self.cigar = cigar
+        self.k = 0
+        self.icig = 0
+        self.iseq = 0
+        self.iref = 0
+        self.ret = self._set(pos=iref)
+
+    def _set(self, pos):
+
+        if pos < 0:
+            return -1
+
+        while self.k < len(self.cigar):
+            op, n = self.cigar[self.k]
+            self.k += 1
+
+            if op in _CIGAR_MATCH_OPS:
+                pos -= n
+                if pos < 0:
+                    self.k -= 1
+                    self.icig = n + pos
+                    self.iseq += self.icig
+                    self.iref += self.icig
+                    return 0
+                self.iseq += n
+                self.iref += n
+            elif op == _CIGAR_DEL or op == _CIGAR_REF_SKIP:
+                pos = max(pos - n, 0)
+                self.iref += n
+            elif op == _CIGAR_INS or op == _CIGAR_SOFT_CLIP:
+                self.iseq += n
+            self.icig = 0
+
+        self.iseq = -1
+        return -1
+
+    def next(self):
+
+        while self.k < len(self.cigar):
+            op, n = self.cigar[self.k]
+
+            if op in _CIGAR_MATCH_OPS and self.icig < n - 1:
+                self.iseq += 1
+                self.icig += 1
+                self.iref += 1
+                return 0
+
+            if op == _CIGAR_DEL or op == _CIGAR_REF_SKIP:
+                self.iref += n
+            elif op == _CIGAR_INS or op == _CIGAR_SOFT_CLIP:
+                self.iseq += n
+            self.icig = -1
+            self.k += 1
+
+        self.iseq = -1
+        self.iref = -1
+        return -1
+
+    def after_deletion(self):
+        return self.k > 0 and self.cigar[self.k - 1][0] == _CIGAR_DEL
+
+
+def _tweak_pair_qualities(a, b, a_codes, b_codes, a_quals, b_quals, a_keeps, start, stop):
+    """
+    Change the qualities of the overlapping bases of the mates
+    a and b in place as tweak_overlap_quality of htslib does.
+    The bases of a mate over a deletion of the other are
+    treated as mismatches. The walk begins at start, before
+    which the mates have no deletions or reference skips, and
+    returns the first position past stop where the mates line
+    up again or None if the walk reaches the end of a mate
+    """
+
+    a_pos = a.reference_start
+    b_pos = b.reference_start
+    iref = start
+
+    a_cur = _MateCursor(cigar=a.cigartuples, iref=iref - a_pos)
+    if a_cur.ret < 0:
+        return None
+
+    b_cur = _MateCursor(cigar=b.cigartuples, iref=iref - b_pos)
+    if b_cur.ret < 0:
+        return None
+
+    while True:
+
+        while a_cur.ret >= 0 and 0 <= a_cur.iref < iref - a_pos:
+            a_cur.ret = a_cur.next()
+        if a_cur.ret < 0:
+            return None
+
+        while b_cur.ret >= 0 and 0 <= b_cur.iref < iref - b_pos:
+            b_cur.ret = b_cur.next()
+        if b_cur.ret < 0:
+            return None
+
+        iref = max(iref, a_cur.iref + a_pos, b_cur.iref + b_pos) + 1
+
+        # catch up the mate that is behind a deletion of the other
+        if a_cur.iref + a_pos != b_cur.iref + b_pos:
+            if a_cur.iref + a_pos < b_cur.iref + b_pos and b_cur.after_deletion():
+                behind, ahead, behind_pos, ahead_pos = a_cur, b_cur, a_pos, b_pos
+                behind_quals, behind_keeps = a_quals, a_keeps
+            elif a_cur.after_deletion():
+                behind, ahead, behind_pos, ahead_pos = b_cur, a_cur, b_pos, a_pos
+                behind_quals, behind_keeps = b_quals, not a_keeps
+            else:
+                continue
+
+            while True:
+                behind_quals[behind.iseq] = int(0.8 * behind_quals[behind.iseq]) if behind_keeps else 0
+                behind.ret = behind.next()
+                if behind.ret < 0:
+                    return None
+                if behind.iref + behind_pos >= ahead.iref + ahead_pos:
+                    break
+
+        if a_cur.iseq >= len(a_quals) or b_cur.iseq >= len(b_quals):
+            return None
+
+        # past stop the mates overlap base to base
+        if a_cur.iref + a_pos == b_cur.iref + b_pos >= stop:
+            return a_cur.iref + a_pos
+
+        qa = a_quals[a_cur.iseq]
+        qb = b_quals[b_cur.iseq]
+        if a_codes[a_cur.iseq] == b_codes[b_cur.iseq]:
+            total = min(qa + qb, 200)
+            a_quals[a_cur.iseq] = total if a_keeps else 0
+            b_quals[b_cur.iseq] = 0 if a_keeps else total
+        elif qa > qb or (qa == qb and a_keeps):
+            a_quals[a_cur.iseq] = int(0.8 * qa)
+            b_quals[b_cur.iseq] = 0
+        else:
+            a_quals[a_cur.iseq] = 0
+            b_quals[b_cur.iseq] = int(0.8 * qb)
+
+
+def _region_pileup_arrays(reads, start, end, qual, add_indels):
+    """
+    Returns the per-base arrays of the region [start, end) that
+    window_sam_file computes from the pileup columns i.e. the
+    number of reads, the number of quality limited reads, the
+    reads starting at the position and the GC count and length
+    of the read elements with the minimum and maximum GC count.
+    The reads are those of _region_reads that cover the region
+    and the first one after it if any. The CIGAR strings of the
+    reads are expanded into arrays of the read elements of
+    every position once and the arrays are computed with bincount
+    """
+
+    length = end - start
+
+    arrays = {name: np.zeros(length, dtype=np.int64)
+              for name in ['nseq', 'nalign', 'head', 'gc_min', 'len_min', 'gc_max', 'len_max']}
+
+    if len(reads) == 0:
+        return arrays
+
+    # the query bases and qualities of all the reads
+    codes = np.frombuffer("".join([read.query_sequence for read in reads]).upper().encode(), dtype=np.uint8)
+    quals = np.concatenate([np.asarray(read.query_qualities, dtype=np.int64)
+                            if read.query_qualities is not None
+                            else np.full(read.query_length, 255, dtype=np.int64) for read in reads])
+    q_lengths = np.array([read.query_length for read in reads], dtype=np.int64)
+    q_offsets = np.concatenate(([0], np.cumsum(q_lengths)[:-1]))
+    r_starts = np.array([read.reference_start for read in reads], dtype=np.int64)
+
+    # the CIGAR operations of all the reads
+    cigars = [read.cigartuples for read in reads]
+    op_read = np.repeat(np.arange(len(reads)), [len(cigar) for cigar in cigars])
+    ops = np.array([op for cigar in cigars for op in cigar], dtype=np.int64).reshape(-1, 2)
+    op_code = ops[:, 0]
+    op_len = ops[:, 1]
+
+    # the reference and query offsets of the operations in their reads
+    ref_len = np.where(np.isin(op_code, _CIGAR_REF_OPS), op_len, 0)
+    query_len = np.where(np.isin(op_code, _CIGAR_QUERY_OPS), op_len, 0)
+    first_op = np.concatenate(([0], np.cumsum([len(cigar) for cigar in cigars])[:-1]))
+    ref_off = np.cumsum(ref_len) - ref_len
+    ref_off -= ref_off[first_op][op_read]
+    query_off = np.cumsum(query_len) - query_len
+    query_off -= query_off[first_op][op_read]
+
+    # an element for every read and position in its pileup columns
+    in_pileup = np.flatnonzero(np.isin(op_code, _CIGAR_PILEUP_OPS))
+    n_elements = op_len[in_pileup]
+    e_op = np.repeat(in_pileup, n_elements)
+    step = np.arange(n_elements.sum()) - np.repeat(np.cumsum(n_elements) - n_elements, n_elements)
+    e_read = op_read[e_op]
+    e_pos = r_starts[e_read] + ref_off[e_op] + step
+    is_match = np.isin(op_code[e_op], _CIGAR_MATCH_OPS)
+
+    # the index of the base of the element in codes, or
+    # of the next base of a deletion or a reference skip
+    e_qpos = query_off[e_op] + np.where(is_match, step, 0)
+    e_base = np.where(is_match, q_offsets[e_read] + e_qpos, -1)
+
+    # mates with deletions or reference skips where they
+    # overlap are walked as htslib does
+    pairs = _overlapping_mates(reads=reads)
+    raw_quals = quals.copy()
+    r_ends = np.array([read.reference_end for read in reads], dtype=np.int64)
+    overlap_start = np.zeros(len(reads), dtype=np.int64)
+    overlap_end = np.zeros(len(reads), dtype=np.int64)
+    overlap_start[pairs[:, 0]] = overlap_start[pairs[:, 1]] = r_starts[pairs[:, 1]]
+    overlap_end[pairs[:, 0]] = overlap_end[pairs[:, 1]] = np.minimum(r_ends[pairs[:, 0]], r_ends[pairs[:, 1]])
+
+    gaps = np.flatnonzero(np.isin(op_code, [_CIGAR_DEL, _CIGAR_REF_SKIP]))
+    gap_read = op_read[gaps]
+    gap_start = np.maximum(r_starts[gap_read] + ref_off[gaps], overlap_start[gap_read])
+    gap_end = r_starts[gap_read] + ref_off[gaps] + op_len[gaps]
+    in_overlap = (gap_end > overlap_start[gap_read]) & (gap_start < overlap_end[gap_read])
+
+    # the first and last gap positions of the mates where they overlap
+    first_gap = np.full(len(reads), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(first_gap, gap_read[in_overlap], gap_start[in_overlap])
+    last_gap = np.full(len(reads), -1, dtype=np.int64)
+    np.maximum.at(last_gap, gap_read[in_overlap], gap_end[in_overlap])
+    walk_start = np.minimum(first_gap[pairs[:, 0]], first_gap[pairs[:, 1]])
+    walk_stop = np.maximum(last_gap[pairs[:, 0]], last_gap[pairs[:, 1]])
+    walked = np.flatnonzero(walk_stop >= 0)
+
+    walk_end = np.full(len(pairs), -1, dtype=np.int64)
+    for pair in walked.tolist():
+        a, b, a_keeps = pairs[pair].tolist()
+        a_slice = slice(q_offsets[a], q_offsets[a] + q_lengths[a])
+        b_slice = slice(q_offsets[b], q_offsets[b] + q_lengths[b])
+        resync = _tweak_pair_qualities(a=reads[a], b=reads[b], a_codes=codes[a_slice], b_codes=codes[b_slice],
+                                       a_quals=quals[a_slice], b_quals=quals[b_slice], a_keeps=a_keeps == 1,
+                                       start=int(walk_start[pair]), stop=int(walk_stop[pair]))
+        walk_end[pair] = resync if resync is not None else np.iinfo(np.int64).max
+
+    _tweak_overlap_qualities(pairs=pairs, e_read=e_read, e_pos=e_pos, e_base=e_base, codes=codes,
+                             quals=quals, walk_start=walk_start, walk_end=walk_end)
+
+    # only the columns of the region
+    keep = (e_pos >= start) & (e_pos < end)
+    idx = e_pos[keep] - start
+    arrays['nseq'] = np.bincount(idx, minlength=length)
+
+    if qual is None:
+        return arrays
+
+    # deletions and reference skips use the quality of the next
+    # base. The pileup changes the qualities of the first mate
+    # when it adds the second, and it adds the reads up to the
+    # first one starting after a column before the column, so
+    # until then they see the unchanged qualities
+    second_mate = np.full(len(reads), -1, dtype=np.int64)
+    second_mate[pairs[:, 0]] = pairs[:, 1]
+    unchanged = ~is_match & (second_mate[e_read] > np.searchsorted(r_starts, e_pos, side='right'))
+    in_query = e_qpos < q_lengths[e_read]
+    q_idx = np.where(in_query, q_offsets[e_read] + e_qpos, 0)
+    e_qual = np.where(in_query, np.where(unchanged, raw_quals[q_idx], quals[q_idx]), 0)
+    passes = (e_qual >= qual)[keep]
+    arrays['nalign'] = np.bincount(idx[passes], minlength=length)
+
+    is_head = (e_pos == r_starts[e_read])[keep]
+    arrays['head'] = np.bincount(idx[passes & is_head], minlength=length)
+
+    # the GC count and length of the elements. Deletions are *
+    # and reference skips > or < with add_indels, counted as GC
+    # by window_statistics, and empty otherwise. Insertions after an element are +n followed by
+    # the bases after the query position of the element. The
+    # -n of deletions is dropped by window_statistics
+    e_code = codes[np.maximum(e_base, 0)]
+    is_skip = int(add_indels) * (op_code[e_op] == _CIGAR_REF_SKIP).astype(np.int64)
+    e_gc = np.where(is_match, _BASE_GC[e_code], is_skip)
+    e_len = np.where(is_match, _BASE_LEN[e_code], is_skip)
+
+    if add_indels:
+        before_ins = np.flatnonzero((op_code[1:] == _CIGAR_INS) & (op_read[:-1] == op_read[1:]) &
+                                    np.isin(op_code[:-1], _CIGAR_PILEUP_OPS))
+        if len(before_ins) != 0:
+            gc_prefix = np.concatenate(([0], np.cumsum(_BASE_GC[codes])))
+            len_prefix = np.concatenate(([0], np.cumsum(_BASE_LEN[codes])))
+            ins = before_ins + 1
+
+            # the element at the last position of the operation before the insertion
+            last = np.searchsorted(e_op, before_ins, side='right') - 1
+            ins_start = q_offsets[e_read[last]] + e_qpos[last] + 1
+            ins_end = np.minimum(ins_start + op_len[ins], q_offsets[e_read[last]] + q_lengths[e_read[last]])
+            n_digits = np.array([len(str(n)) for n in op_len[ins].tolist()], dtype=np.int64)
+
+            e_gc[last] += n_digits + gc_prefix[ins_end] - gc_prefix[ins_start]
+            e_len[last] += n_digits + len_prefix[ins_end] - len_prefix[ins_start]
+
+    # the elements with the minimum and the maximum GC count of a
+    # position. Of elements with the same GC count the shortest is
+    # used so the GC count and length are packed into one key
+    idx = idx[passes]
+    e_gc = e_gc[keep][passes]
+    e_len = e_len[keep][passes]
+    if len(idx) != 0:
+        scale = e_len.max() + 1
+        has_reads = np.bincount(idx, minlength=length) != 0
+
+        key_min = np.full(length, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(key_min, idx, e_gc * scale + e_len)
+        key_max = np.full(length, -1, dtype=np.int64)
+        np.maximum.at(key_max, idx, e_gc * scale + scale - 1 - e_len)
+
+        arrays['gc_min'] = np.where(has_reads, key_min // scale, 0)
+        arrays['len_min'] = np.where(has_reads, key_min % scale, 0)
+        arrays['gc_max'] = np.where(has_reads, key_max // scale, 0)
+        arrays['len_max'] = np.where(has_reads, scale - 1 - key_max % scale, 0)
+    return arrays
+
+
+def window_sam_region_arrays(chromosome, sam_file, fastafile,
+                             start, end, windowsize, **kwargs):
+    """
+    Array based alternative of window_sam_region. The region is
+    processed in blocks of whole windows. The per-base read
+    depths and GC counts of a block are computed from its reads
+    with _region_pileup_arrays and the statistics of its windows
+    with reductions over the (n_windows, windowsize) reshaped
+    arrays. Yields the samdata dictionary of each window in order
+    :param chromosome: chromosome name (str)
+    :param sam_file: An open pysam.AlignmentFile
+    :param fastafile: An open pysam.FastaFile or a ReferenceCache
+    :param start: The start of the region
+    :param end: The end of the region
+    :param windowsize: The capacity of the windows
+    :return: generator of samdata dictionaries
+    """
+
+    ignore_orphans = kwargs['sam_read_config']['ignore_orphans']
+    max_depth = kwargs['sam_read_config']['max_depth']
+    qual = kwargs['sam_read_config'].get('quality_threshold', None)
+    add_indels = kwargs['sam_read_config']['add_indels']
+
+    if end <= start:
+        return
+
+    n_windows = (end - start + windowsize - 1) // windowsize
+    region_end = start + n_windows * windowsize
+    block_windows = max(WINDOW_ARRAYS_BLOCK_SIZE // windowsize, 1)
+
+    # the reads are read once for the region. The reads of a block
+    # that reach into the next one are kept for it with their mates,
+    # which can change their qualities past their own end, and the
+    # first read after a block is also used by it, see _region_pileup_arrays
+    reads = _region_reads(sam_file=sam_file, chromosome=chromosome, start=start,
+                          end=region_end, ignore_orphans=ignore_orphans, max_depth=max_depth)
+    block_reads = []
+    next_read = next(reads, None)
+
+    for b_start in range(start, region_end, block_windows * windowsize):
+        b_end = min(b_start + block_windows * windowsize, region_end)
+
+        names = set([read.query_name for read in block_reads if read.reference_end > b_start])
+        block_reads = [read for read in block_reads if read.query_name in names]
+        while next_read is not None and next_read.reference_start < b_end:
+            block_reads.append(next_read)
+            next_read = next(reads, None)
+
+        # without a quality threshold window_sam_file ignores
+        # the reads and every position of a window has no reads
+        arrays = _region_pileup_arrays(reads=block_reads + ([next_read] if next_read is not None else []),
+                                       start=b_start, end=b_end, qual=qual, add_indels=add_indels)
+        if qual is None:
+            arrays = {name: np.zeros_like(values) for name, values in arrays.items()}
+
+        for output in _block_samdata(arrays=arrays, refseq_block=fastafile.fetch(chromosome, b_start, b_end),
+                                     start=b_start, end=b_end, windowsize=windowsize):
+            yield output
+
+
+def _block_samdata(arrays, refseq_block, start, end, windowsize):
+    """
+    Yields the samdata dictionaries of the windows of the block
+    [start, end) from the per-base arrays of _region_pileup_arrays
+    """
+
+    n_windows = (end - start) // windowsize
+    length = end - start
+    shape = (n_windows, windowsize)
+
+    # the reference bases that make up refseq. The fetched
+    # slice is shorter if the block exceeds the chromosome
+    ref = np.zeros(length, dtype=np.uint8)
+    ref[:len(refseq_block)] = np.frombuffer(refseq_block.encode(), dtype=np.uint8)
+    in_ref = (np.arange(length) < len(refseq_block)).reshape(shape)
+
+    ref = ref.reshape(shape)
+    is_gc = np.isin(ref, np.frombuffer(b'GgCc', dtype=np.uint8)) & in_ref
+    is_n = np.isin(ref, np.frombuffer(b'Nn', dtype=np.uint8)) & in_ref
+
+    nseq = arrays['nseq'].reshape(shape)
+    nalign = arrays['nalign'].reshape(shape)
+
+    allsum = nseq.sum(axis=1)
+    qsum = nalign.sum(axis=1)
+    allmean = allsum / windowsize
+    qmean = qsum / windowsize
+    allmedian = np.median(nseq, axis=1)
+    qmedian = np.median(nalign, axis=1)
+
+    # windows past the end of the chromosome have no reference
+    n_ref = in_ref.sum(axis=1)
+    gcr = np.divide(is_gc.sum(axis=1), n_ref, out=np.zeros(n_windows), where=n_ref != 0)
+    gap_alert = is_n.any(axis=1)
+
+    gcmax = arrays['gc_max'].reshape(shape).sum(axis=1)
+    gcmaxlen = arrays['len_max'].reshape(shape).sum(axis=1)
+    gcmin = arrays['gc_min'].reshape(shape).sum(axis=1)
+    gcminlen = arrays['len_min'].reshape(shape).sum(axis=1)
+    head = arrays['head'].reshape(shape).sum(axis=1)
+
+    w_starts = start + np.arange(n_windows) * windowsize
+
+    for w, w_start in enumerate(w_starts.tolist()):
+        output = {'gcmax': gcmax[w] / gcmaxlen[w] if gcmaxlen[w] > 0 else None,
+                  'gcmin': gcmin[w] / gcminlen[w] if gcminlen[w] > 0 else None,
+                  'gcr': float(gcr[w]),
+                  'gapAlert': bool(gap_alert[w]),
+                  'allmean': allmean[w],
+                  'qmean': qmean[w],
+                  'allmedian': allmedian[w],
+                  'allsum': allsum[w],
+                  'qsum': qsum[w],
+                  'qmedian': qmedian[w],
+                  'errorAlert': False,
+                  'head': int(head[w]),
+                  'start': w_start,
+                  'end': w_start + windowsize - 1,
+                  'minLen': int(gcminlen[w])
+                  }
+        yield output
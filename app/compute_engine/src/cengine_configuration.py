@@ -1,4 +1,42 @@
 TREAT_ERRORS_AS_WARNINGS = True
 PRINT_WARNINGS = False
 HAS_PYTORCH = True
-HAS_SKLEARN = True
\ No newline at end of file
+HAS_SKLEARN = True
+
+# number of observations decoded per block by the
+# streaming Viterbi. None decodes the whole sequence at once
+VITERBI_BLOCK_SIZE = 100000
+
+# the engine used for the HMM computations.
+# One of hmm_loader.HMM_ENGINES
+HMM_ENGINE = 'pomegranate'
+
+# maximum number of built HMMs kept
+# in memory by every process
+HMM_CACHE_SIZE = 8
+
+# the format the Viterbi paths are saved in.
+# One of viterbi_path_io.VITERBI_PATH_FORMATS
+VITERBI_PATH_FORMAT = 'txt'
+
+# number of processes running the SPADE jobs of a
+# TUF-DEL-TUF analysis. 1 runs them in the analysis process
+SPADE_N_WORKERS = 4
+
+# directory of the on-disk cache of the SPADE
+# results and its size in bytes. None disables the cache
+SPADE_CACHE_PATH = None
+SPADE_CACHE_MAX_BYTES = 1024 ** 3
+
+# fraction of the size of the SPADE cache the
+# cache is reduced to when it gets full
+SPADE_CACHE_LOW_WATER = 0.9
+
+# size in bases of the blocks the reference is read in and
+# the number of blocks kept in memory by every process
+REFERENCE_BLOCK_SIZE = 64 * 1024
+REFERENCE_CACHE_MAX_BLOCKS = 1024
+
+# number of bases the numpy statistics backend of the
+# windows computes at once. Rounded down to whole windows
+WINDOW_ARRAYS_BLOCK_SIZE = 100000
@@ -16,6 +16,17 @@ categories_words = {'C1': ['RR', 'RY', 'YR', 'YY'],
 # complements
 complement = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
 
+# number of entries of the feature vectors
+N_FEATURES = 12
+
+# index of the bases in BASES and, for every category, the
+# group of every base with the first group of the category 0
+BASES = "ACGT"
+BASE_INDEX = np.full(256, -1, dtype=np.int64)
+BASE_INDEX[np.frombuffer(BASES.encode(), dtype=np.uint8)] = np.arange(len(BASES))
+CATEGORY_GROUPS = np.array([[0 if base in list(categories[C].values())[0] else 1 for base in BASES]
+                            for C in categories], dtype=np.int64)
+
 
 def reverse_complement(seq):
     t = ''
@@ -172,109 +183,92 @@ def count_words(word, seq):
     return count
 
 
-def sequence_feature_vector_from_counts(seq, k=2):
+def sequence_words(seq, k=2):
     """
-       Build the feature vector for the given sequence using
-       a word size k=2
+    Returns the index of every word of the projections of the
+    sequence into the categories, in the order of the feature
+    vector, and its 1-based position in the projection. The
+    projections are computed with the CATEGORY_GROUPS lookup
+    table from a single encoding of the sequence. As
+    categories_words has only words of two letters no word
+    is returned when k is not 2
     """
 
-    # placeholder for shannon entropies
-    feature_vec = []
-
-    for C in categories:
-
-        # map the bases in seq into the groups
-        # of the category
-        new_seq = map_seq_to_category(categories[C], seq)
+    codes = BASE_INDEX[np.frombuffer(seq.encode('ascii', 'replace'), dtype=np.uint8)]
 
-        # collect the words in the sequence for
-        # a sliding window of length k
-        words = collect_words(seq=new_seq, k=k)
+    invalid = np.flatnonzero(codes < 0)
+    if len(invalid) != 0:
+        g1, g2 = categories['C1'].values()
+        raise ValueError("base {0} not in {1} or in {2}".format(seq[invalid[0]], g1, g2))
 
-        # loop over the unique words that
-        # each category can produce
-        for word in categories_words[C]:
+    if k != 2 or len(codes) < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
 
-            tuple_word = (word[0], word[1])
-
-            if tuple_word not in words:
-                feature_vec.append(0)
-                continue
-
-            # compute the local frequencies
-            # of the word in the sequence
-            word_count = count_words(word=tuple_word, seq=words)
-
-            # compute the partial sums of the sequence
-            # which is basically the prefix sum
-
-            # ...append it to list
-            feature_vec.append(word_count)
-
-    if len(feature_vec) != 12:
-        raise ValueError("Invalid dimension for feature vector. {0} should be {1}".format(len(feature_vec), 12))
-
-    return feature_vec
+    groups = CATEGORY_GROUPS[:, codes]
+    words = 2 * groups[:, :-1] + groups[:, 1:] + 4 * np.arange(len(categories))[:, None]
+    positions = np.broadcast_to(np.arange(1, len(codes)), words.shape)
+    return words.ravel(), positions.ravel()
 
 
-def sequence_feature_vector(seq, use_partial_sums=True, k=2):
+def word_entropies(words, positions, use_partial_sums=True):
     """
-    Build the feature vector for the given sequence using
-    a word size k=2
+    Returns the Shannon entropy of the local frequencies of
+    every word computed for all the words at once. This is
+    local_frequency, partial_sums, calculate_p and
+    shannon_entropy applied to every word
     """
 
-    # placeholder for shannon entropies
-    feature_vec = []
-
-    for C in categories:
+    # the positions of every word one after the other
+    order = np.argsort(words, kind='stable')
+    words = words[order]
+    positions = positions[order]
 
-        # map the bases in seq into the groups
-        # of the category
-        new_seq = map_seq_to_category(categories[C], seq)
+    first = np.ones(len(words), dtype=bool)
+    first[1:] = words[1:] != words[:-1]
 
-        # collect the words in the sequence for
-        # a sliding window of length k
-        words = collect_words(seq=new_seq, k=k)
+    previous = np.zeros(len(words), dtype=np.int64)
+    previous[1:] = positions[:-1]
+    previous[first] = 0
 
-        # loop over the unique words that
-        # each category can produce
-        for word in categories_words[C]:
+    frequencies = 1.0 / (positions - previous)
 
-            tuple_word = (word[0], word[1])
+    if use_partial_sums:
+        sums = np.cumsum(frequencies)
+        starts = np.flatnonzero(first)
+        frequencies = sums - np.repeat(sums[starts] - frequencies[starts],
+                                       np.diff(np.append(starts, len(words))))
 
-            if tuple_word not in words:
-                feature_vec.append(0.0)
-                continue
+    z = np.bincount(words, weights=frequencies, minlength=N_FEATURES)
+    probabilities = frequencies / z[words]
 
-            # compute the local frequencies
-            # of the word in the sequence
-            lf_w = local_frequency(word=tuple_word, seq=words)
+    terms = np.zeros(len(words), dtype=np.float64)
+    keep = probabilities >= 1.0e-4
+    terms[keep] = probabilities[keep] * np.log2(probabilities[keep])
+    return -1.0 * np.bincount(words, weights=terms, minlength=N_FEATURES)
 
-            # compute the partial sums of the sequence 
-            # which is basically the prefix sum
 
-            if use_partial_sums:
-                S = partial_sums(seq=lf_w)
-            else:
-                S = lf_w
+def sequence_feature_vector_from_counts(seq, k=2):
+    """
+       Build the feature vector for the given sequence using
+       a word size k=2
+    """
 
-            # compute the total sum of the sequence with the
-            # prefix sums
-            z = sequence_total_sum(s=S)
+    words, _ = sequence_words(seq=seq, k=k)
 
-            # calculate the sequence of probabilities
-            probabilities = calculate_p(s=S, z=z)
+    # the number of times every word occurs
+    return np.bincount(words, minlength=N_FEATURES).astype(np.float64)
 
-            # compute the entropy
-            entropy = shannon_entropy(ps=probabilities)
 
-            # ...append it to list
-            feature_vec.append(entropy)
+def sequence_feature_vector(seq, use_partial_sums=True, k=2):
+    """
+    Build the feature vector for the given sequence using
+    a word size k=2
+    """
 
-    if len(feature_vec) != 12:
-        raise ValueError("Invalid dimension for feature vector. {0} should be {1}".format(len(feature_vec), 12))
+    words, positions = sequence_words(seq=seq, k=k)
 
-    return feature_vec
+    # the Shannon entropies of the words
+    return word_entropies(words=words, positions=positions, use_partial_sums=use_partial_sums)
 
 
 def cpf_from_counts(seq1, seq2, k=2):
@@ -321,42 +315,14 @@ def sequence_feature_vector_from_probability_counts(seq, k=2):
         a word size k=2
     """
 
-    # placeholder for shannon entropies
-    feature_vec = []
-
-    for C in categories:
-
-        # map the bases in seq into the groups
-        # of the category
-        new_seq = map_seq_to_category(categories[C], seq)
-
-        # collect the words in the sequence for
-        # a sliding window of length k
-        words = collect_words(seq=new_seq, k=k)
-
-        # loop over the unique words that
-        # each category can produce
-        for word in categories_words[C]:
-
-            tuple_word = (word[0], word[1])
+    words, _ = sequence_words(seq=seq, k=k)
 
-            if tuple_word not in words:
-                feature_vec.append(0.0)
-                continue
-
-            # count how many times the word occurs
-            # in the sequnce
-            word_count = count_words(word=tuple_word, seq=words)
-
-            # frequency based probability calculation
-            probability = float(word_count)/float(len(words))
-
-            # ...append it to list
-            feature_vec.append(probability)
-
-    if len(feature_vec) != 12:
-        raise ValueError("Invalid dimension for feature vector. {0} should be {1}".format(len(feature_vec), 12))
+    # frequency based probability calculation. Every
+    # category has len(seq) - 1 words
+    feature_vec = np.bincount(words, minlength=N_FEATURES).astype(np.float64)
 
+    if len(words) != 0:
+        feature_vec /= float(len(seq) - 1)
     return feature_vec
 
 
@@ -414,7 +380,7 @@ def cpf(seq1, seq2, use_partial_sums=True, k=2):
 
 class CPF(object):
     def __init__(self, k=2):
-        self._feature_vectors = np.empty((0, 12), np.float)
+        self._feature_vectors = []
         self._k = k
         self._use_partial_sums = True
         self._use_word_counts = False
@@ -422,19 +388,51 @@ class CPF(object):
         self._use_probability_counts = False
         self._use_probability_counts_and_remove_zeros = False
 
+        # the feature vectors by (sequence, kind, use_partial_sums)
+        # so every sequence is projected only once
+        self._cache = {}
+
+    def feature_vector(self, seq, kind="entropy", use_partial_sums=True):
+        """
+        Returns the cached feature vector of the sequence. The
+        kind is entropy, counts or probabilities
+        """
+
+        key = (seq, kind, use_partial_sums)
+        feature_vec = self._cache.get(key, None)
+
+        if feature_vec is None:
+            if kind == "counts":
+                feature_vec = sequence_feature_vector_from_counts(seq=seq, k=self._k)
+            elif kind == "probabilities":
+                feature_vec = sequence_feature_vector_from_probability_counts(seq=seq, k=self._k)
+            else:
+                feature_vec = sequence_feature_vector(seq=seq, use_partial_sums=use_partial_sums, k=self._k)
+            self._cache[key] = feature_vec
+        return feature_vec
+
+    def feature_matrix(self, sequences):
+        """
+        Returns the feature vectors of the sequences, for the
+        current options, as the rows of a matrix
+        """
+
+        kind = self._kind()
+        return np.array([self.feature_vector(seq=seq, kind=kind, use_partial_sums=self._use_partial_sums)
+                         for seq in sequences], dtype=np.float64).reshape(len(sequences), N_FEATURES)
+
     def add_feature_vector(self, seq):
 
         if self._use_word_counts:
-            feature_vec = sequence_feature_vector_from_counts(seq=seq, k=self._k)
+            feature_vec = self.feature_vector(seq=seq, kind="counts")
         elif self._use_probability_counts:
-            feature_vec = sequence_feature_vector_from_probability_counts(seq=seq, k=self._k)
+            feature_vec = self.feature_vector(seq=seq, kind="probabilities")
         else:
-            feature_vec = sequence_feature_vector(seq=seq, k=self._k)
-        self._feature_vectors = np.append(self._feature_vectors,
-                                          np.array([feature_vec]), axis=0)
+            feature_vec = self.feature_vector(seq=seq, kind="entropy")
+        self._feature_vectors.append(feature_vec)
 
     def get_feature_vectors(self):
-        return self._feature_vectors
+        return np.array(self._feature_vectors, dtype=np.float64).reshape(len(self._feature_vectors), N_FEATURES)
 
     def set_options(self, **options):
         if "use_word_counts" in options:
@@ -453,17 +451,57 @@ class CPF(object):
             self._use_partial_sums = options["use_partial_sums"]
 
     def similarity(self, seq1, seq2):
+        return float(self.pairwise_similarities(seqs_a=[seq1], seqs_b=[seq2])[0])
+
+    def pairwise_similarities(self, seqs_a, seqs_b):
+        """
+        Returns the distances of the pairs (seqs_a[i], seqs_b[i])
+        as the L2 norms of the differences of the rows of
+        their feature matrices
+        """
+
+        if len(seqs_a) != len(seqs_b):
+            raise ValueError("Number of sequences {0} and {1} differ".format(len(seqs_a), len(seqs_b)))
+
+        return self._distances(self.feature_matrix(sequences=seqs_a), self.feature_matrix(sequences=seqs_b))
 
+    def similarity_matrix(self, sequences):
+        """
+        Returns the matrix of the distances of all
+        the pairs of the sequences
+        """
+
+        vectors = self.feature_matrix(sequences=sequences)
+        return self._distances(vectors[:, None, :], vectors[None, :, :])
+
+    def _kind(self):
+
+        if self._use_word_counts or self._use_word_counts_and_remove_zeros:
+            return "counts"
+        elif self._use_probability_counts or self._use_probability_counts_and_remove_zeros:
+            return "probabilities"
+        return "entropy"
+
+    def _distances(self, vectors_a, vectors_b):
+
+        differences = vectors_a - vectors_b
+
+        # the entries that are zero in any of the
+        # two vectors are removed from the norm
+        threshold = None
         if self._use_word_counts:
-            return cpf_from_counts(seq1=seq1, seq2=seq2)
+            pass
         elif self._use_word_counts_and_remove_zeros:
-            return cpf_from_counts_without_zeros(seq1=seq1, seq2=seq2)
+            threshold = 1.0
         elif self._use_probability_counts:
-            return cpf_from_probability_counts(seq1=seq1, seq2=seq2)
+            pass
         elif self._use_probability_counts_and_remove_zeros:
-            return cpf_from_probability_counts_remove_zeros(seq1=seq1, seq2=seq2)
+            threshold = 1.0e-5
+
+        if threshold is not None:
+            differences = np.where((vectors_a < threshold) | (vectors_b < threshold), 0.0, differences)
 
-        return cpf(seq1=seq1, seq2=seq2, use_partial_sums=self._use_partial_sums)
+        return np.linalg.norm(differences, axis=-1)
 
     def __call__(self, *args, **kwargs):
         return self.similarity(seq1=args[0], seq2=args[1])
@@ -1,4 +1,5 @@
 import sys
+from concurrent.futures import ProcessPoolExecutor
 
 #from helpers import read_configuration_file
 #from helpers import set_up_logger
@@ -14,7 +15,7 @@ def make_window_regions(configuration):
     print("{0} Processing type is: {1}".format(INFO, configuration['processing']['type']))
 
     if configuration['processing']['type'] == 'multi':
-        from parallel import par_make_window_regions
+        from compute_engine.src.parallel import par_make_window_regions
         return par_make_window_regions(configuration=configuration)
 
     windowsize = configuration["window_size"]
@@ -31,58 +32,77 @@ def make_window_regions(configuration):
 
     regions_created = []
 
-    counter = 0
-    for r in regions_list:
+    # windows of the WGA and NO_WGA files are
+    # extracted concurrently by a process pool
+    executor = None
+    if configuration['processing']['type'] == 'concurrent':
+        n_procs = configuration['processing']['n_procs']
+        print("{0} Creating windows with {1} processes".format(INFO, n_procs))
+        executor = ProcessPoolExecutor(max_workers=n_procs)
 
-        start_idx = r[0]
-        end_idx = r[1]
+    try:
+        counter = 0
+        for r in regions_list:
 
-        print("{0} Start index: {1}".format(INFO, start_idx))
-        sys.stdout.flush()
-        print("{0} End index:   {1}".format(INFO, end_idx))
-        sys.stdout.flush()
-        region = Region(idx=counter,
-                        start=start_idx,
-                        end=end_idx,
-                        window_size=windowsize)
-
-        kwargs = {"sam_read_config": configuration["sam_read_config"]}
+            start_idx = r[0]
+            end_idx = r[1]
 
-        if "debug" in configuration:
-            kwargs["debug"] = configuration["debug"]
-
-        print("{0} Creating WGA Windows...".format(INFO))
-        sys.stdout.flush()
-        region.make_wga_windows(chromosome=chromosome,
-                                ref_filename=configuration["reference_file"]["filename"],
-                                bam_filename=configuration["wga_file"]["filename"],
-                                **kwargs)
-
-        #if region.get_n_windows(type_=WindowType.WGA) == 0:
-        #    raise Error("WGA windows have not been created")
-        #else:
-        print("{0} Number of WGA "
-                  "windows: {1}".format(INFO,
-                                        region.get_n_windows(type_=WindowType.WGA)))
-        sys.stdout.flush()
+            print("{0} Start index: {1}".format(INFO, start_idx))
+            sys.stdout.flush()
+            print("{0} End index:   {1}".format(INFO, end_idx))
+            sys.stdout.flush()
+            region = Region(idx=counter,
+                            start=start_idx,
+                            end=end_idx,
+                            window_size=windowsize)
+
+            kwargs = {"sam_read_config": configuration["sam_read_config"]}
+
+            if "debug" in configuration:
+                kwargs["debug"] = configuration["debug"]
+
+            if executor is not None:
+                kwargs["executor"] = executor
+                kwargs["n_chunks"] = configuration['processing'].get('n_chunks',
+                                                                     configuration['processing']['n_procs'])
+
+                print("{0} Creating WGA and No WGA Windows...".format(INFO))
+                sys.stdout.flush()
+                region.make_windows(chromosome=chromosome,
+                                    ref_filename=configuration["reference_file"]["filename"],
+                                    wga_filename=configuration["wga_file"]["filename"],
+                                    no_wga_filename=configuration["no_wga_file"]["filename"],
+                                    **kwargs)
+            else:
+                print("{0} Creating WGA Windows...".format(INFO))
+                sys.stdout.flush()
+                region.make_wga_windows(chromosome=chromosome,
+                                        ref_filename=configuration["reference_file"]["filename"],
+                                        bam_filename=configuration["wga_file"]["filename"],
+                                        **kwargs)
+
+                print("{0} Creating No WGA Windows...".format(INFO))
+                sys.stdout.flush()
+                region.make_no_wga_windows(chromosome=chromosome,
+                                           ref_filename=configuration["reference_file"]["filename"],
+                                           bam_filename=configuration["no_wga_file"]["filename"],
+                                           **kwargs)
+
+            print("{0} Number of WGA "
+                      "windows: {1}".format(INFO,
+                                            region.get_n_windows(type_=WindowType.WGA)))
+            sys.stdout.flush()
 
-        print("{0} Creating No WGA Windows...".format(INFO))
-        sys.stdout.flush()
-        region.make_no_wga_windows(chromosome=chromosome,
-                                   ref_filename=configuration["reference_file"]["filename"],
-                                   bam_filename=configuration["no_wga_file"]["filename"],
-                                   **kwargs)
-
-        #if region.get_n_windows(type_=WindowType.NO_WGA) == 0:
-        #    raise Error("Non-WGA windows have not  been created")
-        #else:
-        print("{0} Number of Non WGA"
-                  " windows: {1}".format(INFO,
-                                         region.get_n_windows(type_=WindowType.NO_WGA)))
-        sys.stdout.flush()
+            print("{0} Number of Non WGA"
+                      " windows: {1}".format(INFO,
+                                             region.get_n_windows(type_=WindowType.NO_WGA)))
+            sys.stdout.flush()
 
-        regions_created.append(region)
-        counter += 1
+            regions_created.append(region)
+            counter += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
     return regions_created
 
@@ -186,7 +206,8 @@ def save_regions(regions, configuration):
     for region in regions:
         #region.save_mixed_windows_statistic(statistic="mean", tips=configuration["plot_tips"])
         #region.save_mixed_windows_gc_content(tips=configuration["plot_tips"])
-        region.save(path=configuration["region_path"], filename=configuration["region_name"], tips=None)# tips=configuration["plot_tips"])
+        region.save(path=configuration["region_path"], filename=configuration["region_name"], tips=None,
+                    file_format=configuration.get("region_file_format", "txt"))# tips=configuration["plot_tips"])
 
 
 @timefn
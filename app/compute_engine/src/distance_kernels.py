@@ -0,0 +1,579 @@
+"""
+Batch NumPy kernels of the text distances used for the repeats.
+The sequences of a batch are integer encoded and padded into
+matrices and the dynamic programming of the edit distances is
+done one row at a time for all the pairs of the batch. The
+Levenshtein and Damerau-Levenshtein distances are computed with
+the bit-parallel algorithm of Myers and Hyyro instead. The
+calculator classes extend the textdistance classes with a
+pairwise method and give the same values as normalized_distance
+"""
+
+from abc import ABC, abstractmethod
+
+import numpy as np
+import textdistance
+
+from compute_engine.src.sequence_transforms import COMPLEMENT_TABLE, reverse_complement_table
+
+# number of pairs computed at once by the kernels
+BATCH_SIZE = 2048
+
+# maximum number of cells of the
+# k-mer count matrix of a batch
+MAX_KMER_COUNT_CELLS = 2 ** 24
+
+# codes of the padding of the two sides of a
+# pair. They differ so padding never matches
+PAD_A = -1
+PAD_B = -2
+
+# bits of the words of the bit-parallel kernels
+WORD_BITS = 64
+
+
+def encode_sequence(seq) -> np.ndarray:
+    """
+    Returns the codes of the sequence. Strings are encoded
+    with their code points and arrays, e.g. the codes of
+    SequenceTransforms, are used as given
+    """
+
+    if isinstance(seq, str):
+        return np.frombuffer(seq.encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+    return np.asarray(seq, dtype=np.int64)
+
+
+def pad_sequences(seqs, pad: int, width: int=None) -> tuple:
+    """
+    Returns the (len(seqs), width) matrix of the codes of the
+    sequences padded with pad and the array of their lengths
+    """
+
+    codes = [encode_sequence(seq=seq) for seq in seqs]
+    lengths = np.array([len(code) for code in codes], dtype=np.int64)
+
+    if width is None:
+        width = int(lengths.max()) if len(lengths) != 0 else 0
+
+    matrix = np.full((len(codes), width), pad, dtype=np.int64)
+    for row, code in enumerate(codes):
+        matrix[row, :len(code)] = code
+    return matrix, lengths
+
+
+def identical(a, a_lengths, b, b_lengths) -> np.ndarray:
+    """
+    Returns the mask of the pairs of equal sequences
+    """
+
+    width = min(a.shape[1], b.shape[1])
+    same = (a[:, :width] == b[:, :width]) | (np.arange(width) >= a_lengths[:, None])
+    return (a_lengths == b_lengths) & same.all(axis=1)
+
+
+def hamming_distances(a, a_lengths, b, b_lengths) -> np.ndarray:
+    """
+    Returns the Hamming distances of the pairs. As in
+    textdistance the extra items of the longer sequence
+    count as mismatches
+    """
+
+    width = min(a.shape[1], b.shape[1])
+    common = np.minimum(a_lengths, b_lengths)
+    mismatches = (a[:, :width] != b[:, :width]) & (np.arange(width) < common[:, None])
+    return mismatches.sum(axis=1) + np.abs(a_lengths - b_lengths)
+
+
+def _shift_left(words) -> np.ndarray:
+    """
+    Shift the multiword bit vectors, the rows
+    of words with the low word first, by one bit
+    """
+
+    shifted = words << np.uint64(1)
+    shifted[:, 1:] |= words[:, :-1] >> np.uint64(WORD_BITS - 1)
+    return shifted
+
+
+def _add(x, y) -> np.ndarray:
+    """
+    Add the multiword bit vectors x and y
+    carrying between the words
+    """
+
+    if x.shape[1] == 1:
+        return x + y
+
+    result = np.empty_like(x)
+    carry = np.zeros(x.shape[0], dtype=np.uint64)
+    for word in range(x.shape[1]):
+        total = x[:, word] + y[:, word]
+        result[:, word] = total + carry
+        carry = ((total < x[:, word]) | (result[:, word] < total)).astype(np.uint64)
+    return result
+
+
+def bit_parallel_distances(a, a_lengths, b, b_lengths, transpositions: bool=False,
+                           pattern_index=None) -> np.ndarray:
+    """
+    Returns the Levenshtein distances of the pairs or, if
+    transpositions is True, the restricted Damerau-Levenshtein
+    distances with the bit-parallel algorithm of Myers (1999)
+    in the formulation of Hyyro (2001). The columns of the
+    DP matrix of a pair are bit vectors of the length of the
+    sequence of a, stored in 64-bit words, and a column is
+    computed with a few word operations for all the pairs.
+    The text b[k] is compared with the pattern
+    a[pattern_index[k]] so several texts can share a pattern
+    """
+
+    n_texts, width = b.shape
+
+    if pattern_index is None:
+        pattern_index = np.arange(n_texts)
+
+    m = a_lengths[pattern_index]
+    distances = m.copy()
+
+    n_words = max(1, (int(a_lengths.max()) + WORD_BITS - 1) // WORD_BITS) if len(a_lengths) != 0 else 1
+
+    # the codes of both sides as ids of a compact alphabet
+    _, ids = np.unique(np.concatenate((a.ravel(), b.ravel())), return_inverse=True)
+    ids = ids.ravel()
+    a_ids = ids[:a.size].reshape(a.shape)
+    b_ids = ids[a.size:].reshape(b.shape)
+    n_symbols = int(ids.max()) + 1 if len(ids) != 0 else 1
+
+    # the match bit vector of every symbol of every pattern
+    peq = np.zeros((a.shape[0], n_symbols, n_words), dtype=np.uint64)
+    rows, positions = np.nonzero(np.arange(a.shape[1]) < a_lengths[:, None])
+    np.bitwise_or.at(peq, (rows, a_ids[rows, positions], positions // WORD_BITS),
+                     np.left_shift(np.uint64(1), (positions % WORD_BITS).astype(np.uint64)))
+
+    # the word and the bit of the last row of every pair
+    last = np.maximum(m - 1, 0)
+    last_word = last // WORD_BITS
+    last_bit = (last % WORD_BITS).astype(np.uint64)
+    texts = np.arange(n_texts)
+
+    vp = np.full((n_texts, n_words), np.uint64(2 ** WORD_BITS - 1), dtype=np.uint64)
+    vn = np.zeros((n_texts, n_words), dtype=np.uint64)
+    d0 = np.zeros((n_texts, n_words), dtype=np.uint64)
+    previous_eq = np.zeros((n_texts, n_words), dtype=np.uint64)
+
+    # the bits above the last row only depend on the
+    # lower bits so they are not masked
+    for j in range(width):
+        eq = peq[pattern_index, b_ids[:, j]]
+        x = eq | vn
+
+        if transpositions:
+            transposed = _shift_left(~d0 & eq) & previous_eq
+            d0 = (_add(eq & vp, vp) ^ vp) | x | transposed
+        else:
+            d0 = (_add(eq & vp, vp) ^ vp) | x
+
+        hp = vn | ~(d0 | vp)
+        hn = vp & d0
+
+        active = j < b_lengths
+        distances += np.where(active, ((hp[texts, last_word] >> last_bit) & np.uint64(1)).astype(np.int64) -
+                              ((hn[texts, last_word] >> last_bit) & np.uint64(1)).astype(np.int64), 0)
+
+        x = _shift_left(hp)
+        x[:, 0] |= np.uint64(1)
+        vp = _shift_left(hn) | ~(d0 | x)
+        vn = x & d0
+        previous_eq = eq
+
+    # an empty pattern has no rows
+    empty = m == 0
+    distances[empty] = b_lengths[empty]
+    return distances
+
+
+def lcsseq_lengths(a, a_lengths, b, b_lengths) -> np.ndarray:
+    """
+    Returns the lengths of the longest common subsequences
+    of the pairs. A row is max(L[i, j - 1], Y[j]) with Y the
+    match or deletion values so it is a running maximum
+    """
+
+    n_pairs, width = b.shape
+
+    lengths = np.zeros(n_pairs, dtype=np.int64)
+    previous = np.zeros((n_pairs, width + 1), dtype=np.int64)
+
+    for i in range(1, a.shape[1] + 1):
+        y = np.zeros((n_pairs, width + 1), dtype=np.int64)
+        y[:, 1:] = np.where(a[:, i - 1, None] == b, previous[:, :-1] + 1, previous[:, 1:])
+        current = np.maximum.accumulate(y, axis=1)
+
+        ends = a_lengths == i
+        lengths[ends] = current[ends, b_lengths[ends]]
+        previous = current
+
+    return lengths
+
+
+def lcsstr_lengths(a, a_lengths, b, b_lengths) -> np.ndarray:
+    """
+    Returns the lengths of the longest common substrings of the
+    pairs. The padding never matches so the runs of matches of
+    the padded rows and columns are zero
+    """
+
+    n_pairs, width = b.shape
+
+    lengths = np.zeros(n_pairs, dtype=np.int64)
+    previous = np.zeros((n_pairs, width + 1), dtype=np.int64)
+
+    for i in range(1, a.shape[1] + 1):
+        current = np.zeros((n_pairs, width + 1), dtype=np.int64)
+        current[:, 1:] = np.where(a[:, i - 1, None] == b, previous[:, :-1] + 1, 0)
+        lengths = np.maximum(lengths, current.max(axis=1))
+        previous = current
+
+    return lengths
+
+
+def kmer_counts(seqs_a, seqs_b, k: int, as_set: bool=False) -> tuple:
+    """
+    Returns the k-mer bag sizes of the two sides and the sizes of
+    the intersections and the unions of the bags of the pairs.
+    Returns None if the count matrix of the batch is too large
+    """
+
+    codes = [encode_sequence(seq=seq) for seq in list(seqs_a) + list(seqs_b)]
+
+    kmers = []
+    owners = []
+    for idx, code in enumerate(codes):
+        if len(code) < k:
+            continue
+        starts = np.arange(len(code) - k + 1)
+        kmers.append(code[starts[:, None] + np.arange(k)])
+        owners.append(np.full(len(starts), idx, dtype=np.int64))
+
+    n_seqs = len(codes)
+    if len(kmers) == 0:
+        counts = np.zeros((n_seqs, 0), dtype=np.int64)
+    else:
+        kmers = np.concatenate(kmers)
+        base = int(kmers.max()) + 1
+
+        # the k-mers are numbers in the given base
+        # if they fit in 63 bits or rows otherwise
+        if base ** k < 2 ** 63:
+            keys = kmers[:, 0].copy()
+            for column in range(1, k):
+                keys = keys * base + kmers[:, column]
+            _, kmer_ids = np.unique(keys, return_inverse=True)
+        else:
+            _, kmer_ids = np.unique(kmers, axis=0, return_inverse=True)
+
+        kmer_ids = kmer_ids.ravel()
+        n_kmers = int(kmer_ids.max()) + 1
+
+        if n_seqs * n_kmers > MAX_KMER_COUNT_CELLS:
+            return None
+
+        counts = np.bincount(np.concatenate(owners) * n_kmers + kmer_ids,
+                             minlength=n_seqs * n_kmers).reshape(n_seqs, n_kmers)
+
+    if as_set:
+        counts = (counts > 0).astype(np.int64)
+
+    n_pairs = len(codes) // 2
+    counts_a = counts[:n_pairs]
+    counts_b = counts[n_pairs:]
+
+    return (counts_a.sum(axis=1), counts_b.sum(axis=1),
+            np.minimum(counts_a, counts_b).sum(axis=1),
+            np.maximum(counts_a, counts_b).sum(axis=1))
+
+
+class PairwiseMixin(ABC):
+    """
+    Adds the pairwise method to a textdistance class. The
+    subclasses implement _pairwise_batch for the batches
+    the kernels support and the other pairs, e.g. those of
+    a calculator with a test_func, use the textdistance
+    implementation
+    """
+
+    def pairwise(self, seqs_a, seqs_b, normalized: bool=True) -> np.ndarray:
+        """
+        Returns the array of the distances of the pairs
+        (seqs_a[k], seqs_b[k]), normalized as normalized_distance
+        if normalized is True
+        """
+
+        seqs_a = list(seqs_a)
+        seqs_b = list(seqs_b)
+
+        if len(seqs_a) != len(seqs_b):
+            raise ValueError("Number of sequences {0} and {1} "
+                             "differ".format(len(seqs_a), len(seqs_b)))
+
+        distances = np.zeros(len(seqs_a), dtype=np.float64)
+
+        if not self._use_kernel():
+            for idx, (seq_a, seq_b) in enumerate(zip(seqs_a, seqs_b)):
+                distances[idx] = self._pair_distance(seq_a, seq_b, normalized)
+            return distances
+
+        for batch in self._batches(seqs_a=seqs_a):
+            distances[batch] = self._pairwise_batch(seqs_a=[seqs_a[idx] for idx in batch],
+                                                    seqs_b=[seqs_b[idx] for idx in batch],
+                                                    normalized=normalized)
+        return distances
+
+    def pairwise_min_reverse(self, seqs_a, seqs_b, seqs_b_rc=None, normalized: bool=True) -> np.ndarray:
+        """
+        Returns the minimum of the distances of the pairs with seqs_b
+        and with their reverse complements seqs_b_rc. If not given
+        seqs_b_rc are the reverse complements of the seqs_b strings
+        """
+
+        if seqs_b_rc is None:
+            seqs_b_rc = [reverse_complement_table(seq=seq, tab=COMPLEMENT_TABLE) for seq in seqs_b]
+
+        return np.minimum(self.pairwise(seqs_a, seqs_b, normalized=normalized),
+                          self.pairwise(seqs_a, seqs_b_rc, normalized=normalized))
+
+    @staticmethod
+    def _batches(seqs_a) -> list:
+        """
+        Returns the indices of the batches. Pairs of similar
+        lengths are batched together to reduce the padding
+        """
+
+        lengths = np.array([len(seq) for seq in seqs_a], dtype=np.int64)
+        order = np.argsort(lengths, kind='stable')
+        return [order[start:start + BATCH_SIZE] for start in range(0, len(order), BATCH_SIZE)]
+
+    def _use_kernel(self) -> bool:
+        return self.qval == 1 and getattr(self, 'test_func', self._ident) == self._ident
+
+    def _pair_distance(self, seq_a, seq_b, normalized: bool) -> float:
+
+        if not isinstance(seq_a, str):
+            seq_a = encode_sequence(seq=seq_a).tolist()
+            seq_b = encode_sequence(seq=seq_b).tolist()
+
+        if normalized:
+            return self.normalized_distance(seq_a, seq_b)
+        return self.distance(seq_a, seq_b)
+
+    @abstractmethod
+    def _pairwise_batch(self, seqs_a, seqs_b, normalized: bool) -> np.ndarray:
+        """
+        Returns the distances of the pairs of the batch
+        """
+
+
+class _PaddedBatchMixin(PairwiseMixin):
+    """
+    The batches are padded into matrices and the
+    subclasses implement _batch_distances on them
+    """
+
+    def _pairwise_batch(self, seqs_a, seqs_b, normalized: bool) -> np.ndarray:
+
+        a, a_lengths = pad_sequences(seqs=seqs_a, pad=PAD_A)
+        b, b_lengths = pad_sequences(seqs=seqs_b, pad=PAD_B)
+        distances, maximum = self._batch_distances(a=a, a_lengths=a_lengths,
+                                                   b=b, b_lengths=b_lengths)
+
+        distances = distances.astype(np.float64)
+        if normalized:
+            distances = np.divide(distances, maximum, out=np.zeros(len(distances), dtype=np.float64),
+                                  where=maximum != 0)
+        return distances
+
+    @abstractmethod
+    def _batch_distances(self, a, a_lengths, b, b_lengths) -> tuple:
+        """
+        Returns the distances of the batch and the
+        maximum values they are normalized with
+        """
+
+
+class Hamming(_PaddedBatchMixin, textdistance.Hamming):
+
+    def _use_kernel(self) -> bool:
+        return not self.truncate and super(Hamming, self)._use_kernel()
+
+    def _batch_distances(self, a, a_lengths, b, b_lengths) -> tuple:
+        return hamming_distances(a, a_lengths, b, b_lengths), np.maximum(a_lengths, b_lengths)
+
+
+class _BitParallelMixin(_PaddedBatchMixin):
+    """
+    Edit distances with bit_parallel_distances. The distances
+    to the sequences and to their reverse complements are
+    computed in a single pass sharing the match vectors
+    """
+
+    TRANSPOSITIONS = False
+
+    def pairwise_min_reverse(self, seqs_a, seqs_b, seqs_b_rc=None, normalized: bool=True) -> np.ndarray:
+
+        if not self._use_kernel():
+            return super(_BitParallelMixin, self).pairwise_min_reverse(seqs_a, seqs_b, seqs_b_rc=seqs_b_rc,
+                                                                       normalized=normalized)
+
+        seqs_a = list(seqs_a)
+        seqs_b = list(seqs_b)
+
+        if seqs_b_rc is None:
+            seqs_b_rc = [reverse_complement_table(seq=seq, tab=COMPLEMENT_TABLE) for seq in seqs_b]
+        seqs_b_rc = list(seqs_b_rc)
+
+        if len(seqs_a) != len(seqs_b) or len(seqs_b) != len(seqs_b_rc):
+            raise ValueError("Number of sequences {0}, {1} and {2} "
+                             "differ".format(len(seqs_a), len(seqs_b), len(seqs_b_rc)))
+
+        distances = np.zeros(len(seqs_a), dtype=np.float64)
+        for batch in self._batches(seqs_a=seqs_a):
+            a, a_lengths = pad_sequences(seqs=[seqs_a[idx] for idx in batch], pad=PAD_A)
+            b, b_lengths = pad_sequences(seqs=[seqs_b[idx] for idx in batch] +
+                                         [seqs_b_rc[idx] for idx in batch], pad=PAD_B)
+
+            both = bit_parallel_distances(a, a_lengths, b, b_lengths, transpositions=self.TRANSPOSITIONS,
+                                          pattern_index=np.tile(np.arange(len(batch)), 2))
+            batch_distances = np.minimum(both[:len(batch)], both[len(batch):]).astype(np.float64)
+
+            if normalized:
+                maximum = np.maximum(a_lengths, b_lengths[:len(batch)])
+                batch_distances = np.divide(batch_distances, maximum, out=np.zeros(len(batch), dtype=np.float64),
+                                            where=maximum != 0)
+            distances[batch] = batch_distances
+        return distances
+
+    def _batch_distances(self, a, a_lengths, b, b_lengths) -> tuple:
+        return (bit_parallel_distances(a, a_lengths, b, b_lengths, transpositions=self.TRANSPOSITIONS),
+                np.maximum(a_lengths, b_lengths))
+
+
+class Levenshtein(_BitParallelMixin, textdistance.Levenshtein):
+    pass
+
+
+class DamerauLevenshtein(_BitParallelMixin, textdistance.DamerauLevenshtein):
+
+    TRANSPOSITIONS = True
+
+    def _use_kernel(self) -> bool:
+        return self.restricted and super(DamerauLevenshtein, self)._use_kernel()
+
+
+class LCSSeq(_PaddedBatchMixin, textdistance.LCSSeq):
+
+    def _batch_distances(self, a, a_lengths, b, b_lengths) -> tuple:
+        maximum = np.maximum(a_lengths, b_lengths)
+        return maximum - lcsseq_lengths(a, a_lengths, b, b_lengths), maximum
+
+
+class LCSStr(_PaddedBatchMixin, textdistance.LCSStr):
+
+    def _use_kernel(self) -> bool:
+        return self.qval == 1
+
+    def _batch_distances(self, a, a_lengths, b, b_lengths) -> tuple:
+        maximum = np.maximum(a_lengths, b_lengths)
+        return maximum - lcsstr_lengths(a, a_lengths, b, b_lengths), maximum
+
+
+class _KmerBagMixin(PairwiseMixin):
+    """
+    The similarities of the k-mer bags with k the qval. As with
+    textdistance equal sequences have similarity 1 and pairs
+    with an empty sequence similarity 0. The distance is
+    1 - similarity
+    """
+
+    def _use_kernel(self) -> bool:
+        return self.qval is not None and self.qval >= 1
+
+    def _pairwise_batch(self, seqs_a, seqs_b, normalized: bool) -> np.ndarray:
+
+        a, a_lengths = pad_sequences(seqs=seqs_a, pad=PAD_A)
+        b, b_lengths = pad_sequences(seqs=seqs_b, pad=PAD_B)
+
+        similarities = np.zeros(len(seqs_a), dtype=np.float64)
+        same = identical(a, a_lengths, b, b_lengths)
+        similarities[same] = 1.0
+
+        # the remaining pairs without empty sequences
+        rest = np.flatnonzero(~same & (a_lengths != 0) & (b_lengths != 0))
+
+        counts = None
+        if len(rest) != 0:
+            counts = kmer_counts(seqs_a=[seqs_a[idx] for idx in rest],
+                                 seqs_b=[seqs_b[idx] for idx in rest],
+                                 k=self.qval, as_set=self.as_set)
+
+        if counts is not None:
+            sizes_a, sizes_b, intersections, unions = counts
+
+            # textdistance fails on the pairs whose
+            # bags make the similarity undefined
+            valid = self._defined(sizes_a, sizes_b, unions)
+            similarities[rest[valid]] = self._bag_similarities(sizes_a[valid], sizes_b[valid],
+                                                               intersections[valid], unions[valid])
+            rest = rest[~valid]
+
+        for idx in rest.tolist():
+            similarities[idx] = 1 - self._pair_distance(seqs_a[idx], seqs_b[idx], normalized)
+
+        return 1 - similarities
+
+    def _defined(self, sizes_a, sizes_b, unions) -> np.ndarray:
+        return unions != 0
+
+    @abstractmethod
+    def _bag_similarities(self, sizes_a, sizes_b, intersections, unions) -> np.ndarray:
+        """
+        Returns the similarities of the bags from their sizes
+        and the sizes of their intersections and unions
+        """
+
+
+class Jaccard(_KmerBagMixin, textdistance.Jaccard):
+
+    def _bag_similarities(self, sizes_a, sizes_b, intersections, unions) -> np.ndarray:
+        return intersections / unions
+
+
+class Sorensen(_KmerBagMixin, textdistance.Sorensen):
+
+    def _bag_similarities(self, sizes_a, sizes_b, intersections, unions) -> np.ndarray:
+        return 2.0 * intersections / (sizes_a + sizes_b)
+
+
+class Cosine(_KmerBagMixin, textdistance.Cosine):
+
+    def _defined(self, sizes_a, sizes_b, unions) -> np.ndarray:
+        return (sizes_a != 0) & (sizes_b != 0)
+
+    def _bag_similarities(self, sizes_a, sizes_b, intersections, unions) -> np.ndarray:
+        return intersections / np.power((sizes_a * sizes_b).astype(np.float64), 1.0 / 2)
+
+
+def pairwise_distances(calculator, seqs_a, seqs_b, normalized: bool=True) -> np.ndarray:
+    """
+    Returns the distances of the pairs (seqs_a[k], seqs_b[k])
+    with the pairwise method of the calculator or, if it has
+    none, its normalized_distance or distance
+    """
+
+    pairwise = getattr(calculator, "pairwise", None)
+
+    if pairwise is not None:
+        return pairwise(seqs_a, seqs_b, normalized=normalized)
+
+    distance = calculator.normalized_distance if normalized else calculator.distance
+    return np.array([distance(seq_a, seq_b) for seq_a, seq_b in zip(seqs_a, seqs_b)], dtype=np.float64)
@@ -10,6 +10,7 @@ from typing import List, Tuple
 
 from compute_engine.src.enumeration_types import FileReaderType
 from compute_engine.src.exceptions import IndexExists, InvalidReadingMode, InvalidFileFormat
+from compute_engine.src.viterbi_path_io import ViterbiPathFile, is_viterbi_path_npz
 
 def read_line_nucl_out_file(line: str, delimiter='\t') -> tuple:
     line_data = line.split(delimiter)
@@ -104,6 +105,10 @@ class ViterbiPathReader(DeaultReader):
     def __call__(self, filename: Path):
 
         if self._mode == 'default':
+
+            if is_viterbi_path_npz(filename=filename):
+                return list(ViterbiPathFile(filename=filename).iter_text_lines())
+
             return self.read_default(filename=filename)
         elif self._mode == 'dict_coords_state':
             return self.read_dict_coords_state(filename=filename)
@@ -113,6 +118,9 @@ class ViterbiPathReader(DeaultReader):
 
     def read_dict_coords_state(self, filename: Path) -> dict:
 
+        if is_viterbi_path_npz(filename=filename):
+            return ViterbiPathFile(filename=filename).to_dict_coords_state()
+
         with open(filename, 'r', newline='\n') as fh:
             reader = csv.reader(fh, delimiter=':')
             result = dict()
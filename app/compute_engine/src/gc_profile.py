@@ -0,0 +1,226 @@
+"""
+GC profiles of sequences. A profile stores a bit per base telling
+if the base is G or C, packed in bytes, and the cumulative number
+of G/C bases before every byte. The number of G/C bases in any
+[start, end) and so the GC percent of any range and of its chunks
+is computed with a few array lookups without slicing the sequence.
+GCProfileService builds the profiles of the chromosomes of a FASTA
+file once and caches them on disk
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import numpy as np
+import pysam
+
+from compute_engine.src.constants import INFO
+from compute_engine.src.exceptions import Error
+from compute_engine.src.utils import load_npz_columns
+
+# number of bits set in every byte
+POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.int64)
+
+# G, C, g and c
+GC_BASES = np.array([ord(base) for base in "GCgc"], dtype=np.uint8)
+
+
+def format_gc_percent(gc: int, min_gc: int=None, max_gc: int=None) -> str:
+    """
+    Returns the gc_min_max string of gcpercent.
+    None min and max are written as NA
+    """
+    return str(gc) + "_" + ("NA" if min_gc is None else str(min_gc)) + \
+           "_" + ("NA" if max_gc is None else str(max_gc))
+
+
+class GCProfile(object):
+    """
+    The GC profile of a sequence
+    """
+
+    def __init__(self, bits, byte_counts, length: int) -> None:
+
+        if len(byte_counts) != len(bits) + 1:
+            raise Error("GC profile has {0} byte counts for {1} bytes".format(len(byte_counts), len(bits)))
+
+        self._bits = bits
+        self._byte_counts = byte_counts
+        self._length = length
+
+    @staticmethod
+    def from_sequence(sequence: str):
+        bits, byte_counts = GCProfile.pack(sequence=sequence)
+        return GCProfile(bits=bits, byte_counts=byte_counts, length=len(sequence))
+
+    @staticmethod
+    def pack(sequence: str, count: int=0) -> tuple:
+        """
+        Returns the packed G/C bits of the sequence and the
+        cumulative G/C counts after every byte starting at count
+        """
+
+        bases = np.frombuffer(sequence.encode('ascii', 'replace'), dtype=np.uint8)
+        bits = np.packbits(np.isin(bases, GC_BASES))
+        byte_counts = np.cumsum(POPCOUNT[bits]) + count
+        return bits, np.concatenate(([count], byte_counts)).astype(np.int64)
+
+    @property
+    def bits(self):
+        return self._bits
+
+    @property
+    def byte_counts(self):
+        return self._byte_counts
+
+    def __len__(self) -> int:
+        return self._length
+
+    def prefix_counts(self, positions) -> np.ndarray:
+        """
+        Returns the number of G/C bases before the given positions
+        """
+
+        positions = np.asarray(positions, dtype=np.int64)
+        byte = positions >> 3
+        shift = 8 - (positions & 7)
+
+        # the bits of the byte before the position. Positions at
+        # the end of a last full byte have no partial byte
+        partial = np.zeros(positions.shape, dtype=np.int64)
+        inside = byte < len(self._bits)
+        partial[inside] = POPCOUNT[self._bits[byte[inside]].astype(np.int64) >> shift[inside]]
+        return self._byte_counts[byte] + partial
+
+    def gc_counts(self, starts, ends) -> np.ndarray:
+        """
+        Returns the number of G/C bases in every [start, end)
+        """
+        return self.prefix_counts(ends) - self.prefix_counts(starts)
+
+    def gc_percent(self, start: int=0, end: int=None, chunk_size: int=100) -> tuple:
+        """
+        Returns the truncated GC percent of [start, end) and the
+        minimum and maximum GC percent of its chunks of chunk_size
+        bases. The minimum and maximum are None if the range
+        is not longer than chunk_size. As with fetching the
+        sequence the range ends at the end of the profile
+        """
+
+        if end is None or end > self._length:
+            end = self._length
+
+        if start < 0 or end <= start:
+            raise Error("Invalid GC profile range [{0}, {1}) "
+                        "for length {2}".format(start, end, self._length))
+
+        gc = int(np.floor(self.gc_counts(start, end) / (end - start) * 100))
+
+        if end - start <= chunk_size:
+            return gc, None, None
+
+        starts = np.arange(start, end, chunk_size, dtype=np.int64)
+        ends = np.minimum(starts + chunk_size, end)
+        percents = np.floor(self.gc_counts(starts, ends) / (ends - starts) * 100).astype(np.int64)
+        return gc, int(percents.min()), int(percents.max())
+
+    def gc_string(self, start: int=0, end: int=None, chunk_size: int=100) -> str:
+        """
+        Returns gc_percent as the gc_min_max string of gcpercent
+        """
+        return format_gc_percent(*self.gc_percent(start=start, end=end, chunk_size=chunk_size))
+
+
+class GCProfileService(object):
+    """
+    GC profiles of the chromosomes of a FASTA file. A profile is
+    built on the first use of its chromosome and, if cache_path is
+    given, saved there so that other processes and later runs
+    memory map it instead of reading the chromosome
+    """
+
+    def __init__(self, fasta_file: str, cache_path: str=None, block_size: int=2 ** 24) -> None:
+
+        if block_size % 8 != 0:
+            raise Error("GC profile block size {0} is not "
+                        "a multiple of 8".format(block_size))
+
+        self._fasta_file = str(fasta_file)
+        self._cache_path = cache_path
+        self._block_size = block_size
+        self._profiles = {}
+        self._lock = threading.Lock()
+
+    def cache_filename(self, chromosome: str) -> str:
+        """
+        Returns the file the profile of the chromosome is cached in.
+        The directory depends on the path, size and modification
+        time of the FASTA file so a new file gets new profiles
+        """
+
+        stat = os.stat(self._fasta_file)
+        key = hashlib.sha256("{0}:{1}:{2}".format(os.path.abspath(self._fasta_file), stat.st_size,
+                                                  stat.st_mtime_ns).encode()).hexdigest()
+        return os.path.join(str(self._cache_path), key[:16], chromosome + ".npz")
+
+    def profile(self, chromosome: str) -> GCProfile:
+
+        with self._lock:
+            if chromosome not in self._profiles:
+                self._profiles[chromosome] = self._load(chromosome=chromosome)
+            return self._profiles[chromosome]
+
+    def gc_percent(self, chromosome: str, start: int, end: int, chunk_size: int=100) -> tuple:
+        return self.profile(chromosome=chromosome).gc_percent(start=start, end=end, chunk_size=chunk_size)
+
+    def gc_string(self, chromosome: str, start: int, end: int, chunk_size: int=100) -> str:
+        return self.profile(chromosome=chromosome).gc_string(start=start, end=end, chunk_size=chunk_size)
+
+    def _load(self, chromosome: str) -> GCProfile:
+
+        filename = None
+        if self._cache_path is not None:
+            filename = self.cache_filename(chromosome=chromosome)
+
+            if os.path.isfile(filename):
+                columns = load_npz_columns(filename=filename, mmap_mode='r')
+                return GCProfile(bits=columns["bits"], byte_counts=columns["byte_counts"],
+                                 length=int(columns["length"][0]))
+
+        profile = self._build(chromosome=chromosome)
+
+        if filename is not None:
+            print("{0} Saving GC profile of {1} to {2}".format(INFO, chromosome, filename))
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+            # write a temporary file and rename it so that
+            # readers never see a partially written profile
+            fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(filename), suffix=".tmp")
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, bits=profile.bits, byte_counts=profile.byte_counts,
+                         length=np.array([len(profile)], dtype=np.int64))
+            os.replace(tmp_filename, filename)
+        return profile
+
+    def _build(self, chromosome: str) -> GCProfile:
+        """
+        Build the profile of the chromosome reading it in blocks
+        """
+
+        print("{0} Building GC profile of {1}".format(INFO, chromosome))
+
+        with pysam.FastaFile(self._fasta_file) as fas:
+            length = fas.get_reference_length(chromosome)
+
+            bits = []
+            byte_counts = [np.zeros(1, dtype=np.int64)]
+            for start in range(0, length, self._block_size):
+                block_bits, block_counts = GCProfile.pack(sequence=fas.fetch(chromosome, start,
+                                                                             start + self._block_size),
+                                                          count=int(byte_counts[-1][-1]))
+                bits.append(block_bits)
+                byte_counts.append(block_counts[1:])
+
+        return GCProfile(bits=np.concatenate(bits) if len(bits) != 0 else np.zeros(0, dtype=np.uint8),
+                         byte_counts=np.concatenate(byte_counts), length=length)
@@ -1,8 +1,146 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from pomegranate import *
 import matplotlib.pyplot as plt
 
 from compute_engine.src.constants import INFO
+from compute_engine.src.exceptions import Error
+from compute_engine.src.numpy_hmm import NumpyHMM
+from compute_engine.src.cengine_configuration import HMM_CACHE_SIZE
+
+
+# the engines that can be used for the HMM computations
+HMM_ENGINES = ['pomegranate', 'numpy']
+
+
+class HMMCache(object):
+    """
+    LRU cache of built HMMs. Entries are keyed by the engine
+    and the SHA-256 digest and modification time of the model
+    file so that an updated file is built again
+    """
+
+    def __init__(self, max_size):
+
+        if max_size <= 0:
+            raise Error("HMM cache size should be positive. "
+                        "Size given {0}".format(max_size))
+
+        self._max_size = max_size
+        self._models = OrderedDict()
+
+        # (path, mtime, size) -> digest so that
+        # unchanged files are not hashed again
+        self._digests = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    def statistics(self):
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses,
+                    "evictions": self._evictions, "size": len(self._models),
+                    "max_size": self._max_size}
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._digests.clear()
+            self._hits = 0
+            self._misses = 0
+            self._evictions = 0
+
+    def make_key(self, hmm_file, engine):
+
+        stat = os.stat(hmm_file)
+        file_key = (os.path.abspath(hmm_file), stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            digest = self._digests.get(file_key, None)
+
+        if digest is None:
+            with open(hmm_file, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+
+            with self._lock:
+                self._digests[file_key] = digest
+
+        return engine, digest, stat.st_mtime_ns
+
+    def get(self, hmm_file, engine, builder):
+        """
+        Returns the HMM for the given file and engine. On a
+        miss the HMM is built by calling builder(hmm_file=hmm_file)
+        """
+
+        key = self.make_key(hmm_file=hmm_file, engine=engine)
+
+        with self._lock:
+            if key in self._models:
+                self._hits += 1
+                self._models.move_to_end(key)
+                return self._models[key]
+            self._misses += 1
+
+        hmm = builder(hmm_file=hmm_file)
+
+        with self._lock:
+            self._models[key] = hmm
+            self._models.move_to_end(key)
+
+            while len(self._models) > self._max_size:
+                self._models.popitem(last=False)
+                self._evictions += 1
+        return hmm
+
+
+# the HMMs built by this process
+HMM_CACHE = HMMCache(max_size=HMM_CACHE_SIZE)
+
+
+def hmm_cache_statistics():
+    return HMM_CACHE.statistics()
+
+
+def load_hmm(hmm_file: Path, engine: str='pomegranate', use_cache: bool=True):
+    """
+    Build the HMM in the given file with the given engine.
+    If use_cache is True the HMM is taken from the process
+    HMM cache and built only if it is not there
+    """
+
+    if engine == 'pomegranate':
+        builder = build_hmm
+    elif engine == 'numpy':
+        builder = build_numpy_hmm
+    else:
+        raise Error("HMM engine '{0}' not in {1}".format(engine, HMM_ENGINES))
+
+    if not use_cache:
+        return builder(hmm_file=hmm_file)
+
+    hmm = HMM_CACHE.get(hmm_file=hmm_file, engine=engine, builder=builder)
+    print("{0} HMM cache statistics {1}".format(INFO, HMM_CACHE.statistics()))
+    return hmm
+
+
+def build_numpy_hmm(hmm_file: Path):
+    """
+    Compile the HMM in the given file into a NumpyHMM.
+    This does not need pomegranate to build or bake the model
+    """
+
+    print("{0} Building NumPy HMM from file {1}".format(INFO, hmm_file))
+    return NumpyHMM.from_json_file(hmm_file=hmm_file)
+
 
 def build_hmm(hmm_file: Path):
 
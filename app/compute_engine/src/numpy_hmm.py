@@ -0,0 +1,456 @@
+"""
+NumPy implementation of the HMM computations used by
+HMMTuf. A NumpyHMM is compiled either from the JSON
+description of a pomegranate HiddenMarkovModel, as saved in
+the HMM files, or from a baked pomegranate model. Transitions
+are held as dense log-probability matrices and the state
+distributions as vectorized log-density functions.
+Decoding is done in log space
+"""
+
+import json
+import numpy as np
+
+from compute_engine.src.exceptions import Error
+
+try:
+    import numba
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+LOG_2_PI = np.log(2.0 * np.pi)
+
+
+class NormalLogDensity(object):
+
+    def __init__(self, mu, sigma):
+        self._mu = mu
+        self._log_sigma_sqrt_2_pi = -np.log(sigma * np.sqrt(2.0 * np.pi))
+        self._two_sigma_squared = 1.0 / (2.0 * sigma ** 2)
+
+    def log_probability(self, X):
+        X = np.asarray(X, dtype=np.float64).reshape(-1)
+        return self._log_sigma_sqrt_2_pi - ((X - self._mu) ** 2) * self._two_sigma_squared
+
+
+class UniformLogDensity(object):
+
+    def __init__(self, start, end):
+        self._start = start
+        self._end = end
+        self._logp = -np.log(end - start)
+
+    def log_probability(self, X):
+        X = np.asarray(X, dtype=np.float64).reshape(-1)
+        inside = (X >= self._start) & (X <= self._end)
+        return np.where(inside, self._logp, -np.inf)
+
+
+class MultivariateGaussianLogDensity(object):
+
+    def __init__(self, means, covariance):
+
+        means = np.asarray(means, dtype=np.float64)
+        covariance = np.asarray(covariance, dtype=np.float64)
+
+        chol = np.linalg.cholesky(covariance)
+        self._inv_cov = np.linalg.solve(chol, np.eye(len(means))).T
+        self._inv_dot_mu = means.dot(self._inv_cov)
+        self._log_norm = -0.5 * (len(means) * LOG_2_PI + 2.0 * np.sum(np.log(np.diag(chol))))
+
+    def log_probability(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        maha = np.sum((X.dot(self._inv_cov) - self._inv_dot_mu) ** 2, axis=1)
+        return self._log_norm - 0.5 * maha
+
+
+class MixtureLogDensity(object):
+
+    def __init__(self, distributions, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+        self._distributions = distributions
+        self._log_weights = np.log(weights / weights.sum())
+
+    def log_probability(self, X):
+
+        log_probability = None
+        for log_weight, distribution in zip(self._log_weights, self._distributions):
+            logp = log_weight + distribution.log_probability(X)
+
+            if log_probability is None:
+                log_probability = logp
+            else:
+                log_probability = np.logaddexp(log_probability, logp)
+        return log_probability
+
+
+class IndependentComponentsLogDensity(object):
+
+    def __init__(self, distributions, weights=None):
+
+        if weights is None:
+            weights = np.ones(len(distributions))
+
+        self._distributions = distributions
+        self._weights = np.asarray(weights, dtype=np.float64)
+
+    def log_probability(self, X):
+
+        X = np.asarray(X, dtype=np.float64)
+        log_probability = np.zeros(len(X))
+        for j, distribution in enumerate(self._distributions):
+            log_probability += distribution.log_probability(X[:, j]) * self._weights[j]
+        return log_probability
+
+
+def compile_distribution(dist_map, use_component_weights=False):
+    """
+    Compile the JSON map of a pomegranate distribution into
+    a log-density object. IndependentComponentsDistribution
+    weights are used only if use_component_weights is True
+    as hmm_loader.build_state does not use them
+    """
+
+    if dist_map.get("class", None) == "GeneralMixtureModel":
+        distributions = [compile_distribution(dist, use_component_weights)
+                         for dist in dist_map["distributions"]]
+        return MixtureLogDensity(distributions=distributions,
+                                 weights=dist_map["weights"])
+
+    name = dist_map.get("name", None)
+    parameters = dist_map["parameters"]
+
+    if name == "NormalDistribution":
+        return NormalLogDensity(mu=parameters[0], sigma=parameters[1])
+    elif name == "UniformDistribution":
+        return UniformLogDensity(start=parameters[0], end=parameters[1])
+    elif name == "MultivariateGaussianDistribution":
+        return MultivariateGaussianLogDensity(means=parameters[0], covariance=parameters[1])
+    elif name == "IndependentComponentsDistribution":
+        distributions = [compile_distribution(dist, use_component_weights)
+                         for dist in parameters[0]]
+
+        weights = None
+        if use_component_weights and len(parameters) > 1:
+            weights = parameters[1]
+        return IndependentComponentsLogDensity(distributions=distributions,
+                                               weights=weights)
+
+    raise Error("Distribution {0} is not supported. "
+                "Supported distributions are {1}".format(name, ["NormalDistribution",
+                                                                "UniformDistribution",
+                                                                "MultivariateGaussianDistribution",
+                                                                "IndependentComponentsDistribution",
+                                                                "GeneralMixtureModel"]))
+
+
+class HMMState(object):
+    """
+    A state of a NumpyHMM. Offers the name and
+    distribution attributes of a pomegranate State
+    """
+
+    __slots__ = ('name', 'distribution')
+
+    def __init__(self, name, distribution):
+        self.name = name
+        self.distribution = distribution
+
+    def __repr__(self):
+        return "HMMState({0})".format(self.name)
+
+
+def _viterbi_forward_numpy(log_start, log_trans, log_emissions, backpointers,
+                           chunk_size=4096):
+
+    n_obs, n_states = log_emissions.shape
+    deltas = np.empty_like(log_emissions)
+    deltas[0] = log_start + log_emissions[0]
+
+    # only the scores are computed in the sequential loop
+    columns = deltas[:, :, np.newaxis]
+    scores = np.empty((n_states, n_states))
+    for t in range(1, n_obs):
+        np.add(columns[t - 1], log_trans, out=scores)
+        np.max(scores, axis=0, out=deltas[t])
+        deltas[t] += log_emissions[t]
+
+    # the backpointers are recovered in chunks from the scores
+    for start in range(1, n_obs, chunk_size):
+        stop = min(start + chunk_size, n_obs)
+        backpointers[start:stop] = np.argmax(columns[start - 1:stop - 1] + log_trans, axis=1)
+    return deltas[-1]
+
+
+def _viterbi_forward_loops(log_start, log_trans, log_emissions, backpointers):
+
+    n_obs, n_states = log_emissions.shape
+    delta = log_start + log_emissions[0]
+    new_delta = np.empty(n_states)
+    for t in range(1, n_obs):
+        for j in range(n_states):
+            best = 0
+            best_score = delta[0] + log_trans[0, j]
+            for i in range(1, n_states):
+                score = delta[i] + log_trans[i, j]
+                if score > best_score:
+                    best_score = score
+                    best = i
+            backpointers[t, j] = best
+            new_delta[j] = best_score + log_emissions[t, j]
+        delta[:] = new_delta
+    return delta
+
+
+if HAS_NUMBA:
+    _viterbi_forward = numba.njit(cache=True)(_viterbi_forward_loops)
+else:
+    _viterbi_forward = _viterbi_forward_numpy
+
+
+class NumpyHMM(object):
+    """
+    Hidden Markov model with dense log-space
+    transitions and vectorized emissions
+    """
+
+    @staticmethod
+    def from_json_file(hmm_file):
+        """
+        Compile the HMM described in the given JSON file.
+        The file has the format read by hmm_loader.build_hmm
+        """
+
+        with open(hmm_file) as json_file:
+            hmm_json_map = json.load(json_file)
+
+        # the HMM files hold the JSON string of the model
+        if isinstance(hmm_json_map, str):
+            hmm_json_map = json.loads(hmm_json_map)
+
+        return NumpyHMM.from_json(hmm_json_map=hmm_json_map)
+
+    @staticmethod
+    def from_json(hmm_json_map, use_component_weights=False):
+        """
+        Compile the HMM from its JSON map. The emitting states
+        should precede the silent ones, as in the JSON of a baked
+        pomegranate model, and the only silent states should be
+        the start and end states
+        """
+
+        states = hmm_json_map["states"]
+        start_index = hmm_json_map["start_index"]
+        end_index = hmm_json_map["end_index"]
+
+        emitting = [i for i, state in enumerate(states) if state["distribution"] is not None]
+
+        if emitting != list(range(len(emitting))) or \
+                sorted([start_index, end_index]) != list(range(len(emitting), len(states))):
+            raise Error("The emitting states should precede the start and end "
+                        "states and these should be the only silent states")
+
+        transitions = np.zeros((len(states), len(states)))
+        for start, end, probability, pseudocount, group in hmm_json_map["edges"]:
+            transitions[start, end] = probability
+
+        hmm_states = [HMMState(name=state["name"],
+                               distribution=compile_distribution(state["distribution"],
+                                                                 use_component_weights))
+                      for state in states[:len(emitting)]]
+
+        return NumpyHMM(name=hmm_json_map["name"], states=hmm_states,
+                        transitions=transitions, start_index=start_index,
+                        end_index=end_index,
+                        start_name=states[start_index]["name"],
+                        end_name=states[end_index]["name"])
+
+    @staticmethod
+    def from_model(hmm_model):
+        """
+        Compile a baked pomegranate HiddenMarkovModel
+        """
+
+        n_states = hmm_model.silent_start
+        states = hmm_model.states
+
+        if len(states) - n_states != 2:
+            raise Error("The only silent states should be the start and end states")
+
+        hmm_states = [HMMState(name=state.name,
+                               distribution=compile_distribution(json.loads(state.distribution.to_json()),
+                                                                 use_component_weights=True))
+                      for state in states[:n_states]]
+
+        return NumpyHMM(name=hmm_model.name, states=hmm_states,
+                        transitions=hmm_model.dense_transition_matrix(),
+                        start_index=hmm_model.start_index,
+                        end_index=hmm_model.end_index,
+                        start_name=states[hmm_model.start_index].name,
+                        end_name=states[hmm_model.end_index].name)
+
+    def __init__(self, name, states, transitions, start_index,
+                 end_index, start_name, end_name):
+        """
+        transitions is the (S + 2, S + 2) matrix of transition
+        probabilities over the emitting states followed by the
+        start and end states. Outgoing probabilities are normalized
+        as pomegranate does when baking a model
+        """
+
+        self._name = name
+        self._states = states
+        self._start_index = start_index
+        self._end_index = end_index
+        self._start = HMMState(name=start_name, distribution=None)
+        self._end = HMMState(name=end_name, distribution=None)
+
+        transitions = np.array(transitions, dtype=np.float64)
+        totals = transitions.sum(axis=1, keepdims=True)
+        transitions = np.divide(transitions, totals,
+                                out=np.zeros_like(transitions), where=totals > 0.0)
+
+        emitting = np.arange(len(states))
+        with np.errstate(divide='ignore'):
+            log_trans = np.log(transitions)
+
+        self._log_start = log_trans[start_index, emitting]
+        self._log_trans = np.ascontiguousarray(log_trans[np.ix_(emitting, emitting)])
+        self._log_end = log_trans[emitting, end_index]
+
+        if not np.isfinite(self._log_end).any():
+            self._log_end = None
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def states(self):
+        return self._states
+
+    @property
+    def state_names(self):
+        return [state.name for state in self._states]
+
+    def log_parameters(self):
+        """
+        Returns the log-space parameters in the format of
+        streaming_viterbi.hmm_log_parameters plus the
+        log_emissions function
+        """
+        return {"states": self._states,
+                "start": self._start,
+                "start_index": self._start_index,
+                "end": self._end,
+                "end_index": self._end_index,
+                "log_start": self._log_start,
+                "log_trans": self._log_trans,
+                "log_end": self._log_end,
+                "log_emissions": self.log_emissions}
+
+    def log_emissions(self, X):
+        """
+        Returns the (N, S) matrix of the log-densities
+        of the observations for every state
+        """
+        X = np.asarray(X, dtype=np.float64)
+        return np.column_stack([state.distribution.log_probability(X)
+                                for state in self._states])
+
+    def viterbi(self, X):
+        """
+        Returns the log-probability of the ML path and the path
+        in the format of pomegranate's HiddenMarkovModel.viterbi
+        i.e. a list of (state index, state) that starts with the
+        start state and ends with the end state if this is reachable.
+        The path is None if it is impossible
+        """
+
+        log_probability, path = self.viterbi_indices(X)
+
+        if path is None:
+            return log_probability, None
+
+        states_path = [(self._start_index, self._start)]
+        states_path.extend([(idx, self._states[idx]) for idx in path.tolist()])
+
+        if self._log_end is not None:
+            states_path.append((self._end_index, self._end))
+        return log_probability, states_path
+
+    def viterbi_indices(self, X):
+        """
+        Returns the log-probability of the ML path and the
+        state index of every observation as an int64 array
+        """
+
+        log_emissions = self.log_emissions(X)
+        n_obs = len(log_emissions)
+
+        if n_obs == 0:
+            return -np.inf, None
+
+        backpointers = np.zeros((n_obs, len(self._states)), dtype=np.int64)
+        delta = _viterbi_forward(self._log_start, self._log_trans,
+                                 log_emissions, backpointers)
+
+        if self._log_end is not None:
+            delta = delta + self._log_end
+
+        state = int(np.argmax(delta))
+        log_probability = float(delta[state])
+
+        if not np.isfinite(log_probability):
+            return -np.inf, None
+
+        path = np.empty(n_obs, dtype=np.int64)
+        path[-1] = state
+        for t in range(n_obs - 1, 0, -1):
+            state = backpointers[t, state]
+            path[t - 1] = state
+        return log_probability, path
+
+    def forward_backward(self, X):
+        """
+        Returns the log-probability of the observations and the
+        (N, S) matrix of the log posterior state probabilities
+        """
+
+        log_emissions = self.log_emissions(X)
+        n_obs, n_states = log_emissions.shape
+
+        if n_obs == 0:
+            return -np.inf, np.zeros((0, n_states))
+
+        log_alpha = np.empty((n_obs, n_states))
+        log_alpha[0] = self._log_start + log_emissions[0]
+        for t in range(1, n_obs):
+            log_alpha[t] = _logsumexp(log_alpha[t - 1].reshape(n_states, 1) +
+                                      self._log_trans, axis=0) + log_emissions[t]
+
+        log_beta = np.empty((n_obs, n_states))
+        log_beta[-1] = 0.0 if self._log_end is None else self._log_end
+        for t in range(n_obs - 2, -1, -1):
+            log_beta[t] = _logsumexp(self._log_trans + log_emissions[t + 1] + log_beta[t + 1],
+                                     axis=1)
+
+        log_probability = float(_logsumexp(log_alpha[-1] + log_beta[-1], axis=0))
+        return log_probability, log_alpha + log_beta - log_probability
+
+    def predict_proba(self, X):
+        return np.exp(self.forward_backward(X)[1])
+
+    def log_probability(self, X):
+        return self.forward_backward(X)[0]
+
+
+def _logsumexp(a, axis):
+
+    a_max = np.max(a, axis=axis, keepdims=True)
+    a_max[~np.isfinite(a_max)] = 0.0
+
+    with np.errstate(divide='ignore'):
+        out = np.log(np.sum(np.exp(a - a_max), axis=axis, keepdims=True)) + a_max
+    return np.squeeze(out, axis=axis)
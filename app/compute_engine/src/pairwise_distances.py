@@ -0,0 +1,271 @@
+"""
+Pairwise distances of the sequences of a nucleods file. Only the
+pairs i < j (and optionally i == j) are enumerated. The upper
+triangle of the pairs matrix is cut into square tiles that are the
+units of work of the process pool. Every tile is written to its own
+CSV file once completed so a stopped computation resumes from the
+tiles not written yet. The transforms of the sequences are computed
+once, see sequence_transforms, and shared by the workers
+"""
+
+import csv
+import json
+import os
+import tempfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from compute_engine.src.constants import INFO, WARNING
+from compute_engine.src.exceptions import Error
+from compute_engine.src.file_readers import NuclOutFileReader
+from compute_engine.src.string_sequence_calculator import TextDistanceCalculator
+from compute_engine.src.sequence_transforms import SequenceTransforms, sequence_transforms
+from compute_engine.src.sequence_transforms import TRANSFORMS
+
+# the columns of the pair files
+PAIR_COLUMNS = ["#", "ChrSeq-1", "StartSeq-1", "EndSeq-1", "Seq-1", "HMM-State-1",
+                "ChrSeq-2", "StartSeq-2", "EndSeq-2", "Seq-2", "HMM-State-2",
+                "Distance", "Distance-PP", "Distance-AK", "Distance-WS"]
+
+# the file describing the tiling of a computation
+TILING_FILENAME = "pairwise_tiles.json"
+
+# the file the workers load the sequence transforms from
+TRANSFORMS_FILENAME = "sequence_transforms.npz"
+
+
+def triangular_tiles(n_items: int, tile_size: int, start: int=0, end: int=None) -> list:
+    """
+    Returns the (row_start, row_end, col_start, col_end) tiles
+    covering the pairs i <= j with i in [start, end) and j < n_items.
+    The tiles on the diagonal have col_start == row_start
+    """
+
+    if tile_size <= 0:
+        raise Error("Tile size should be positive. Size given {0}".format(tile_size))
+
+    if end is None or end == -1:
+        end = n_items
+
+    if start < 0 or end > n_items or start > end:
+        raise Error("Invalid rows [{0}, {1}) for {2} items".format(start, end, n_items))
+
+    tiles = []
+    for row_start in range(start, end, tile_size):
+        row_end = min(row_start + tile_size, end)
+        for col_start in range(row_start, n_items, tile_size):
+            tiles.append((row_start, row_end, col_start, min(col_start + tile_size, n_items)))
+    return tiles
+
+
+def tile_pairs(tile: tuple, include_self_pairs: bool=False) -> tuple:
+    """
+    Returns the arrays of the i and j indices of the pairs
+    of the tile. On a diagonal tile only i < j is returned,
+    or i <= j if include_self_pairs is True
+    """
+
+    row_start, row_end, col_start, col_end = tile
+
+    if row_start == col_start:
+        rows, cols = np.triu_indices(n=row_end - row_start, m=col_end - col_start,
+                                     k=0 if include_self_pairs else 1)
+    else:
+        rows, cols = np.indices((row_end - row_start, col_end - col_start))
+        rows = rows.ravel()
+        cols = cols.ravel()
+
+    return rows + row_start, cols + col_start
+
+
+def tile_filename(outdir: str, tile: tuple) -> Path:
+    return Path(outdir) / "part_seqs_pairs_tile_{0}_{1}.csv".format(tile[0], tile[2])
+
+
+def transforms_distances(calculator, strings1, strings2) -> tuple:
+    """
+    Returns the normalized distances of the raw, PP, AK and WS
+    transforms given as by sequence_transforms. Every distance
+    is the minimum of the distance to the second transform and
+    to its reverse complement
+    """
+
+    distances = []
+    for slot in range(0, len(strings1), 2):
+        distance = calculator.normalized_distance(strings1[slot], strings2[slot])
+        distance_rev = calculator.normalized_distance(strings1[slot], strings2[slot + 1])
+        distances.append(min(distance, distance_rev))
+    return tuple(distances)
+
+
+def sequence_pair_distances(calculator, seq1: str, seq2: str) -> tuple:
+    """
+    Returns the normalized distance of the two sequences and of
+    their PP, AK and WS alphabets
+    """
+    return transforms_distances(calculator=calculator, strings1=sequence_transforms(seq=seq1),
+                                strings2=sequence_transforms(seq=seq2))
+
+
+def read_sequences(input_file: str) -> list:
+    """
+    Returns the (chromosome, start, end, sequence, state)
+    rows of the nucleods file without the NO_REPEATS rows
+    """
+
+    filereader = NuclOutFileReader(exclude_seqs=["NO_REPEATS"])
+    return [[row[0].strip(), row[1], row[2], row[3].strip(), row[4].strip()]
+            for row in filereader(filename=input_file)]
+
+
+def compute_tile_distances(tile: tuple, sequences: list, transforms: SequenceTransforms,
+                           calculator, max_total_length: int=200,
+                           include_self_pairs: bool=False) -> list:
+    """
+    Returns the rows of the pair file of the tile. Only the pairs
+    whose total sequence length is less than max_total_length
+    are computed
+    """
+
+    rows, cols = tile_pairs(tile=tile, include_self_pairs=include_self_pairs)
+    selected = transforms.lengths[rows] + transforms.lengths[cols] < max_total_length
+
+    # the calculators with batch kernels compute
+    # all the pairs of the tile at once
+    if getattr(calculator, "pairwise", None) is not None:
+        rows = rows[selected].tolist()
+        cols = cols[selected].tolist()
+
+        distances = np.zeros((len(rows), len(TRANSFORMS)), dtype=np.float64)
+        for slot, transform in enumerate(TRANSFORMS):
+            distances[:, slot] = calculator.pairwise_min_reverse(
+                [transforms.encoded(idx=i, transform=transform) for i in rows],
+                [transforms.encoded(idx=j, transform=transform) for j in cols],
+                [transforms.encoded(idx=j, transform=transform, reverse=True) for j in cols])
+
+        return [list(sequences[i]) + list(sequences[j]) + pair_distances
+                for i, j, pair_distances in zip(rows, cols, distances.tolist())]
+
+    lines = []
+    for i, j in zip(rows[selected].tolist(), cols[selected].tolist()):
+        distances = transforms_distances(calculator=calculator, strings1=transforms.strings(idx=i),
+                                         strings2=transforms.strings(idx=j))
+        lines.append(list(sequences[i]) + list(sequences[j]) + list(distances))
+    return lines
+
+
+def write_tile(filename: Path, lines: list) -> None:
+    """
+    Write the lines of a tile. The file is written under a
+    temporary name and renamed so that an existing file is
+    always a completed tile
+    """
+
+    fd, tmp_filename = tempfile.mkstemp(dir=str(filename.parent), suffix=".tmp")
+    with os.fdopen(fd, 'w', newline="\n") as fh:
+        writer = csv.writer(fh, delimiter=",")
+        writer.writerow(PAIR_COLUMNS)
+
+        for line in lines:
+            writer.writerow(line)
+    os.replace(tmp_filename, str(filename))
+
+
+# the sequences and the calculator of a worker process
+_WORKER_STATE = {}
+
+
+def _init_worker(input_file: str, transforms_file: str, distance_type: str) -> None:
+    _WORKER_STATE["sequences"] = read_sequences(input_file=input_file)
+    _WORKER_STATE["transforms"] = SequenceTransforms.load(filename=transforms_file)
+    _WORKER_STATE["calculator"] = TextDistanceCalculator.build_calculator(name=distance_type)
+
+
+def _run_tile(tile: tuple, outdir: str, max_total_length: int, include_self_pairs: bool) -> int:
+
+    lines = compute_tile_distances(tile=tile, sequences=_WORKER_STATE["sequences"],
+                                   transforms=_WORKER_STATE["transforms"],
+                                   calculator=_WORKER_STATE["calculator"],
+                                   max_total_length=max_total_length,
+                                   include_self_pairs=include_self_pairs)
+    write_tile(filename=tile_filename(outdir=outdir, tile=tile), lines=lines)
+    return len(lines)
+
+
+def check_tiling(outdir: str, tiling: dict) -> None:
+    """
+    Save the tiling of the computation in the outdir or, if it is
+    saved already, check that the tiles written are of the same one
+    """
+
+    filename = Path(outdir) / TILING_FILENAME
+
+    if filename.is_file():
+        with open(filename, 'r') as fh:
+            saved = json.load(fh)
+
+        if saved != tiling:
+            raise Error("Output directory {0} has the tiles of {1}. "
+                        "Cannot resume with {2}".format(outdir, saved, tiling))
+        return
+
+    with open(filename, 'w') as fh:
+        json.dump(tiling, fh)
+
+
+def compute_pairwise_distances(input_file: str, outdir: str, distance_type: str,
+                               n_workers: int, tile_size: int, start: int=0, end: int=None,
+                               max_total_length: int=200, include_self_pairs: bool=False) -> dict:
+    """
+    Compute the distances of the pairs of the sequences in the
+    input_file with rows in [start, end) and write a pair file
+    for every tile in the outdir. The tiles already written are
+    skipped. Returns the number of the tiles computed, skipped
+    and failed
+    """
+
+    if n_workers <= 0:
+        raise Error("Number of workers should be positive. Given {0}".format(n_workers))
+
+    os.makedirs(outdir, exist_ok=True)
+
+    sequences = read_sequences(input_file=input_file)
+    n_items = len(sequences)
+    tiles = triangular_tiles(n_items=n_items, tile_size=tile_size, start=start, end=end)
+
+    check_tiling(outdir=outdir, tiling={"input_file": str(input_file), "n_items": n_items,
+                                        "distance_type": distance_type, "tile_size": tile_size,
+                                        "start": start, "end": end if end is not None else -1,
+                                        "max_total_length": max_total_length,
+                                        "include_self_pairs": include_self_pairs})
+
+    todo = [tile for tile in tiles if not tile_filename(outdir=outdir, tile=tile).is_file()]
+
+    print("{0} Number of sequences {1}".format(INFO, n_items))
+    print("{0} Number of tiles {1}. Tiles already computed {2}".format(INFO, len(tiles),
+                                                                         len(tiles) - len(todo)))
+
+    # the transforms are computed once and the
+    # workers memory map the saved arrays
+    transforms_file = str(Path(outdir) / TRANSFORMS_FILENAME)
+    SequenceTransforms.from_sequences(sequences=[row[3] for row in sequences]).save(filename=transforms_file)
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                             initargs=(input_file, transforms_file, distance_type)) as pool:
+
+        futures = {pool.submit(_run_tile, tile, outdir, max_total_length, include_self_pairs): tile
+                   for tile in todo}
+
+        for finished, future in enumerate(as_completed(futures)):
+            tile = futures[future]
+            try:
+                n_pairs = future.result()
+                print("{0} Tile {1} with {2} pairs finished "
+                      "({3}/{4})".format(INFO, tile, n_pairs, finished + 1, len(todo)))
+            except Exception as e:
+                failed += 1
+                print("{0} Tile {1} failed. Error Message {2}".format(WARNING, tile, str(e)))
+
+    return {"computed": len(todo) - failed, "skipped": len(tiles) - len(todo), "failed": failed}
@@ -1,14 +1,13 @@
 import sys
 import time
-from multiprocessing import Process
-from multiprocessing import Manager
+from concurrent.futures import ProcessPoolExecutor
 
-from helpers import partition_range
-from helpers import WindowType
-from helpers import INFO
-from exceptions import Error
-from bam_helpers import extract_windows
-from region import Region
+from compute_engine.src.windows import WindowType, Window
+from compute_engine.src.windows import samdata_to_records, records_to_samdata
+from compute_engine.src.constants import INFO
+from compute_engine.src.exceptions import Error
+from compute_engine.src.bam_helpers import extract_samdata, partition_windows
+from compute_engine.src.region import Region
 
 
 def test_windowing(**args):
@@ -32,8 +31,16 @@ def test_windowing(**args):
     return windows
 
 
-def regions_worker(worker_id, configuration, regions_chuncks,
-                   regions_dict, msg_dict, errors_dict):
+def regions_worker(worker_id, configuration, regions_chuncks):
+    """
+    Compute the windows of the chunk assigned to worker_id
+    for every region. The windows are returned as compact
+    structured arrays (see windows.SAMDATA_DTYPE) so that
+    no per-window objects cross the process boundary.
+    Returns (msg, {rid: (wga_records, no_wga_records)}).
+    On failure the records are None and msg holds the error
+    """
+
     try:
 
         args = {}
@@ -46,38 +53,49 @@ def regions_worker(worker_id, configuration, regions_chuncks,
         chromosome = configuration["chromosome"]
         ref_filename = configuration["reference_file"]['filename']
 
+        records = {}
         tstart = time.perf_counter()
         for rid in regions_chuncks.keys():
+
+            if worker_id >= len(regions_chuncks[rid]):
+                # the region has fewer windows than workers
+                continue
+
             worker_chunck = regions_chuncks[rid][worker_id]
 
-            args["start_idx"] = worker_chunck[0]
-            args["end_idx"] = worker_chunck[1]
+            args["start_idx"] = worker_chunck[1]
+            args["end_idx"] = worker_chunck[2]
             args["windowsize"] = windowsize
 
-            wga_windows = []
-            no_wga_windows = []
-
             bam_filename = configuration['wga_file']['filename']
-            wga_windows = extract_windows(chromosome=chromosome,
+            wga_samdata = extract_samdata(chromosome=chromosome,
                                           ref_filename=ref_filename,
                                           bam_filename=bam_filename,
                                           **args)
 
             bam_filename = configuration['no_wga_file']['filename']
-            no_wga_windows = extract_windows(chromosome=chromosome,
+            no_wga_samdata = extract_samdata(chromosome=chromosome,
                                              ref_filename=ref_filename,
                                              bam_filename=bam_filename,
                                              **args)
 
-            regions_dict[rid][worker_id] = {"wga_windows": wga_windows,
-                                            "no_wga_windows": no_wga_windows}
+            records[rid] = (samdata_to_records(samdata=wga_samdata),
+                            samdata_to_records(samdata=no_wga_samdata))
         tend = time.perf_counter()
         msg = ("Process {0} finished in {1} secs").format(worker_id, tend - tstart)
-        msg_dict[worker_id] = msg
+        return msg, records
     except Exception as e:
         msg = "An exception occured in worker {0}. Exception message {1}".format(worker_id, str(e))
-        errors_dict[worker_id] = msg
-        return
+        return msg, None
+
+
+def records_to_windows(records, first_idx, capacity):
+    """
+    Build the Window objects of the given structured array.
+    The window ids start at first_idx
+    """
+    return [Window(idx=first_idx + i, capacity=capacity, samdata=samdata)
+            for i, samdata in enumerate(records_to_samdata(records=records))]
 
 
 def par_make_window_regions(configuration):
@@ -89,87 +107,54 @@ def par_make_window_regions(configuration):
     regions_list = [(start, end) for start, end
                     in zip(regions["start"], regions["end"])]
 
-    regions_created = []
+    windowsize = configuration["window_size"]
 
-    # get the chunks that each process will work on
+    # get the chunks that each process will work on.
+    # Chunks are aligned to the window boundaries
     chunks_dict = dict()
 
     for i, r in enumerate(regions_list):
-        chunks_dict[i] = partition_range(start=r[0], end=r[1], npieces=n_procs)
+        chunks_dict[i] = partition_windows(start=r[0], end=r[1],
+                                           windowsize=windowsize, n_chunks=n_procs)
         print("{0} chuncks for region {1}: {2}".format(INFO, i, chunks_dict[i]))
         sys.stdout.flush()
-    manager = Manager()
-    windows_dict = manager.dict()
-    errors_dict = manager.dict()
-    msg_dict = manager.dict()
-
-    for i in range(len(regions_list)):
-        windows_dict[i] = manager.dict()
-        for p in range(n_procs):
-            windows_dict[i][p] = {"wga_windows": [],
-                                  "no_wga_windows": []}
-
-    for p in range(n_procs):
-        errors_dict[p] = "No error"
-        msg_dict[p] = "No msg"
-
-    procs = []
-
-    for p in range(n_procs - 1):
-        procs.append(Process(target=regions_worker,
-                             args=(p, configuration,
-                                   chunks_dict,
-                                   windows_dict,
-                                   msg_dict,
-                                   errors_dict)))
-        procs[p].start()
-
-    print("{0} Created: {1} processes".format(INFO, n_procs))
-    sys.stdout.flush()
-
-    p = n_procs - 1
-    print("{0} Master process is: {1} ".format(INFO, p))
-    sys.stdout.flush()
 
-    print("{0} Master process doing its share".format(INFO))
-    sys.stdout.flush()
+    with ProcessPoolExecutor(max_workers=n_procs) as executor:
+        futures = [executor.submit(regions_worker, p, configuration, chunks_dict)
+                   for p in range(n_procs)]
 
-    p = n_procs - 1
-    regions_worker(p,
-                   configuration,
-                   chunks_dict,
-                   windows_dict,
-                   msg_dict,
-                   errors_dict)
-
-    if errors_dict[p] != "No error":
-        raise Error(errors_dict[p])
-    else:
-        print("{0} Process {1} msg: {2}".format(INFO, p, msg_dict[p]))
+        print("{0} Created: {1} processes".format(INFO, n_procs))
         sys.stdout.flush()
 
-    # wait here and join the processes
-    for p in range(n_procs - 1):
-        procs[p].join()
+        # wait here for the workers
+        results = []
+        for p, future in enumerate(futures):
+            msg, records = future.result()
 
-        if errors_dict[p] != "No error":
-            raise Error(errors_dict[p])
-        else:
-            print("{0} Process {1} msg: {2}".format(INFO, p, msg_dict[p]))
+            if records is None:
+                raise Error(msg)
+
+            print("{0} Process {1} msg: {2}".format(INFO, p, msg))
             sys.stdout.flush()
+            results.append(records)
 
     regions = []
 
     # now bring together the pieces of the regions
     for i, r in enumerate(regions_list):
         region = Region(idx=i, start=r[0],
-                        end=r[1], window_size=configuration["window_size"])
+                        end=r[1], window_size=windowsize)
 
         wga_windows = []
         no_wga_windows = []
-        for p in range(n_procs):
-            wga_windows.extend(windows_dict[i][p]["wga_windows"])
-            no_wga_windows.extend(windows_dict[i][p]["no_wga_windows"])
+        for p, (first_idx, _, _) in enumerate(chunks_dict[i]):
+            wga_records, no_wga_records = results[p][i]
+            wga_windows.extend(records_to_windows(records=wga_records,
+                                                  first_idx=first_idx,
+                                                  capacity=windowsize))
+            no_wga_windows.extend(records_to_windows(records=no_wga_records,
+                                                     first_idx=first_idx,
+                                                     capacity=windowsize))
 
         region.set_windows(wtype=WindowType.WGA, windows=wga_windows)
 
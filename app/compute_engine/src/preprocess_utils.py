@@ -59,7 +59,7 @@ def compute_statistic(data, statistics):
     elif statistics == "max":
         return np.amax(data)
     elif statistics == "mode":
-        return stats.mode(data, axis=None).mode[0]
+        return np.atleast_1d(stats.mode(data, axis=None).mode)[0]
     elif statistics == "q75":
         return np.percentile(data, [75])
     elif statistics == "q25":
@@ -73,7 +73,7 @@ def compute_statistic(data, statistics):
         median = np.median(data)
         min_ = np.amin(data)
         max_ = np.amax(data)
-        mode = stats.mode(data, axis=None).mode[0]
+        mode = np.atleast_1d(stats.mode(data, axis=None).mode)[0]
         q75, q50, q25 = np.percentile(data, [75, 50, 25])
         return {"mean": mean, "var": var,
                 "median": median,
@@ -167,6 +167,63 @@ def remove_outliers(windows, removemethod, config):
     raise Error("Unknown outlier removal method: {0}".format(removemethod))
 
 
+def zscore_outlier_mask(means, gap_mask, config):
+    """
+    Array version of zscore_outlier_removal. means is an
+    (N, 2) array with the WGA and NO_WGA RD means of the windows
+    and gap_mask flags the gap windows. Returns a boolean
+    mask of the windows to keep
+    """
+
+    statistics = config["statistics"]
+    sigma_wga = np.sqrt(statistics[WindowType.WGA]["var"])
+    sigma_no_wga = np.sqrt(statistics[WindowType.NO_WGA]["var"])
+
+    zscore_wga = (means[:, 0] - statistics[WindowType.WGA]["mean"]) / sigma_wga
+    zscore_no_wga = (means[:, 1] - statistics[WindowType.NO_WGA]["mean"]) / sigma_no_wga
+
+    remove = (zscore_wga > config["sigma_factor"]) | \
+             (zscore_no_wga > config["sigma_factor"])
+
+    if config["use_both_ends"] == True:
+        remove |= (zscore_wga < - config["sigma_factor"]) | \
+                  (zscore_no_wga < - config["sigma_factor"])
+
+    # we don't want to remove the n_windows
+    # as these mark gaps
+    remove &= ~gap_mask
+
+    print("{0} Removed {1} windows ".format(INFO, int(np.count_nonzero(remove))))
+    print("{0} There are {1} GAP windows ".format(INFO, int(np.count_nonzero(gap_mask))))
+    return ~remove
+
+
+def means_cutoff_outlier_mask(means, gap_mask, config):
+    """
+    Array version of means_cutoff_outlier_removal.
+    Returns a boolean mask of the windows to keep
+    """
+
+    limits = config['mu_limits']
+    print("{0} Cutoff means limit: {1}".format(INFO, limits))
+
+    remove = (means[:, 0] > limits['wga_mu']) | (means[:, 1] > limits['no_wga_mu'])
+    remove &= ~gap_mask
+
+    print("{0} Removed {1} windows ".format(INFO, int(np.count_nonzero(remove))))
+    print("{0} There are {1} GAP windows ".format(INFO, int(np.count_nonzero(gap_mask))))
+    return ~remove
+
+
+def outliers_mask(means, gap_mask, removemethod, config):
+    if removemethod == "zscore":
+        return zscore_outlier_mask(means=means, gap_mask=gap_mask, config=config)
+    elif removemethod == "means_cutoff":
+        return means_cutoff_outlier_mask(means=means, gap_mask=gap_mask, config=config)
+
+    raise Error("Unknown outlier removal method: {0}".format(removemethod))
+
+
 def get_distance_metric(dist_metric, degree=4):
     if dist_metric.upper() == "MANHATAN":
         t_metric = type_metric.MANHATTAN
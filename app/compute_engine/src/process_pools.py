@@ -0,0 +1,93 @@
+"""
+Process pools that can also be started from daemonic
+processes e.g. the prefork workers of Celery
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import billiard
+    HAS_BILLIARD = True
+except ImportError:
+    HAS_BILLIARD = False
+
+
+class BilliardFuture(object):
+    """
+    The result of a job submitted to a BilliardPoolExecutor
+    """
+
+    def __init__(self, async_result) -> None:
+        self._async_result = async_result
+
+    def done(self) -> bool:
+        return self._async_result.ready()
+
+    def result(self, timeout=None):
+        return self._async_result.get(timeout=timeout)
+
+
+class BilliardPoolExecutor(object):
+    """
+    Executor with the submit, map and shutdown methods of
+    a ProcessPoolExecutor over a billiard pool. Unlike
+    multiprocessing, billiard lets daemonic processes
+    start child processes
+    """
+
+    def __init__(self, max_workers: int, initializer=None, initargs: tuple=()) -> None:
+        self._pool = billiard.Pool(processes=max_workers,
+                                   initializer=initializer, initargs=initargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown(wait=True)
+        return False
+
+    def submit(self, fn, *args, **kwargs) -> BilliardFuture:
+        return BilliardFuture(async_result=self._pool.apply_async(fn, args, kwargs))
+
+    def map(self, fn, iterable):
+
+        # a job per item as the workers of the chunks of
+        # Pool.map wait for their results to be consumed
+        futures = [self.submit(fn, item) for item in iterable]
+        return (future.result() for future in futures)
+
+    def shutdown(self, wait: bool=True) -> None:
+        self._pool.close()
+        if wait:
+            self._pool.join()
+
+
+def is_daemonic_process() -> bool:
+    """
+    Returns True if this process cannot start
+    the processes of a ProcessPoolExecutor
+    """
+
+    if multiprocessing.current_process().daemon:
+        return True
+
+    return HAS_BILLIARD and bool(billiard.current_process().daemon)
+
+
+def process_pool_executor(max_workers: int, initializer=None, initargs: tuple=()):
+    """
+    Returns an executor with a pool of max_workers processes. This
+    is a ProcessPoolExecutor unless the process is daemonic in which
+    case the pool is a billiard one. Returns None if the process is
+    daemonic and billiard is not installed
+    """
+
+    if not is_daemonic_process():
+        return ProcessPoolExecutor(max_workers=max_workers,
+                                   initializer=initializer, initargs=initargs)
+
+    if HAS_BILLIARD:
+        return BilliardPoolExecutor(max_workers=max_workers,
+                                    initializer=initializer, initargs=initargs)
+    return None
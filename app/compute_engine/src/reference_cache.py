@@ -0,0 +1,228 @@
+"""
+Cached access to a FASTA reference. The reference is read in
+fixed size blocks with pysam.FastaFile.fetch and the blocks are
+kept in an LRU cache so that the many small and overlapping
+fetches of the analyses, e.g. single bases of the pileups or the
+random normal windows of TUF-DEL-TUF, do not go to the file.
+get_reference_cache returns the cache of a file shared by the
+users of the process
+"""
+
+import os
+import threading
+from collections import OrderedDict
+import pysam
+
+from compute_engine.src.exceptions import Error
+from compute_engine.src.cengine_configuration import REFERENCE_BLOCK_SIZE
+from compute_engine.src.cengine_configuration import REFERENCE_CACHE_MAX_BLOCKS
+
+
+class ReferenceCache(object):
+    """
+    LRU cache of the blocks of a FASTA reference. fetch has
+    the signature of pysam.FastaFile.fetch so the cache can
+    be used where an open FastaFile is expected
+    """
+
+    def __init__(self, fasta_file: str, block_size: int=REFERENCE_BLOCK_SIZE,
+                 max_blocks: int=REFERENCE_CACHE_MAX_BLOCKS) -> None:
+
+        if block_size <= 0 or max_blocks <= 0:
+            raise Error("Reference cache block size and number of blocks "
+                        "should be positive. Given {0} and {1}".format(block_size, max_blocks))
+
+        self._fasta_file = str(fasta_file)
+        self._block_size = block_size
+        self._max_blocks = max_blocks
+
+        # (reference, block index) -> block in LRU order
+        self._blocks = OrderedDict()
+        self._lengths = None
+
+        # the open file and the process that opened it. A
+        # forked process opens the file again
+        self._fas = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._bypasses = 0
+        self._bytes_read = 0
+
+    @property
+    def filename(self) -> str:
+        return self._fasta_file
+
+    @property
+    def block_size(self) -> int:
+        return self._block_size
+
+    @property
+    def references(self) -> tuple:
+        with self._lock:
+            self._open()
+            return self._fas.references
+
+    def get_reference_length(self, reference: str) -> int:
+        with self._lock:
+            return self._reference_length(reference=reference)
+
+    def statistics(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {"hits": self._hits, "misses": self._misses,
+                    "hit_rate": self._hits / lookups if lookups != 0 else 0.0,
+                    "evictions": self._evictions, "bypasses": self._bypasses,
+                    "size": len(self._blocks), "max_blocks": self._max_blocks,
+                    "block_size": self._block_size, "bytes_read": self._bytes_read}
+
+    def fetch(self, reference: str, start: int=None, end: int=None) -> str:
+        """
+        Returns the sequence of the reference in [start, end).
+        As with pysam the range ends at the end of the reference
+        """
+
+        with self._lock:
+            return self._fetch(reference=reference, start=start, end=end)
+
+    def fetch_intervals(self, intervals) -> list:
+        """
+        Returns the sequences of the (reference, start, end)
+        intervals in the given order. The intervals are fetched
+        sorted so every block they share is read once
+        """
+
+        intervals = list(intervals)
+        order = sorted(range(len(intervals)),
+                       key=lambda idx: (intervals[idx][0], intervals[idx][1], intervals[idx][2]))
+
+        sequences = [None] * len(intervals)
+        with self._lock:
+            for idx in order:
+                reference, start, end = intervals[idx]
+                sequences[idx] = self._fetch(reference=reference, start=start, end=end)
+        return sequences
+
+    def clear(self) -> None:
+        with self._lock:
+            self._blocks.clear()
+            self._hits = 0
+            self._misses = 0
+            self._evictions = 0
+            self._bypasses = 0
+            self._bytes_read = 0
+
+    def close(self) -> None:
+        """
+        Close the file. The blocks are kept and the
+        file is opened again if a block is missing
+        """
+
+        with self._lock:
+            if self._fas is not None and self._pid == os.getpid():
+                self._fas.close()
+            self._fas = None
+            self._pid = None
+
+    def _open(self) -> None:
+
+        if self._fas is None or self._pid != os.getpid():
+            self._fas = pysam.FastaFile(self._fasta_file)
+            self._pid = os.getpid()
+            self._lengths = dict(zip(self._fas.references, self._fas.lengths))
+
+    def _reference_length(self, reference: str) -> int:
+
+        if self._lengths is None:
+            self._open()
+
+        if reference not in self._lengths:
+            raise Error("Reference {0} not in {1}".format(reference, self._fasta_file))
+        return self._lengths[reference]
+
+    def _fetch(self, reference: str, start: int, end: int) -> str:
+
+        length = self._reference_length(reference=reference)
+
+        if start is None:
+            start = 0
+
+        if end is None or end > length:
+            end = length
+
+        if start < 0:
+            raise Error("Invalid reference start {0}".format(start))
+
+        if end <= start:
+            if end < start and end != length:
+                raise Error("Invalid reference range [{0}, {1})".format(start, end))
+            return ""
+
+        first = start // self._block_size
+        last = (end - 1) // self._block_size
+
+        # ranges spanning much of the cache would evict
+        # the blocks of the other users so read them directly
+        if 2 * (last - first + 1) > self._max_blocks:
+            self._bypasses += 1
+            self._open()
+            self._bytes_read += end - start
+            return self._fas.fetch(reference, start, end)
+
+        offset = first * self._block_size
+        sequence = "".join([self._block(reference=reference, idx=idx, length=length)
+                            for idx in range(first, last + 1)])
+        return sequence[start - offset:end - offset]
+
+    def _block(self, reference: str, idx: int, length: int) -> str:
+
+        key = (reference, idx)
+        block = self._blocks.get(key, None)
+
+        if block is not None:
+            self._hits += 1
+            self._blocks.move_to_end(key)
+            return block
+
+        self._misses += 1
+        self._open()
+        block = self._fas.fetch(reference, idx * self._block_size,
+                                min((idx + 1) * self._block_size, length))
+        self._bytes_read += len(block)
+        self._blocks[key] = block
+
+        while len(self._blocks) > self._max_blocks:
+            self._blocks.popitem(last=False)
+            self._evictions += 1
+        return block
+
+
+# the caches used by this process by file
+_REFERENCE_CACHES = {}
+_REFERENCE_CACHES_LOCK = threading.Lock()
+
+
+def get_reference_cache(fasta_file: str, block_size: int=REFERENCE_BLOCK_SIZE,
+                        max_blocks: int=REFERENCE_CACHE_MAX_BLOCKS) -> ReferenceCache:
+    """
+    Returns the ReferenceCache of the given file. The cache is
+    created once per process and file version so that all the
+    analyses of a worker share the blocks and the statistics
+    """
+
+    stat = os.stat(fasta_file)
+    key = (os.path.abspath(str(fasta_file)), stat.st_size, stat.st_mtime_ns, block_size, max_blocks)
+
+    with _REFERENCE_CACHES_LOCK:
+        if key not in _REFERENCE_CACHES:
+
+            # drop the caches of older versions of the file
+            for old_key in [old_key for old_key in _REFERENCE_CACHES if old_key[0] == key[0]]:
+                _REFERENCE_CACHES.pop(old_key).close()
+
+            _REFERENCE_CACHES[key] = ReferenceCache(fasta_file=fasta_file, block_size=block_size,
+                                                     max_blocks=max_blocks)
+        return _REFERENCE_CACHES[key]
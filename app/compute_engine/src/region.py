@@ -1,9 +1,15 @@
 import array
+import numpy as np
 from compute_engine.src.windows import WindowType, MixedWindowView, Window
+from compute_engine.src.windows import SAMDATA_DTYPE, samdata_to_records, records_to_samdata
+from compute_engine.src.windows import WindowColumns, MixedWindowsArray
 
 from compute_engine.src.exceptions import Error
-from compute_engine.src.preprocess_utils import remove_outliers, compute_statistic
+from compute_engine.src.utils import NPZ_MAGIC, load_npz_columns
+from compute_engine.src.preprocess_utils import remove_outliers, outliers_mask, compute_statistic
 from compute_engine.src.analysis_helpers import save_windows_statistic
+from compute_engine.src.bam_helpers import extract_windows
+from compute_engine.src.bam_helpers import extract_windows_concurrently
 from compute_engine.src.cengine_configuration import TREAT_ERRORS_AS_WARNINGS, PRINT_WARNINGS
 from compute_engine.src.constants import WARNING, INFO
 
@@ -36,10 +42,76 @@ class Region(object):
   of windows
   """
 
+    # the formats a region can be saved in
+    FILE_FORMATS = ['txt', 'npz']
+
+    # version of the columnar npz format
+    NPZ_VERSION = 1
+
     @staticmethod
-    def load(filename):
+    def load(filename, lazy=False):
+        """
+        Load the region from the given file. The format is
+        detected from the file contents. Columnar npz files
+        written by Region.save are zip archives, anything
+        else is read as the legacy text format.
+        If lazy is True and the file is in the npz format the
+        region is array backed. The columns are memory mapped
+        and the windows are views created on access
+        """
 
         print("{0} Loading region from file: {1}".format(INFO, filename))
+
+        if Region.is_npz_file(filename=filename):
+            return Region._load_npz(filename=filename, lazy=lazy)
+
+        return Region._load_txt(filename=filename)
+
+    @staticmethod
+    def is_npz_file(filename):
+        with open(filename, 'rb') as f:
+            return f.read(4) == NPZ_MAGIC
+
+    @staticmethod
+    def _load_npz(filename, lazy=False):
+
+        data = load_npz_columns(filename=filename, mmap_mode='r' if lazy else None)
+
+        version, idx, start, end, w_size = data["header"].tolist()
+
+        if version != Region.NPZ_VERSION:
+            raise Error("Region file {0} has version {1}. "
+                        "Version {2} is supported".format(filename, version,
+                                                          Region.NPZ_VERSION))
+
+        region = Region(idx=idx, start=start,
+                        end=end, window_size=w_size)
+
+        for wtype in [WindowType.WGA, WindowType.NO_WGA]:
+            prefix = wtype.name.lower() + "_"
+
+            if lazy:
+                columns = {name: data[prefix + name]
+                           for name in ("wid", "capacity") + SAMDATA_DTYPE.names}
+                region.set_window_columns(wtype=wtype, columns=WindowColumns(columns=columns))
+                continue
+
+            records = np.zeros(len(data[prefix + "wid"]), dtype=SAMDATA_DTYPE)
+
+            for name in SAMDATA_DTYPE.names:
+                records[name] = data[prefix + name]
+
+            windows = [Window(idx=wid, capacity=cap, samdata=samdata)
+                       for wid, cap, samdata in zip(data[prefix + "wid"].tolist(),
+                                                    data[prefix + "capacity"].tolist(),
+                                                    records_to_samdata(records=records))]
+            region.set_windows(wtype=wtype, windows=windows)
+
+        return region
+
+    @staticmethod
+    def _load_txt(filename):
+
         with open(filename, 'r') as f:
 
             idx = int(f.readline().split(":")[1].rstrip("\n"))
@@ -140,6 +212,10 @@ class Region(object):
         self._windows = {WindowType.WGA: [],
                          WindowType.NO_WGA: []}
 
+        # column storage of the windows when
+        # the region is array backed
+        self._columns = None
+
         self._mixed_windows = None
 
     @property
@@ -164,24 +240,38 @@ class Region(object):
     def get_n_windows(self, type_):
         if self._mixed_windows is not None:
             return len(self._mixed_windows)
+
+        if self.is_array_backed():
+            return len(self._columns[type_])
         return len(self._windows[type_])
 
+    def is_array_backed(self):
+        return self._columns is not None
+
     def get_n_mixed_windows(self):
         if self._mixed_windows is None:
             return 0
 
         return len(self._mixed_windows)
 
-    def save(self, path, filename, tips):
+    def save(self, path, filename, tips, file_format='txt'):
 
         #filename = "region_" + str(self.ridx)
 
         #filename_ = path + filename
 
+        if file_format not in Region.FILE_FORMATS:
+            raise Error("Region file format '{0}' not in {1}".format(file_format,
+                                                                    Region.FILE_FORMATS))
+
         if tips is not None:
             for tip in tips:
                 filename += "_" + tip
 
+        if file_format == 'npz':
+            self._save_npz(filename=path + filename + ".npz")
+            return
+
         filename += ".txt"
 
         with open(path + filename, 'w') as f:
@@ -212,8 +302,44 @@ class Region(object):
                 for name in no_wga_w.sam_property_names():
                     f.write(name + ":" + str(no_wga_w.sam_property(name)) + "\n")
 
+    def _save_npz(self, filename):
+        """
+        Save the region in the columnar npz format. Every samdata
+        property of the WGA and NO_WGA windows is stored as a
+        typed column along with the window ids and capacities
+        """
+
+        columns = {"header": np.array([Region.NPZ_VERSION, self.ridx, self.start,
+                                       self.end, self.w_size], dtype=np.int64)}
+
+        for wtype in [WindowType.WGA, WindowType.NO_WGA]:
+
+            if self.is_array_backed():
+                prefix = wtype.name.lower() + "_"
+                for name in ("wid", "capacity") + SAMDATA_DTYPE.names:
+                    columns[prefix + name] = self._mixed_windows.column(wtype=wtype, name=name)
+                continue
+
+            windows = [window.get_window(wtype=wtype) for window in self._mixed_windows]
+            records = samdata_to_records(samdata=[window.samdata for window in windows])
+
+            prefix = wtype.name.lower() + "_"
+            columns[prefix + "wid"] = np.array([window.idx for window in windows], dtype=np.int64)
+            columns[prefix + "capacity"] = np.array([window.capacity for window in windows], dtype=np.int64)
+
+            for name in SAMDATA_DTYPE.names:
+                columns[prefix + name] = records[name]
+
+        # store uncompressed so that the
+        # columns can be read without inflating
+        with open(filename, 'wb') as f:
+            np.savez(f, **columns)
+
     def count_gap_windows(self):
 
+        if self.is_array_backed():
+            return int(np.count_nonzero(self._mixed_windows.gap_mask()))
+
         counter = 0
         for win in self._mixed_windows:
             if win.is_gap_window():
@@ -230,43 +356,70 @@ class Region(object):
 
         self._windows[wtype] = windows
 
-    def make_wga_windows(self, chromosome,
-                         ref_filename,
-                         bam_filename, **kwargs):
-
-        args = {"start_idx": self._start,
-                "end_idx": self._end,
-                "windowsize": self._w_size}
+    def set_window_columns(self, wtype, columns):
+        """
+        Set the column storage of the windows of the given
+        type. This makes the region array backed
+        """
 
-        if "debug" in kwargs:
-            args["debug"] = kwargs["debug"]
+        if wtype != WindowType.WGA and \
+                wtype != WindowType.NO_WGA:
+            raise Error("Invalid Window type {0}"
+                        " not in ['WGA', 'NO_WGA']".format(wtype))
 
-        args["sam_read_config"] = kwargs["sam_read_config"]
+        if self._columns is None:
+            self._columns = {}
 
-        #windows = extract_windows(chromosome=chromosome,
-        #                          ref_filename=ref_filename,
-        #                          bam_filename=bam_filename,
-        #                          **args)
-        windows = []
+        self._columns[wtype] = columns
 
-        if len(windows) != 0:
-            print("{0} Region Start Window "
-                  "Coords: Start/End idx {1}".format(INFO, windows[0].start_end_pos))
-            print("{0} Region End Window "
-                  "Coords: Start/End idx {1}".format(INFO, windows[-1].start_end_pos))
-        else:
+    def make_wga_windows(self, chromosome,
+                         ref_filename,
+                         bam_filename, **kwargs):
 
-            if TREAT_ERRORS_AS_WARNINGS:
-                print("{0} WGA Windows were not  created ".format(INFO))
-            else:
-                raise Error("Empty WGA windows list")
+        windows = self._extract_windows(chromosome=chromosome,
+                                        ref_filename=ref_filename,
+                                        bam_filenames=[bam_filename],
+                                        **kwargs)[0]
 
-        self._windows[WindowType.WGA] = windows
+        self._set_extracted_windows(wtype=WindowType.WGA, windows=windows)
 
     def make_no_wga_windows(self, chromosome,
                             ref_filename,
                             bam_filename, **kwargs):
 
+        windows = self._extract_windows(chromosome=chromosome,
+                                        ref_filename=ref_filename,
+                                        bam_filenames=[bam_filename],
+                                        **kwargs)[0]
+
+        self._set_extracted_windows(wtype=WindowType.NO_WGA, windows=windows)
+
+    def make_windows(self, chromosome, ref_filename,
+                     wga_filename, no_wga_filename, **kwargs):
+        """
+        Create the WGA and NO_WGA windows of the region. If an
+        executor is given in kwargs the two BAM files are
+        windowed concurrently
+        """
+
+        wga_windows, no_wga_windows = \
+            self._extract_windows(chromosome=chromosome,
+                                  ref_filename=ref_filename,
+                                  bam_filenames=[wga_filename, no_wga_filename],
+                                  **kwargs)
+
+        self._set_extracted_windows(wtype=WindowType.WGA, windows=wga_windows)
+        self._set_extracted_windows(wtype=WindowType.NO_WGA, windows=no_wga_windows)
+
+    def _extract_windows(self, chromosome, ref_filename,
+                         bam_filenames, **kwargs):
+        """
+        Extract the windows of the region for every BAM file.
+        If kwargs['executor'] is a concurrent.futures.Executor
+        the region is split into kwargs['n_chunks'] coordinate
+        chunks that are windowed by the executor workers
+        """
+
         args = {"start_idx": self._start,
                 "end_idx": self._end,
                 "windowsize": self._w_size}
@@ -276,12 +429,22 @@ class Region(object):
 
         args["sam_read_config"] = kwargs["sam_read_config"]
 
-        #windows = extract_windows(chromosome=chromosome,
-        #                          ref_filename=ref_filename,
-        #                          bam_filename=bam_filename,
-        #                          **args)
+        executor = kwargs.get("executor", None)
+
+        if executor is None:
+            return [extract_windows(chromosome=chromosome,
+                                    ref_filename=ref_filename,
+                                    bam_filename=bam_filename,
+                                    **args) for bam_filename in bam_filenames]
+
+        return extract_windows_concurrently(chromosome=chromosome,
+                                            ref_filename=ref_filename,
+                                            bam_filenames=bam_filenames,
+                                            executor=executor,
+                                            n_chunks=kwargs.get("n_chunks", 1),
+                                            **args)
 
-        windows = []
+    def _set_extracted_windows(self, wtype, windows):
 
         if len(windows) != 0:
             print("{0} Region Start Window "
@@ -291,29 +454,51 @@ class Region(object):
         else:
 
             if TREAT_ERRORS_AS_WARNINGS:
-                print("{0} NO_WGA Windows were not  created ".format(INFO))
+                print("{0} {1} Windows were not  created ".format(INFO, wtype.name))
             else:
-                raise Error("Empty NO WGA windows list")
+                raise Error("Empty {0} windows list".format(wtype.name))
 
-        self._windows[WindowType.NO_WGA] = windows
+        self._windows[wtype] = windows
 
     def check_windows_sanity(self):
 
-        if len(self._windows[WindowType.NO_WGA]) > len(self._windows[WindowType.WGA]):
+        windows = self._columns if self.is_array_backed() else self._windows
+
+        if len(windows[WindowType.NO_WGA]) > len(windows[WindowType.WGA]):
             print("{0} Windows size mismatch"
                   " WGA {1} NON_WGA {2}".format(WARNING,
-                                                len(self._windows[WindowType.WGA]),
-                                                len(self._windows[WindowType.NO_WGA])))
-        elif len(self._windows[WindowType.NO_WGA]) < len(self._windows[WindowType.WGA]):
+                                                len(windows[WindowType.WGA]),
+                                                len(windows[WindowType.NO_WGA])))
+        elif len(windows[WindowType.NO_WGA]) < len(windows[WindowType.WGA]):
             print("{0} Windows size mismatch"
                   " WGA {1} NON_WGA {2}".format(WARNING,
-                                                len(self._windows[WindowType.WGA]),
-                                                len(self._windows[WindowType.NO_WGA])))
+                                                len(windows[WindowType.WGA]),
+                                                len(windows[WindowType.NO_WGA])))
 
         # check if the rest of the windows
         # are aligned
         self.get_mixed_windows()
 
+        if self.is_array_backed():
+            mismatch = np.zeros(len(self._mixed_windows), dtype=np.bool_)
+            for name in ("start", "end"):
+                mismatch |= self._mixed_windows.column(wtype=WindowType.WGA, name=name) != \
+                            self._mixed_windows.column(wtype=WindowType.NO_WGA, name=name)
+
+            if not mismatch.any():
+                return
+
+            # report the first misaligned pair
+            window = self._mixed_windows[int(np.argmax(mismatch))]
+            start_wga, end_wga = window.get_window(wtype=WindowType.WGA).start_end_pos
+            start_no_wga, end_no_wga = window.get_window(wtype=WindowType.NO_WGA).start_end_pos
+            raise Error("Invalid window matching "
+                        "window WGA at {0}, {1} "
+                        "matched with NO WGA window at {2}, {3}".format(start_wga,
+                                                                        end_wga,
+                                                                        start_no_wga,
+                                                                        end_no_wga))
+
         for window in self._mixed_windows:
             start_wga, end_wga = window.get_window(wtype=WindowType.WGA).start_end_pos
             start_no_wga, end_no_wga = window.get_window(wtype=WindowType.NO_WGA).start_end_pos
@@ -330,6 +515,11 @@ class Region(object):
         if self._mixed_windows is not None:
             return self._mixed_windows
 
+        if self.is_array_backed():
+            self._mixed_windows = MixedWindowsArray(wga_columns=self._columns[WindowType.WGA],
+                                                    no_wga_columns=self._columns[WindowType.NO_WGA])
+            return self._mixed_windows
+
         self._mixed_windows = []
         for win1, win2 in zip(self._windows[WindowType.WGA],
                               self._windows[WindowType.NO_WGA]):
@@ -346,6 +536,10 @@ class Region(object):
         if self._mixed_windows is None:
             raise Error("Mixed windows have not been computed")
 
+        if self.is_array_backed():
+            self._mixed_windows = self._mixed_windows.select(~self._mixed_windows.gap_mask())
+            return
+
         mixed_windows = []
         for w in self._mixed_windows:
 
@@ -360,6 +554,10 @@ class Region(object):
         if self._mixed_windows is None:
             raise Error("Mixed windows have not been computed")
 
+        if self.is_array_backed():
+            self._mixed_windows = self._mixed_windows.select(~self._mixed_windows.error_mask())
+            return
+
         mixed_windows = []
         for w in self._mixed_windows:
 
@@ -403,6 +601,10 @@ class Region(object):
         if self._mixed_windows is None:
             raise Error("Mixed windows have not been computed")
 
+        if self.is_array_backed():
+            self._remove_outliers_with_mask(configuration=configuration)
+            return
+
         # compute the statistics
         wga_means = array.array('d')
         no_wga_means = array.array('d')
@@ -433,11 +635,39 @@ class Region(object):
                             removemethod=configuration["outlier_remove"]["name"],
                             config=config)
 
+    def _remove_outliers_with_mask(self, configuration):
+
+        gap_mask = self._mixed_windows.gap_mask()
+        means = np.column_stack((self._mixed_windows.column(wtype=WindowType.WGA, name="qmean"),
+                                 self._mixed_windows.column(wtype=WindowType.NO_WGA, name="qmean")))
+
+        if np.all(gap_mask):
+            print("{0} Cannot remove outliers for region. "
+                  "Empty RD list detected".format(WARNING))
+            return
+
+        wga_statistics = compute_statistic(data=means[~gap_mask, 0],
+                                           statistics="all")
+        no_wga_statistics = compute_statistic(data=means[~gap_mask, 1],
+                                              statistics="all")
+
+        config = configuration["outlier_remove"]["config"]
+        config["statistics"] = {WindowType.NO_WGA: no_wga_statistics,
+                                WindowType.WGA: wga_statistics}
+
+        keep = outliers_mask(means=means, gap_mask=gap_mask,
+                             removemethod=configuration["outlier_remove"]["name"],
+                             config=config)
+        self._mixed_windows = self._mixed_windows.select(keep)
+
     def mark_windows_with_gaps(self, n_mark):
 
         if self._mixed_windows is None:
             raise Error("Mixed windows have not been computed")
 
+        if self.is_array_backed():
+            return self._mark_windows_with_gaps_with_mask(n_mark=n_mark)
+
         counter = 0
         for window in self._mixed_windows:
             wga_w = window.get_window(wtype=WindowType.WGA)
@@ -465,6 +695,38 @@ class Region(object):
 
         return counter
 
+    def _mark_windows_with_gaps_with_mask(self, n_mark):
+
+        wga_gaps = self._mixed_windows.column(wtype=WindowType.WGA, name="gapAlert")
+        no_wga_gaps = self._mixed_windows.column(wtype=WindowType.NO_WGA, name="gapAlert")
+
+        # Add error if one has gap and the other not
+        mismatch = wga_gaps != no_wga_gaps
+        if mismatch.any():
+            window = self._mixed_windows[int(np.argmax(mismatch))]
+            wga_w = window.get_window(wtype=WindowType.WGA)
+            n_wga_w = window.get_window(wtype=WindowType.NO_WGA)
+
+            if wga_w.has_gaps():
+                raise Error("WGA Window {0} has GAP "
+                            "but Non WGA Window {1} does not".format(wga_w.idx,
+                                                                     n_wga_w.idx))
+            raise Error("WGA Window {0} does not have GAP "
+                        "but Non WGA Window {1} does".format(wga_w.idx,
+                                                             n_wga_w.idx))
+
+        gap_rows = self._mixed_windows.rows[wga_gaps]
+
+        if len(gap_rows) != 0:
+            Window.set_window_marker(marker=n_mark)
+
+        for wtype in [WindowType.WGA, WindowType.NO_WGA]:
+            columns = self._mixed_windows.get_columns(wtype=wtype)
+            for row in gap_rows.tolist():
+                columns.set_state(row=row, value=WindowType.N_WIN)
+
+        return len(gap_rows)
+
     def get_rd_mean_sequence(self, size, window_type, exclude_gaps):
 
         if self._mixed_windows is None:
@@ -575,6 +837,53 @@ class Region(object):
 
         return sequences
 
+    def get_rd_mean_observations(self, exclude_gaps=False):
+        """
+        Returns the RD means of the mixed windows as an (N, 2)
+        float64 array with columns (WGA, NO_WGA) and the window
+        coordinates as an (N, 2) int64 array with columns
+        (start, end). Gap windows have both means set to
+        Window.N_WINDOW_MARKER unless exclude_gaps is True
+        in which case they are dropped
+        """
+
+        if self._mixed_windows is None:
+            raise Error("Mixed windows have not been computed")
+
+        if self.is_array_backed():
+            wga_means = self._mixed_windows.column(wtype=WindowType.WGA, name="qmean")
+            no_wga_means = self._mixed_windows.column(wtype=WindowType.NO_WGA, name="qmean")
+            starts = self._mixed_windows.column(wtype=WindowType.WGA, name="start")
+            ends = self._mixed_windows.column(wtype=WindowType.WGA, name="end")
+            gap_mask = self._mixed_windows.gap_mask()
+        else:
+            n_windows = len(self._mixed_windows)
+            wga_means = np.empty(n_windows, dtype=np.float64)
+            no_wga_means = np.empty(n_windows, dtype=np.float64)
+            starts = np.empty(n_windows, dtype=np.int64)
+            ends = np.empty(n_windows, dtype=np.int64)
+            gap_mask = np.empty(n_windows, dtype=np.bool_)
+
+            for i, window in enumerate(self._mixed_windows):
+                wga_w = window.get_window(wtype=WindowType.WGA)
+                no_wga_w = window.get_window(wtype=WindowType.NO_WGA)
+                gap_mask[i] = wga_w.has_gaps() or no_wga_w.has_gaps()
+
+                if not gap_mask[i]:
+                    wga_means[i] = wga_w.get_rd_statistic(statistic="mean")
+                    no_wga_means[i] = no_wga_w.get_rd_statistic(statistic="mean")
+
+                starts[i], ends[i] = wga_w.start_end_pos
+
+        observations = np.column_stack((wga_means, no_wga_means)).astype(np.float64, copy=False)
+        coordinates = np.column_stack((starts, ends)).astype(np.int64, copy=False)
+
+        if exclude_gaps:
+            return observations[~gap_mask], coordinates[~gap_mask]
+
+        observations[gap_mask] = Window.N_WINDOW_MARKER
+        return observations, coordinates
+
     def __len__(self):
         return self.get_n_mixed_windows()
 
@@ -585,4 +894,8 @@ class Region(object):
         return self._mixed_windows[item]
 
     def __setitem__(self, o, value):
+
+        if self.is_array_backed():
+            raise Error("Array backed regions do not support window assignment")
+
         self._mixed_windows[o] = value
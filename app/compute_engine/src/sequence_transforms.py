@@ -0,0 +1,149 @@
+"""
+Precomputed transforms of the sequences of a distance computation.
+The raw, PP (purine/pyrimidine), AK (amino/keto) and WS (weak/strong)
+forms of every sequence and their reverse complements are computed
+once and stored as ASCII codes in a single uint8 array. The distance
+kernels address the transforms by sequence index instead of
+translating the sequences of every pair
+"""
+
+import os
+import tempfile
+import numpy as np
+
+from compute_engine.src.exceptions import Error
+from compute_engine.src.utils import load_npz_columns
+
+# complement and purine/pyrimidine, amino/keto
+# and weak/strong alphabets of the sequences
+COMPLEMENT_TABLE = str.maketrans("ACTGRMW", "TGACYKS")
+PP_TABLE = str.maketrans("AGCT", "RRYY")
+AK_TABLE = str.maketrans("ACGT", "MMKK")
+WS_TABLE = str.maketrans("ATCG", "WWSS")
+
+# the transforms in the order of the distance columns
+TRANSFORMS = ["raw", "PP", "AK", "WS"]
+TRANSFORM_TABLES = {"raw": None, "PP": PP_TABLE, "AK": AK_TABLE, "WS": WS_TABLE}
+
+
+def reverse_complement_table(seq, tab):
+    return seq.translate(tab)[::-1]
+
+
+def sequence_transforms(seq: str) -> list:
+    """
+    Returns the forward and reverse complement strings of
+    every transform of the sequence in the order of TRANSFORMS.
+    The reverse complement is taken after the transform as
+    in the distance computations
+    """
+
+    strings = []
+    for name in TRANSFORMS:
+        table = TRANSFORM_TABLES[name]
+        tseq = seq if table is None else seq.translate(table)
+        strings.append(tseq)
+        strings.append(reverse_complement_table(seq=tseq, tab=COMPLEMENT_TABLE))
+    return strings
+
+
+class SequenceTransforms(object):
+    """
+    The transforms of a list of sequences. The 2 * len(TRANSFORMS)
+    transforms of sequence idx are stored one after the other in
+    codes starting at offsets[idx] and have length lengths[idx]
+    """
+
+    N_SLOTS = 2 * len(TRANSFORMS)
+
+    def __init__(self, codes, offsets, lengths) -> None:
+
+        if len(offsets) != len(lengths):
+            raise Error("Sequence transforms have {0} offsets "
+                        "for {1} lengths".format(len(offsets), len(lengths)))
+
+        self._codes = codes
+        self._offsets = offsets
+        self._lengths = lengths
+
+        # the decoded strings by sequence index
+        self._strings = {}
+
+    @staticmethod
+    def from_sequences(sequences: list):
+
+        lengths = np.array([len(seq) for seq in sequences], dtype=np.int64)
+        offsets = np.zeros(len(sequences), dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths * SequenceTransforms.N_SLOTS)[:-1]
+
+        # non ASCII characters become ? so
+        # every character is a single code
+        codes = np.frombuffer("".join(["".join(sequence_transforms(seq=seq))
+                                       for seq in sequences]).encode('ascii', 'replace'), dtype=np.uint8)
+        return SequenceTransforms(codes=codes, offsets=offsets, lengths=lengths)
+
+    @staticmethod
+    def load(filename: str, mmap_mode: str='r'):
+        """
+        Load the transforms saved with save. The arrays are memory
+        mapped so the processes loading the file share its pages
+        """
+
+        columns = load_npz_columns(filename=filename, mmap_mode=mmap_mode)
+        return SequenceTransforms(codes=columns["codes"], offsets=columns["offsets"],
+                                  lengths=columns["lengths"])
+
+    @property
+    def codes(self):
+        return self._codes
+
+    @property
+    def offsets(self):
+        return self._offsets
+
+    @property
+    def lengths(self):
+        return self._lengths
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def encoded(self, idx: int, transform: str="raw", reverse: bool=False) -> np.ndarray:
+        """
+        Returns the codes of the given transform of the sequence idx
+        or of its reverse complement if reverse is True
+        """
+
+        length = int(self._lengths[idx])
+        start = int(self._offsets[idx]) + (2 * TRANSFORMS.index(transform) + int(reverse)) * length
+        return self._codes[start:start + length]
+
+    def strings(self, idx: int) -> tuple:
+        """
+        Returns the strings of all the transforms of the
+        sequence idx in the order of sequence_transforms
+        """
+
+        strings = self._strings.get(idx, None)
+
+        if strings is None:
+            length = int(self._lengths[idx])
+            start = int(self._offsets[idx])
+            block = self._codes[start:start + SequenceTransforms.N_SLOTS * length].tobytes().decode('ascii')
+            strings = tuple(block[slot * length:(slot + 1) * length]
+                            for slot in range(SequenceTransforms.N_SLOTS))
+            self._strings[idx] = strings
+        return strings
+
+    def save(self, filename: str) -> None:
+        """
+        Save the arrays uncompressed so that they can be memory
+        mapped. The file is written under a temporary name and
+        renamed so readers never see a partially written file
+        """
+
+        fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)), suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, codes=np.asarray(self._codes), offsets=np.asarray(self._offsets),
+                     lengths=np.asarray(self._lengths))
+        os.replace(tmp_filename, filename)
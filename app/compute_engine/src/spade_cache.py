@@ -0,0 +1,238 @@
+"""
+On-disk cache of the SPADE results. The repeats SPADE finds
+in a sequence, see SPADE.run_sequence, are stored as JSON files
+keyed by the SHA-256 digest of the SPADE.py file, the SPADE
+parameters and the sequence. The cache is bounded in bytes
+and the least recently used entries are evicted first until
+the cache is down to a low water mark of its size
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from compute_engine.src.exceptions import Error
+from compute_engine.src.cengine_configuration import SPADE_CACHE_LOW_WATER
+
+SPADE_CACHE_VERSION = 1
+
+
+class SpadeCache(object):
+    """
+    LRU cache of SPADE repeats in the directory path. The
+    use of an entry is recorded in its modification time so
+    the order survives the process and is shared by the
+    processes using the same directory
+    """
+
+    def __init__(self, path, max_bytes, low_water=SPADE_CACHE_LOW_WATER):
+
+        if max_bytes <= 0:
+            raise Error("SPADE cache size should be positive. "
+                        "Size given {0}".format(max_bytes))
+
+        if low_water <= 0.0 or low_water > 1.0:
+            raise Error("SPADE cache low water mark should be in (0, 1]. "
+                        "Low water mark given {0}".format(low_water))
+
+        self._path = str(path)
+        self._max_bytes = max_bytes
+
+        # the size the cache is evicted to when full
+        self._low_water_bytes = int(low_water * max_bytes)
+
+        # key -> size of the entries in LRU order
+        self._entries = None
+        self._total_bytes = 0
+
+        # (path, mtime, size) -> digest so that
+        # unchanged files are not hashed again
+        self._digests = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    def statistics(self):
+        with self._lock:
+            self._load_entries()
+            lookups = self._hits + self._misses
+            return {"hits": self._hits, "misses": self._misses,
+                    "hit_rate": self._hits / lookups if lookups != 0 else 0.0,
+                    "evictions": self._evictions, "size": len(self._entries),
+                    "bytes": self._total_bytes, "max_bytes": self._max_bytes}
+
+    def make_key(self, seq, spade_file, parameters=None):
+        """
+        Returns the key of the repeats of the sequence seq computed
+        by the SPADE.py spade_file with the given parameters
+        """
+
+        stat = os.stat(spade_file)
+        file_key = (os.path.abspath(spade_file), stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            digest = self._digests.get(file_key, None)
+
+        if digest is None:
+            with open(spade_file, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+
+            with self._lock:
+                self._digests[file_key] = digest
+
+        key = hashlib.sha256()
+        key.update(str(SPADE_CACHE_VERSION).encode())
+        key.update(digest.encode())
+        key.update(json.dumps(parameters if parameters is not None else {},
+                              sort_keys=True).encode())
+        key.update(seq.encode())
+        return key.hexdigest()
+
+    def get(self, key):
+        """
+        Returns the repeats stored with the
+        given key or None if there are none
+        """
+
+        filename = self._filename(key=key)
+
+        try:
+            with open(filename, 'r') as f:
+                size = os.fstat(f.fileno()).st_size
+                repeats = json.load(f)["repeats"]
+
+            # mark the entry as used
+            os.utime(filename)
+        except (OSError, ValueError, KeyError):
+            repeats = None
+
+        with self._lock:
+            self._load_entries()
+
+            if repeats is None:
+                self._misses += 1
+                return None
+
+            self._hits += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                # the entry was added by another process
+                # after the directory was indexed
+                self._entries[key] = size
+                self._total_bytes += size
+            return repeats
+
+    def put(self, key, repeats):
+        """
+        Store the repeats with the given key and evict
+        the least recently used entries if the cache is full
+        """
+
+        filename = self._filename(key=key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        # write a temporary file and rename it so that
+        # readers never see a partially written entry
+        fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(filename), suffix=".tmp")
+        with os.fdopen(fd, 'w') as f:
+            json.dump({"version": SPADE_CACHE_VERSION, "repeats": repeats}, f)
+        size = os.path.getsize(tmp_filename)
+        os.replace(tmp_filename, filename)
+
+        with self._lock:
+            self._load_entries()
+            self._total_bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+
+            if self._total_bytes > self._max_bytes:
+                # other processes may have added entries. As the
+                # cache is evicted to the low water mark the
+                # directory is indexed again only after a
+                # fraction of the cache size has been added
+                self._entries = None
+                self._load_entries()
+                self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._load_entries()
+            for key in list(self._entries):
+                self._remove(key=key)
+            self._hits = 0
+            self._misses = 0
+            self._evictions = 0
+
+    def _filename(self, key):
+        return os.path.join(self._path, key[:2], key + ".json")
+
+    def _load_entries(self):
+        """
+        Index the entries in the directory by their
+        modification time if not done already
+        """
+
+        if self._entries is not None:
+            return
+
+        entries = []
+        if os.path.isdir(self._path):
+            for root, _, filenames in os.walk(self._path):
+                for filename in filenames:
+                    if not filename.endswith(".json"):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(root, filename))
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime_ns, filename[:-len(".json")], stat.st_size))
+
+        entries.sort()
+        self._entries = OrderedDict((key, size) for _, key, size in entries)
+        self._total_bytes = sum(self._entries.values())
+
+    def _evict(self):
+
+        while self._total_bytes > self._low_water_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            self._remove(key=key)
+            self._evictions += 1
+
+    def _remove(self, key):
+
+        self._total_bytes -= self._entries.pop(key)
+        try:
+            os.remove(self._filename(key=key))
+        except OSError:
+            pass
+
+
+# the caches used by this process by directory
+_SPADE_CACHES = {}
+_SPADE_CACHES_LOCK = threading.Lock()
+
+
+def get_spade_cache(path, max_bytes):
+    """
+    Returns the SpadeCache of the given directory. The cache
+    is created once per process so that its statistics
+    cover all the runs of the process
+    """
+
+    path = os.path.abspath(str(path))
+    with _SPADE_CACHES_LOCK:
+        if path not in _SPADE_CACHES:
+            _SPADE_CACHES[path] = SpadeCache(path=path, max_bytes=max_bytes)
+        return _SPADE_CACHES[path]
@@ -0,0 +1,201 @@
+"""
+Streaming Viterbi decoding. The observations are processed
+in blocks and the part of the path that all surviving
+paths agree on is emitted as soon as it is known.
+Only the backpointers of the undecided tail are kept,
+so memory is bounded by the block size plus the length
+of the undecided tail rather than by the sequence length.
+The decoded path is identical to the one of a full decode
+"""
+
+import numpy as np
+
+from compute_engine.src.exceptions import Error
+
+
+def hmm_log_parameters(hmm_model):
+    """
+    Returns the log-space parameters of a baked pomegranate
+    HiddenMarkovModel as a dictionary with keys
+    states (the emitting states), log_start (S,),
+    log_trans (S, S) and log_end (S,) or None if the model
+    has no transitions into its end state
+    """
+
+    n_states = len(hmm_model.states)
+    silent_start = hmm_model.silent_start
+    start_index = hmm_model.start_index
+    end_index = hmm_model.end_index
+
+    if n_states - silent_start != 2:
+        raise Error("Streaming Viterbi only supports models whose "
+                    "only silent states are the start and end states")
+
+    with np.errstate(divide='ignore'):
+        log_trans = np.log(hmm_model.dense_transition_matrix())
+
+    emitting = np.arange(silent_start)
+    log_end = log_trans[emitting, end_index]
+
+    if not np.isfinite(log_end).any():
+        log_end = None
+
+    return {"states": hmm_model.states[:silent_start],
+            "start": hmm_model.states[start_index],
+            "start_index": start_index,
+            "end": hmm_model.states[end_index],
+            "end_index": end_index,
+            "log_start": log_trans[start_index, emitting],
+            "log_trans": log_trans[np.ix_(emitting, emitting)],
+            "log_end": log_end}
+
+
+def states_log_emissions(states):
+    """
+    Returns a function that computes the (B, S) log
+    emission matrix of a block of observations for
+    the given pomegranate states
+    """
+
+    def log_emissions(block):
+        return np.column_stack([np.asarray(state.distribution.log_probability(block),
+                                           dtype=np.float64).reshape(len(block))
+                                for state in states])
+
+    return log_emissions
+
+
+class StreamingViterbi(object):
+    """
+    Online Viterbi decoder. Iterating over decode(observations)
+    yields the state index of every observation in order.
+    Once the iteration is exhausted log_probability holds the
+    log-probability of the ML path. It is -inf and nothing is
+    yielded for the final observations if the path is impossible
+    """
+
+    def __init__(self, log_start, log_trans, log_emissions,
+                 block_size, log_end=None):
+
+        if block_size <= 0:
+            raise Error("Block size should be positive. "
+                        "Block size given {0}".format(block_size))
+
+        self._log_start = log_start
+        self._log_trans = log_trans
+        self._log_emissions = log_emissions
+        self._log_end = log_end
+        self._block_size = block_size
+        self.log_probability = None
+
+    def decode(self, observations):
+
+        n_obs = len(observations)
+        n_states = len(self._log_start)
+        self.log_probability = None
+
+        if n_obs == 0:
+            self.log_probability = -np.inf
+            return
+
+        # backpointers[i] maps the states at time t + i + 1 to
+        # the states at t + i where t is the first time whose
+        # state has not been yielded yet
+        backpointers = []
+
+        delta = None
+        all_states = np.arange(n_states)
+
+        for block_start in range(0, n_obs, self._block_size):
+            block = observations[block_start: block_start + self._block_size]
+            emissions = self._log_emissions(block)
+
+            for row in range(len(emissions)):
+
+                if delta is None:
+                    delta = self._log_start + emissions[row]
+                    continue
+
+                scores = delta[:, np.newaxis] + self._log_trans
+                pointers = np.argmax(scores, axis=0)
+                delta = scores[pointers, all_states] + emissions[row]
+                backpointers.append(pointers)
+
+            if not np.isfinite(delta).any():
+                self.log_probability = -np.inf
+                return
+
+            # find the latest time every surviving
+            # path goes through the same state
+            converged = self._find_convergence(backpointers=backpointers,
+                                               n_states=n_states)
+
+            if converged is not None:
+                time, state = converged
+                yield from self._traceback(backpointers=backpointers[:time],
+                                           state=state)
+                backpointers = backpointers[time + 1:]
+
+        if self._log_end is not None:
+            delta = delta + self._log_end
+
+        state = int(np.argmax(delta))
+        self.log_probability = float(delta[state])
+
+        if not np.isfinite(self.log_probability):
+            return
+
+        yield from self._traceback(backpointers=backpointers, state=state)
+
+    @staticmethod
+    def _find_convergence(backpointers, n_states):
+        """
+        Returns (time, state) for the latest time, relative to the
+        first undecided one, at which all the paths ending in the
+        current states coincide or None
+        """
+
+        current = np.arange(n_states)
+        for time in range(len(backpointers) - 1, -1, -1):
+            current = np.unique(backpointers[time][current])
+
+            if len(current) == 1:
+                return time, int(current[0])
+        return None
+
+    @staticmethod
+    def _traceback(backpointers, state):
+        """
+        Yields the states from the first undecided time up to
+        the time len(backpointers) where the path is in state
+        """
+
+        path = np.empty(len(backpointers) + 1, dtype=np.int64)
+        path[-1] = state
+        for time in range(len(backpointers) - 1, -1, -1):
+            state = backpointers[time][state]
+            path[time] = state
+
+        yield from path.tolist()
+
+
+def build_streaming_decoder(hmm_model, block_size):
+    """
+    Returns the log-space parameters of the hmm_model
+    (see hmm_log_parameters) and a StreamingViterbi decoder
+    for it that works in blocks of block_size. The model is
+    either a baked pomegranate model or a NumpyHMM
+    """
+
+    if hasattr(hmm_model, "log_parameters"):
+        params = hmm_model.log_parameters()
+    else:
+        params = hmm_log_parameters(hmm_model=hmm_model)
+        params["log_emissions"] = states_log_emissions(states=params["states"])
+
+    decoder = StreamingViterbi(log_start=params["log_start"],
+                               log_trans=params["log_trans"],
+                               log_emissions=params["log_emissions"],
+                               block_size=block_size,
+                               log_end=params["log_end"])
+    return params, decoder
@@ -5,6 +5,7 @@ from compute_engine.src.exceptions import Error
 from compute_engine.src.utils import read_sequence_bed_file
 from compute_engine.src.utils import INFO
 from compute_engine.src.cpf import CPF
+from compute_engine.src import distance_kernels
 
 
 class L2Norm(object):
@@ -23,47 +24,38 @@ class AllDistancesCalculator(object):
     """
     Wrapper for calculating all the distances
     """
+
+    # the names of the distances and their classes
+    CALCULATORS = [('ham', textdistance.Hamming), ('mlipns', textdistance.MLIPNS),
+                   ('lev', textdistance.Levenshtein), ('damlev', textdistance.DamerauLevenshtein),
+                   ('jwink', textdistance.JaroWinkler), ('str', textdistance.StrCmp95),
+                   ('nw', textdistance.NeedlemanWunsch), ('got', textdistance.Gotoh),
+                   ('jac', textdistance.Jaccard), ('sor', textdistance.Sorensen),
+                   ('tve', textdistance.Tversky), ('ov', textdistance.Overlap),
+                   ('tan', textdistance.Tanimoto), ('cos', textdistance.Cosine),
+                   ('mon', textdistance.MongeElkan), ('bag', textdistance.Bag),
+                   ('lcsseq', textdistance.LCSSeq), ('lcsstr', textdistance.LCSStr),
+                   ('rat', textdistance.RatcliffObershelp), ('ari', textdistance.ArithNCD),
+                   ('rle', textdistance.RLENCD), ('bwt', textdistance.BWTRLENCD),
+                   ('sqr', textdistance.SqrtNCD), ('ent', textdistance.EntropyNCD),
+                   ('bz2', textdistance.BZ2NCD), ('lzm', textdistance.LZMANCD),
+                   ('zli', textdistance.ZLIBNCD), ('mra', textdistance.MRA),
+                   ('edi', textdistance.Editex), ('pre', textdistance.Prefix),
+                   ('pos', textdistance.Postfix), ('len', textdistance.Length),
+                   ('id', textdistance.Identity), ('mat', textdistance.Matrix)]
+
     def __init__(self):
-        pass
+
+        # the calculators are built once
+        # and not for every pair
+        self._calculators = [(name, calculator()) for name, calculator in AllDistancesCalculator.CALCULATORS]
 
     def similarity(self, seq1, seq2):
 
         results = {}
 
-        results['ham'] = textdistance.Hamming().distance(seq1, seq2)
-        results['mlipns'] = textdistance.MLIPNS().distance(seq1, seq2)
-        results['lev'] = textdistance.Levenshtein().distance(seq1, seq2)
-        results['damlev'] = textdistance.DamerauLevenshtein().distance(seq1, seq2)
-        results['jwink'] = textdistance.JaroWinkler().distance(seq1, seq2)
-        results['str'] = textdistance.StrCmp95().distance(seq1, seq2)
-        results['nw'] = textdistance.NeedlemanWunsch().distance(seq1, seq2)
-        results['got'] = textdistance.Gotoh().distance(seq1, seq2)
-        results['jac'] = textdistance.Jaccard().distance(seq1, seq2)
-        results['sor'] = textdistance.Sorensen().distance(seq1, seq2)
-        results['tve'] = textdistance.Tversky().distance(seq1, seq2)
-        results['ov'] = textdistance.Overlap().distance(seq1, seq2)
-        results['tan'] = textdistance.Tanimoto().distance(seq1, seq2)
-        results['cos'] = textdistance.Cosine().distance(seq1, seq2)
-        results['mon'] = textdistance.MongeElkan().distance(seq1, seq2)
-        results['bag'] = textdistance.Bag().distance(seq1, seq2)
-        results['lcsseq'] = textdistance.LCSSeq().distance(seq1, seq2)
-        results['lcsstr'] = textdistance.LCSStr().distance(seq1, seq2)
-        results['rat'] = textdistance.RatcliffObershelp().distance(seq1, seq2)
-        results['ari'] = textdistance.ArithNCD().distance(seq1, seq2)
-        results['rle'] = textdistance.RLENCD().distance(seq1, seq2)
-        results['bwt'] = textdistance.BWTRLENCD().distance(seq1, seq2)
-        results['sqr'] = textdistance.SqrtNCD().distance(seq1, seq2)
-        results['ent'] = textdistance.EntropyNCD().distance(seq1, seq2)
-        results['bz2'] = textdistance.BZ2NCD().distance(seq1, seq2)
-        results['lzm'] = textdistance.LZMANCD().distance(seq1, seq2)
-        results['zli'] = textdistance.ZLIBNCD().distance(seq1, seq2)
-        results['mra'] = textdistance.MRA().distance(seq1, seq2)
-        results['edi'] = textdistance.Editex().distance(seq1, seq2)
-        results['pre'] = textdistance.Prefix().distance(seq1, seq2)
-        results['pos'] = textdistance.Postfix().distance(seq1, seq2)
-        results['len'] = textdistance.Length().distance(seq1, seq2)
-        results['id'] = textdistance.Identity().distance(seq1, seq2)
-        results['mat'] = textdistance.Matrix().distance(seq1, seq2)
+        for name, calculator in self._calculators:
+            results[name] = calculator.distance(seq1, seq2)
 
         return results
 
@@ -86,25 +78,27 @@ class TextDistanceCalculator(object):
         if name not in TextDistanceCalculator.NAMES:
             raise Error("Distance type '{0}' is invalid".format(name))
 
-        if name   == 'ham'   : return textdistance.Hamming()
+        # the calculators of distance_kernels extend the
+        # textdistance ones with a batch pairwise method
+        if name   == 'ham'   : return distance_kernels.Hamming()
         elif name == 'mlipns': return textdistance.MLIPNS()
-        elif name == 'lev'   : return textdistance.Levenshtein()
-        elif name == 'damlev': return textdistance.DamerauLevenshtein()
+        elif name == 'lev'   : return distance_kernels.Levenshtein()
+        elif name == 'damlev': return distance_kernels.DamerauLevenshtein()
         elif name == 'jwink' : return textdistance.JaroWinkler()
         elif name == 'str'   : return textdistance.StrCmp95()
         elif name == 'nw'    : return textdistance.NeedlemanWunsch()
         elif name == 'sw'    : return textdistance.SmithWaterman()
         elif name == 'got'   : return textdistance.Gotoh()
-        elif name == 'jac'   : return textdistance.Jaccard()
-        elif name == 'sor'   : return textdistance.Sorensen()
+        elif name == 'jac'   : return distance_kernels.Jaccard()
+        elif name == 'sor'   : return distance_kernels.Sorensen()
         elif name == 'tve'   : return textdistance.Tversky()
         elif name == 'ov'    : return textdistance.Overlap()
         elif name == 'tan'   : return textdistance.Tanimoto()
-        elif name == 'cos'   : return textdistance.Cosine()
+        elif name == 'cos'   : return distance_kernels.Cosine()
         elif name == 'mon'   : return textdistance.MongeElkan()
         elif name == 'bag'   : return textdistance.Bag()
-        elif name == 'lcsseq': return textdistance.LCSSeq()
-        elif name == 'lcsstr': return textdistance.LCSStr()
+        elif name == 'lcsseq': return distance_kernels.LCSSeq()
+        elif name == 'lcsstr': return distance_kernels.LCSStr()
         elif name == 'rat'   : return textdistance.RatcliffObershelp()
         elif name == 'ari'   : return textdistance.ArithNCD()
         elif name == 'rle'   : return textdistance.RLENCD()
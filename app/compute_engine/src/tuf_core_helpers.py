@@ -6,41 +6,57 @@ import os
 import shutil
 from pathlib import Path
 from compute_engine.src.utils import INFO
-from compute_engine.src.utils import get_sequence_chunks
+from compute_engine.src.viterbi_segments import run_length_encode
+from compute_engine.src.gc_profile import GCProfile
+
+def get_fasta_lines_sequence(lines) -> tuple:
+    """
+    Returns the number of records and the concatenated
+    sequences without gaps of the given FASTA lines
+    """
+
+    seq = ""
+    counter = 0
+    for line in lines:
+        if line.startswith(">"):
+            counter += 1
+        else:
+            line = line.rstrip('\n')
+            line = line.replace("-", "")
+            seq += line
+
+    return counter, seq
+
 
 def get_align_unit_seq_fasta(working_dir):
 
     with open(working_dir / "align.unit_seq.fasta", "r") as fh:
+        return get_fasta_lines_sequence(lines=fh)
 
-        seq = ""
-        counter = 0
-        for line in fh:
-            if line.startswith(">"):
-                counter += 1
-            else:
-                line = line.rstrip('\n')
-                line = line.replace("-", "")
-                seq += line
-
-        #seq = seq.replace("-", "")
-        return counter, seq
 
 def get_unit_seq_fasta(working_dir):
 
     with open(working_dir / "unit_seq.fasta", "r") as fh:
+        return get_fasta_lines_sequence(lines=fh)
 
-        seq = ""
-        counter = 0
-        for line in fh:
-            if line.startswith(">"):
-                counter += 1
-            else:
-                line = line.rstrip('\n')
-                line = line.replace("-","")
-                seq += line
 
-        #seq = seq.replace("-","")
-        return counter, seq
+def read_spade_repeat(weblogo_dir: Path) -> dict:
+    """
+    Returns the repeat of the SPADE directory weblogo_dir in
+    the form returned by the in-process SPADE run i.e. the lines
+    of the weblogo.txt, unit_seq.fasta and align.unit_seq.fasta files
+    """
+
+    repeat = {"name": Path(weblogo_dir).name}
+    for key, filename in [("weblogo", "weblogo.txt"),
+                          ("unit_seq", "unit_seq.fasta"),
+                          ("align_unit_seq", "align.unit_seq.fasta")]:
+        repeat[key] = None
+        if os.path.isfile(Path(weblogo_dir) / filename):
+            with open(Path(weblogo_dir) / filename, 'r') as f:
+                repeat[key] = f.readlines()
+    return repeat
+
 
 def is_contributing_weblogo(weblogo_dir: Path, count_check: int=12) -> bool:
 
@@ -149,43 +165,67 @@ def get_statistics_from_weblogo(weblogo_dir: Path,
             #raise ValueError(f"The computed count {count} does not match the given {count_check}")
 
 
-def write_from_weblogo(weblogo_dir: Path, out_repeats, out_nucleods,
-                       out_repeats_info, chrom: str,
-                       start: int, stop: int, region_type: str, count_check: int=12):
-
+def get_weblogo_sequence(lines) -> tuple:
     """
-    write to the outrep and to the nucl_out files
-    information
+    Returns the number of lines and the sequence of the bases
+    with the maximum count in the given weblogo.txt lines
     """
 
     nucleods = ['A', 'C', 'G', 'T']
     count = 0
     seq = ''
 
-    with open(weblogo_dir / 'weblogo.txt', 'r') as f:
+    for line in lines:
+        count += 1
 
-        for line in f:
-            count += 1
+        # don't process the comment line
+        if line.startswith('#'):
+            continue
 
-            # don't process the comment line
-            if line.startswith('#'):
-                continue
+        # checkout from the line which has the maximum
+        new_line = line.split('\t')
 
-            # checkout from the line which has the maximum
-            new_line = line.split('\t')
+        if len(new_line) > 5:
+            new_line = new_line[1:5]
+            new_line = [int(item) for item in new_line]
+            max_item = max(new_line)
+            nucleod_idx = new_line.index(max_item)
 
-            if len(new_line) > 5:
-                new_line = new_line[1:5]
-                new_line = [int(item) for item in new_line]
-                max_item = max(new_line)
-                nucleod_idx = new_line.index(max_item)
+            if nucleod_idx >= 4:
+                raise ValueError("Invalid index for nucleod. "
+                                 "Index {0} not in [0,3]".format(nucleod_idx))
 
-                if nucleod_idx >= 4:
-                    raise ValueError("Invalid index for nucleod. "
-                                     "Index {0} not in [0,3]".format(nucleod_idx))
+            nucleod = nucleods[nucleod_idx]
+            seq += nucleod
+
+    return count, seq
 
-                nucleod = nucleods[nucleod_idx]
-                seq += nucleod
+
+def write_from_weblogo(weblogo_dir: Path, out_repeats, out_nucleods,
+                       out_repeats_info, chrom: str,
+                       start: int, stop: int, region_type: str, count_check: int=12):
+
+    """
+    write to the outrep and to the nucl_out files
+    information
+    """
+
+    write_from_spade_repeat(repeat=read_spade_repeat(weblogo_dir=weblogo_dir),
+                            out_repeats=out_repeats, out_nucleods=out_nucleods,
+                            out_repeats_info=out_repeats_info, chrom=chrom,
+                            start=start, stop=stop, region_type=region_type,
+                            count_check=count_check)
+
+
+def write_from_spade_repeat(repeat: dict, out_repeats, out_nucleods,
+                            out_repeats_info, chrom: str,
+                            start: int, stop: int, region_type: str, count_check: int=12):
+    """
+    Same as write_from_weblogo for a repeat
+    returned by the in-process SPADE run
+    """
+
+    count, seq = get_weblogo_sequence(lines=repeat["weblogo"])
 
     # TODO: Make this application defined?
     # write only if it is worth i.e. we have at least
@@ -197,9 +237,9 @@ def write_from_weblogo(weblogo_dir: Path, out_repeats, out_nucleods,
 
         if len(seq) != 0:
 
-            # open the unit sequences
-            align_seq_count, align_seq = get_align_unit_seq_fasta(working_dir=weblogo_dir)
-            unit_seq_count, unit_seq = get_unit_seq_fasta(working_dir=weblogo_dir)
+            # the unit sequences
+            align_seq_count, align_seq = get_fasta_lines_sequence(lines=repeat["align_unit_seq"] or [])
+            unit_seq_count, unit_seq = get_fasta_lines_sequence(lines=repeat["unit_seq"] or [])
 
             out_nucleods.write(chrom + '\t' + str(start) + '\t' + str(stop) + '\t' + seq + '\t' + region_type + '\n')
             out_repeats_info.write(chrom + '\t' + str(start) + '\t' + str(stop) + "\t" +
@@ -212,53 +252,134 @@ def write_from_weblogo(weblogo_dir: Path, out_repeats, out_nucleods,
 
 def gcpercent(cseq, chunk_size=100):
     """
-    Calculate GC percent from the sequence
+    Calculate GC percent from the sequence. Returns gc_min_max
+    where min and max are the GC percent of the chunks of
+    chunk_size bases or NA if the sequence is not longer
     """
+    return GCProfile.from_sequence(sequence=cseq).gc_string(chunk_size=chunk_size)
 
-    count = 0
-    count += cseq.count('G')
-    count += cseq.count('g')
-    count += cseq.count('C')
-    count += cseq.count('c')
-    count = str(int(count / len(cseq) * 100))
-
-    # if sequence is less than the chunk_size
-    # then non max/min calculation
-    if len(cseq) <= chunk_size:
-        return count + "_NA_" + "NA"
-
-    # otherwise split the sequence into chuncks of size 100
-    # amd calculate max/min GC percentage
-    chunks = get_sequence_chunks(cseq=cseq, chunk_size=chunk_size) #[cseq[i:i + chunk_size] for i in range(0, len(cseq), chunk_size)]
-    rslt = []
-    for chunk in chunks:
-        tmp = gcpercent(cseq=chunk, chunk_size=chunk_size)
-        tmp = int(tmp.split("_")[0])
-        rslt.append(tmp)
-
-    min_rslt = min(rslt)
-    max_rslt = max(rslt)
-    return count + "_" + str(min_rslt) + "_" + str(max_rslt)
 
-# this function copied from gquadfinder
+class GQuadScores(object):
+    """
+    The G4Hunter scores of a sequence computed with NumPy.
+    Every G, resp. C, scores the length of its run of G, resp. C,
+    capped at 4 and negated for C. This is what BaseScore computes
+    but the runs are found by run-length encoding and the sums
+    of the scores over any range come from cumulative sums
+    """
+
+    def __init__(self, sequence: str) -> None:
+
+        bases = np.frombuffer(sequence.encode('ascii', 'replace'), dtype=np.uint8)
+
+        signs = np.zeros(len(bases), dtype=np.int64)
+        signs[(bases == ord('G')) | (bases == ord('g'))] = 1
+        signs[(bases == ord('C')) | (bases == ord('c'))] = -1
+
+        run_starts, run_lengths, run_signs = run_length_encode(values=signs)
+
+        self._run_starts = run_starts
+        self._run_lengths = run_lengths
+        self._run_values = run_signs * np.minimum(run_lengths, 4)
+        self._run_ids = np.repeat(np.arange(len(run_starts)), run_lengths)
+        self._scores = np.repeat(self._run_values, run_lengths)
+        self._cumsum = np.concatenate(([0], np.cumsum(self._scores)))
+
+    @property
+    def scores(self) -> np.ndarray:
+        return self._scores
+
+    def window_means(self, window: int) -> np.ndarray:
+        """
+        Returns the means of the scores of the windows
+        of the given size starting at every position
+        """
+
+        if len(self._scores) < window:
+            return np.zeros(0, dtype=np.float64)
+        return (self._cumsum[window:] - self._cumsum[:-window]) / float(window)
+
+    def range_sums(self, starts, ends) -> np.ndarray:
+        """
+        Returns the sums of the scores of the subsequences
+        [start, end) scored on their own i.e. a run cut by the
+        range boundaries only scores its part in the range
+        """
+
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        sums = self._cumsum[ends] - self._cumsum[starts]
+
+        first = self._run_ids[starts]
+        last = self._run_ids[ends - 1]
+        run_ends = self._run_starts + self._run_lengths
+        signs = np.sign(self._run_values)
+
+        # the run cut at the start
+        length = np.minimum(run_ends[first], ends) - starts
+        cut = (self._run_starts[first] < starts) | (run_ends[first] > ends)
+        sums += np.where(cut, length * (signs[first] * np.minimum(length, 4) - self._run_values[first]), 0)
+
+        # the run cut at the end if a different one
+        length = ends - self._run_starts[last]
+        cut = (last != first) & (run_ends[last] > ends)
+        sums += np.where(cut, length * (signs[last] * np.minimum(length, 4) - self._run_values[last]), 0)
+        return sums
+
+
+def gquad_windows(window_means, minscore: float) -> np.ndarray:
+    """
+    Returns the start of the windows whose mean
+    score is at least minscore in absolute value
+    """
+    return np.flatnonzero((window_means >= float(minscore)) | (window_means <= -float(minscore)))
+
+
+def gquad_regions(windows, window: int, length: int) -> tuple:
+    """
+    Returns the [start, end) ranges of the runs of consecutive
+    windows in the way WriteSeq merges them. Note that the last
+    two windows are never compared and the last range is one
+    base longer
+    """
+
+    n_windows = len(windows)
+    consecutive = windows[1:n_windows - 1] == windows[:n_windows - 2] + 1
+    breaks = np.flatnonzero(~consecutive)
+
+    first = np.concatenate(([0], breaks + 1)).astype(np.int64)
+    last = np.concatenate((breaks, [n_windows - 2])).astype(np.int64)
+
+    starts = windows[first]
+    extra = np.zeros(len(first), dtype=np.int64)
+    extra[-1] = 1
+    ends = np.minimum(starts + window + last - first + extra, length)
+    return starts, ends
+
+
+# this function replaces the gquadfinder
+# port i.e. BaseScore, CalScore, GetG4 and WriteSeq
 def gquadcheck(sequence):
 
     minscore = 2
     window = 50
 
-    cseq, scores = BaseScore(sequence)
-    score = CalScore(scores, window)
-    outG4 = GetG4(sequence, score, minscore, window, len(scores))
+    gscores = GQuadScores(sequence=sequence)
+    window_means = gscores.window_means(window=window)
+    windows = gquad_windows(window_means=window_means, minscore=minscore)
 
-    if len(outG4) == 0:
+    if len(windows) == 0:
         return False, []
 
-    mscore = WriteSeq(sequence, score, outG4, window, len(scores))
+    if len(windows) == 1:
+        return True, [abs(float(window_means[windows[0]]))]
+
+    starts, ends = gquad_regions(windows=windows, window=window, length=len(sequence))
+    means = gscores.range_sums(starts=starts, ends=ends) / (ends - starts).astype(np.float64)
+
+    # round as WriteSeq does
+    return True, [abs(round(mean, 2)) for mean in means]
 
-    if len(mscore):
-        return True, mscore
-    else:
-        return False, mscore
 
 def remove_directories(chromosome, spade_output):
 
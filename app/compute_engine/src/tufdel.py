@@ -1,409 +1,539 @@
-import pysam
 import numpy as np
 import os
 import shutil
 import random
+import threading
+import collections
+import importlib.util
 from pathlib import Path
 
 #from hmmtuf import ENABLE_SPADE, SPADE_PATH
 from compute_engine.src.constants import INFO, WARNING, ENABLE_SPADE, SPADE_PATH
-from compute_engine.src.cengine_configuration import TREAT_ERRORS_AS_WARNINGS
+from compute_engine.src.cengine_configuration import TREAT_ERRORS_AS_WARNINGS, SPADE_N_WORKERS
+from compute_engine.src.cengine_configuration import SPADE_CACHE_PATH, SPADE_CACHE_MAX_BYTES
 from compute_engine.src.exceptions import Error
-from compute_engine.src.tuf_core_helpers import write_from_weblogo
+from compute_engine.src.tuf_core_helpers import write_from_spade_repeat
 from compute_engine.src.tuf_core_helpers import gcpercent
 from compute_engine.src.tuf_core_helpers import gquadcheck
 from compute_engine.src.tuf_core_helpers import match
 from compute_engine.src.tuf_core_helpers import create_bed
 from compute_engine.src.tuf_core_helpers import remove_directories
 from compute_engine.src.tuf_core_helpers import concatenate_bed_files
+from compute_engine.src.spade_cache import get_spade_cache
+from compute_engine.src.process_pools import process_pool_executor
+from compute_engine.src.reference_cache import get_reference_cache
+from compute_engine.src.viterbi_path_io import ViterbiPathFile, is_viterbi_path_npz
+from compute_engine.src.viterbi_segments import state_segments
 
 
-fas = None
-outbedgraph = None
-outtuf = None
-outnor = None
-outdel = None
-outdup = None
-outgap = None
-outtdt = None
-outquad = None
-outrep = None
-quadout = None
-nucl_out = None
-out_repeats_info = None
+# the SPADE modules imported by path
+_SPADE_MODULES = {}
+_SPADE_MODULES_LOCK = threading.Lock()
 
-PATH = None
-SPADE_OUTPATH = None
 
+def load_spade(spade_path: str):
+    """
+    Returns the SPADE module i.e. SPADE.py in the spade_path.
+    The module is imported once per process
+    """
+
+    filename = os.path.abspath(os.path.join(spade_path, 'SPADE.py'))
+
+    with _SPADE_MODULES_LOCK:
+        if filename not in _SPADE_MODULES:
+            spec = importlib.util.spec_from_file_location("SPADE", filename)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            _SPADE_MODULES[filename] = module
+
+        return _SPADE_MODULES[filename]
 
-def spade(repseq, chrom, start, stop, region_type):
 
+def run_spade_job(spade_path: str, seq: str, name: str,
+                  out_dir: Path, parameters: dict=None) -> list:
     """
-    Call SPADE application in the SPADE_PATH
+    Run SPADE in the spade_path on the sequence seq and return
+    its repeats. This is what the SPADE pool processes execute
     """
+    return load_spade(spade_path=spade_path).run_sequence(seq=seq, name=name, out_dir=out_dir,
+                                                          parameters=parameters)
 
-    global outrep
-    global nucl_out
-    global  out_repeats_info
 
-    global PATH
-    global SPADE_OUTPATH
+def read_viterbi_path_arrays(filename, ccheck):
+    """
+    Returns the chromosome names, the chromosome ids, the (N, 2)
+    coordinates, the state ids and the state names of the windows
+    in the given Viterbi path file. Files in the binary format
+    are read directly from the arrays
+    """
 
-    if outrep is None:
-        raise Exception("outrep file is None")
+    if is_viterbi_path_npz(filename=filename):
+        viterbi_path = ViterbiPathFile(filename=filename)
+        return [viterbi_path.chromosome], np.zeros(len(viterbi_path), dtype=np.int64), \
+               viterbi_path.coordinates, viterbi_path.state_ids, viterbi_path.state_names
 
-    if nucl_out is None:
-        raise Exception("nucl_out file is None")
+    chromosomes = {}
+    names = {}
+    chromosome_ids = []
+    coordinates = []
+    state_ids = []
+    with open(filename) as vfile:
+        for line in vfile:
+            vdata = create_bed(line, ccheck)
 
-    if out_repeats_info is None:
-        raise Exception("out_repeats_info is None")
+            if len(vdata) == 0:
+                continue
 
-    if PATH is None:
-        raise Exception("PATH variable not specified")
+            chromosome_ids.append(chromosomes.setdefault(vdata['chr'], len(chromosomes)))
+            coordinates.append((int(float(vdata['loc'][0])), int(float(vdata['loc'][1]))))
+            state_ids.append(names.setdefault(vdata['state'], len(names)))
 
-    if SPADE_OUTPATH is None:
-        raise Exception("SPADE_OUTPATH variable not specified")
+    return list(chromosomes), np.array(chromosome_ids, dtype=np.int64), \
+           np.array(coordinates, dtype=np.int64).reshape(-1, 2), \
+           np.array(state_ids, dtype=np.int64), list(names)
 
-    if not os.path.isdir(PATH + 'repeats'):
-        try:
-            os.mkdir(PATH + 'repeats')
-        except OSError as e:
 
-            if TREAT_ERRORS_AS_WARNINGS:
-                print("%s Error: %s." % (WARNING, e.strerror))
-            else:
+class TufDelTuf(object):
+    """
+    The TUF-DEL-TUF analysis of the Viterbi path of a region.
+    Every instance owns its output files and configuration
+    so that regions and chromosomes can be processed
+    concurrently by threads or processes
+    """
+
+    NUCL_FILENAME = 'nucl_out.bed'
+    OUT_REPEATS_INFO_FILENAME = "repeates_info_file.bed"
+
+    # the files created in the path in this order
+    FILES_CREATED = ["viterbi.bedgraph",
+                     "tuf.bed",
+                     "normal.bed",
+                     "deletion.bed",
+                     "duplication.bed",
+                     "gap.bed",
+                     "tdt.bed",
+                     "quad.bed",
+                     "rep.bed",
+                     'gquads.txt',
+                     NUCL_FILENAME,
+                     OUT_REPEATS_INFO_FILENAME]
+
+    # TODO: these should be set by the application
+    CONV = {'TUF': 10,
+            'TUFDUP': 12,
+            'Normal-I': 40,
+            'Normal-II': 42,
+            'Deletion': 30,
+            'Duplication': 50,
+            'GAP_STATE': 0}
+
+    # states merged in the segments
+    STATE_MAP = {'TUFDUP': 'TUF',
+                 'Normal-II': 'Normal-I'}
+
+    def __init__(self, path: str, fas_file_name: str, chromosome: str,
+                 chr_idx: int, viterbi_file: str, nucleods_path: str,
+                 remove_dirs: bool=False, test_me: bool=False,
+                 enable_spade: bool=ENABLE_SPADE, spade_path: str=SPADE_PATH,
+                 seed=None, spade_n_workers: int=SPADE_N_WORKERS,
+                 spade_parameters: dict=None, spade_cache_path: str=SPADE_CACHE_PATH,
+                 spade_cache_max_bytes: int=SPADE_CACHE_MAX_BYTES) -> None:
+
+        if not path.endswith("/"):
+            path = path + "/"
+
+        if not nucleods_path.endswith("/"):
+            nucleods_path = nucleods_path + "/"
+
+        self._path = path
+        self._fas_file_name = fas_file_name
+        self._chromosome = chromosome
+        self._chr_idx = chr_idx
+        self._viterbi_file = viterbi_file
+        self._nucleods_path = nucleods_path
+        self._remove_dirs = remove_dirs
+        self._test_me = test_me
+        self._enable_spade = enable_spade
+        self._spade_path = spade_path
+        self._spade_outpath = None
+        self._spade_n_workers = spade_n_workers
+        self._spade_parameters = spade_parameters
+        self._spade_cache_path = spade_cache_path
+        self._spade_cache_max_bytes = spade_cache_max_bytes
+        self._spade_cache = None
+
+        # the pool running the SPADE jobs and the
+        # jobs whose repeats are not written yet
+        self._spade_pool = None
+        self._spade_jobs = collections.deque()
+
+        # random generator for choosing normal regions
+        self._random = random.Random(seed)
+
+        # the reference file and the
+        # open output files by name
+        self._fas = None
+        self._outputs = {}
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def output(self, name: str):
+        """
+        Returns the open output file with the given name
+        """
+
+        if name not in self._outputs:
+            raise Error("Output file {0} is not open".format(name))
+
+        return self._outputs[name]
+
+    def spade(self, repseq, chrom, start, stop, region_type):
+        """
+        Run SPADE in the spade_path on the given sequence
+        and write the repeats found. The repeats are taken from
+        the SPADE cache if there. With a SPADE pool the job
+        is queued and its repeats are written once it finishes
+        in the order the jobs are queued
+        """
+
+        if self._spade_outpath is None:
+            raise Error("SPADE output path not specified")
+
+        folder = chrom + '_'+str(start) + '-' + str(stop) + '_' + region_type + '_' + gcpercent(repseq)
+
+        job = {"folder": folder, "chrom": chrom, "start": start,
+               "stop": stop, "region_type": region_type,
+               "seq": repseq, "working_dir": None,
+               "future": None, "repeats": None, "cache_key": None}
+
+        if self._spade_cache is not None:
+            job["cache_key"] = self._spade_cache.make_key(seq=repseq,
+                                                          spade_file=os.path.join(self._spade_path, 'SPADE.py'),
+                                                          parameters=self._spade_parameters)
+            job["repeats"] = self._spade_cache.get(key=job["cache_key"])
+
+        # the SPADE files are removed with the directories so
+        # don't write them at all. SPADE does not run for the
+        # cached sequences so they have no SPADE directory
+        if not self._remove_dirs and job["repeats"] is None:
+            job["working_dir"] = Path(self._spade_outpath + folder)
+            os.mkdir(job["working_dir"])
+
+        # write now unless queued jobs should be written first
+        if self._spade_pool is None or (job["repeats"] is not None and len(self._spade_jobs) == 0):
+            self._write_spade_job(job=job)
+            return
+
+        if job["repeats"] is not None:
+            self._spade_jobs.append(job)
+            return
+
+        print("{0} Queue SPADE job for {1}".format(INFO, folder))
+        job["future"] = self._spade_pool.submit(run_spade_job, self._spade_path,
+                                                repseq, folder, job["working_dir"],
+                                                self._spade_parameters)
+        job["seq"] = None
+        self._spade_jobs.append(job)
+
+        # bound the jobs in memory
+        while len(self._spade_jobs) > 2 * self._spade_n_workers:
+            self._write_spade_job(job=self._spade_jobs.popleft())
+
+    def _write_spade_job(self, job: dict) -> None:
+        """
+        Wait for the SPADE job or, if it is not queued and
+        not cached, run it and write its repeats
+        """
+
+        chrom = job["chrom"]
+        start = job["start"]
+        stop = job["stop"]
+        region_type = job["region_type"]
+
+        outrep = self.output(name="rep.bed")
+        nucl_out = self.output(name=TufDelTuf.NUCL_FILENAME)
+        out_repeats_info = self.output(name=TufDelTuf.OUT_REPEATS_INFO_FILENAME)
+
+        repeats = job["repeats"]
+
+        if repeats is None:
+            try:
+                if job["future"] is None:
+                    print("{0} Running SPADE for {1}".format(INFO, job["folder"]))
+                    repeats = run_spade_job(spade_path=self._spade_path, seq=job["seq"],
+                                            name=job["folder"], out_dir=job["working_dir"],
+                                            parameters=self._spade_parameters)
+                else:
+                    repeats = job["future"].result()
+            except Exception as e:
+
+                if TREAT_ERRORS_AS_WARNINGS:
+                    print("{0} SPADE failed for {1}: {2}".format(WARNING, job["folder"], str(e)))
+                    return
                 raise e
 
-    fasta = open(PATH + 'repeats/tdtseq.fasta', 'w')
+            if job["cache_key"] is not None:
+                self._spade_cache.put(key=job["cache_key"], repeats=repeats)
+
+        if len(repeats) == 0:
+            # if we dont have a weblogo then we have
+            # no repeats and then we want to document
+            # that in the nucl_file
+            nucl_out.write(chrom + '\t' + str(start) + '\t' + str(stop) +
+                           '\t' + "NO_REPEATS" + '\t' + region_type + '\n')
+        else:
+
+            for repeat in repeats:
 
-    folder = chrom + '_'+str(start) + '-' + str(stop) + '_' + region_type + '_' + gcpercent(repseq)
-    working_dir = Path(SPADE_OUTPATH + folder)
+                if repeat["weblogo"] is not None:
 
-    os.mkdir(working_dir)
+                    # we do have a weblog file so extract nucleods
+                    write_from_spade_repeat(repeat=repeat, out_repeats=outrep,
+                                            out_nucleods=nucl_out, start=start, stop=stop,
+                                            out_repeats_info=out_repeats_info,
+                                            region_type=region_type, chrom=chrom, count_check=12)
 
-    fasta.write('>'+folder+'\n')
-    fasta.write(repseq+'\n')
-    fasta.close()
+    def _start_spade_pool(self) -> None:
 
-    # system cmd to execute
-    str_cmd = 'python3 {0} -in {1} -out_dir {2}'.format(SPADE_PATH + 'SPADE.py',
-                                                        PATH + 'repeats/tdtseq.fasta',
-                                                        SPADE_OUTPATH + folder + "/")
-    print("{0} str_cmd {1}".format(INFO, str_cmd))
-    os.system(str_cmd)
+        if not self._enable_spade or self._spade_n_workers <= 1:
+            return
 
-    # open the nucl files and attempt to write the
-    # outrep file
-    directories = os.listdir(path=working_dir)
+        # the pool of a daemonic process e.g. a Celery worker
+        # is a billiard pool. Without billiard the jobs run in this process
+        self._spade_pool = process_pool_executor(max_workers=self._spade_n_workers)
+        if self._spade_pool is None:
+            print("{0} Cannot start a SPADE pool in a daemonic process. "
+                  "SPADE jobs run serially".format(WARNING))
+            return
 
-    # collecte the nucleods files
-    nucls_files = [name for name in directories if name.startswith('nucl_')]
+        print("{0} Running SPADE jobs with {1} processes".format(INFO, self._spade_n_workers))
 
-    if len(nucls_files) == 0:
-        # if we dont have a weblogo then we have
-        # no repeats and then we want to document
-        # that in the nucl_file
-        nucl_out.write(chrom + '\t' + str(start) + '\t' + str(stop) +
-                           '\t' + "NO_REPEATS" + '\t' + region_type + '\n')
-    else:
+    def do_tdt(self, tdtarray, outfile):
 
-        for name in nucls_files:
+        if self._fas is None:
+            raise Error("fas file is None")
 
-            # if this is a nucl_ directory
-            #if name.startswith('nucl_'):
+        outtdt = self.output(name="tdt.bed")
+        outquad = self.output(name="quad.bed")
 
-            # get the all the files in the path
-            files = os.listdir(path=working_dir / name)
+        sequences = self._fas.fetch_intervals(intervals=[(tdt['chr'], tdt['start'], tdt['end'])
+                                                         for tdt in tdtarray])
 
-            if 'weblogo.txt' in files:
+        for tdt, seq in zip(tdtarray, sequences):
+            # check not a deletion beginning
+            # do quad and repeat finding
+            if self._enable_spade:
+                self.spade(seq, tdt['chr'], tdt['start'], tdt['end'], region_type=tdt['type'])
 
-                    count_check = 12
-                    # we do have a weblog file so extract nucleods
-                    weblogo_dir = Path(working_dir / name)
-                    write_from_weblogo(weblogo_dir=weblogo_dir, out_repeats=outrep,
-                                       out_nucleods=nucl_out, start=start, stop=stop,
-                                       out_repeats_info=out_repeats_info,
-                                       region_type=region_type, chrom=chrom, count_check=12)
+            if tdt['type'] == 'Deletion' and len(seq) < 2000:
+                outtdt.write(tdt['chr'] + '\t' +
+                             str(tdt['start']) + '\t' +
+                             str(tdt['end']) + '\n')
 
+            gquad, mscore = gquadcheck(seq)
 
-def do_TDT(tdtarray, outfile):
+            if gquad:
+                outquad.write(tdt['chr']+'\t'+str(tdt['start'])+'\t'+str(tdt['end'])+'\n')
 
-    global outtdt
-    global outquad
-    global fas
+            outfile.write(tdt['chr'] + ':' + str(tdt['start']) +
+                          '-' + str(tdt['end']) + '_' + tdt['type'] +
+                          '_' + gcpercent(seq) + '\t' + str(gquad) + str(mscore) + '\n')
 
-    if outquad is None:
-        raise Exception("outquad file is None")
+    def run(self) -> list:
+        """
+        Run the TUF-DEL-TUF analysis and return the
+        names of the files created in the path
+        """
 
-    if outtdt is None:
-        raise Exception("outtdt file is None")
+        print("{0} Start TUF-DEL-TUF".format(INFO))
+        print("{0} Path {1}".format(INFO, self._path))
+        print("{0} FAS file {1}".format(INFO, self._fas_file_name))
+        print("{0} Viterbi file {1}".format(INFO, self._viterbi_file))
+        print("{0} Nucleods {1}".format(INFO, self._nucleods_path))
 
-    if fas is None:
-        raise Exception("fas file is None")
+        if self._enable_spade:
+            os.mkdir(self._path + "spade_output")
+            self._spade_outpath = self._path + "spade_output/"
 
-    for tdt in tdtarray:
-        # check not a deletion beginning
-        # do quad and repeat finding
-        # print(tdt)
-        seq = fas.fetch(tdt['chr'], tdt['start'], tdt['end'])
-        if ENABLE_SPADE:
-            spade(seq, tdt['chr'], tdt['start'], tdt['end'], region_type=tdt['type'])
+        # the reference is read through the block
+        # cache shared by the analyses of the process
+        self._fas = get_reference_cache(fasta_file=self._fas_file_name)
 
-        if tdt['type'] == 'Deletion' and len(seq) < 2000:
-            outtdt.write(tdt['chr'] + '\t' +
-                         str(tdt['start']) + '\t' +
-                         str(tdt['end']) + '\n')
+        try:
+            for name in TufDelTuf.FILES_CREATED:
+                self._outputs[name] = open(self._path + name, "w")
 
-        gquad, mscore = gquadcheck(seq)
+            if not self._test_me:
+                if self._enable_spade and self._spade_cache_path is not None:
+                    self._spade_cache = get_spade_cache(path=self._spade_cache_path,
+                                                        max_bytes=self._spade_cache_max_bytes)
+                self._start_spade_pool()
+                self._process_viterbi_path()
 
-        if gquad:
-            outquad.write(tdt['chr']+'\t'+str(tdt['start'])+'\t'+str(tdt['end'])+'\n')
+                while len(self._spade_jobs) != 0:
+                    self._write_spade_job(job=self._spade_jobs.popleft())
+        finally:
+            if self._spade_pool is not None:
+                self._spade_pool.shutdown(wait=True)
+                self._spade_pool = None
+            self._spade_jobs.clear()
 
-        outfile.write(tdt['chr'] + ':' + str(tdt['start']) +
-                      '-' + str(tdt['end']) + '_' + tdt['type'] +
-                      '_' + gcpercent(seq) + '\t' + str(gquad) + str(mscore) + '\n')
+            for name in self._outputs:
+                self._outputs[name].close()
+            self._outputs = {}
 
-def main(path: str, fas_file_name: str, chromosome: str,
-         chr_idx: int, viterbi_file: str, nucleods_path: str,
-         remove_dirs: bool=False, test_me: bool= False):
+            print("{0} Reference cache statistics {1}".format(INFO, self._fas.statistics()))
+            self._fas = None
 
-    print("{0} Start TUF-DEL-TUF".format(INFO))
-
-    if not path.endswith("/"):
-        path = path + "/"
-
-    if not nucleods_path.endswith("/"):
-        nucleods_path = nucleods_path + "/"
-
-    global fas
-    global outbedgraph
-    global outtuf
-    global outnor
-    global outdel
-    global outdup
-    global outgap
-    global outtdt
-    global outquad
-    global outrep
-    global quadout
-    global nucl_out
-    global out_repeats_info
-
-    global PATH
-    global SPADE_OUTPATH
-
-    print("{0} Path {1}".format(INFO, path))
-    print("{0} FAS file {1}".format(INFO, fas_file_name))
-    print("{0} Viterbi file {1}".format(INFO, viterbi_file))
-    print("{0} Nucleods {1}".format(INFO, nucleods_path))
-
-    #path = path + "/"
-    NUCL_FILENAME = 'nucl_out.bed'
-    OUT_REPEATS_INFO_FILENAME = "repeates_info_file.bed"
-    PATH = path
+        print("{0} Closing files...".format(INFO))
 
-    if ENABLE_SPADE:
-        os.mkdir(PATH +  "repeats")
-        os.mkdir(PATH + "spade_output")
-        SPADE_OUTPATH = PATH + "spade_output/"
+        if self._spade_cache is not None:
+            print("{0} SPADE cache statistics {1}".format(INFO, self._spade_cache.statistics()))
 
-    # read global reference file
-    fas = pysam.FastaFile(fas_file_name)
+        if self._remove_dirs and self._spade_outpath is not None:
+            print("{0} Removing directories".format(INFO))
+            remove_directories(chromosome=self._chromosome, spade_output=self._spade_outpath)
 
-    # TODO: these should be set by the application
-    conv = {'TUF': 10,
-            'TUFDUP': 12,
-            'Normal-I': 40,
-            'Normal-II': 42,
-            'Deletion': 30,
-            'Duplication': 50,
-            'GAP_STATE': 0}
+        for name in [TufDelTuf.NUCL_FILENAME, TufDelTuf.OUT_REPEATS_INFO_FILENAME]:
+            if self._path + name != self._nucleods_path + name:
+                print("{0} Copying  {1} to {2}".format(INFO, self._path + name,
+                                                       self._nucleods_path + name))
 
-    files_created = ["viterbi.bedgraph",
-                     "tuf.bed",
-                     "normal.bed",
-                     "deletion.bed",
-                     "duplication.bed",
-                     "gap.bed",
-                     "tdt.bed",
-                     "quad.bed",
-                     "rep.bed",
-                     'gquads.txt',
-                     NUCL_FILENAME,
-                     OUT_REPEATS_INFO_FILENAME]
+                # copy the nucleods file produced
+                shutil.copyfile(self._path + name, self._nucleods_path + name)
+
+        print("{0} END TUF-DEL-TUF".format(INFO))
+        return list(TufDelTuf.FILES_CREATED)
+
+    def _process_viterbi_path(self) -> None:
+
+        outbedgraph = self.output(name="viterbi.bedgraph")
+        chrlistsorted = {self._chr_idx: self._viterbi_file}
 
-    # Open global files
-    outbedgraph = open(path + "viterbi.bedgraph", "w")
-    outtuf = open(path + "tuf.bed", "w")
-    outnor = open(path + "normal.bed", "w")
-    outdel = open(path + "deletion.bed", "w")
-    outdup = open(path + "duplication.bed", "w")
-    outgap = open(path + "gap.bed", "w")
-    outtdt = open(path + "tdt.bed", "w")
-    outquad = open(path + "quad.bed", "w")
-    outrep = open(path + "rep.bed", "w")
-    quadout = open(path + 'gquads.txt', 'w')
-    nucl_out = open(path  + NUCL_FILENAME, 'w')
-    out_repeats_info = open(path  + OUT_REPEATS_INFO_FILENAME, 'w')
-
-    prevstate = ""
-    start = 0
-    end = 0
-    chr = ''
-    ptemp = True
-    chrlistsorted = {chr_idx: viterbi_file}
-
-    if not test_me:
         for i in sorted(chrlistsorted):
 
-            flist = []
             viterbisorted = chrlistsorted
 
-            for f in flist:
-                # if 'tuf_delete_tuf' in f and '._' not in f:
-                #     tdtsorted[int(f.split('_')[6])] = f
-                if 'viterbi' in f and '._' not in f:
-                    viterbisorted[int(f.split('_')[5])] = f
-
-            tdtcheck = ''
-            tdtlist = []
+            # the (chr, start, end, state) segments of the
+            # Viterbi path where states are mapped with STATE_MAP
+            segments = []
 
             for j in sorted(viterbisorted):
                 print("{0} working with file: {1}".format(INFO, viterbisorted[j]))
-                with open(viterbisorted[j]) as vfile:
-
-                    ccheck = chrlistsorted[i].split('_')[2].rstrip()
-
-                    for line in vfile:
-                        vdata = create_bed(line, ccheck)
-
-                        if len(vdata) == 0:
-                            continue
-
-                        outbedgraph.write(vdata['chr']+'\t' + str(int(float(vdata['loc'][0]))) +
-                                          '\t'+str(int(float(vdata['loc'][1]))) + '\t'+str(conv[vdata['state']])+'\n')
-                        curstate = vdata['state']
-
-                        if curstate == 'TUFDUP':
-                            curstate = 'TUF'
-                        elif curstate == 'Normal-II':
-                            curstate = 'Normal-I'
-                        if prevstate == "":
-                            prevstate = curstate
-                            chr = vdata['chr']
-                            start = int(float(vdata['loc'][0]))
-                            end = int(float(vdata['loc'][1]))
-
-                        if curstate == prevstate and chr == vdata['chr'] and (int(float(vdata['loc'][0])) == end+1 or ptemp):
-                            end = int(float(vdata['loc'][1]))
-
-                        if curstate != prevstate or chr != vdata['chr'] or (int(float(vdata['loc'][0])) != end+1 and not ptemp):
-
-                            if prevstate == 'TUF':
-                                tdtcheck = tdtcheck + 'T'
-                                tdtlist.append({"chr": chr, "start": start, "end": end, "type": 'TUF'})
-                                print(chr+'\t'+str(start)+'\t'+str(end)+'TUF')
-                                outtuf.write(chr+'\t'+str(start)+'\t'+str(end)+'\n')
-
-                            if prevstate == 'Normal-I':
-                                if 'TDT' in tdtcheck:
-                                    print("{0} Processing TDT file".format(INFO))
-                                    do_TDT(tdtlist, outfile=quadout)
-                                    print("{0} Done Processing TDT file".format(INFO))
-
-                                tdtcheck = ''
-                                tdtlist = []
-                                print("{0} {1}".format(INFO, chr+'\t'+str(start)+'\t'+str(end)+'Normal'))
-                                outnor.write(chr+'\t'+str(start)+'\t'+str(end)+'\n')
-
-                                if (end - start) > 1000:
-                                    p = random.randint(1, 10)
-                                    print("{0} normal >1000, rand: {1}".format(INFO, p))
-                                    if p in [1, 3, 5, 7, 9]:
-                                        print("{0} processing random normal region".format(INFO))
-                                        n = random.randint(start, end - 1000)
-                                        nseq = fas.fetch(chr, n, n + 1000)
-                                        # print("calculating random normal G Quad")
-                                        gquad, mscore = gquadcheck(nseq)
-                                        quadout.write(chr + ':' + str(n) + '-'+str(n + 1000) + '_' +
-                                                      'Normal' + '_'+gcpercent(nseq) + '\t' +
-                                                      str(gquad)+str(mscore)+'\n')
-
-                                        if ENABLE_SPADE:
-                                            spade(nseq, chr, n, n + 1000, 'Normal')
-                                else:
-                                    print("{0} normal section too short Only processing if section > 1000...".format(INFO))
-
-                            if prevstate == 'Deletion':
-                                if len(tdtcheck) > 0 and tdtcheck[0] == 'T':
-                                    tdtcheck = tdtcheck+'D'
-                                    tdtlist.append({"chr": chr, "start": start, "end": end, "type": 'Deletion'})
-
-                                print("{0} {1}".format(INFO, chr+'\t'+str(start)+'\t'+str(end)+'Deletion'))
-                                outdel.write(chr+'\t'+str(start)+'\t'+str(end)+'\n')
-
-                            if prevstate == 'Duplication':
-                                if 'TDT' in tdtcheck:
-                                    #print("{0} Processing TDT file".format(INFO))
-                                    do_TDT(tdtlist, outfile=quadout)
-                                    #print("{0} Done Processing TDT file".format(INFO))
-                                tdtcheck = ''
-                                tdtlist = []
-                                print(chr+'\t'+str(start)+'\t'+str(end)+'Duplication')
-                                outdup.write(chr+'\t'+str(start)+'\t'+str(end)+'\n')
-
-                            if prevstate == 'GAP_STATE':
-                                if 'TDT' in tdtcheck:
-                                    #print("{0} Processing TDT file".format(INFO))
-                                    do_TDT(tdtlist, outfile=quadout)
-                                    #print("{0} Done Processing TDT file".format(INFO))
-
-                                tdtcheck = ''
-                                tdtlist = []
-                                print(chr+'\t'+str(start)+'\t'+str(end)+'GAP')
-                                outgap.write(chr+'\t'+str(start)+'\t'+str(end)+'\n')
-                            chr = vdata['chr']
-                            start = int(float(vdata['loc'][0]))
-                            end = int(float(vdata['loc'][1]))
-                            prevstate = curstate
-
-    quadout.close()
-    outbedgraph.close()
-    outtuf.close()
-    outnor.close()
-    outdel.close()
-    outdup.close()
-    outgap.close()
-    outtdt.close()
-    outquad.close()
-    outrep.close()
-    nucl_out.close()
-    out_repeats_info.close()
-    print("{0} Closing files...".format(INFO))
-
-    if remove_dirs:
-        print("{0} Removing directories".format(INFO))
-        remove_directories(chromosome=chromosome, spade_output=SPADE_OUTPATH)
-
-    if path + NUCL_FILENAME != nucleods_path + NUCL_FILENAME:
-        print("{0} Copying  {1} to {2}".format(INFO, path + NUCL_FILENAME, nucleods_path + NUCL_FILENAME))
-
-        # copy the nucleods file produced
-        shutil.copyfile(path + NUCL_FILENAME, nucleods_path + NUCL_FILENAME)
-
-    if path + OUT_REPEATS_INFO_FILENAME != nucleods_path + OUT_REPEATS_INFO_FILENAME:
-        print("{0} Copying {1} to {2}".format(INFO, path + OUT_REPEATS_INFO_FILENAME,
-                                              nucleods_path + OUT_REPEATS_INFO_FILENAME))
-
-        # copy the nucleods file produced
-        shutil.copyfile(path + OUT_REPEATS_INFO_FILENAME, nucleods_path + OUT_REPEATS_INFO_FILENAME)
-
-    print("{0} END TUF-DEL-TUF".format(INFO))
-    return files_created
-
-
-
-
-            
+                ccheck = chrlistsorted[i].split('_')[2].rstrip()
+
+                chromosomes, chromosome_ids, coordinates, \
+                state_ids, state_names = read_viterbi_path_arrays(filename=viterbisorted[j], ccheck=ccheck)
+
+                bedgraph_values = np.array([TufDelTuf.CONV[name] for name in state_names], dtype=np.int64)
+                outbedgraph.writelines([chromosomes[c] + '\t' + str(r[0]) + '\t' + str(r[1]) + '\t' + str(value) + '\n'
+                                        for c, r, value in zip(chromosome_ids.tolist(), coordinates.tolist(),
+                                                               bedgraph_values[state_ids].tolist())])
+
+                run_chromosomes, run_starts, \
+                run_ends, run_states = state_segments(state_ids=state_ids, state_names=state_names,
+                                                      coordinates=coordinates, chromosome_ids=chromosome_ids,
+                                                      state_map=TufDelTuf.STATE_MAP)
+
+                for c, start, end, state in zip(run_chromosomes.tolist(), run_starts.tolist(),
+                                                run_ends.tolist(), run_states):
+
+                    # runs that continue in the next file are merged
+                    if len(segments) != 0 and segments[-1][0] == chromosomes[c] and segments[-1][3] == state:
+                        segments[-1][2] = end
+                    else:
+                        segments.append([chromosomes[c], start, end, state])
+
+            # the last segment is not processed as its
+            # end is not known when reading the path
+            self._process_segments(segments=segments[:-1])
+
+    def _process_segments(self, segments) -> None:
+
+        outtuf = self.output(name="tuf.bed")
+        outnor = self.output(name="normal.bed")
+        outdel = self.output(name="deletion.bed")
+        outdup = self.output(name="duplication.bed")
+        outgap = self.output(name="gap.bed")
+        quadout = self.output(name='gquads.txt')
+
+        tdtcheck = ''
+        tdtlist = []
+
+        for chr, start, end, state in segments:
+            if state == 'TUF':
+                tdtcheck = tdtcheck + 'T'
+                tdtlist.append({"chr": chr, "start": start, "end": end, "type": 'TUF'})
+                print(chr+'\t'+str(start)+'\t'+str(end)+'TUF')
+                outtuf.write(chr+'\t'+str(start)+'\t'+str(end)+'\n')
+
+            if state == 'Normal-I':
+                if 'TDT' in tdtcheck:
+                    print("{0} Processing TDT file".format(INFO))
+                    self.do_tdt(tdtlist, outfile=quadout)
+                    print("{0} Done Processing TDT file".format(INFO))
+
+                tdtcheck = ''
+                tdtlist = []
+                print("{0} {1}".format(INFO, chr+'\t'+str(start)+'\t'+str(end)+'Normal'))
+                outnor.write(chr+'\t'+str(start)+'\t'+str(end)+'\n')
+
+                if (end - start) > 1000:
+                    p = self._random.randint(1, 10)
+                    print("{0} normal >1000, rand: {1}".format(INFO, p))
+                    if p in [1, 3, 5, 7, 9]:
+                        print("{0} processing random normal region".format(INFO))
+                        n = self._random.randint(start, end - 1000)
+                        nseq = self._fas.fetch(chr, n, n + 1000)
+                        # print("calculating random normal G Quad")
+                        gquad, mscore = gquadcheck(nseq)
+                        quadout.write(chr + ':' + str(n) + '-'+str(n + 1000) + '_' +
+                                      'Normal' + '_'+gcpercent(nseq) + '\t' +
+                                      str(gquad)+str(mscore)+'\n')
+
+                        if self._enable_spade:
+                            self.spade(nseq, chr, n, n + 1000, 'Normal')
+                else:
+                    print("{0} normal section too short Only processing if section > 1000...".format(INFO))
+
+            if state == 'Deletion':
+                if len(tdtcheck) > 0 and tdtcheck[0] == 'T':
+                    tdtcheck = tdtcheck+'D'
+                    tdtlist.append({"chr": chr, "start": start, "end": end, "type": 'Deletion'})
+
+                print("{0} {1}".format(INFO, chr+'\t'+str(start)+'\t'+str(end)+'Deletion'))
+                outdel.write(chr+'\t'+str(start)+'\t'+str(end)+'\n')
+
+            if state == 'Duplication':
+                if 'TDT' in tdtcheck:
+                    #print("{0} Processing TDT file".format(INFO))
+                    self.do_tdt(tdtlist, outfile=quadout)
+                    #print("{0} Done Processing TDT file".format(INFO))
+                tdtcheck = ''
+                tdtlist = []
+                print(chr+'\t'+str(start)+'\t'+str(end)+'Duplication')
+                outdup.write(chr+'\t'+str(start)+'\t'+str(end)+'\n')
+
+            if state == 'GAP_STATE':
+                if 'TDT' in tdtcheck:
+                    #print("{0} Processing TDT file".format(INFO))
+                    self.do_tdt(tdtlist, outfile=quadout)
+                    #print("{0} Done Processing TDT file".format(INFO))
+
+                tdtcheck = ''
+                tdtlist = []
+                print(chr+'\t'+str(start)+'\t'+str(end)+'GAP')
+                outgap.write(chr+'\t'+str(start)+'\t'+str(end)+'\n')
 
 
+def main(path: str, fas_file_name: str, chromosome: str,
+         chr_idx: int, viterbi_file: str, nucleods_path: str,
+         remove_dirs: bool=False, test_me: bool= False):
+
+    tuf_del_tuf = TufDelTuf(path=path, fas_file_name=fas_file_name,
+                            chromosome=chromosome, chr_idx=chr_idx,
+                            viterbi_file=viterbi_file, nucleods_path=nucleods_path,
+                            remove_dirs=remove_dirs, test_me=test_me)
+    return tuf_del_tuf.run()
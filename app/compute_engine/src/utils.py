@@ -1,13 +1,72 @@
 import json
+import struct
+import zipfile
 from functools import wraps
 import time
 import os
 from pathlib import Path
 from zipfile import ZipFile
+import numpy as np
 
 from compute_engine.src.constants import INFO, WARNING
 from compute_engine.src.exceptions import Error
 
+# the first bytes of a zip archive i.e. of an npz file
+NPZ_MAGIC = b'PK\x03\x04'
+
+# size of the fixed part of a zip local file header
+ZIP_LOCAL_HEADER_SIZE = 30
+
+
+def load_npz_columns(filename, mmap_mode='r'):
+    """
+    Load the arrays of the given npz file into a dictionary.
+    Arrays stored uncompressed are memory mapped in place
+    using mmap_mode so that their pages are only read when
+    accessed. Compressed arrays, or any array when mmap_mode
+    is None, are read into memory
+    """
+
+    columns = {}
+    with zipfile.ZipFile(filename) as archive, open(filename, 'rb') as f:
+        for info in archive.infolist():
+
+            name = info.filename
+            if name.endswith(".npy"):
+                name = name[:-4]
+
+            if mmap_mode is None or info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    columns[name] = np.lib.format.read_array(member, allow_pickle=False)
+                continue
+
+            # the member data follow the local header
+            # whose name and extra fields have variable length
+            f.seek(info.header_offset)
+            local_header = f.read(ZIP_LOCAL_HEADER_SIZE)
+            name_len, extra_len = struct.unpack('<HH', local_header[26:30])
+            f.seek(info.header_offset + ZIP_LOCAL_HEADER_SIZE + name_len + extra_len)
+
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+
+            if dtype.hasobject:
+                raise Error("Array {0} in {1} holds Python objects".format(name, filename))
+
+            if int(np.prod(shape)) == 0:
+                # an empty file region cannot be mapped
+                columns[name] = np.zeros(shape, dtype=dtype)
+                continue
+
+            columns[name] = np.memmap(filename, dtype=dtype, mode=mmap_mode,
+                                      offset=f.tell(), shape=shape,
+                                      order='F' if fortran_order else 'C')
+    return columns
+
+
 def timefn(fn):
     @wraps(fn)
     def measure(*args, **kwargs):
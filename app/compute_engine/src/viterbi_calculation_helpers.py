@@ -7,6 +7,10 @@ import numpy as np
 from pomegranate import *
 
 from compute_engine.src.constants import INFO
+from compute_engine.src.exceptions import Error
+from compute_engine.src.streaming_viterbi import build_streaming_decoder
+from compute_engine.src.viterbi_path_io import save_viterbi_path_npz, viterbi_path_line, VITERBI_PATH_FORMATS
+from compute_engine.src.windows import Window
 
 
 def get_window_ids_from_viterbi_path(path, wstate, limit_state):
@@ -239,12 +243,21 @@ def get_continuous(tuf_delete_tuf, start_tuf_counter, name):
     return item, counter
 
 
-def get_start_end_segment(tuf_delete_tuf, sequence):
+def get_start_end_segment(tuf_delete_tuf, sequence=None, coordinates=None):
+    """
+    Returns the (idx, start, end, length, state) segments of
+    the filtered Viterbi path. The window coordinates are
+    taken from the (N, 2) coordinates array if given otherwise
+    from the ((wga_mean, no_wga_mean), (start, end)) sequence
+    """
 
     if len(tuf_delete_tuf) == 0:
         print("{0} TUF_DELETE_TUF data is empty".format(INFO))
         return []
 
+    if coordinates is not None:
+        sequence = [(None, pos) for pos in coordinates.tolist()]
+
     start_tuf_counter = 0
     segments = []
     while True:
@@ -326,6 +339,156 @@ def create_viterbi_path(sequence, hmm_model, chromosome: str,
     return viterbi_path, observations, sequence_viterbi_state
 
 
+def check_viterbi_path_format(file_format: str, append_or_write: str) -> None:
+
+    if file_format not in VITERBI_PATH_FORMATS:
+        raise Error("Viterbi path format '{0}' not in {1}".format(file_format,
+                                                                  VITERBI_PATH_FORMATS))
+
+    if file_format == 'npz' and append_or_write != 'w':
+        raise Error("Viterbi paths in npz format cannot be appended")
+
+
+def create_viterbi_path_from_observations(observations, coordinates, hmm_model,
+                                          chromosome: str, filename: Path,
+                                          append_or_write: str,
+                                          gap_state_obs: tuple=None,
+                                          file_format: str='txt') -> tuple:
+    """
+    Same as create_viterbi_path but the observations are
+    given as an (N, 2) float array which is passed to the HMM
+    as is and the window coordinates as an (N, 2) int array
+    (see Region.get_rd_mean_observations). The path is saved
+    in the given file_format, one of VITERBI_PATH_FORMATS.
+    The gap windows have the observations gap_state_obs,
+    by default Window.N_WINDOW_MARKER
+    """
+
+    check_viterbi_path_format(file_format=file_format, append_or_write=append_or_write)
+
+    if gap_state_obs is None:
+        gap_state_obs = (Window.N_WINDOW_MARKER, Window.N_WINDOW_MARKER)
+
+    print("{0} Observation length: {1}".format(INFO, len(observations)))
+    viterbi_path = hmm_model.viterbi(observations)
+    print("{0} Log-probability of ML Viterbi path: {1}".format(INFO, viterbi_path[0]))
+
+    # for each item in the sequence
+    # cache the index and state predicted
+    sequence_viterbi_state = []
+
+    if viterbi_path[1] is not None:
+        print("{0} Viterbi path length: {1}".format(INFO, len(viterbi_path[1])))
+
+        counter = int(np.count_nonzero(np.all(observations == np.array(gap_state_obs), axis=1)))
+
+        names = [state.name for _, state in viterbi_path[1][1:len(observations) + 1]]
+        sequence_viterbi_state = list(enumerate(names))
+
+        if file_format == 'npz':
+            state_names, state_ids = np.unique(np.array(names, dtype=str), return_inverse=True)
+            save_viterbi_path_npz(filename=filename, chromosome=chromosome,
+                                  coordinates=coordinates, observations=observations,
+                                  state_ids=state_ids, state_names=state_names.tolist(),
+                                  path_length=len(viterbi_path[1]))
+        else:
+            with open(filename, append_or_write) as f:
+                f.write(str(len(viterbi_path[1]) - 1) + "\n")
+                for item, (obs, r) in enumerate(zip(observations.tolist(), coordinates.tolist())):
+                    f.write(viterbi_path_line(chromosome=chromosome, item=item, r=r, obs=obs,
+                                              name=names[item], gap_state_obs=gap_state_obs))
+
+        print("{0} There should be {1} gaps".format(INFO, counter))
+    else:
+        print("{0} Viterbi path is impossible for the given sequence".format(INFO))
+
+    return viterbi_path, observations, sequence_viterbi_state
+
+
+def create_viterbi_path_streaming(observations, coordinates, hmm_model,
+                                  chromosome: str, filename: Path,
+                                  append_or_write: str, block_size: int,
+                                  gap_state_obs: tuple=None,
+                                  file_format: str='txt') -> tuple:
+    """
+    Same as create_viterbi_path_from_observations but the path is
+    decoded in blocks of block_size observations. The state ids are
+    kept in an int16 array and, in the text format, the path lines are
+    flushed to the file a block at a time as the path gets decided.
+    Returns (log-probability, state ids), observations and the state
+    names the ids index. The state ids are None and the file is left
+    as it was if the path is impossible
+    """
+
+    check_viterbi_path_format(file_format=file_format, append_or_write=append_or_write)
+
+    if gap_state_obs is None:
+        gap_state_obs = (Window.N_WINDOW_MARKER, Window.N_WINDOW_MARKER)
+
+    print("{0} Observation length: {1}".format(INFO, len(observations)))
+    print("{0} Streaming Viterbi with block size {1}".format(INFO, block_size))
+
+    params, decoder = build_streaming_decoder(hmm_model=hmm_model, block_size=block_size)
+    state_names = [state.name for state in params["states"]]
+
+    # the path starts with the start state and
+    # ends with the end state if this is reachable
+    path_length = len(observations) + 1
+    if params["log_end"] is not None:
+        path_length += 1
+
+    counter = int(np.count_nonzero(np.all(observations == np.array(gap_state_obs), axis=1)))
+    state_ids = np.empty(len(observations), dtype=np.int16)
+
+    if file_format == 'npz':
+        for item, state_idx in enumerate(decoder.decode(observations)):
+            state_ids[item] = state_idx
+
+        if np.isfinite(decoder.log_probability):
+            save_viterbi_path_npz(filename=filename, chromosome=chromosome,
+                                  coordinates=coordinates, observations=observations,
+                                  state_ids=state_ids, state_names=state_names,
+                                  path_length=path_length)
+    else:
+
+        def write_block(f, block_start, block_end):
+            for item, obs, r, state_idx in zip(range(block_start, block_end),
+                                                observations[block_start:block_end].tolist(),
+                                                coordinates[block_start:block_end].tolist(),
+                                                state_ids[block_start:block_end].tolist()):
+                f.write(viterbi_path_line(chromosome=chromosome, item=item, r=r, obs=obs,
+                                          name=state_names[state_idx], gap_state_obs=gap_state_obs))
+            f.flush()
+
+        with open(filename, append_or_write) as f:
+            file_start = f.tell()
+            f.write(str(path_length - 1) + "\n")
+
+            block_start = 0
+            for item, state_idx in enumerate(decoder.decode(observations)):
+                state_ids[item] = state_idx
+
+                if item + 1 - block_start == block_size:
+                    write_block(f=f, block_start=block_start, block_end=item + 1)
+                    block_start = item + 1
+
+            write_block(f=f, block_start=block_start, block_end=len(observations))
+
+            if not np.isfinite(decoder.log_probability):
+                f.seek(file_start)
+                f.truncate()
+
+    print("{0} Log-probability of ML Viterbi path: {1}".format(INFO, decoder.log_probability))
+
+    if not np.isfinite(decoder.log_probability):
+        print("{0} Viterbi path is impossible for the given sequence".format(INFO))
+        return (decoder.log_probability, None), observations, state_names
+
+    print("{0} Viterbi path length: {1}".format(INFO, path_length))
+    print("{0} There should be {1} gaps".format(INFO, counter))
+    return (decoder.log_probability, state_ids), observations, state_names
+
+
 def plot_state(state_dist, sample_size, min_, max_, n_bins):
 
      samples = state_dist.sample(n=sample_size)
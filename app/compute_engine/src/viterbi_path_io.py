@@ -0,0 +1,220 @@
+"""
+Binary format for Viterbi paths. A path is stored as an
+uncompressed npz file with typed arrays for the window
+coordinates, the observations and the state ids plus the table
+of the state names. The arrays are memory mapped when read so
+that a coordinate range of the path can be accessed without
+reading the whole file. The legacy text format, i.e.
+chr:idx:(start, end):(wga, nowga):STATE per window, and BED
+can be produced from it on demand
+"""
+
+from pathlib import Path
+import numpy as np
+
+from compute_engine.src.exceptions import Error
+from compute_engine.src.utils import NPZ_MAGIC, load_npz_columns
+from compute_engine.src.windows import Window
+
+VITERBI_PATH_NPZ_VERSION = 1
+
+# the formats a Viterbi path can be saved in
+VITERBI_PATH_FORMATS = ['txt', 'npz']
+
+
+def is_viterbi_path_npz(filename: Path) -> bool:
+    """
+    Returns True if the given Viterbi path file
+    is in the binary format
+    """
+    with open(filename, 'rb') as f:
+        return f.read(4) == NPZ_MAGIC
+
+
+def viterbi_path_line(chromosome: str, item: int, r, obs, name: str, gap_state_obs: tuple=None) -> str:
+    """
+    Returns the line of the text format for a window. Gap
+    windows are written with the integer Window.N_WINDOW_MARKER
+    as create_viterbi_path writes the observations of the
+    gap windows
+    """
+
+    if gap_state_obs is None:
+        gap_state_obs = (Window.N_WINDOW_MARKER, Window.N_WINDOW_MARKER)
+
+    obs = tuple(obs)
+    if obs == tuple(gap_state_obs):
+        obs = (Window.N_WINDOW_MARKER,) * len(obs)
+
+    return chromosome + ":" + str(item) + ":" + str(tuple(r)) + ":" + str(obs) + ":" + name + "\n"
+
+
+def save_viterbi_path_npz(filename: Path, chromosome: str, coordinates, observations,
+                          state_ids, state_names, path_length: int=None) -> None:
+    """
+    Save the Viterbi path of a chromosome region in the binary format
+
+    :param coordinates: (N, 2) array of the window start and end
+    :param observations: (N, 2) array of the (wga, nowga) observations
+    :param state_ids: (N,) array of the indices of the window states in state_names
+    :param state_names: the names of the states
+    :param path_length: the length of the Viterbi path including the
+    silent start and end states. It defaults to N + 1
+    """
+
+    coordinates = np.asarray(coordinates, dtype=np.int64).reshape(-1, 2)
+    observations = np.asarray(observations, dtype=np.float64).reshape(-1, 2)
+    state_ids = np.asarray(state_ids, dtype=np.int16)
+
+    if not len(coordinates) == len(observations) == len(state_ids):
+        raise Error("Viterbi path arrays have different lengths: "
+                    "{0}, {1}, {2}".format(len(coordinates), len(observations), len(state_ids)))
+
+    if len(state_ids) != 0 and (state_ids.min() < 0 or state_ids.max() >= len(state_names)):
+        raise Error("Viterbi path state ids not in [0, {0})".format(len(state_names)))
+
+    # the range queries rely on the window order
+    if np.any(np.diff(coordinates[:, 0]) < 0):
+        raise Error("Viterbi path windows are not sorted by their start")
+
+    if path_length is None:
+        path_length = len(state_ids) + 1
+
+    columns = {"header": np.array([VITERBI_PATH_NPZ_VERSION, path_length], dtype=np.int64),
+               "chromosome": np.array([chromosome]),
+               "state_names": np.array(list(state_names)),
+               "coordinates": coordinates,
+               "observations": observations,
+               "state_ids": state_ids}
+
+    with open(filename, 'wb') as f:
+        np.savez(f, **columns)
+
+
+class ViterbiPathFile(object):
+    """
+    Reader of a Viterbi path saved with save_viterbi_path_npz
+    """
+
+    def __init__(self, filename: Path, mmap_mode: str='r') -> None:
+
+        columns = load_npz_columns(filename=filename, mmap_mode=mmap_mode)
+
+        for name in ["header", "chromosome", "state_names",
+                     "coordinates", "observations", "state_ids"]:
+            if name not in columns:
+                raise Error("Viterbi path file {0} has no {1} array".format(filename, name))
+
+        if int(columns["header"][0]) != VITERBI_PATH_NPZ_VERSION:
+            raise Error("Viterbi path file {0} has version {1} "
+                        "not {2}".format(filename, int(columns["header"][0]),
+                                         VITERBI_PATH_NPZ_VERSION))
+
+        self._filename = filename
+        self._path_length = int(columns["header"][1])
+        self._chromosome = str(columns["chromosome"][0])
+        self._state_names = [str(name) for name in columns["state_names"]]
+        self._coordinates = columns["coordinates"]
+        self._observations = columns["observations"]
+        self._state_ids = columns["state_ids"]
+
+    @property
+    def chromosome(self) -> str:
+        return self._chromosome
+
+    @property
+    def path_length(self) -> int:
+        return self._path_length
+
+    @property
+    def state_names(self) -> list:
+        return self._state_names
+
+    @property
+    def coordinates(self):
+        return self._coordinates
+
+    @property
+    def observations(self):
+        return self._observations
+
+    @property
+    def state_ids(self):
+        return self._state_ids
+
+    def __len__(self) -> int:
+        return len(self._state_ids)
+
+    def states(self, start: int=None, end: int=None):
+        """
+        Returns the state names of the windows
+        overlapping [start, end]
+        """
+        lo, hi = self.index_range(start=start, end=end)
+        return np.array(self._state_names)[self._state_ids[lo:hi]]
+
+    def index_range(self, start: int=None, end: int=None) -> tuple:
+        """
+        Returns the [lo, hi) indices of the windows that overlap
+        [start, end]. A None limit means the start or
+        the end of the path
+        """
+
+        lo = 0
+        hi = len(self)
+
+        if start is not None:
+            # the window ends are sorted as the windows do not overlap
+            lo = int(np.searchsorted(self._coordinates[:, 1], start, side='left'))
+
+        if end is not None:
+            hi = int(np.searchsorted(self._coordinates[:, 0], end, side='right'))
+
+        return lo, max(lo, hi)
+
+    def iter_text_lines(self, start: int=None, end: int=None, header: bool=True):
+        """
+        Yields the lines of the legacy text format for
+        the windows overlapping [start, end]
+        """
+
+        if header:
+            yield str(self._path_length - 1) + "\n"
+
+        lo, hi = self.index_range(start=start, end=end)
+        names = self._state_names
+        for item, r, obs, state_id in zip(range(lo, hi),
+                                          self._coordinates[lo:hi].tolist(),
+                                          self._observations[lo:hi].tolist(),
+                                          self._state_ids[lo:hi].tolist()):
+            yield viterbi_path_line(chromosome=self._chromosome, item=item, r=r,
+                                    obs=obs, name=names[state_id])
+
+    def iter_bed_lines(self, start: int=None, end: int=None, delimiter: str='\t'):
+        """
+        Yields chr start end STATE lines for
+        the windows overlapping [start, end]
+        """
+
+        lo, hi = self.index_range(start=start, end=end)
+        names = self._state_names
+        for r, state_id in zip(self._coordinates[lo:hi].tolist(),
+                               self._state_ids[lo:hi].tolist()):
+            yield delimiter.join([self._chromosome, str(r[0]), str(r[1]), names[state_id]]) + "\n"
+
+    def write_text(self, filename: Path, start: int=None, end: int=None) -> None:
+        with open(filename, 'w') as f:
+            f.writelines(self.iter_text_lines(start=start, end=end))
+
+    def write_bed(self, filename: Path, start: int=None, end: int=None) -> None:
+        with open(filename, 'w') as f:
+            f.writelines(self.iter_bed_lines(start=start, end=end))
+
+    def to_dict_coords_state(self) -> dict:
+        """
+        Returns the (chr, start, end) -> STATE map that
+        ViterbiPathReader reads from the text format
+        """
+        names = self._state_names
+        return {(self._chromosome, r[0], r[1]): names[state_id]
+                for r, state_id in zip(self._coordinates.tolist(), self._state_ids.tolist())}
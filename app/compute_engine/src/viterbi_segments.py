@@ -0,0 +1,156 @@
+"""
+Segments of Viterbi paths. The windows states are given as an
+array of state ids indexing a table of state names. The path is
+run-length encoded with NumPy and the segments are computed over
+the runs instead of the windows
+"""
+
+import numpy as np
+
+
+def run_length_encode(values, breaks=None) -> tuple:
+    """
+    Returns the starts, the lengths and the values of the runs
+    of equal consecutive items in the 1-D values array. If given,
+    breaks is a boolean array and a new run also starts at every
+    index where it is True
+    """
+
+    values = np.asarray(values)
+    n_values = len(values)
+
+    if n_values == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, values[:0]
+
+    change = values[1:] != values[:-1]
+
+    if breaks is not None:
+        change |= np.asarray(breaks, dtype=bool)[1:]
+
+    starts = np.concatenate(([0], np.flatnonzero(change) + 1)).astype(np.int64)
+    lengths = np.diff(np.append(starts, n_values))
+    return starts, lengths, values[starts]
+
+
+def state_ids_with_name(state_names, names) -> np.ndarray:
+    """
+    Returns the ids of the states in the state_names
+    table whose name is in names
+    """
+
+    if isinstance(state_names, dict):
+        items = state_names.items()
+    else:
+        items = enumerate(state_names)
+
+    return np.array([idx for idx, name in items if name in names], dtype=np.int64)
+
+
+def viterbi_path_state_ids(path) -> tuple:
+    """
+    Returns the state ids array and the state names
+    table of a path of (idx, state) items as returned
+    by the HMM viterbi
+    """
+
+    state_ids = np.fromiter((idx for idx, _ in path), dtype=np.int64, count=len(path))
+
+    state_names = {}
+    if len(state_ids) != 0:
+        unique_ids, first = np.unique(state_ids, return_index=True)
+        state_names = {int(idx): path[pos][1].name for idx, pos in zip(unique_ids, first)}
+
+    return state_ids, state_names
+
+
+def tuf_del_tuf_runs(run_states, run_lengths, wstate_ids,
+                     limit_state_ids, min_subsequence: int=1) -> np.ndarray:
+    """
+    Returns the indices of the runs that form TUF-DEL-TUF islands
+    i.e. runs of a limit state with at least min_subsequence
+    windows that have a run of a wstate on both sides. The
+    runs on the sides are included once even if shared by
+    two consecutive islands
+    """
+
+    n_runs = len(run_states)
+    if n_runs < 3:
+        return np.zeros(0, dtype=np.int64)
+
+    is_wstate = np.isin(run_states, wstate_ids)
+    is_limit = np.isin(run_states, limit_state_ids)
+
+    islands = np.flatnonzero(is_limit[1:-1] & is_wstate[:-2] & is_wstate[2:] &
+                             (run_lengths[1:-1] >= min_subsequence)) + 1
+
+    return np.unique(np.concatenate((islands - 1, islands, islands + 1)))
+
+
+def tuf_del_tuf_segments(state_ids, state_names, coordinates, wstate: str='TUF',
+                         limit_state: str='Deletion', min_subsequence: int=1) -> list:
+    """
+    Returns the (idx, start, end, length, state) segments of
+    the TUF-DEL-TUF islands of the path. The window coordinates
+    are given as an (N, 2) array (see Region.get_rd_mean_observations)
+    """
+
+    starts, lengths, run_states = run_length_encode(values=state_ids)
+
+    runs = tuf_del_tuf_runs(run_states=run_states, run_lengths=lengths,
+                            wstate_ids=state_ids_with_name(state_names, [wstate]),
+                            limit_state_ids=state_ids_with_name(state_names, [limit_state]),
+                            min_subsequence=min_subsequence)
+
+    first = starts[runs]
+    last = first + lengths[runs] - 1
+    seg_starts = np.asarray(coordinates)[first, 0]
+    seg_ends = np.asarray(coordinates)[last, 1]
+
+    return [(idx, start, end, end - start + 1, state_names[state])
+            for idx, start, end, state in zip(first.tolist(), seg_starts.tolist(),
+                                               seg_ends.tolist(), run_states[runs].tolist())]
+
+
+def state_segments(state_ids, state_names, coordinates, chromosome_ids=None,
+                   state_map: dict=None) -> tuple:
+    """
+    Returns the runs of the path as (chromosome_id, start, end, state)
+    arrays. The states are renamed with state_map, e.g. TUFDUP to TUF,
+    before the runs are computed so renamed states merge with the
+    state they are mapped to. A run ends where the chromosome changes
+    """
+
+    state_ids = np.asarray(state_ids)
+
+    if isinstance(state_names, dict):
+        table_size = max(state_names.keys()) + 1 if len(state_names) != 0 else 0
+        names = [state_names.get(idx, None) for idx in range(table_size)]
+    else:
+        names = list(state_names)
+
+    if state_map is not None:
+        # map every state id to the id of its new name
+        names = [state_map.get(name, name) for name in names]
+        _, remap = np.unique(np.array(names, dtype=str), return_inverse=True)
+        state_ids = remap[state_ids]
+        names_by_id = dict(zip(remap.tolist(), names))
+    else:
+        names_by_id = dict(enumerate(names))
+
+    breaks = None
+    if chromosome_ids is not None:
+        chromosome_ids = np.asarray(chromosome_ids)
+        breaks = np.ones(len(state_ids), dtype=bool)
+        breaks[1:] = chromosome_ids[1:] != chromosome_ids[:-1]
+
+    starts, lengths, run_states = run_length_encode(values=state_ids, breaks=breaks)
+
+    run_chromosomes = np.zeros(len(starts), dtype=np.int64)
+    if chromosome_ids is not None:
+        run_chromosomes = chromosome_ids[starts]
+
+    coordinates = np.asarray(coordinates)
+    return (run_chromosomes, coordinates[starts, 0],
+            coordinates[starts + lengths - 1, 1],
+            [names_by_id[state] for state in run_states.tolist()])
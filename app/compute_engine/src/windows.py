@@ -1,6 +1,67 @@
 from enum import Enum
+import numpy as np
 from compute_engine.src.exceptions import Error
 
+# fixed schema of the samdata of a window
+# when stored as a NumPy structured array.
+# None values of the float fields are stored as NaN
+SAMDATA_DTYPE = np.dtype([('gcmax', np.float64),
+                          ('gcmin', np.float64),
+                          ('gcr', np.float64),
+                          ('gapAlert', np.bool_),
+                          ('allmean', np.float64),
+                          ('qmean', np.float64),
+                          ('allmedian', np.float64),
+                          ('allsum', np.int64),
+                          ('qsum', np.int64),
+                          ('qmedian', np.float64),
+                          ('errorAlert', np.bool_),
+                          ('head', np.int64),
+                          ('start', np.int64),
+                          ('end', np.int64),
+                          ('minLen', np.int64)])
+
+# samdata fields that may be None
+SAMDATA_NULLABLE = ('gcmax', 'gcmin')
+
+
+def samdata_to_records(samdata):
+    """
+    Convert a list of samdata dictionaries into
+    a structured array with dtype SAMDATA_DTYPE
+    """
+
+    records = np.zeros(len(samdata), dtype=SAMDATA_DTYPE)
+
+    for name in SAMDATA_DTYPE.names:
+        column = [data[name] for data in samdata]
+
+        if name in SAMDATA_NULLABLE:
+            column = [np.nan if value is None else value for value in column]
+
+        records[name] = column
+    return records
+
+
+def records_to_samdata(records):
+    """
+    Convert a structured array with dtype SAMDATA_DTYPE
+    into a list of samdata dictionaries
+    """
+
+    names = SAMDATA_DTYPE.names
+    columns = []
+    for name in names:
+        column = records[name].tolist()
+
+        if name in SAMDATA_NULLABLE:
+            column = [None if value != value else value for value in column]
+
+        columns.append(column)
+
+    return [dict(zip(names, values)) for values in zip(*columns)]
+
+
 class WindowType(Enum):
     WGA = 0
     NO_WGA = 1
@@ -115,6 +176,10 @@ class Window(object):
     def capacity(self):
         return self._capacity
 
+    @property
+    def samdata(self):
+        return self._samdata
+
     @property
     def start_end_pos(self):
         return self.sam_property("start"), self.sam_property("end")
@@ -131,7 +196,7 @@ class Window(object):
             return self._samdata["qmean"]
 
         elif statistic == "median":
-            self._samdata["qmedian"]
+            return self._samdata["qmedian"]
 
         raise Error("Statistic '{0}' is not currently "
                     "computed for Window".format(statistic))
@@ -154,22 +219,30 @@ class MixedWindowView(object):
         Class that holds two instances of windows
     """
 
-    __slots__ = ('_windows', '_state')
+    __slots__ = ('_windows', '_state', '_states', '_row')
 
-    def __init__(self, wga_w, n_wga_w):
+    def __init__(self, wga_w, n_wga_w, states=None, row=None):
         self._windows = {WindowType.WGA: wga_w,
                          WindowType.NO_WGA: n_wga_w}
 
-        # the state of the window
+        # the state of the window. The views of a MixedWindowsArray
+        # keep it in the states column of the array at row
         self._state = WindowState.INVALID
+        self._states = states
+        self._row = row
 
     @property
     def state(self):
+        if self._states is not None:
+            return self._states[self._row]
         return self._state
 
     @state.setter
     def state(self, value):
-        self._state = value
+        if self._states is not None:
+            self._states[self._row] = value
+        else:
+            self._state = value
 
     @property
     def start_end_pos(self):
@@ -270,3 +343,202 @@ class MixedWindowView(object):
                     " not in {1}".format(wtype, [WindowType.BOTH.name,
                                                 WindowType.WGA.name,
                                                 WindowType.NO_WGA.name]))
+
+
+class WindowColumns(object):
+    """
+    The windows of one type stored column wise. Every
+    samdata property is an array (possibly memory mapped)
+    along with the window ids and capacities. Window states
+    are kept sparsely since only few windows get one
+    """
+
+    __slots__ = ('_columns', '_states')
+
+    def __init__(self, columns):
+
+        # name -> array. Expected names are
+        # 'wid', 'capacity' and SAMDATA_DTYPE.names
+        self._columns = columns
+
+        # row -> state for the rows that have a state
+        self._states = {}
+
+    def __len__(self):
+        return len(self._columns["wid"])
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    def get_state(self, row):
+        return self._states.get(row, WindowState.INVALID)
+
+    def set_state(self, row, value):
+        self._states[row] = value
+
+
+class WindowView(object):
+    """
+    Lightweight view of a window stored as a row
+    of a WindowColumns instance. Exposes the same
+    interface as Window without holding a samdata dict
+    """
+
+    __slots__ = ('_columns', '_row')
+
+    def __init__(self, columns, row):
+        self._columns = columns
+        self._row = row
+
+    @property
+    def idx(self):
+        return int(self._columns["wid"][self._row])
+
+    @property
+    def start(self):
+        return self.sam_property("start")
+
+    @property
+    def end(self):
+        return self.sam_property("end")
+
+    @property
+    def state(self):
+        return self._columns.get_state(row=self._row)
+
+    @state.setter
+    def state(self, value):
+        self._columns.set_state(row=self._row, value=value)
+
+    @property
+    def capacity(self):
+        return int(self._columns["capacity"][self._row])
+
+    @property
+    def samdata(self):
+        return {name: self.sam_property(name) for name in SAMDATA_DTYPE.names}
+
+    @property
+    def start_end_pos(self):
+        return self.sam_property("start"), self.sam_property("end")
+
+    def sam_property_names(self):
+        return SAMDATA_DTYPE.names
+
+    def sam_property(self, name):
+        value = self._columns[name][self._row].item()
+
+        if name in SAMDATA_NULLABLE and value != value:
+            return None
+        return value
+
+    def get_rd_statistic(self, statistic):
+
+        if statistic == "mean":
+            return self.sam_property("qmean")
+
+        elif statistic == "median":
+            return self.sam_property("qmedian")
+
+        raise Error("Statistic '{0}' is not currently "
+                    "computed for Window".format(statistic))
+
+    def get_gc_percent(self):
+        return self.sam_property("gcr")
+
+    def set_window_rd_mark(self, mark):
+        Window.set_window_marker(marker=mark)
+
+    def has_gaps(self):
+        return self.sam_property("gapAlert")
+
+    def has_errors(self):
+        return self.sam_property("errorAlert")
+
+
+class MixedWindowsArray(object):
+    """
+    Sequence of mixed windows backed by the WGA and
+    NO_WGA WindowColumns. Only the indices of the selected
+    rows are stored. MixedWindowView instances are
+    created on access and keep their state in the states
+    column, which is shared by the selections of the array
+    """
+
+    __slots__ = ('_wga', '_no_wga', '_rows', '_states')
+
+    def __init__(self, wga_columns, no_wga_columns, rows=None, states=None):
+
+        self._wga = wga_columns
+        self._no_wga = no_wga_columns
+
+        n_rows = min(len(wga_columns), len(no_wga_columns))
+        if rows is None:
+            rows = np.arange(n_rows, dtype=np.int64)
+
+        if states is None:
+            states = np.full(n_rows, WindowState.INVALID, dtype=object)
+
+        self._rows = rows
+        self._states = states
+
+    @property
+    def rows(self):
+        return self._rows
+
+    @property
+    def states(self):
+        """
+        Returns the states of the selected rows
+        """
+        return self._states[self._rows]
+
+    def get_columns(self, wtype):
+
+        if wtype == WindowType.WGA:
+            return self._wga
+        elif wtype == WindowType.NO_WGA:
+            return self._no_wga
+
+        raise Error("Invalid Window type {0}"
+                    " not in ['WGA', 'NO_WGA']".format(wtype))
+
+    def column(self, wtype, name):
+        """
+        Returns the values of the property
+        name for the selected rows
+        """
+        return self.get_columns(wtype=wtype)[name][self._rows]
+
+    def gap_mask(self):
+        return self.column(wtype=WindowType.WGA, name="gapAlert") | \
+               self.column(wtype=WindowType.NO_WGA, name="gapAlert")
+
+    def error_mask(self):
+        return self.column(wtype=WindowType.WGA, name="errorAlert") | \
+               self.column(wtype=WindowType.NO_WGA, name="errorAlert")
+
+    def select(self, mask):
+        """
+        Returns a new MixedWindowsArray with the
+        rows for which mask is True
+        """
+        return MixedWindowsArray(wga_columns=self._wga,
+                                 no_wga_columns=self._no_wga,
+                                 rows=self._rows[mask],
+                                 states=self._states)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        for row in self._rows.tolist():
+            yield self._make_view(row=row)
+
+    def __getitem__(self, item):
+        return self._make_view(row=int(self._rows[item]))
+
+    def _make_view(self, row):
+        return MixedWindowView(wga_w=WindowView(columns=self._wga, row=row),
+                               n_wga_w=WindowView(columns=self._no_wga, row=row),
+                               states=self._states, row=row)
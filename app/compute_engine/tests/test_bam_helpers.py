@@ -0,0 +1,266 @@
+import unittest
+import random
+from concurrent.futures import ProcessPoolExecutor
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import pysam
+
+from compute_engine.src import bam_helpers
+from compute_engine.src.bam_helpers import window_sam_file
+from compute_engine.src.bam_helpers import window_sam_region
+from compute_engine.src.bam_helpers import window_sam_region_arrays
+from compute_engine.src.bam_helpers import extract_windows
+from compute_engine.src.bam_helpers import extract_windows_concurrently
+from compute_engine.src.bam_helpers import partition_windows
+from compute_engine.src.exceptions import Error
+
+
+def make_test_files(path, chromosome="chr1", ref_size=3000, n_reads=400, seed=42):
+    """
+    Create a small indexed reference and a sorted and
+    indexed BAM file with paired reads over it
+    """
+
+    rng = random.Random(seed)
+    bases = "ACGTacgt"
+    refseq = [rng.choice(bases) for _ in range(ref_size)]
+
+    # add a gap region
+    for i in range(1200, 1260):
+        refseq[i] = 'N'
+
+    refseq = ''.join(refseq)
+
+    ref_filename = str(path / "ref.fa")
+    with open(ref_filename, 'w') as f:
+        f.write(">" + chromosome + "\n")
+        for i in range(0, ref_size, 60):
+            f.write(refseq[i:i + 60] + "\n")
+    pysam.faidx(ref_filename)
+
+    header = {'HD': {'VN': '1.0'},
+              'SQ': [{'LN': ref_size, 'SN': chromosome}]}
+
+    unsorted_filename = str(path / "unsorted.bam")
+    with pysam.AlignmentFile(unsorted_filename, "wb", header=header) as out:
+        for r in range(n_reads):
+            read_len = rng.randint(30, 80)
+
+            # leave the end of the chromosome uncovered
+            start = rng.randint(0, ref_size - 400)
+            seq = list(refseq[start:start + read_len].upper().replace('N', 'A'))
+
+            # introduce a few mismatches
+            for _ in range(3):
+                seq[rng.randint(0, read_len - 1)] = rng.choice("ACGT")
+
+            segment = pysam.AlignedSegment()
+            segment.query_name = "read_{0}".format(r // 2)
+            segment.query_sequence = ''.join(seq)
+            segment.flag = 1 | 2 | (64 if r % 2 == 0 else 128)
+            segment.reference_id = 0
+            segment.reference_start = start
+            segment.mapping_quality = 60
+            segment.cigar = ((0, read_len),)
+            segment.next_reference_id = 0
+            segment.next_reference_start = start
+            segment.template_length = read_len
+            segment.query_qualities = pysam.qualitystring_to_array(
+                ''.join([chr(33 + rng.randint(5, 40)) for _ in range(read_len)]))
+            out.write(segment)
+
+    bam_filename = str(path / "test.bam")
+    pysam.sort("-o", bam_filename, unsorted_filename)
+    pysam.index(bam_filename)
+    return ref_filename, bam_filename
+
+
+class TestBamHelpers(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.path = Path(tempfile.mkdtemp())
+        cls.chromosome = "chr1"
+        cls.ref_filename, cls.bam_filename = make_test_files(path=cls.path,
+                                                             chromosome=cls.chromosome)
+        cls.sam_read_config = {"truncate": True, "ignore_orphans": False,
+                               "max_depth": 8000, "quality_threshold": 20,
+                               "add_indels": True}
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.path)
+
+    def window_by_window(self, start, end, windowsize, sam_read_config):
+
+        outputs = []
+        with pysam.FastaFile(self.ref_filename) as fastafile:
+            with pysam.AlignmentFile(self.bam_filename, "rb") as sam_file:
+                while start < end:
+                    outputs.append(window_sam_file(chromosome=self.chromosome,
+                                                   sam_file=sam_file,
+                                                   fastafile=fastafile,
+                                                   start=start, end=start + windowsize,
+                                                   sam_read_config=sam_read_config))
+                    start += windowsize
+        return outputs
+
+    def single_pass(self, start, end, windowsize, sam_read_config, region_windows=window_sam_region):
+
+        with pysam.FastaFile(self.ref_filename) as fastafile:
+            with pysam.AlignmentFile(self.bam_filename, "rb") as sam_file:
+                return list(region_windows(chromosome=self.chromosome,
+                                           sam_file=sam_file,
+                                           fastafile=fastafile,
+                                           start=start, end=end,
+                                           windowsize=windowsize,
+                                           sam_read_config=sam_read_config))
+
+    def test_window_sam_region_parity(self):
+
+        for start, end, windowsize in [(0, 3000, 100), (150, 2950, 100), (37, 1999, 64)]:
+            expected = self.window_by_window(start=start, end=end, windowsize=windowsize,
+                                             sam_read_config=self.sam_read_config)
+            computed = self.single_pass(start=start, end=end, windowsize=windowsize,
+                                        sam_read_config=self.sam_read_config)
+
+            self.assertEqual(len(expected), len(computed))
+            for w_expected, w_computed in zip(expected, computed):
+                self.assertEqual(w_expected, w_computed)
+
+    def test_window_sam_region_no_quality_threshold(self):
+
+        sam_read_config = dict(self.sam_read_config)
+        del sam_read_config["quality_threshold"]
+
+        # covered windows and windows at the
+        # uncovered end of the chromosome
+        for start, end, windowsize in [(0, 1000, 100), (37, 1999, 64), (2700, 3000, 100)]:
+            expected = self.window_by_window(start=start, end=end, windowsize=windowsize,
+                                             sam_read_config=sam_read_config)
+            computed = self.single_pass(start=start, end=end, windowsize=windowsize,
+                                        sam_read_config=sam_read_config)
+            self.assertEqual(expected, computed)
+
+    def test_window_sam_region_arrays_parity(self):
+
+        for start, end, windowsize in [(0, 3000, 100), (150, 2950, 100), (37, 1999, 64)]:
+            expected = self.window_by_window(start=start, end=end, windowsize=windowsize,
+                                             sam_read_config=self.sam_read_config)
+            computed = self.single_pass(start=start, end=end, windowsize=windowsize,
+                                        sam_read_config=self.sam_read_config,
+                                        region_windows=window_sam_region_arrays)
+
+            self.assertEqual(len(expected), len(computed))
+            for w_expected, w_computed in zip(expected, computed):
+                self.assertEqual(w_expected, w_computed)
+
+    def test_window_sam_region_arrays_no_quality_threshold(self):
+
+        sam_read_config = dict(self.sam_read_config)
+        del sam_read_config["quality_threshold"]
+
+        for start, end, windowsize in [(0, 1000, 100), (37, 1999, 64), (2700, 3000, 100)]:
+            expected = self.window_by_window(start=start, end=end, windowsize=windowsize,
+                                             sam_read_config=sam_read_config)
+            computed = self.single_pass(start=start, end=end, windowsize=windowsize,
+                                        sam_read_config=sam_read_config,
+                                        region_windows=window_sam_region_arrays)
+            self.assertEqual(expected, computed)
+
+    def test_window_sam_region_arrays_blocks(self):
+
+        # blocks of a few windows and a depth limit the
+        # region pileup reaches give the same windows
+        sam_read_config = dict(self.sam_read_config)
+        sam_read_config["max_depth"] = 10
+
+        for block_size in [64, 300, 1000]:
+            with mock.patch.object(bam_helpers, 'WINDOW_ARRAYS_BLOCK_SIZE', block_size):
+                for start, end, windowsize in [(0, 3000, 100), (37, 1999, 64)]:
+                    expected = self.single_pass(start=start, end=end, windowsize=windowsize,
+                                                sam_read_config=sam_read_config)
+                    computed = self.single_pass(start=start, end=end, windowsize=windowsize,
+                                                sam_read_config=sam_read_config,
+                                                region_windows=window_sam_region_arrays)
+                    self.assertEqual(expected, computed)
+
+    def test_extract_windows_numpy_backend(self):
+
+        sam_read_config = dict(self.sam_read_config)
+        sam_read_config["statistics_backend"] = "numpy"
+        windows = extract_windows(chromosome=self.chromosome,
+                                  ref_filename=self.ref_filename,
+                                  bam_filename=self.bam_filename,
+                                  windowsize=100, start_idx=1000, end_idx=1500,
+                                  sam_read_config=sam_read_config)
+
+        self.assertEqual(len(windows), 5)
+        self.assertEqual(windows[0].start_end_pos, (1000, 1099))
+        self.assertTrue(windows[2].has_gaps())
+
+    def test_extract_windows_invalid_backend(self):
+
+        sam_read_config = dict(self.sam_read_config)
+        sam_read_config["statistics_backend"] = "gpu"
+        self.assertRaises(Error, extract_windows, self.chromosome,
+                          self.ref_filename, self.bam_filename,
+                          windowsize=100, start_idx=1000, end_idx=1500,
+                          sam_read_config=sam_read_config)
+
+    def test_extract_windows(self):
+
+        windows = extract_windows(chromosome=self.chromosome,
+                                  ref_filename=self.ref_filename,
+                                  bam_filename=self.bam_filename,
+                                  windowsize=100, start_idx=1000, end_idx=1500,
+                                  sam_read_config=self.sam_read_config)
+
+        self.assertEqual(len(windows), 5)
+        self.assertEqual(windows[0].start_end_pos, (1000, 1099))
+        self.assertEqual(windows[-1].start_end_pos, (1400, 1499))
+        self.assertEqual([w.idx for w in windows], [0, 1, 2, 3, 4])
+        self.assertTrue(windows[2].has_gaps())
+        self.assertFalse(windows[0].has_gaps())
+
+    def test_partition_windows(self):
+
+        chunks = partition_windows(start=37, end=2950, windowsize=100, n_chunks=4)
+        self.assertEqual(chunks, [(0, 37, 737), (7, 737, 1437),
+                                  (14, 1437, 2137), (21, 2137, 2950)])
+
+        # more chunks than windows
+        chunks = partition_windows(start=0, end=250, windowsize=100, n_chunks=8)
+        self.assertEqual(chunks, [(0, 0, 100), (1, 100, 200), (2, 200, 250)])
+
+    def test_extract_windows_concurrently(self):
+
+        args = {"windowsize": 100, "start_idx": 37, "end_idx": 2950,
+                "sam_read_config": self.sam_read_config}
+        expected = extract_windows(chromosome=self.chromosome,
+                                   ref_filename=self.ref_filename,
+                                   bam_filename=self.bam_filename, **args)
+
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            computed = extract_windows_concurrently(chromosome=self.chromosome,
+                                                    ref_filename=self.ref_filename,
+                                                    bam_filenames=[self.bam_filename,
+                                                                   self.bam_filename],
+                                                    executor=executor, n_chunks=4, **args)
+
+        self.assertEqual(len(computed), 2)
+        for windows in computed:
+            self.assertEqual(len(windows), len(expected))
+            for w_expected, w_computed in zip(expected, windows):
+                self.assertEqual(w_expected.idx, w_computed.idx)
+                self.assertEqual(w_expected.start_end_pos, w_computed.start_end_pos)
+                self.assertEqual(w_expected.get_rd_statistic(statistic="mean"),
+                                 w_computed.get_rd_statistic(statistic="mean"))
+                self.assertEqual(w_expected.get_gc_percent(), w_computed.get_gc_percent())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import random
+
+import numpy as np
+
+from compute_engine.src import cpf
+from compute_engine.src.cpf import CPF, categories, categories_words
+
+
+def reference_feature_vector(seq, use_partial_sums=True):
+    """
+    The feature vector computed word by word
+    with the helpers of cpf
+    """
+
+    feature_vec = []
+    for C in categories:
+        words = cpf.collect_words(seq=cpf.map_seq_to_category(categories[C], seq), k=2)
+
+        for word in categories_words[C]:
+            tuple_word = (word[0], word[1])
+
+            if tuple_word not in words:
+                feature_vec.append(0.0)
+                continue
+
+            S = cpf.local_frequency(word=tuple_word, seq=words)
+            if use_partial_sums:
+                S = cpf.partial_sums(seq=S)
+            feature_vec.append(cpf.shannon_entropy(ps=cpf.calculate_p(s=S, z=cpf.sequence_total_sum(s=S))))
+    return feature_vec
+
+
+class TestCPF(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(42)
+        self.sequences = ["".join(rng.choice("ACGT") for _ in range(rng.choice([0, 1, 2, 15, 120])))
+                          for _ in range(60)] + ["AAAAAAAA", "ACACACAC"]
+
+    def test_sequence_feature_vector(self):
+
+        for seq in self.sequences:
+            for use_partial_sums in [True, False]:
+                np.testing.assert_allclose(cpf.sequence_feature_vector(seq=seq, use_partial_sums=use_partial_sums),
+                                           reference_feature_vector(seq=seq, use_partial_sums=use_partial_sums),
+                                           rtol=0.0, atol=1.0e-12)
+
+        # RR and YR with C1 i.e. AGAAC -> RRRRY
+        counts = cpf.sequence_feature_vector_from_counts(seq="AGAAC")
+        np.testing.assert_array_equal(counts[:4], [3, 1, 0, 0])
+        np.testing.assert_array_equal(cpf.sequence_feature_vector_from_probability_counts(seq="AGAAC")[:4],
+                                      [0.75, 0.25, 0.0, 0.0])
+
+        self.assertRaises(ValueError, cpf.sequence_feature_vector, "ACGN")
+
+    def test_pairwise_similarities(self):
+
+        calculator = CPF()
+        seqs_a = self.sequences[:30]
+        seqs_b = self.sequences[30:60]
+
+        expected = [np.linalg.norm(np.array(reference_feature_vector(seq=a)) -
+                                   np.array(reference_feature_vector(seq=b))) for a, b in zip(seqs_a, seqs_b)]
+        np.testing.assert_allclose(calculator.pairwise_similarities(seqs_a, seqs_b), expected,
+                                   rtol=0.0, atol=1.0e-12)
+        self.assertAlmostEqual(calculator(seqs_a[0], seqs_b[0]), expected[0], places=12)
+
+        matrix = calculator.similarity_matrix(sequences=seqs_a)
+        self.assertEqual(matrix.shape, (30, 30))
+        np.testing.assert_allclose(np.diag(matrix), 0.0)
+        np.testing.assert_allclose(matrix[0, 1], calculator(seqs_a[0], seqs_a[1]))
+
+    def test_remove_zeros(self):
+
+        calculator = CPF()
+        calculator.set_options(use_word_counts_and_remove_zeros=True)
+
+        # only the RR, MM, WW and WS entries are non zero in both
+        vec_1 = cpf.sequence_feature_vector_from_counts(seq="AAAAG")
+        vec_2 = cpf.sequence_feature_vector_from_counts(seq="AACCA")
+        self.assertAlmostEqual(calculator.similarity("AAAAG", "AACCA"),
+                               np.linalg.norm((vec_1 - vec_2)[[0, 4, 8, 9]]), places=12)
+
+
+if __name__ == '__main__':
+    unittest.main()
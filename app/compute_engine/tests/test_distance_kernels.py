@@ -0,0 +1,192 @@
+import unittest
+import random
+
+import numpy as np
+import textdistance
+
+from compute_engine.src import distance_kernels
+from compute_engine.src.distance_kernels import pairwise_distances
+from compute_engine.src.string_sequence_calculator import TextDistanceCalculator
+
+
+def levenshtein_distances(a, a_lengths, b, b_lengths, transpositions: bool=False) -> np.ndarray:
+    """
+    Reference row by row kernel of the bit-parallel one.
+    Returns the Levenshtein distances of the pairs or, if
+    transpositions is True, the restricted Damerau-Levenshtein
+    (optimal string alignment) distances. A row of the matrix
+    of all the pairs is computed at a time. The insertions
+    within a row are resolved with a running minimum as
+    D[i, j] = j + min_{k <= j} (X[i, k] - k) where X holds
+    the deletion, substitution and transposition costs
+    """
+
+    n_pairs, width = b.shape
+    columns = np.arange(width + 1, dtype=np.int64)
+
+    distances = b_lengths.copy()
+    before = None
+    previous = np.tile(columns, (n_pairs, 1))
+
+    for i in range(1, a.shape[1] + 1):
+        cost = (a[:, i - 1, None] != b).astype(np.int64)
+
+        x = np.empty((n_pairs, width + 1), dtype=np.int64)
+        x[:, 0] = i
+        x[:, 1:] = np.minimum(previous[:, 1:] + 1, previous[:, :-1] + cost)
+
+        if transpositions and i > 1 and width > 1:
+            swapped = (a[:, i - 1, None] == b[:, :-1]) & (a[:, i - 2, None] == b[:, 1:])
+            x[:, 2:] = np.where(swapped, np.minimum(x[:, 2:], before[:, :-2] + cost[:, 1:]), x[:, 2:])
+
+        current = np.minimum.accumulate(x - columns, axis=1) + columns
+
+        ends = a_lengths == i
+        distances[ends] = current[ends, b_lengths[ends]]
+
+        before = previous
+        previous = current
+
+    return distances
+
+
+def make_pairs(n_pairs, seed=42):
+    """
+    Random pairs with equal, empty and edited
+    sequences and sequences over few letters
+    """
+
+    rng = random.Random(seed)
+    seqs_a = []
+    seqs_b = []
+    for _ in range(n_pairs):
+        seq_a = "".join(rng.choice(rng.choice(["ACGT", "AC"])) for _ in range(rng.choice([0, 1, 2, 40])))
+
+        r = rng.random()
+        if r < 0.1:
+            seq_b = seq_a
+        elif r < 0.5 and len(seq_a) > 1:
+            seq_b = list(seq_a)
+            k = rng.randrange(len(seq_b) - 1)
+            seq_b[k], seq_b[k + 1] = seq_b[k + 1], seq_b[k]
+            seq_b[rng.randrange(len(seq_b))] = rng.choice("ACGT")
+            seq_b = "".join(seq_b)
+        else:
+            seq_b = "".join(rng.choice("ACGT") for _ in range(rng.choice([0, 1, 3, 35])))
+
+        seqs_a.append(seq_a)
+        seqs_b.append(seq_b)
+    return seqs_a, seqs_b
+
+
+class TestDistanceKernels(unittest.TestCase):
+
+    def assert_same_distances(self, calculator, expected, seqs_a, seqs_b):
+
+        for normalized in [True, False]:
+            distances = calculator.pairwise(seqs_a, seqs_b, normalized=normalized)
+
+            if normalized:
+                values = [expected.normalized_distance(a, b) for a, b in zip(seqs_a, seqs_b)]
+            else:
+                values = [expected.distance(a, b) for a, b in zip(seqs_a, seqs_b)]
+
+            np.testing.assert_allclose(distances, values, rtol=0.0, atol=1.0e-12)
+
+    def test_edit_distances(self):
+
+        seqs_a, seqs_b = make_pairs(n_pairs=300)
+
+        for calculator, expected in [(distance_kernels.Hamming(), textdistance.Hamming()),
+                                     (distance_kernels.Levenshtein(), textdistance.Levenshtein()),
+                                     (distance_kernels.DamerauLevenshtein(), textdistance.DamerauLevenshtein()),
+                                     (distance_kernels.LCSSeq(), textdistance.LCSSeq()),
+                                     (distance_kernels.LCSStr(), textdistance.LCSStr())]:
+            self.assert_same_distances(calculator=calculator, expected=expected,
+                                       seqs_a=seqs_a, seqs_b=seqs_b)
+
+    def test_bit_parallel_distances(self):
+
+        # sequences longer than a word span several words
+        rng = random.Random(7)
+        seqs_a = ["".join(rng.choice("ACGT") for _ in range(rng.randint(0, 200))) for _ in range(100)]
+        seqs_b = ["".join(rng.choice("ACGT") for _ in range(rng.randint(0, 200))) for _ in range(100)]
+        seqs_b[:10] = seqs_a[:10]
+
+        a, a_lengths = distance_kernels.pad_sequences(seqs=seqs_a, pad=distance_kernels.PAD_A)
+        b, b_lengths = distance_kernels.pad_sequences(seqs=seqs_b, pad=distance_kernels.PAD_B)
+
+        for transpositions in [False, True]:
+            np.testing.assert_array_equal(
+                distance_kernels.bit_parallel_distances(a, a_lengths, b, b_lengths, transpositions=transpositions),
+                levenshtein_distances(a, a_lengths, b, b_lengths, transpositions=transpositions))
+
+        self.assert_same_distances(calculator=distance_kernels.DamerauLevenshtein(),
+                                   expected=textdistance.DamerauLevenshtein(), seqs_a=seqs_a, seqs_b=seqs_b)
+
+    def test_pairwise_min_reverse(self):
+
+        seqs_a, seqs_b = make_pairs(n_pairs=200)
+        seqs_b_rc = [seq.translate(str.maketrans("ACGT", "TGCA"))[::-1] for seq in seqs_b]
+
+        for calculator in [distance_kernels.Levenshtein(), distance_kernels.DamerauLevenshtein(),
+                           distance_kernels.LCSSeq()]:
+            expected = np.minimum(calculator.pairwise(seqs_a, seqs_b), calculator.pairwise(seqs_a, seqs_b_rc))
+            np.testing.assert_array_equal(calculator.pairwise_min_reverse(seqs_a, seqs_b), expected)
+            np.testing.assert_array_equal(calculator.pairwise_min_reverse(seqs_a, seqs_b, seqs_b_rc), expected)
+
+    def test_kmer_distances(self):
+
+        seqs_a, seqs_b = make_pairs(n_pairs=300)
+
+        # pairs textdistance cannot compute e.g. two
+        # sequences with no k-mers are left out
+        pairs = [(a, b) for a, b in zip(seqs_a, seqs_b) if a == b or not a or not b or
+                 (len(a) >= 3 and len(b) >= 3)]
+        seqs_a = [a for a, _ in pairs]
+        seqs_b = [b for _, b in pairs]
+
+        for qval in [1, 3]:
+            for as_set in [False, True]:
+                for calculator, expected in [(distance_kernels.Jaccard, textdistance.Jaccard),
+                                             (distance_kernels.Sorensen, textdistance.Sorensen),
+                                             (distance_kernels.Cosine, textdistance.Cosine)]:
+                    self.assert_same_distances(calculator=calculator(qval=qval, as_set=as_set),
+                                               expected=expected(qval=qval, as_set=as_set),
+                                               seqs_a=seqs_a, seqs_b=seqs_b)
+
+    def test_encoded_sequences(self):
+
+        seqs_a, seqs_b = make_pairs(n_pairs=50)
+        encoded_a = [np.frombuffer(seq.encode(), dtype=np.uint8) for seq in seqs_a]
+        encoded_b = [np.frombuffer(seq.encode(), dtype=np.uint8) for seq in seqs_b]
+
+        calculator = distance_kernels.Levenshtein()
+        np.testing.assert_array_equal(calculator.pairwise(encoded_a, encoded_b),
+                                      calculator.pairwise(seqs_a, seqs_b))
+
+    def test_fallback(self):
+
+        seqs_a, seqs_b = make_pairs(n_pairs=50)
+
+        # a test_func is not supported by the kernels
+        calculator = distance_kernels.Levenshtein(test_func=lambda x, y: x.upper() == y.upper())
+        np.testing.assert_array_equal(calculator.pairwise(seqs_a, seqs_b),
+                                      [calculator.normalized_distance(a, b) for a, b in zip(seqs_a, seqs_b)])
+
+        # calculators without pairwise
+        calculator = textdistance.JaroWinkler()
+        np.testing.assert_array_equal(pairwise_distances(calculator, seqs_a, seqs_b),
+                                      [calculator.normalized_distance(a, b) for a, b in zip(seqs_a, seqs_b)])
+
+        self.assertRaises(ValueError, distance_kernels.Hamming().pairwise, ["A"], [])
+
+    def test_build_calculator(self):
+
+        calculator = TextDistanceCalculator.build_calculator(name='lev')
+        self.assertIsInstance(calculator, textdistance.Levenshtein)
+        self.assertIsNotNone(getattr(calculator, "pairwise", None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pysam
+
+from compute_engine.src.exceptions import Error
+from compute_engine.src.gc_profile import GCProfile, GCProfileService, format_gc_percent
+
+
+def count_gc(sequence):
+    return sum(1 for base in sequence if base in "GCgc")
+
+
+class TestGCProfile(unittest.TestCase):
+
+    def test_prefix_counts(self):
+
+        rng = np.random.RandomState(3)
+        for n_bases in [0, 1, 7, 8, 9, 64, 101]:
+            sequence = "".join(rng.choice(list("GCATgcatN"), size=n_bases))
+            profile = GCProfile.from_sequence(sequence=sequence)
+
+            self.assertEqual(len(profile), n_bases)
+            self.assertEqual(profile.prefix_counts(np.arange(n_bases + 1)).tolist(),
+                             [count_gc(sequence[:pos]) for pos in range(n_bases + 1)])
+
+    def test_gc_percent(self):
+
+        sequence = "GGCCAATT" * 20 + "GGGA" * 10
+        profile = GCProfile.from_sequence(sequence=sequence)
+
+        # int(58 / 100 * 100) is 57 as in gcpercent
+        self.assertEqual(profile.gc_percent(), (55, 52, 57))
+        self.assertEqual(profile.gc_percent(start=160, end=200), (75, None, None))
+        self.assertEqual(profile.gc_string(start=0, end=8), "50_NA_NA")
+
+        # the range ends at the end of the sequence
+        self.assertEqual(profile.gc_percent(start=160, end=300), (75, None, None))
+        self.assertRaises(Error, profile.gc_percent, 10, 10)
+
+    def test_format_gc_percent(self):
+        self.assertEqual(format_gc_percent(40), "40_NA_NA")
+        self.assertEqual(format_gc_percent(40, 20, 60), "40_20_60")
+
+
+class TestGCProfileService(unittest.TestCase):
+
+    def setUp(self):
+        self.path = Path(tempfile.mkdtemp())
+
+        rng = np.random.RandomState(0)
+        self.sequences = {"chr1": "".join(rng.choice(list("ACGTNacgt"), size=10007)),
+                          "chr2": "".join(rng.choice(list("ACGT"), size=512))}
+
+        with open(self.path / "ref.fa", 'w') as f:
+            for name, sequence in self.sequences.items():
+                f.write(">" + name + "\n" + sequence + "\n")
+        pysam.faidx(str(self.path / "ref.fa"))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_invalid_block_size(self):
+        self.assertRaises(Error, GCProfileService, self.path / "ref.fa", None, 100)
+
+    def test_gc_percent(self):
+
+        service = GCProfileService(fasta_file=self.path / "ref.fa", cache_path=self.path / "cache",
+                                   block_size=1024)
+
+        ranges = [("chr1", 0, 10007), ("chr1", 1000, 1050), ("chr1", 5, 9999), ("chr2", 100, 512)]
+        results = [service.gc_percent(chromosome=chromosome, start=start, end=end)
+                   for chromosome, start, end in ranges]
+
+        for (chromosome, start, end), (gc, min_gc, max_gc) in zip(ranges, results):
+            sequence = self.sequences[chromosome][start:end]
+            self.assertEqual(gc, int(count_gc(sequence) / len(sequence) * 100))
+
+            if len(sequence) > 100:
+                percents = [int(count_gc(sequence[i:i + 100]) / len(sequence[i:i + 100]) * 100)
+                            for i in range(0, len(sequence), 100)]
+                self.assertEqual((min_gc, max_gc), (min(percents), max(percents)))
+            else:
+                self.assertEqual((min_gc, max_gc), (None, None))
+
+        # a new service reads the profiles from the cache
+        self.assertTrue(os.path.isfile(service.cache_filename(chromosome="chr1")))
+
+        cached = GCProfileService(fasta_file=self.path / "ref.fa", cache_path=self.path / "cache")
+        self.assertEqual([cached.gc_percent(chromosome=chromosome, start=start, end=end)
+                          for chromosome, start, end in ranges], results)
+        self.assertIsInstance(cached.profile(chromosome="chr1").bits, np.memmap)
+
+
+if __name__ == '__main__':
+    unittest.main()
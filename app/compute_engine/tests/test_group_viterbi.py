@@ -0,0 +1,152 @@
+import unittest
+import multiprocessing
+import shutil
+import tempfile
+from pathlib import Path
+
+from compute_engine.src.actors import compute_group_viterbi_paths
+from compute_engine.src.enumeration_types import JobResultEnum
+from compute_engine.src.numpy_hmm import NumpyHMM
+from compute_engine.src.process_pools import HAS_BILLIARD, BilliardPoolExecutor
+from compute_engine.src.process_pools import process_pool_executor
+from compute_engine.src.region import Region
+from compute_engine.src.windows import Window, WindowType
+from compute_engine.tests.test_region import make_region, make_samdata
+from compute_engine.tests.test_numpy_hmm import HMM_FILE
+
+
+def make_tuf_del_tuf_region(r):
+    """
+    A region whose path has two TUF-DEL-TUF islands
+    """
+
+    # (WGA, NO_WGA) means of TUF, Deletion and Normal-I windows
+    means = [(0.0, 20.0)] * 4 + [(0.0, 0.0)] * (3 + r) + [(0.0, 20.0)] * 4 + \
+            [(10.0, 10.0)] * 4 + [(0.0, 20.0)] * 4 + [(0.0, 0.0)] * 3 + [(0.0, 20.0)] * 4
+
+    region = Region(idx=r, start=1000, end=1000 + 100 * len(means), window_size=100)
+    for w, wtype in enumerate([WindowType.WGA, WindowType.NO_WGA]):
+        region.set_windows(wtype=wtype,
+                           windows=[Window(idx=i, capacity=100,
+                                           samdata=make_samdata(start=1000 + 100 * i,
+                                                                qmean=mean[w]))
+                                    for i, mean in enumerate(means)])
+    region.get_mixed_windows()
+    return region
+
+
+def daemonic_group_viterbi(actor_inputs, queue):
+    """
+    Decode the regions from a daemonic process and put
+    the states of the outputs and the pool type in queue
+    """
+
+    executor = process_pool_executor(max_workers=1)
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+    hmm_model = NumpyHMM.from_json_file(hmm_file=HMM_FILE)
+    outputs = compute_group_viterbi_paths(actor_inputs=actor_inputs,
+                                          hmm_model=hmm_model, n_procs=3)
+    queue.put(([output["state"] for output in outputs], type(executor).__name__))
+
+
+class TestGroupViterbi(unittest.TestCase):
+
+    def setUp(self):
+        self.path = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def make_inputs(self, n_regions, tip, make=None):
+
+        if make is None:
+            make = lambda r: make_region(n_windows=20, qmeans=[float((3 * i + r) % 40) for i in range(20)])
+
+        actor_inputs = []
+        for r in range(n_regions):
+            region = make(r)
+            region.save(path=str(self.path) + "/", filename="region_{0}".format(r),
+                        tips=None, file_format='npz')
+
+            actor_inputs.append({"chromosome": "chr1",
+                                 "region_filename": self.path / "region_{0}.npz".format(r),
+                                 "hmm_model_filename": None,
+                                 "viterbi_path_filename": self.path / "viterbi_{0}_{1}.txt".format(tip, r),
+                                 "tuf_del_tuf_filename": self.path / "tdt_{0}_{1}.csv".format(tip, r),
+                                 "viterbi_block_size": 8})
+        return actor_inputs
+
+    def test_compute_group_viterbi_paths(self):
+
+        hmm_model = NumpyHMM.from_json_file(hmm_file=HMM_FILE)
+
+        serial_inputs = self.make_inputs(n_regions=5, tip="serial")
+        serial = compute_group_viterbi_paths(actor_inputs=serial_inputs,
+                                             hmm_model=hmm_model, n_procs=1)
+
+        pool_inputs = self.make_inputs(n_regions=5, tip="pool")
+        pool = compute_group_viterbi_paths(actor_inputs=pool_inputs,
+                                           hmm_model=hmm_model, n_procs=3)
+
+        self.assertEqual([output["state"] for output in serial], [JobResultEnum.SUCCESS] * 5)
+        self.assertEqual([output["state"] for output in pool], [JobResultEnum.SUCCESS] * 5)
+
+        for serial_input, pool_input in zip(serial_inputs, pool_inputs):
+            with open(serial_input["viterbi_path_filename"]) as f1, \
+                    open(pool_input["viterbi_path_filename"]) as f2:
+                lines = f1.readlines()
+                self.assertEqual(len(lines), 21)
+                self.assertEqual(lines, f2.readlines())
+
+    def test_streaming_segments(self):
+
+        # the segments from the state ids of the streaming
+        # decoder are those of the whole sequence path
+        hmm_model = NumpyHMM.from_json_file(hmm_file=HMM_FILE)
+
+        streaming_inputs = self.make_inputs(n_regions=3, tip="streaming", make=make_tuf_del_tuf_region)
+        whole_inputs = self.make_inputs(n_regions=3, tip="whole", make=make_tuf_del_tuf_region)
+        for actor_input in whole_inputs:
+            actor_input["viterbi_block_size"] = None
+
+        for actor_inputs in [streaming_inputs, whole_inputs]:
+            outputs = compute_group_viterbi_paths(actor_inputs=actor_inputs,
+                                                  hmm_model=hmm_model, n_procs=1)
+            self.assertEqual([output["state"] for output in outputs], [JobResultEnum.SUCCESS] * 3)
+
+        for streaming_input, whole_input in zip(streaming_inputs, whole_inputs):
+            with open(streaming_input["tuf_del_tuf_filename"]) as f1, \
+                    open(whole_input["tuf_del_tuf_filename"]) as f2:
+                segments = f1.read()
+                self.assertEqual(segments.count("Deletion"), 2)
+                self.assertEqual(segments, f2.read())
+
+    def test_daemonic_process(self):
+
+        hmm_model = NumpyHMM.from_json_file(hmm_file=HMM_FILE)
+        serial_inputs = self.make_inputs(n_regions=4, tip="serial")
+        compute_group_viterbi_paths(actor_inputs=serial_inputs, hmm_model=hmm_model, n_procs=1)
+
+        daemon_inputs = self.make_inputs(n_regions=4, tip="daemon")
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=daemonic_group_viterbi,
+                                          args=(daemon_inputs, queue), daemon=True)
+        process.start()
+        states, executor_type = queue.get(timeout=120)
+        process.join()
+
+        # billiard pools are used if installed and
+        # the regions are decoded serially otherwise
+        self.assertEqual(executor_type, BilliardPoolExecutor.__name__ if HAS_BILLIARD else "NoneType")
+        self.assertEqual(states, [JobResultEnum.SUCCESS] * 4)
+
+        for serial_input, daemon_input in zip(serial_inputs, daemon_inputs):
+            with open(serial_input["viterbi_path_filename"]) as f1, \
+                    open(daemon_input["viterbi_path_filename"]) as f2:
+                self.assertEqual(f1.readlines(), f2.readlines())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from compute_engine.src.hmm_loader import HMMCache, build_numpy_hmm
+from compute_engine.src.exceptions import Error
+from compute_engine.tests.test_numpy_hmm import HMM_FILE
+
+
+class TestHMMCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = Path(tempfile.mkdtemp())
+        self.files = []
+        for i in range(3):
+            filename = self.path / "hmm_{0}.json".format(i)
+            shutil.copy(str(HMM_FILE), str(filename))
+            os.utime(str(filename), ns=(10 ** 9, 10 ** 9))
+            self.files.append(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_hits_and_misses(self):
+
+        cache = HMMCache(max_size=2)
+        hmm = cache.get(hmm_file=self.files[0], engine='numpy', builder=build_numpy_hmm)
+        self.assertIs(cache.get(hmm_file=self.files[0], engine='numpy',
+                                builder=build_numpy_hmm), hmm)
+
+        # same content and modification time
+        # in another file is the same model
+        self.assertIs(cache.get(hmm_file=self.files[1], engine='numpy',
+                                builder=build_numpy_hmm), hmm)
+
+        self.assertEqual(cache.statistics(), {"hits": 2, "misses": 1, "evictions": 0,
+                                              "size": 1, "max_size": 2})
+
+    def test_lru_eviction(self):
+
+        cache = HMMCache(max_size=2)
+        for i, filename in enumerate(self.files):
+            os.utime(str(filename), ns=((i + 1) * 10 ** 9, (i + 1) * 10 ** 9))
+
+        first = cache.get(hmm_file=self.files[0], engine='numpy', builder=build_numpy_hmm)
+        cache.get(hmm_file=self.files[1], engine='numpy', builder=build_numpy_hmm)
+
+        # touch the first so that the second is evicted
+        cache.get(hmm_file=self.files[0], engine='numpy', builder=build_numpy_hmm)
+        cache.get(hmm_file=self.files[2], engine='numpy', builder=build_numpy_hmm)
+
+        self.assertIs(cache.get(hmm_file=self.files[0], engine='numpy',
+                                builder=build_numpy_hmm), first)
+        cache.get(hmm_file=self.files[1], engine='numpy', builder=build_numpy_hmm)
+
+        statistics = cache.statistics()
+        self.assertEqual(statistics["hits"], 2)
+        self.assertEqual(statistics["misses"], 4)
+        self.assertEqual(statistics["evictions"], 2)
+        self.assertEqual(statistics["size"], 2)
+
+    def test_modified_file(self):
+
+        cache = HMMCache(max_size=2)
+        hmm = cache.get(hmm_file=self.files[0], engine='numpy', builder=build_numpy_hmm)
+
+        stat = os.stat(str(self.files[0]))
+        os.utime(str(self.files[0]), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertIsNot(cache.get(hmm_file=self.files[0], engine='numpy',
+                                   builder=build_numpy_hmm), hmm)
+        self.assertEqual(cache.statistics()["misses"], 2)
+
+    def test_invalid_size(self):
+        self.assertRaises(Error, HMMCache, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
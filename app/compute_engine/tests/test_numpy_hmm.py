@@ -0,0 +1,191 @@
+import unittest
+import itertools
+from pathlib import Path
+
+import numpy as np
+from scipy import stats
+
+try:
+    import pomegranate
+except ImportError:
+    pomegranate = None
+
+from compute_engine.src.numpy_hmm import NumpyHMM, compile_distribution
+from compute_engine.src.streaming_viterbi import build_streaming_decoder
+from compute_engine.src.exceptions import Error
+from compute_engine.tests.test_streaming_viterbi import full_viterbi
+
+HMM_FILE = Path(__file__).parent.parent.parent / "default_hmm" / "HMM_Model_9.json"
+
+
+def normal(mu, sigma):
+    return {'class': 'Distribution', 'name': 'NormalDistribution',
+            'parameters': [mu, sigma], 'frozen': False}
+
+
+def make_json_model():
+    """
+    A small model with a GMM and an
+    IndependentComponents state
+    """
+
+    gmm = {'class': 'GeneralMixtureModel',
+           'distributions': [normal(0.0, 1.0), normal(4.0, 2.0)],
+           'weights': [0.3, 0.7]}
+
+    icd = {'class': 'Distribution', 'name': 'IndependentComponentsDistribution',
+           'parameters': [[normal(10.0, 1.0), gmm], [1.0, 1.0]], 'frozen': False}
+
+    uniform = {'class': 'Distribution', 'name': 'IndependentComponentsDistribution',
+               'parameters': [[{'class': 'Distribution', 'name': 'UniformDistribution',
+                                'parameters': [-999.5, -998.5], 'frozen': False}] * 2,
+                              [1.0, 1.0]], 'frozen': False}
+
+    mvn = {'class': 'Distribution', 'name': 'MultivariateGaussianDistribution',
+           'parameters': [[2.0, 3.0], [[2.0, 0.3], [0.3, 1.0]]], 'frozen': False}
+
+    states = [{'name': 'A', 'weight': 1.0, 'distribution': icd},
+              {'name': 'B', 'weight': 1.0, 'distribution': mvn},
+              {'name': 'GAP', 'weight': 1.0, 'distribution': uniform},
+              {'name': 'start', 'weight': 1.0, 'distribution': None},
+              {'name': 'end', 'weight': 1.0, 'distribution': None}]
+
+    edges = [[3, 0, 1.0, 1.0, None], [3, 1, 1.0, 1.0, None], [3, 2, 1.0, 1.0, None],
+             [0, 0, 0.8, 0.8, None], [0, 1, 0.1, 0.1, None], [0, 2, 0.1, 0.1, None],
+             [1, 0, 0.2, 0.2, None], [1, 1, 0.7, 0.7, None], [1, 2, 0.1, 0.1, None],
+             [2, 0, 0.1, 0.1, None], [2, 1, 0.1, 0.1, None], [2, 2, 0.8, 0.8, None]]
+
+    return {'class': 'HiddenMarkovModel', 'name': 'test', 'states': states,
+            'start_index': 3, 'end_index': 4, 'silent_index': 3, 'edges': edges}
+
+
+class TestNumpyHMM(unittest.TestCase):
+
+    def test_distributions(self):
+
+        x = np.linspace(-3.0, 8.0, 23)
+        np.testing.assert_allclose(compile_distribution(normal(1.0, 2.0)).log_probability(x),
+                                   stats.norm.logpdf(x, loc=1.0, scale=2.0))
+
+        uniform = compile_distribution({'name': 'UniformDistribution', 'parameters': [0.0, 4.0]})
+        np.testing.assert_allclose(uniform.log_probability(x),
+                                   stats.uniform.logpdf(x, loc=0.0, scale=4.0))
+
+        cov = [[2.0, 0.3], [0.3, 1.0]]
+        X = np.column_stack((x, x[::-1]))
+        mvn = compile_distribution({'name': 'MultivariateGaussianDistribution',
+                                    'parameters': [[1.0, 2.0], cov]})
+        np.testing.assert_allclose(mvn.log_probability(X),
+                                   stats.multivariate_normal.logpdf(X, mean=[1.0, 2.0], cov=cov))
+
+        gmm = compile_distribution({'class': 'GeneralMixtureModel',
+                                    'distributions': [normal(0.0, 1.0), normal(4.0, 2.0)],
+                                    'weights': [3.0, 7.0]})
+        expected = np.log(0.3 * stats.norm.pdf(x, 0.0, 1.0) + 0.7 * stats.norm.pdf(x, 4.0, 2.0))
+        np.testing.assert_allclose(gmm.log_probability(x), expected)
+
+        self.assertRaises(Error, compile_distribution, {'name': 'PoissonDistribution',
+                                                        'parameters': [1.0]})
+
+    def test_default_model(self):
+
+        hmm = NumpyHMM.from_json_file(hmm_file=HMM_FILE)
+        self.assertEqual(hmm.state_names, ['Deletion', 'Duplication', 'GAP_STATE', 'Normal-I',
+                                           'Normal-II', 'TUF', 'TUFDUP'])
+
+        rng = np.random.RandomState(2)
+        X = rng.uniform(0.0, 60.0, size=(2000, 2))
+        X[100:120] = -999.0
+
+        params = hmm.log_parameters()
+        log_probability, expected = full_viterbi(params["log_start"], params["log_trans"],
+                                                 hmm.log_emissions(X))
+
+        computed_probability, path = hmm.viterbi(X)
+        self.assertEqual([idx for idx, _ in path[1:]], expected)
+        self.assertAlmostEqual(computed_probability, log_probability, places=6)
+        self.assertEqual(path[0][1].name, "HMM_Model-start")
+        self.assertEqual(set([state.name for _, state in path[101:121]]), {"GAP_STATE"})
+
+        _, decoder = build_streaming_decoder(hmm_model=hmm, block_size=128)
+        self.assertEqual(list(decoder.decode(X)), expected)
+
+    @unittest.skipUnless(pomegranate is not None, "pomegranate is not installed")
+    def test_same_as_pomegranate(self):
+
+        from compute_engine.src.hmm_loader import build_hmm
+
+        expected_hmm = build_hmm(hmm_file=HMM_FILE)
+        hmm = NumpyHMM.from_json_file(hmm_file=HMM_FILE)
+
+        # windows of every state and two runs of gap windows
+        rng = np.random.RandomState(7)
+        X = rng.uniform(0.0, 60.0, size=(500, 2))
+        X[50:80, 0] = rng.uniform(0.0, 2.0, size=30)
+        X[200:230, 1] = rng.uniform(0.0, 2.0, size=30)
+        X[100:110] = -999.0
+        X[400:403] = -999.0
+
+        expected_probability, expected_path = expected_hmm.viterbi(X)
+        computed_probability, computed_path = hmm.viterbi(X)
+
+        self.assertAlmostEqual(computed_probability, expected_probability, places=6)
+        self.assertEqual(len(computed_path), len(expected_path))
+        self.assertEqual([state.name for _, state in computed_path[1:len(X) + 1]],
+                         [state.name for _, state in expected_path[1:len(X) + 1]])
+        self.assertEqual(set([state.name for _, state in computed_path[101:111]]), {"GAP_STATE"})
+
+        # the streaming decoder of either model gives the same path
+        for model in [expected_hmm, hmm]:
+            params, decoder = build_streaming_decoder(hmm_model=model, block_size=64)
+            self.assertEqual([params["states"][idx].name for idx in decoder.decode(X)],
+                             [state.name for _, state in expected_path[1:len(X) + 1]])
+            self.assertAlmostEqual(decoder.log_probability, expected_probability, places=6)
+
+    def test_json_model(self):
+
+        hmm = NumpyHMM.from_json(hmm_json_map=make_json_model())
+
+        rng = np.random.RandomState(0)
+        X = np.column_stack((rng.uniform(0.0, 12.0, 500), rng.uniform(-2.0, 8.0, 500)))
+        X[40:45] = -999.0
+
+        params = hmm.log_parameters()
+        expected = full_viterbi(params["log_start"], params["log_trans"], hmm.log_emissions(X))
+        log_probability, path = hmm.viterbi_indices(X)
+
+        self.assertEqual(path.tolist(), expected[1])
+        self.assertEqual(path[40:45].tolist(), [2] * 5)
+
+    def test_forward_backward(self):
+
+        hmm = NumpyHMM.from_json(hmm_json_map=make_json_model())
+        X = np.array([[10.0, 0.5], [2.0, 3.0], [-999.0, -999.0], [9.5, 4.0]])
+
+        params = hmm.log_parameters()
+        log_emissions = hmm.log_emissions(X)
+
+        # sum over all the paths
+        log_probabilities = []
+        for path in itertools.product(range(3), repeat=len(X)):
+            logp = params["log_start"][path[0]] + log_emissions[0, path[0]]
+            for t in range(1, len(X)):
+                logp += params["log_trans"][path[t - 1], path[t]] + log_emissions[t, path[t]]
+            log_probabilities.append(logp)
+
+        expected = np.logaddexp.reduce([p for p in log_probabilities if np.isfinite(p)])
+
+        log_probability, log_posteriors = hmm.forward_backward(X)
+        self.assertAlmostEqual(log_probability, expected, places=8)
+        np.testing.assert_allclose(np.exp(log_posteriors).sum(axis=1), np.ones(len(X)))
+        self.assertAlmostEqual(hmm.predict_proba(X)[2, 2], 1.0)
+
+    def test_invalid_model(self):
+
+        model = make_json_model()
+        model["states"][1]["distribution"] = None
+        self.assertRaises(Error, NumpyHMM.from_json, model)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import csv
+import random
+import shutil
+import tempfile
+from pathlib import Path
+
+from compute_engine.src.exceptions import Error
+from compute_engine.src.string_sequence_calculator import TextDistanceCalculator
+from compute_engine.src.pairwise_distances import triangular_tiles, tile_pairs, tile_filename
+from compute_engine.src.pairwise_distances import compute_pairwise_distances, sequence_pair_distances
+from compute_engine.src.pairwise_distances import read_sequences, PAIR_COLUMNS
+
+
+def tiles_pairs(tiles, include_self_pairs):
+    pairs = []
+    for tile in tiles:
+        rows, cols = tile_pairs(tile=tile, include_self_pairs=include_self_pairs)
+        pairs.extend(zip(rows.tolist(), cols.tolist()))
+    return pairs
+
+
+class TestPairwiseDistances(unittest.TestCase):
+
+    def setUp(self):
+        self.path = Path(tempfile.mkdtemp())
+        self.input_file = str(self.path / "nucl_out.bed")
+
+        rng = random.Random(42)
+        with open(self.input_file, 'w') as f:
+            for i in range(13):
+                seq = "NO_REPEATS" if i == 4 else "".join(rng.choice("ACGT")
+                                                          for _ in range(rng.randint(5, 120)))
+                f.write("chr1\t{0}\t{1}\t{2}\tTUF\n".format(i * 1000, i * 1000 + 500, seq))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_triangular_tiles(self):
+
+        for n_items, tile_size in [(10, 3), (7, 7), (5, 10), (0, 2)]:
+            tiles = triangular_tiles(n_items=n_items, tile_size=tile_size)
+
+            pairs = tiles_pairs(tiles=tiles, include_self_pairs=False)
+            expected = [(i, j) for i in range(n_items) for j in range(i + 1, n_items)]
+            self.assertEqual(sorted(pairs), expected)
+
+            pairs = tiles_pairs(tiles=tiles, include_self_pairs=True)
+            expected = [(i, j) for i in range(n_items) for j in range(i, n_items)]
+            self.assertEqual(sorted(pairs), expected)
+
+        # only the rows in [start, end)
+        tiles = triangular_tiles(n_items=10, tile_size=3, start=2, end=6)
+        pairs = tiles_pairs(tiles=tiles, include_self_pairs=False)
+        self.assertEqual(sorted(pairs), [(i, j) for i in range(2, 6) for j in range(i + 1, 10)])
+
+        self.assertRaises(Error, triangular_tiles, 10, 0)
+        self.assertRaises(Error, triangular_tiles, 10, 3, 5, 11)
+
+    def test_compute_pairwise_distances(self):
+
+        outdir = str(self.path / "out")
+        result = compute_pairwise_distances(input_file=self.input_file, outdir=outdir,
+                                            distance_type='lev', n_workers=2, tile_size=5)
+        self.assertEqual(result, {"computed": 6, "skipped": 0, "failed": 0})
+
+        rows = []
+        for tile in triangular_tiles(n_items=12, tile_size=5):
+            with open(tile_filename(outdir=outdir, tile=tile), 'r', newline="\n") as fh:
+                reader = csv.reader(fh, delimiter=",")
+                self.assertEqual(next(reader), PAIR_COLUMNS)
+                rows.extend(reader)
+
+        sequences = read_sequences(input_file=self.input_file)
+        calculator = TextDistanceCalculator.build_calculator(name='lev')
+
+        expected = []
+        for i in range(len(sequences)):
+            for j in range(i + 1, len(sequences)):
+                if len(sequences[i][3]) + len(sequences[j][3]) < 200:
+                    distances = sequence_pair_distances(calculator=calculator,
+                                                        seq1=sequences[i][3], seq2=sequences[j][3])
+                    expected.append(sequences[i] + sequences[j] + [str(d) for d in distances])
+
+        self.assertEqual(sorted(rows), sorted(expected))
+
+        # only the missing tile is computed again
+        tile_filename(outdir=outdir, tile=(5, 10, 5, 10)).unlink()
+        result = compute_pairwise_distances(input_file=self.input_file, outdir=outdir,
+                                            distance_type='lev', n_workers=2, tile_size=5)
+        self.assertEqual(result, {"computed": 1, "skipped": 5, "failed": 0})
+
+        # the tiles of another tiling are not resumed
+        self.assertRaises(Error, compute_pairwise_distances, self.input_file,
+                          outdir, 'lev', 2, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
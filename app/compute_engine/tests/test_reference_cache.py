@@ -0,0 +1,113 @@
+import unittest
+import random
+import shutil
+import tempfile
+from pathlib import Path
+
+import pysam
+
+from compute_engine.src.exceptions import Error
+from compute_engine.src.reference_cache import ReferenceCache, get_reference_cache
+
+
+class TestReferenceCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        cls.path = Path(tempfile.mkdtemp())
+        cls.fasta_file = str(cls.path / "ref.fa")
+
+        rng = random.Random(42)
+        with open(cls.fasta_file, 'w') as f:
+            for name, length in [("chr1", 1234), ("chr2", 517)]:
+                seq = "".join(rng.choice("ACGTacgtN") for _ in range(length))
+                f.write(">" + name + "\n")
+                for i in range(0, length, 60):
+                    f.write(seq[i:i + 60] + "\n")
+        pysam.faidx(cls.fasta_file)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.path)
+
+    def test_invalid_size(self):
+        self.assertRaises(Error, ReferenceCache, self.fasta_file, 0, 10)
+        self.assertRaises(Error, ReferenceCache, self.fasta_file, 10, 0)
+
+    def test_fetch(self):
+
+        cache = ReferenceCache(fasta_file=self.fasta_file, block_size=100, max_blocks=8)
+        rng = random.Random(7)
+
+        with pysam.FastaFile(self.fasta_file) as fas:
+            self.assertEqual(cache.fetch("chr1"), fas.fetch("chr1"))
+            self.assertEqual(cache.fetch("chr2", 500, 600), fas.fetch("chr2", 500, 600))
+            self.assertEqual(cache.fetch("chr2", 600, 700), "")
+
+            for _ in range(200):
+                chromosome = rng.choice(["chr1", "chr2"])
+                start = rng.randint(0, 1300)
+                end = start + rng.randint(0, 250)
+                self.assertEqual(cache.fetch(chromosome, start, end), fas.fetch(chromosome, start, end))
+
+        self.assertRaises(Error, cache.fetch, "chr1", -1, 10)
+        self.assertRaises(Error, cache.fetch, "chr1", 10, 5)
+        self.assertRaises(Error, cache.fetch, "chrX", 0, 10)
+        self.assertEqual(cache.get_reference_length("chr2"), 517)
+
+    def test_statistics(self):
+
+        cache = ReferenceCache(fasta_file=self.fasta_file, block_size=100, max_blocks=4)
+
+        # single bases of a block read it once
+        bases = "".join([cache.fetch("chr1", pos, pos + 1) for pos in range(100)])
+        self.assertEqual(bases, cache.fetch("chr1", 0, 100))
+
+        statistics = cache.statistics()
+        self.assertEqual(statistics["misses"], 1)
+        self.assertEqual(statistics["hits"], 100)
+        self.assertEqual(statistics["bytes_read"], 100)
+
+        # a range of more than half the blocks is read directly
+        cache.fetch("chr1", 0, 1000)
+        self.assertEqual(cache.statistics()["bypasses"], 1)
+        self.assertEqual(cache.statistics()["size"], 1)
+
+        # the least recently used blocks are evicted
+        for idx in [1, 2, 3, 0, 4]:
+            cache.fetch("chr1", idx * 100, idx * 100 + 10)
+
+        statistics = cache.statistics()
+        self.assertEqual(statistics["evictions"], 1)
+        self.assertEqual(statistics["size"], 4)
+        self.assertEqual(statistics["misses"], 5)
+
+        cache.fetch("chr1", 0, 10)
+        self.assertEqual(cache.statistics()["misses"], 5)
+
+        cache.fetch("chr1", 100, 110)
+        self.assertEqual(cache.statistics()["misses"], 6)
+
+    def test_fetch_intervals(self):
+
+        cache = ReferenceCache(fasta_file=self.fasta_file, block_size=100, max_blocks=2)
+        intervals = [("chr2", 10, 20), ("chr1", 250, 260), ("chr1", 5, 15),
+                     ("chr1", 240, 255), ("chr2", 15, 25), ("chr1", 0, 3)]
+
+        with pysam.FastaFile(self.fasta_file) as fas:
+            self.assertEqual(cache.fetch_intervals(intervals=intervals),
+                             [fas.fetch(*interval) for interval in intervals])
+
+        # the sorted intervals read every block once
+        self.assertEqual(cache.statistics()["misses"], 3)
+
+    def test_get_reference_cache(self):
+
+        cache = get_reference_cache(fasta_file=self.fasta_file)
+        self.assertIs(cache, get_reference_cache(fasta_file=self.fasta_file))
+        self.assertIsNot(cache, get_reference_cache(fasta_file=self.fasta_file, block_size=100))
+
+
+if __name__ == '__main__':
+    unittest.main()
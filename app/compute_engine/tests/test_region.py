@@ -0,0 +1,204 @@
+import unittest
+import shutil
+import tempfile
+import numpy as np
+
+from compute_engine.src.region import Region
+from compute_engine.src.windows import Window, WindowType, WindowState, MixedWindowsArray
+from compute_engine.src.exceptions import Error
+
+
+def make_samdata(start, gap=False, qmean=4.25):
+    return {'gcmax': 0.5, 'gcmin': None if gap else 0.25, 'gcr': 0.45,
+            'gapAlert': gap, 'allmean': 6.5, 'qmean': qmean, 'allmedian': 7.0,
+            'allsum': 650, 'qsum': 425, 'qmedian': 4.0, 'errorAlert': False,
+            'head': 8, 'start': start, 'end': start + 99, 'minLen': 100}
+
+
+def make_region(n_windows=10, qmeans=None):
+    region = Region(idx=2, start=1000, end=1000 + 100 * n_windows, window_size=100)
+
+    if qmeans is None:
+        qmeans = [4.25] * n_windows
+
+    for wtype in [WindowType.WGA, WindowType.NO_WGA]:
+        windows = [Window(idx=i, capacity=100,
+                          samdata=make_samdata(start=1000 + 100 * i, gap=i == 3,
+                                               qmean=qmeans[i]))
+                   for i in range(n_windows)]
+        region.set_windows(wtype=wtype, windows=windows)
+
+    region.get_mixed_windows()
+    return region
+
+
+class TestRegion(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp() + "/"
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_save_load_npz(self):
+
+        region = make_region()
+        region.save(path=self.path, filename="region", tips=None, file_format='npz')
+
+        self.assertTrue(Region.is_npz_file(filename=self.path + "region.npz"))
+        loaded = Region.load(filename=self.path + "region.npz")
+        loaded.get_mixed_windows()
+
+        self.assertEqual((loaded.ridx, loaded.start, loaded.end, loaded.w_size),
+                         (2, 1000, 2000, 100))
+        self.assertEqual(len(loaded), len(region))
+
+        for expected, computed in zip(region, loaded):
+            for wtype in [WindowType.WGA, WindowType.NO_WGA]:
+                self.assertEqual(expected.get_window(wtype=wtype).idx,
+                                 computed.get_window(wtype=wtype).idx)
+                self.assertEqual(expected.get_window(wtype=wtype).samdata,
+                                 computed.get_window(wtype=wtype).samdata)
+
+    def test_load_legacy_txt(self):
+
+        region = make_region()
+        region.save(path=self.path, filename="region", tips=None)
+
+        self.assertFalse(Region.is_npz_file(filename=self.path + "region.txt"))
+        loaded = Region.load(filename=self.path + "region.txt")
+        loaded.get_mixed_windows()
+        self.assertEqual(len(loaded), len(region))
+        self.assertEqual(loaded[3].get_window(wtype=WindowType.WGA).sam_property("qmean"), 4.25)
+        self.assertTrue(loaded[3].is_gap_window())
+
+    def test_load_lazy(self):
+
+        region = make_region()
+        region.save(path=self.path, filename="region", tips=None, file_format='npz')
+
+        loaded = Region.load(filename=self.path + "region.npz", lazy=True)
+        self.assertTrue(loaded.is_array_backed())
+        self.assertEqual(loaded.get_n_windows(type_=WindowType.WGA), 10)
+
+        loaded.check_windows_sanity()
+        self.assertIsInstance(loaded.get_mixed_windows(), MixedWindowsArray)
+        self.assertEqual(len(loaded), len(region))
+
+        for expected, computed in zip(region, loaded):
+            self.assertEqual(expected.start_end_pos, computed.start_end_pos)
+            self.assertEqual(expected.is_gap_window(), computed.is_gap_window())
+            self.assertEqual(expected.get_rd_statistic(statistics="mean"),
+                             computed.get_rd_statistic(statistics="mean"))
+            for wtype in [WindowType.WGA, WindowType.NO_WGA]:
+                self.assertEqual(expected.get_window(wtype=wtype).samdata,
+                                 computed.get_window(wtype=wtype).samdata)
+
+        self.assertEqual(loaded.count_gap_windows(), 1)
+        self.assertEqual(loaded.mark_windows_with_gaps(n_mark=-999), 1)
+        self.assertEqual(loaded[3].get_window(wtype=WindowType.WGA).state, WindowType.N_WIN)
+        self.assertRaises(Error, loaded.__setitem__, 0, None)
+
+    def test_lazy_mixed_window_states(self):
+
+        region = make_region()
+        region.save(path=self.path, filename="region", tips=None, file_format='npz')
+        loaded = Region.load(filename=self.path + "region.npz", lazy=True)
+
+        windows = loaded.get_mixed_windows()
+        self.assertEqual(windows[2].state, WindowState.INVALID)
+
+        # the views are created on access but the state is kept
+        windows[2].state = WindowState.DELETE
+        self.assertEqual(windows[2].state, WindowState.DELETE)
+        self.assertEqual([window.state for window in windows][2], WindowState.DELETE)
+        self.assertEqual(windows.states[2], WindowState.DELETE)
+
+        # and shared with the selections of the windows
+        selected = windows.select(mask=np.arange(len(windows)) >= 2)
+        self.assertEqual(selected[0].state, WindowState.DELETE)
+        selected[1].state = WindowState.TUF
+        self.assertEqual(windows[3].state, WindowState.TUF)
+
+    def test_lazy_filters(self):
+
+        qmeans = [4.0, 5.0, 4.5, 0.0, 30.0, 4.25, 5.5, 3.5, 40.0, 4.75]
+        configuration = {"outlier_remove": {"name": "means_cutoff",
+                                            "config": {"mu_limits": {"wga_mu": 20.0,
+                                                                     "no_wga_mu": 20.0}}}}
+
+        region = make_region(qmeans=qmeans)
+        region.save(path=self.path, filename="region", tips=None, file_format='npz')
+
+        region.remove_outliers(configuration=configuration)
+        region.remove_windows_with_gaps()
+
+        loaded = Region.load(filename=self.path + "region.npz", lazy=True)
+        loaded.get_mixed_windows()
+        loaded.remove_outliers(configuration=configuration)
+        loaded.remove_windows_with_gaps()
+
+        self.assertEqual(len(loaded), 7)
+        self.assertEqual([w.start_end_pos for w in loaded],
+                         [w.start_end_pos for w in region])
+
+        # the filtered region is saved without the removed rows
+        loaded.save(path=self.path, filename="filtered", tips=None, file_format='npz')
+        reloaded = Region.load(filename=self.path + "filtered.npz")
+        reloaded.get_mixed_windows()
+        self.assertEqual([w.start_end_pos for w in reloaded],
+                         [w.start_end_pos for w in region])
+
+    def test_lazy_zscore(self):
+
+        rng = np.random.RandomState(3)
+        qmeans = rng.normal(loc=10.0, scale=2.0, size=50).tolist()
+        qmeans[7] = 40.0
+        configuration = {"outlier_remove": {"name": "zscore",
+                                            "config": {"sigma_factor": 2.0,
+                                                       "use_both_ends": True}}}
+
+        region = make_region(n_windows=50, qmeans=qmeans)
+        region.save(path=self.path, filename="region", tips=None, file_format='npz')
+        region.remove_outliers(configuration=configuration)
+
+        loaded = Region.load(filename=self.path + "region.npz", lazy=True)
+        loaded.get_mixed_windows()
+        loaded.remove_outliers(configuration=configuration)
+
+        self.assertLess(len(loaded), 50)
+        self.assertEqual([w.start_end_pos for w in loaded],
+                         [w.start_end_pos for w in region])
+
+    def test_get_rd_mean_observations(self):
+
+        region = make_region(qmeans=[float(i) for i in range(10)])
+        region.save(path=self.path, filename="region", tips=None, file_format='npz')
+        loaded = Region.load(filename=self.path + "region.npz", lazy=True)
+        loaded.get_mixed_windows()
+
+        expected = region.get_region_as_rd_mean_sequences_with_windows(size=None,
+                                                                       window_type='BOTH',
+                                                                       n_seqs=1,
+                                                                       exclude_gaps=False)
+        for r in [region, loaded]:
+            observations, coordinates = r.get_rd_mean_observations()
+
+            self.assertEqual(observations.shape, (10, 2))
+            self.assertEqual(observations.dtype, np.float64)
+            self.assertEqual(coordinates.dtype, np.int64)
+            self.assertEqual(observations.tolist(), [list(obs) for obs, _ in expected])
+            self.assertEqual(coordinates.tolist(), [list(pos) for _, pos in expected])
+            self.assertEqual(observations[3].tolist(), [Window.N_WINDOW_MARKER] * 2)
+
+            observations, coordinates = r.get_rd_mean_observations(exclude_gaps=True)
+            self.assertEqual(len(observations), 9)
+            self.assertNotIn(1300, coordinates[:, 0].tolist())
+
+    def test_save_invalid_format(self):
+        region = make_region()
+        self.assertRaises(Error, region.save, self.path, "region", None, 'hdf5')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from compute_engine.src.sequence_transforms import SequenceTransforms, TRANSFORMS
+from compute_engine.src.sequence_transforms import sequence_transforms
+
+
+class TestSequenceTransforms(unittest.TestCase):
+
+    def setUp(self):
+        self.path = Path(tempfile.mkdtemp())
+        self.sequences = ["ACGTTGCA", "", "GGGAAN", "acgtRMW"]
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_sequence_transforms(self):
+
+        strings = sequence_transforms(seq="AACGTG")
+
+        self.assertEqual(len(strings), 2 * len(TRANSFORMS))
+        self.assertEqual(strings[0], "AACGTG")
+        self.assertEqual(strings[1], "CACGTT")
+        self.assertEqual(strings[2], "RRYRYR")
+
+        # the complement maps R to Y but keeps Y
+        self.assertEqual(strings[3], "YYYYYY")
+        self.assertEqual(strings[4], "MMMKKK")
+        self.assertEqual(strings[6], "WWSSWS")
+
+    def test_encoded(self):
+
+        transforms = SequenceTransforms.from_sequences(sequences=self.sequences)
+
+        self.assertEqual(len(transforms), 4)
+        np.testing.assert_array_equal(transforms.lengths, [8, 0, 6, 7])
+
+        for idx, seq in enumerate(self.sequences):
+            expected = sequence_transforms(seq=seq)
+            self.assertEqual(transforms.strings(idx=idx), tuple(expected))
+
+            for slot, name in enumerate(TRANSFORMS):
+                self.assertEqual(transforms.encoded(idx=idx, transform=name).tobytes().decode(),
+                                 expected[2 * slot])
+                self.assertEqual(transforms.encoded(idx=idx, transform=name, reverse=True).tobytes().decode(),
+                                 expected[2 * slot + 1])
+
+    def test_save_load(self):
+
+        filename = str(self.path / "transforms.npz")
+        SequenceTransforms.from_sequences(sequences=self.sequences).save(filename=filename)
+
+        transforms = SequenceTransforms.load(filename=filename)
+        self.assertIsInstance(transforms.codes, np.memmap)
+
+        for idx, seq in enumerate(self.sequences):
+            self.assertEqual(transforms.strings(idx=idx), tuple(sequence_transforms(seq=seq)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import unittest
+from unittest import mock
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from compute_engine.src.exceptions import Error
+from compute_engine.src.spade_cache import SpadeCache
+
+
+def make_repeats(seq):
+    unit_seq = [">motif_0\n", seq + "\n"]
+    return [{"name": "nucl_0_10", "weblogo": ["## LogoData\n", "1\t3\t1\t1\t1\t1.0\t0.0\t2.0\t1.0\n"],
+             "unit_seq": unit_seq, "align_unit_seq": unit_seq}]
+
+
+class TestSpadeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = Path(tempfile.mkdtemp())
+        self.spade_file = self.path / "SPADE.py"
+        with open(self.spade_file, 'w') as f:
+            f.write("# SPADE\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_invalid_size(self):
+        self.assertRaises(Error, SpadeCache, self.path / "cache", 0)
+        self.assertRaises(Error, SpadeCache, self.path / "cache", 10, 0.0)
+
+    def test_make_key(self):
+
+        cache = SpadeCache(path=self.path / "cache", max_bytes=10 ** 6)
+        key = cache.make_key(seq="ACGT", spade_file=self.spade_file)
+
+        self.assertEqual(key, cache.make_key(seq="ACGT", spade_file=self.spade_file, parameters={}))
+        self.assertNotEqual(key, cache.make_key(seq="ACGA", spade_file=self.spade_file))
+        self.assertNotEqual(key, cache.make_key(seq="ACGT", spade_file=self.spade_file,
+                                                parameters={"Nk": 12}))
+
+        # a new SPADE version gives new keys
+        with open(self.spade_file, 'w') as f:
+            f.write("# SPADE version 2\n")
+        self.assertNotEqual(key, cache.make_key(seq="ACGT", spade_file=self.spade_file))
+
+    def test_get_put(self):
+
+        cache = SpadeCache(path=self.path / "cache", max_bytes=10 ** 6)
+        key = cache.make_key(seq="ACGT", spade_file=self.spade_file)
+
+        self.assertIsNone(cache.get(key=key))
+        cache.put(key=key, repeats=make_repeats("ACGT"))
+        self.assertEqual(cache.get(key=key), make_repeats("ACGT"))
+
+        # no repeats found is a result too
+        empty_key = cache.make_key(seq="AAAA", spade_file=self.spade_file)
+        cache.put(key=empty_key, repeats=[])
+        self.assertEqual(cache.get(key=empty_key), [])
+
+        statistics = cache.statistics()
+        self.assertEqual(statistics["hits"], 2)
+        self.assertEqual(statistics["misses"], 1)
+        self.assertEqual(statistics["hit_rate"], 2 / 3)
+        self.assertEqual(statistics["size"], 2)
+
+        # the entries persist
+        other = SpadeCache(path=self.path / "cache", max_bytes=10 ** 6)
+        self.assertEqual(other.get(key=key), make_repeats("ACGT"))
+        self.assertEqual(other.statistics()["size"], 2)
+
+        other.clear()
+        self.assertEqual(other.statistics()["size"], 0)
+        self.assertIsNone(cache.get(key=key))
+
+    def test_get_entry_of_other_process(self):
+
+        cache = SpadeCache(path=self.path / "cache", max_bytes=10 ** 6)
+        self.assertEqual(cache.statistics()["size"], 0)
+
+        # the entry is added after the directory is indexed
+        other = SpadeCache(path=self.path / "cache", max_bytes=10 ** 6)
+        key = other.make_key(seq="ACGT", spade_file=self.spade_file)
+        other.put(key=key, repeats=make_repeats("ACGT"))
+
+        self.assertEqual(cache.get(key=key), make_repeats("ACGT"))
+        self.assertEqual(cache.get(key=key), make_repeats("ACGT"))
+
+        statistics = cache.statistics()
+        self.assertEqual(statistics["size"], 1)
+        self.assertEqual(statistics["bytes"], other.statistics()["bytes"])
+
+    def test_eviction(self):
+
+        cache = SpadeCache(path=self.path / "cache", max_bytes=10 ** 6)
+        key = cache.make_key(seq="A" * 10, spade_file=self.spade_file)
+        cache.put(key=key, repeats=make_repeats("A" * 10))
+        entry_size = cache.statistics()["bytes"]
+
+        keys = [key]
+        for i in range(1, 3):
+            keys.append(cache.make_key(seq="ACGT"[i] * 10, spade_file=self.spade_file))
+            cache.put(key=keys[-1], repeats=make_repeats("ACGT"[i] * 10))
+
+        # order the entries by their use
+        for i, key in enumerate(keys):
+            os.utime(cache._filename(key=key), ns=((i + 1) * 10 ** 9, (i + 1) * 10 ** 9))
+
+        # use the first entry so the second is evicted. The
+        # low water mark leaves room for three entries
+        cache = SpadeCache(path=self.path / "cache", max_bytes=3 * entry_size + entry_size // 2)
+        self.assertIsNotNone(cache.get(key=keys[0]))
+
+        keys.append(cache.make_key(seq="T" * 10, spade_file=self.spade_file))
+        cache.put(key=keys[-1], repeats=make_repeats("T" * 10))
+
+        statistics = cache.statistics()
+        self.assertEqual(statistics["evictions"], 1)
+        self.assertEqual(statistics["size"], 3)
+        self.assertLessEqual(statistics["bytes"], 3 * entry_size + entry_size // 2)
+
+        self.assertIsNotNone(cache.get(key=keys[0]))
+        self.assertIsNone(cache.get(key=keys[1]))
+        self.assertIsNotNone(cache.get(key=keys[2]))
+        self.assertIsNotNone(cache.get(key=keys[3]))
+
+    def test_low_water(self):
+
+        cache = SpadeCache(path=self.path / "cache", max_bytes=10 ** 6)
+        key = cache.make_key(seq="A" * 10, spade_file=self.spade_file)
+        cache.put(key=key, repeats=make_repeats("A" * 10))
+        entry_size = cache.statistics()["bytes"]
+
+        cache = SpadeCache(path=self.path / "cache", max_bytes=10 * entry_size, low_water=0.5)
+
+        # the directory is indexed when the cache is first
+        # used and once more when it gets full
+        with mock.patch("compute_engine.src.spade_cache.os.walk", wraps=os.walk) as walk:
+            for i in range(15):
+                seq = "ACGT"[i % 4] * (10 + i // 4)
+                cache.put(key=cache.make_key(seq=seq, spade_file=self.spade_file),
+                          repeats=make_repeats(seq))
+            self.assertEqual(walk.call_count, 2)
+
+        statistics = cache.statistics()
+        self.assertEqual(statistics["evictions"], 6)
+        self.assertLessEqual(statistics["bytes"], 10 * entry_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
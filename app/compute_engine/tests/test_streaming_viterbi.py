@@ -0,0 +1,101 @@
+import unittest
+import numpy as np
+
+from compute_engine.src.streaming_viterbi import StreamingViterbi
+from compute_engine.src.exceptions import Error
+
+
+def full_viterbi(log_start, log_trans, log_emissions, log_end=None):
+    """
+    Reference Viterbi decoding over the whole sequence
+    """
+
+    n_obs, n_states = log_emissions.shape
+    delta = log_start + log_emissions[0]
+    backpointers = np.zeros((n_obs, n_states), dtype=np.int64)
+
+    for t in range(1, n_obs):
+        scores = delta[:, np.newaxis] + log_trans
+        backpointers[t] = np.argmax(scores, axis=0)
+        delta = scores[backpointers[t], np.arange(n_states)] + log_emissions[t]
+
+    if log_end is not None:
+        delta = delta + log_end
+
+    path = [int(np.argmax(delta))]
+    for t in range(n_obs - 1, 0, -1):
+        path.append(int(backpointers[t][path[-1]]))
+    return float(np.max(delta)), path[::-1]
+
+
+def make_model(n_states, n_obs, seed, sticky=0.9):
+
+    rng = np.random.RandomState(seed)
+    trans = rng.uniform(size=(n_states, n_states))
+    trans += np.eye(n_states) * sticky * n_states
+    trans /= trans.sum(axis=1, keepdims=True)
+
+    log_start = np.log(np.full(n_states, 1.0 / n_states))
+    log_emissions = np.log(rng.uniform(size=(n_obs, n_states)))
+    return log_start, np.log(trans), log_emissions
+
+
+class TestStreamingViterbi(unittest.TestCase):
+
+    def decode(self, log_start, log_trans, log_emissions, block_size, log_end=None):
+        decoder = StreamingViterbi(log_start=log_start, log_trans=log_trans,
+                                   log_emissions=lambda block: block,
+                                   block_size=block_size, log_end=log_end)
+        path = list(decoder.decode(log_emissions))
+        return decoder.log_probability, path
+
+    def test_matches_full_decode(self):
+
+        for seed in range(5):
+            log_start, log_trans, log_emissions = make_model(n_states=5, n_obs=2000, seed=seed)
+            expected = full_viterbi(log_start, log_trans, log_emissions)
+
+            for block_size in [1, 7, 100, 2000, 5000]:
+                log_prob, path = self.decode(log_start, log_trans,
+                                             log_emissions, block_size=block_size)
+                self.assertEqual(path, expected[1])
+                self.assertAlmostEqual(log_prob, expected[0], places=8)
+
+    def test_weakly_sticky_model(self):
+
+        # paths rarely converge so most of the
+        # path is decided at the end
+        log_start, log_trans, log_emissions = make_model(n_states=3, n_obs=500,
+                                                         seed=11, sticky=0.0)
+        expected = full_viterbi(log_start, log_trans, log_emissions)
+        self.assertEqual(self.decode(log_start, log_trans, log_emissions, block_size=16)[1],
+                         expected[1])
+
+    def test_end_state(self):
+
+        log_start, log_trans, log_emissions = make_model(n_states=4, n_obs=300, seed=3)
+        log_end = np.log(np.array([0.1, 0.0, 0.5, 0.2]))
+        expected = full_viterbi(log_start, log_trans, log_emissions, log_end=log_end)
+
+        log_prob, path = self.decode(log_start, log_trans, log_emissions,
+                                     block_size=32, log_end=log_end)
+        self.assertEqual(path, expected[1])
+        self.assertNotEqual(path[-1], 1)
+        self.assertAlmostEqual(log_prob, expected[0], places=8)
+
+    def test_impossible_path(self):
+
+        log_start, log_trans, log_emissions = make_model(n_states=3, n_obs=100, seed=5)
+        log_emissions[60] = -np.inf
+
+        log_prob, path = self.decode(log_start, log_trans, log_emissions, block_size=10)
+        self.assertEqual(log_prob, -np.inf)
+        self.assertLess(len(path), 100)
+
+    def test_invalid_block_size(self):
+        self.assertRaises(Error, StreamingViterbi, np.zeros(2), np.zeros((2, 2)),
+                          lambda block: block, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,66 @@
 import unittest
 import sys
 import os
-from compute_engine.src.tufdel import gcpercent
+import shutil
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+import numpy as np
+import pysam
+
+from compute_engine.src.constants import SPADE_PATH
+from compute_engine.src.tufdel import gcpercent, TufDelTuf, load_spade
+from compute_engine.src.spade_cache import get_spade_cache
 from compute_engine.src.tuf_core_helpers import concatenate_bed_files
+from compute_engine.src.tuf_core_helpers import write_from_weblogo, write_from_spade_repeat
+from compute_engine.src.tuf_core_helpers import gquadcheck, GQuadScores
+from compute_engine.src.tuf_core_helpers import BaseScore, CalScore, GetG4, WriteSeq
+from compute_engine.src.actors import compute_group_spade
+from compute_engine.src.process_pools import HAS_BILLIARD, BilliardPoolExecutor
+from compute_engine.src.process_pools import process_pool_executor
+from compute_engine.src.enumeration_types import JobResultEnum
+
+
+def write_viterbi_path(filename, chromosome, n_windows, seed):
+
+    names = ['TUF', 'TUFDUP', 'Normal-I', 'Normal-II', 'Deletion', 'Duplication', 'GAP_STATE']
+    rng = np.random.RandomState(seed)
+    states = rng.choice(names, size=n_windows, p=[0.3, 0.05, 0.2, 0.05, 0.3, 0.05, 0.05])
+
+    with open(filename, 'w') as f:
+        f.write(str(n_windows) + "\n")
+        for i, state in enumerate(states):
+            start = 1000 + i * 100
+            f.write("{0}:{1}:({2}, {3}):(1.0, 2.0):{4}\n".format(chromosome, i, start, start + 99, state))
+
+
+# SPADE.py returning a repeat for the
+# sequences with an even number of G
+FAKE_SPADE = """
+def run_sequence(seq, name, out_dir=None, parameters=None):
+    if seq.count("G") % 2 == 1:
+        return []
+    weblogo = ["## LogoData\\n"] + ["{0}\\t{1}\\t3\\t1\\t1\\t1.0\\t0.0\\t2.0\\t1.0\\n".format(i + 1, i % 7)
+                                  for i in range(15)]
+    unit_seq = [">motif_0\\n", seq[:10] + "\\n"]
+    return [{"name": "nucl_0_10", "weblogo": weblogo, "unit_seq": unit_seq, "align_unit_seq": unit_seq}]
+"""
+
+
+def daemonic_tuf_del_tuf(tuf_del_tuf, queue):
+    """
+    Run tuf_del_tuf from a daemonic process and
+    put the type of its SPADE pool in queue
+    """
+
+    executor = process_pool_executor(max_workers=1)
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+    tuf_del_tuf.run()
+    queue.put(type(executor).__name__)
+
 
 class TestUtils(unittest.TestCase):
 
@@ -57,6 +115,290 @@ class TestUtils(unittest.TestCase):
             os.remove(outfile)
 
 
+class TestTufDelTuf(unittest.TestCase):
+
+    def setUp(self):
+        self.path = Path(tempfile.mkdtemp())
+
+        rng = np.random.RandomState(0)
+        with open(self.path / "ref.fa", 'w') as f:
+            f.write(">chr1\n" + "".join(rng.choice(list("ACGT"), size=200000)) + "\n")
+        pysam.faidx(str(self.path / "ref.fa"))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def make_inputs(self, tip, n_regions):
+
+        inputs = []
+        for r in range(n_regions):
+            path = self.path / "{0}_{1}".format(tip, r)
+            os.mkdir(path)
+
+            viterbi_path_filename = self.path / "viterbi_path_chr1_{0}.txt".format(r)
+            write_viterbi_path(filename=viterbi_path_filename, chromosome="chr1",
+                               n_windows=1500, seed=r)
+
+            inputs.append({"ref_seq_file": self.path / "ref.fa",
+                           "chromosome": "chr1",
+                           "chromosome_idx": 1,
+                           "viterbi_path_filename": viterbi_path_filename,
+                           "test_me": False,
+                           "nucleods_path": path,
+                           "remove_dirs": False,
+                           "path": path,
+                           "enable_spade": False})
+        return inputs
+
+    def test_concurrent_regions(self):
+
+        serial_inputs = self.make_inputs(tip="serial", n_regions=4)
+        serial = compute_group_spade(actor_inputs=serial_inputs, n_workers=1)
+
+        pool_inputs = self.make_inputs(tip="pool", n_regions=4)
+        pool = compute_group_spade(actor_inputs=pool_inputs, n_workers=4)
+
+        self.assertEqual([output["state"] for output in serial], [JobResultEnum.SUCCESS] * 4)
+        self.assertEqual([output["state"] for output in pool], [JobResultEnum.SUCCESS] * 4)
+
+        for serial_input, pool_input, output in zip(serial_inputs, pool_inputs, pool):
+            for name in output["files_created"]:
+
+                # the random normal regions differ
+                if name == 'gquads.txt':
+                    continue
+
+                with open(serial_input["path"] / name) as f1, open(pool_input["path"] / name) as f2:
+                    self.assertEqual(f1.read(), f2.read())
+
+        with open(serial_inputs[0]["path"] / "tuf.bed") as f:
+            self.assertNotEqual(len(f.readlines()), 0)
+
+    def run_spade(self, tip, n_workers, spade_cache_path=None, daemonic=False, remove_dirs=True):
+
+        spade_path = self.path / "spade"
+        if not os.path.isdir(spade_path):
+            os.mkdir(spade_path)
+            with open(spade_path / "SPADE.py", 'w') as f:
+                f.write(FAKE_SPADE)
+
+            write_viterbi_path(filename=self.path / "viterbi_path_chr1.txt", chromosome="chr1",
+                               n_windows=1500, seed=3)
+
+        path = self.path / tip
+        os.mkdir(path)
+        tuf_del_tuf = TufDelTuf(path=str(path), fas_file_name=str(self.path / "ref.fa"),
+                                chromosome="chr1", chr_idx=1,
+                                viterbi_file=str(self.path / "viterbi_path_chr1.txt"),
+                                nucleods_path=str(path), remove_dirs=remove_dirs, enable_spade=True,
+                                spade_path=str(spade_path), seed=1, spade_n_workers=n_workers,
+                                spade_cache_path=spade_cache_path)
+
+        if daemonic:
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=daemonic_tuf_del_tuf,
+                                              args=(tuf_del_tuf, queue), daemon=True)
+            process.start()
+            self.executor_type = queue.get(timeout=120)
+            process.join()
+        else:
+            tuf_del_tuf.run()
+
+        output = []
+        for name in ["rep.bed", TufDelTuf.NUCL_FILENAME, TufDelTuf.OUT_REPEATS_INFO_FILENAME]:
+            with open(path / name) as f:
+                output.append(f.read())
+        return output
+
+    def test_spade_pool(self):
+
+        serial = self.run_spade(tip="serial", n_workers=1)
+        pool = self.run_spade(tip="pool", n_workers=3)
+
+        self.assertEqual(serial, pool)
+        self.assertIn("NO_REPEATS", serial[1])
+        self.assertNotEqual(serial[2], "")
+
+    def test_spade_pool_daemonic_process(self):
+
+        serial = self.run_spade(tip="serial", n_workers=1)
+        daemon = self.run_spade(tip="daemon", n_workers=3, daemonic=True)
+
+        # billiard pools are used if installed and
+        # the SPADE jobs run serially otherwise
+        self.assertEqual(self.executor_type, BilliardPoolExecutor.__name__ if HAS_BILLIARD else "NoneType")
+        self.assertEqual(serial, daemon)
+
+    def test_spade_cache(self):
+
+        spade_cache_path = self.path / "spade_cache"
+        cache = get_spade_cache(path=spade_cache_path, max_bytes=10 ** 8)
+
+        expected = self.run_spade(tip="no_cache", n_workers=1)
+        first = self.run_spade(tip="first", n_workers=3, spade_cache_path=spade_cache_path)
+        statistics = cache.statistics()
+
+        second = self.run_spade(tip="second", n_workers=3, spade_cache_path=spade_cache_path)
+
+        self.assertEqual(first, expected)
+        self.assertEqual(second, expected)
+
+        # the second run takes every sequence from the cache
+        self.assertNotEqual(statistics["misses"], 0)
+        self.assertEqual(cache.statistics()["misses"], statistics["misses"])
+        self.assertEqual(cache.statistics()["hits"] - statistics["hits"],
+                         statistics["hits"] + statistics["misses"])
+
+    def test_spade_cache_keep_dirs(self):
+
+        spade_cache_path = self.path / "spade_cache"
+        first = self.run_spade(tip="first", n_workers=1, spade_cache_path=spade_cache_path,
+                               remove_dirs=False)
+        second = self.run_spade(tip="second", n_workers=1, spade_cache_path=spade_cache_path,
+                                remove_dirs=False)
+        self.assertEqual(first, second)
+
+        # SPADE runs, and has a directory, only for the sequences not cached
+        self.assertNotEqual([name for name in os.listdir(self.path / "first" / "spade_output") if name.startswith("chr1_")], [])
+        self.assertEqual([name for name in os.listdir(self.path / "second" / "spade_output") if name.startswith("chr1_")], [])
+
+    def test_test_me(self):
+
+        path = self.path / "test_me"
+        os.mkdir(path)
+        tuf_del_tuf = TufDelTuf(path=str(path), fas_file_name=str(self.path / "ref.fa"),
+                                chromosome="chr1", chr_idx=1, viterbi_file="viterbi_path_chr1.txt",
+                                nucleods_path=str(path), test_me=True, enable_spade=False)
+
+        files_created = tuf_del_tuf.run()
+        self.assertEqual(files_created, TufDelTuf.FILES_CREATED)
+        self.assertEqual(sorted(os.listdir(path)), sorted(TufDelTuf.FILES_CREATED))
+
+
+def gquadfinder_check(sequence):
+    """
+    gquadcheck with the gquadfinder port
+    """
+
+    cseq, scores = BaseScore(sequence)
+    score = CalScore(scores, 50)
+    outG4 = GetG4(sequence, score, 2, 50, len(scores))
+
+    if len(outG4) == 0:
+        return False, []
+
+    mscore = WriteSeq(sequence, score, outG4, 50, len(scores))
+    return len(mscore) != 0, mscore
+
+
+def random_sequence(rng, n_bases):
+    """
+    A sequence with runs of G and C
+    of random length and case
+    """
+
+    bases = []
+    while len(bases) < n_bases:
+        base = rng.choice(list("GCATgcN"), p=[0.25, 0.2, 0.15, 0.15, 0.1, 0.1, 0.05])
+        bases.extend([base] * rng.randint(1, 7))
+    return "".join(bases[:n_bases])
+
+
+class TestGQuad(unittest.TestCase):
+
+    def test_scores(self):
+
+        rng = np.random.RandomState(42)
+        for _ in range(200):
+            sequence = random_sequence(rng=rng, n_bases=rng.randint(1, 300))
+            gscores = GQuadScores(sequence=sequence)
+            scores = BaseScore(sequence)[1]
+
+            self.assertEqual(gscores.scores.tolist(), scores)
+            for window in [1, 7, 50]:
+                self.assertEqual(gscores.window_means(window=window).tolist(), CalScore(scores, window))
+
+            starts = rng.randint(0, len(sequence), size=20)
+            ends = np.minimum(starts + rng.randint(1, 60, size=20), len(sequence))
+            self.assertEqual(gscores.range_sums(starts=starts, ends=ends).tolist(),
+                             [sum(BaseScore(sequence[start:end])[1]) for start, end in zip(starts, ends)])
+
+    def test_gquadcheck(self):
+
+        rng = np.random.RandomState(7)
+        n_gquads = 0
+        for _ in range(500):
+            sequence = random_sequence(rng=rng, n_bases=rng.randint(1, 1000))
+            expected = gquadfinder_check(sequence)
+            n_gquads += expected[0]
+
+            self.assertEqual(gquadcheck(sequence), expected)
+
+        self.assertNotEqual(n_gquads, 0)
+
+    def test_gquadcheck_one_window(self):
+
+        sequence = "G" * 25 + "A" * 25
+        self.assertEqual(gquadcheck(sequence), (True, [2.0]))
+        self.assertEqual(gquadcheck(sequence), gquadfinder_check(sequence))
+        self.assertEqual(gquadcheck("ACGT" * 10), (False, []))
+
+
+class TestSpadeRepeats(unittest.TestCase):
+
+    def setUp(self):
+        self.path = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write_repeat(self, name, n_positions):
+
+        os.mkdir(self.path / name)
+        with open(self.path / name / "weblogo.txt", 'w') as f:
+            f.write("## LogoData\n# First column is position number, followed by counts\n")
+            f.write("#\tA\tC\tG\tT\tEntropy\tLow\tHigh\tWeight\n")
+            for i in range(n_positions):
+                counts = [1, 1, 1, 1]
+                counts[i % 4] = 10
+                f.write("{0}\t{1}\t{2}\t{3}\t{4}\t1.2\t0.9\t1.5\t1.0\n".format(i + 1, *counts))
+
+        for filename in ["unit_seq.fasta", "align.unit_seq.fasta"]:
+            with open(self.path / name / filename, 'w') as f:
+                f.write(">motif_0\nACGT-ACG\n>motif_8\nACGTTACG\n")
+
+    def test_write_from_spade_repeat(self):
+
+        self.write_repeat(name="nucl_0_100", n_positions=20)
+        self.write_repeat(name="nucl_200_300", n_positions=5)
+        os.mkdir(self.path / "nucl_400_500")
+
+        repeats = load_spade(spade_path=SPADE_PATH).collect_repeats(out_dir=str(self.path))
+        self.assertEqual([repeat["name"] for repeat in repeats],
+                         ["nucl_0_100", "nucl_200_300", "nucl_400_500"])
+        self.assertIsNone(repeats[2]["weblogo"])
+
+        for repeat in repeats[:2]:
+            outputs = [[], []]
+            for lines, write in zip(outputs, [write_from_weblogo, write_from_spade_repeat]):
+                files = [self.path / "{0}_{1}".format(name, len(lines)) for name in ["rep", "nucl", "info"]]
+                with open(files[0], 'w') as f1, open(files[1], 'w') as f2, open(files[2], 'w') as f3:
+                    kwargs = {"out_repeats": f1, "out_nucleods": f2, "out_repeats_info": f3,
+                              "chrom": "chr1", "start": 10, "stop": 20, "region_type": "TUF"}
+                    if write is write_from_weblogo:
+                        write(weblogo_dir=self.path / repeat["name"], **kwargs)
+                    else:
+                        write(repeat=repeat, **kwargs)
+
+                for filename in files:
+                    with open(filename) as f:
+                        lines.append(f.read())
+
+            self.assertEqual(outputs[0], outputs[1])
+
+        self.assertEqual(outputs[0][1], "chr1\t10\t20\tNO_REPEATS\tTUF\n")
+
+
 if __name__ == '__main__':
     unittest.main()
 
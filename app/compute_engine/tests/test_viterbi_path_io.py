@@ -0,0 +1,155 @@
+import unittest
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from compute_engine.src.viterbi_path_io import ViterbiPathFile, save_viterbi_path_npz
+from compute_engine.src.viterbi_path_io import is_viterbi_path_npz
+from compute_engine.src.viterbi_calculation_helpers import create_viterbi_path_streaming
+from compute_engine.src.viterbi_calculation_helpers import create_viterbi_path_from_observations
+from compute_engine.src.viterbi_calculation_helpers import create_viterbi_path
+from compute_engine.src.file_readers import ViterbiPathReader
+from compute_engine.src.tufdel import read_viterbi_path_arrays
+from compute_engine.src.numpy_hmm import NumpyHMM
+from compute_engine.src.exceptions import Error
+from compute_engine.tests.test_numpy_hmm import HMM_FILE
+
+
+def make_observations(n_obs, seed=0):
+
+    rng = np.random.RandomState(seed)
+    observations = rng.uniform(0.0, 60.0, size=(n_obs, 2))
+    observations[10:15] = -999.0
+    starts = np.arange(n_obs, dtype=np.int64) * 100 + 1000
+    coordinates = np.column_stack((starts, starts + 99))
+    return observations, coordinates
+
+
+class TestViterbiPathIO(unittest.TestCase):
+
+    def setUp(self):
+        self.path = Path(tempfile.mkdtemp())
+        self.hmm = NumpyHMM.from_json_file(hmm_file=HMM_FILE)
+        self.observations, self.coordinates = make_observations(n_obs=200)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_same_as_text(self):
+
+        for create, kwargs in [(create_viterbi_path_streaming, {"block_size": 16}),
+                               (create_viterbi_path_from_observations, {})]:
+
+            paths = {}
+            for file_format in ["txt", "npz"]:
+                filename = self.path / "viterbi.{0}".format(file_format)
+                paths[file_format] = create(observations=self.observations,
+                                            coordinates=self.coordinates,
+                                            hmm_model=self.hmm, chromosome="chr1",
+                                            filename=filename, append_or_write='w',
+                                            file_format=file_format, **kwargs)
+
+            self.assertEqual(paths["txt"][2], paths["npz"][2])
+
+            if create is create_viterbi_path_streaming:
+                # the state ids index the state names
+                for file_format in ["txt", "npz"]:
+                    self.assertEqual(paths[file_format][0][1].dtype, np.int16)
+                    self.assertEqual(len(paths[file_format][0][1]), 200)
+                np.testing.assert_array_equal(paths["txt"][0][1], paths["npz"][0][1])
+                np.testing.assert_array_equal(
+                    ViterbiPathFile(filename=self.path / "viterbi.npz").state_ids, paths["npz"][0][1])
+            self.assertFalse(is_viterbi_path_npz(self.path / "viterbi.txt"))
+            self.assertTrue(is_viterbi_path_npz(self.path / "viterbi.npz"))
+
+            with open(self.path / "viterbi.txt") as f:
+                lines = f.readlines()
+
+            viterbi_path = ViterbiPathFile(filename=self.path / "viterbi.npz")
+            self.assertEqual(len(viterbi_path), 200)
+            self.assertEqual(list(viterbi_path.iter_text_lines()), lines)
+
+            reader = ViterbiPathReader(mode='dict_coords_state')
+            self.assertEqual(reader(filename=self.path / "viterbi.npz"),
+                             reader(filename=self.path / "viterbi.txt"))
+
+            npz_arrays = read_viterbi_path_arrays(filename=self.path / "viterbi.npz", ccheck="chr1")
+            txt_arrays = read_viterbi_path_arrays(filename=self.path / "viterbi.txt", ccheck="chr1")
+            self.assertEqual(npz_arrays[0], txt_arrays[0])
+            np.testing.assert_array_equal(npz_arrays[2], txt_arrays[2])
+            self.assertEqual([npz_arrays[4][idx] for idx in npz_arrays[3]],
+                             [txt_arrays[4][idx] for idx in txt_arrays[3]])
+
+    def test_same_as_create_viterbi_path(self):
+
+        # the sequence of create_viterbi_path has the
+        # integer marker for the gap windows
+        sequence = [((-999, -999) if obs[0] == -999.0 else tuple(obs), tuple(r))
+                    for obs, r in zip(self.observations.tolist(), self.coordinates.tolist())]
+        create_viterbi_path(sequence=sequence, hmm_model=self.hmm, chromosome="chr1",
+                            filename=self.path / "expected.txt", append_or_write='w')
+
+        with open(self.path / "expected.txt") as f:
+            expected = f.read()
+        self.assertIn(":(-999, -999):", expected)
+
+        for create, kwargs in [(create_viterbi_path_streaming, {"block_size": 16}),
+                               (create_viterbi_path_from_observations, {})]:
+            create(observations=self.observations, coordinates=self.coordinates,
+                   hmm_model=self.hmm, chromosome="chr1", filename=self.path / "viterbi.txt",
+                   append_or_write='w', **kwargs)
+
+            with open(self.path / "viterbi.txt") as f:
+                self.assertEqual(f.read(), expected)
+
+        create_viterbi_path_from_observations(observations=self.observations, coordinates=self.coordinates,
+                                              hmm_model=self.hmm, chromosome="chr1",
+                                              filename=self.path / "viterbi.npz",
+                                              append_or_write='w', file_format='npz')
+        self.assertEqual("".join(ViterbiPathFile(filename=self.path / "viterbi.npz").iter_text_lines()),
+                         expected)
+
+    def test_range_queries(self):
+
+        names = ["Normal-I", "TUF", "Deletion"]
+        state_ids = np.arange(200) % 3
+        filename = self.path / "viterbi.npz"
+        save_viterbi_path_npz(filename=filename, chromosome="chr2",
+                              coordinates=self.coordinates, observations=self.observations,
+                              state_ids=state_ids, state_names=names)
+
+        viterbi_path = ViterbiPathFile(filename=filename)
+        self.assertEqual(viterbi_path.path_length, 201)
+
+        # windows 1 and 2 overlap [1150, 1250]
+        self.assertEqual(viterbi_path.index_range(start=1150, end=1250), (1, 3))
+        self.assertEqual(viterbi_path.states(start=1150, end=1250).tolist(), ["TUF", "Deletion"])
+        self.assertEqual(viterbi_path.index_range(start=0, end=500), (0, 0))
+        self.assertEqual(viterbi_path.index_range(start=50000), (200, 200))
+        self.assertEqual(viterbi_path.index_range(), (0, 200))
+
+        self.assertEqual(list(viterbi_path.iter_bed_lines(start=1150, end=1250)),
+                         ["chr2\t1100\t1199\tTUF\n", "chr2\t1200\t1299\tDeletion\n"])
+
+        lines = list(viterbi_path.iter_text_lines(start=1150, end=1250, header=False))
+        self.assertEqual(lines[0], "chr2:1:(1100, 1199):" +
+                         str(tuple(self.observations[1].tolist())) + ":TUF\n")
+
+    def test_invalid_input(self):
+
+        filename = self.path / "viterbi.npz"
+        self.assertRaises(Error, save_viterbi_path_npz, filename, "chr1",
+                          self.coordinates, self.observations, np.zeros(10), ["TUF"])
+        self.assertRaises(Error, save_viterbi_path_npz, filename, "chr1",
+                          self.coordinates, self.observations, np.full(200, 3), ["TUF"])
+        self.assertRaises(Error, save_viterbi_path_npz, filename, "chr1",
+                          self.coordinates[::-1], self.observations, np.zeros(200), ["TUF"])
+        self.assertRaises(Error, create_viterbi_path_streaming, self.observations,
+                          self.coordinates, self.hmm, "chr1", filename, 'a', 16,
+                          (-999.0, -999.0), 'npz')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+from collections import namedtuple
+
+import numpy as np
+
+from compute_engine.src.viterbi_segments import run_length_encode, tuf_del_tuf_runs
+from compute_engine.src.viterbi_segments import tuf_del_tuf_segments, state_segments
+from compute_engine.src.viterbi_segments import viterbi_path_state_ids, state_ids_with_name
+from compute_engine.src.viterbi_calculation_helpers import filter_viterbi_path
+
+State = namedtuple("State", ["name"])
+
+NAMES = ["TUF", "Deletion", "Normal-I", "TUFDUP", "GAP_STATE"]
+
+
+def make_state_ids(n_obs, seed):
+
+    rng = np.random.RandomState(seed)
+    state_ids = rng.choice(len(NAMES), size=n_obs, p=[0.4, 0.3, 0.2, 0.05, 0.05])
+
+    # make the states sticky
+    for i in range(1, n_obs):
+        if rng.uniform() < 0.5:
+            state_ids[i] = state_ids[i - 1]
+    return state_ids
+
+
+class TestViterbiSegments(unittest.TestCase):
+
+    def test_run_length_encode(self):
+
+        starts, lengths, values = run_length_encode(values=[1, 1, 2, 2, 2, 1, 3])
+        self.assertEqual(starts.tolist(), [0, 2, 5, 6])
+        self.assertEqual(lengths.tolist(), [2, 3, 1, 1])
+        self.assertEqual(values.tolist(), [1, 2, 1, 3])
+
+        starts, lengths, values = run_length_encode(values=[1, 1, 1, 2],
+                                                    breaks=[False, False, True, False])
+        self.assertEqual(starts.tolist(), [0, 2, 3])
+        self.assertEqual(values.tolist(), [1, 1, 2])
+
+        starts, lengths, values = run_length_encode(values=[])
+        self.assertEqual(len(starts), 0)
+
+    def test_same_as_filter_viterbi_path(self):
+
+        for seed in range(20):
+            state_ids = make_state_ids(n_obs=500, seed=seed)
+
+            # a deletion at the start is not handled
+            # by filter_viterbi_path
+            state_ids[0] = 2
+
+            for min_subsequence in [1, 2]:
+                path = [(idx, State(NAMES[idx])) for idx in state_ids.tolist()]
+                expected = filter_viterbi_path(path=path, wstate='TUF', limit_state='Deletion',
+                                               min_subsequence=min_subsequence)
+
+                starts, lengths, run_states = run_length_encode(values=state_ids)
+                runs = tuf_del_tuf_runs(run_states=run_states, run_lengths=lengths,
+                                        wstate_ids=state_ids_with_name(NAMES, ['TUF']),
+                                        limit_state_ids=state_ids_with_name(NAMES, ['Deletion']),
+                                        min_subsequence=min_subsequence)
+
+                windows = [(idx, NAMES[state_ids[idx]]) for run in runs.tolist()
+                           for idx in range(starts[run], starts[run] + lengths[run])]
+                self.assertEqual(windows, expected)
+
+    def test_tuf_del_tuf_segments(self):
+
+        # T T D T N T D D T D T
+        state_ids = np.array([0, 0, 1, 0, 2, 0, 1, 1, 0, 1, 0])
+        starts = np.arange(11) * 100
+        coordinates = np.column_stack((starts, starts + 99))
+
+        path = [(idx, State(NAMES[idx])) for idx in state_ids.tolist()]
+        state_ids, state_names = viterbi_path_state_ids(path=path)
+        self.assertEqual(state_names, {0: "TUF", 1: "Deletion", 2: "Normal-I"})
+
+        segments = tuf_del_tuf_segments(state_ids=state_ids, state_names=state_names,
+                                        coordinates=coordinates)
+
+        self.assertEqual(segments, [(0, 0, 199, 200, "TUF"), (2, 200, 299, 100, "Deletion"),
+                                    (3, 300, 399, 100, "TUF"), (5, 500, 599, 100, "TUF"),
+                                    (6, 600, 799, 200, "Deletion"), (8, 800, 899, 100, "TUF"),
+                                    (9, 900, 999, 100, "Deletion"), (10, 1000, 1099, 100, "TUF")])
+
+    def test_state_segments(self):
+
+        # TUFDUP is merged with TUF and the
+        # runs end where the chromosome changes
+        state_ids = np.array([0, 3, 0, 1, 1, 1, 2])
+        chromosome_ids = np.array([0, 0, 0, 0, 1, 1, 1])
+        starts = np.arange(7) * 10
+        coordinates = np.column_stack((starts, starts + 9))
+
+        chromosomes, seg_starts, seg_ends, states = state_segments(state_ids=state_ids,
+                                                                   state_names=NAMES,
+                                                                   coordinates=coordinates,
+                                                                   chromosome_ids=chromosome_ids,
+                                                                   state_map={'TUFDUP': 'TUF'})
+
+        self.assertEqual(chromosomes.tolist(), [0, 0, 1, 1])
+        self.assertEqual(seg_starts.tolist(), [0, 30, 40, 60])
+        self.assertEqual(seg_ends.tolist(), [29, 39, 59, 69])
+        self.assertEqual(states, ["TUF", "Deletion", "Deletion", "Normal-I"])
+
+
+if __name__ == '__main__':
+    unittest.main()
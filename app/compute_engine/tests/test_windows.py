@@ -0,0 +1,31 @@
+import unittest
+import numpy as np
+
+from compute_engine.src.windows import SAMDATA_DTYPE
+from compute_engine.src.windows import samdata_to_records
+from compute_engine.src.windows import records_to_samdata
+
+
+class TestWindows(unittest.TestCase):
+
+    def test_samdata_records_round_trip(self):
+
+        samdata = [{'gcmax': 0.5, 'gcmin': 0.25, 'gcr': 0.45, 'gapAlert': False,
+                    'allmean': 6.89, 'qmean': 4.06, 'allmedian': 7.0, 'allsum': 689,
+                    'qsum': 406, 'qmedian': 4.0, 'errorAlert': False, 'head': 8,
+                    'start': 500, 'end': 599, 'minLen': 100},
+                   {'gcmax': None, 'gcmin': None, 'gcr': 0.0, 'gapAlert': True,
+                    'allmean': 0.0, 'qmean': 0.0, 'allmedian': 0.0, 'allsum': 0,
+                    'qsum': 0, 'qmedian': 0.0, 'errorAlert': True, 'head': 0,
+                    'start': 600, 'end': 699, 'minLen': 0}]
+
+        records = samdata_to_records(samdata=samdata)
+        self.assertEqual(records.dtype, SAMDATA_DTYPE)
+        self.assertEqual(len(records), 2)
+        self.assertTrue(np.isnan(records['gcmax'][1]))
+
+        self.assertEqual(records_to_samdata(records=records), samdata)
+
+
+if __name__ == '__main__':
+    unittest.main()
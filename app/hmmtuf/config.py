@@ -10,9 +10,25 @@ SESSION_COOKIE_SECURE = True
 CSRF_COOKIE_SECURE = True
 USE_CELERY = False
 ENABLE_SPADE = True
+
+# number of processes used to compute the
+# Viterbi paths of the regions of a group
+GROUP_VITERBI_N_PROCS = 4
+
+# number of processes used to run the
+# SPADE calculations of the regions of a group
+GROUP_SPADE_N_WORKERS = 4
+
+# number of processes used to run the SPADE
+# jobs of the TUF-DEL-TUF analysis of a region
+SPADE_N_WORKERS = 4
 SPADE_PATH = "%s/compute_engine/SPADE/" % BASE_DIR
 DATA_PATH = "%s/data/" % BASE_DIR
 
+# directory of the cache of the SPADE results
+# shared by the tasks. None disables the cache
+SPADE_CACHE_PATH = "%sspade_cache/" % DATA_PATH
+
 USE_DJANGO_EXTENSIONS = True
 
 DB_TYPE = 'sqlite'
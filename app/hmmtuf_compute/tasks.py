@@ -4,12 +4,19 @@ Celery tasks for various computations
 import os
 from celery.decorators import task
 from celery.utils.log import get_task_logger
+from celery.signals import worker_process_init
 from pathlib import Path
 
 from compute_engine import INFO, ERROR, DEFAULT_ERROR_EXPLANATION
 from compute_engine.src.enumeration_types import JobResultEnum
 from compute_engine.src import tufdel
 from compute_engine.src.actors import ViterbiPathCalulation, SpadeCalculation
+from compute_engine.src.actors import compute_group_viterbi_paths, compute_group_spade
+from compute_engine.src import hmm_loader
+from compute_engine.src.cengine_configuration import HMM_ENGINE
+
+from hmmtuf.config import GROUP_VITERBI_N_PROCS, GROUP_SPADE_N_WORKERS, SPADE_N_WORKERS
+from hmmtuf.config import SPADE_CACHE_PATH
 
 from webapp_utils.helpers import make_viterbi_path_filename
 from webapp_utils.helpers import make_viterbi_path
@@ -21,6 +28,24 @@ from hmmtuf_compute.tasks_helpers import build_files_map, update_for_exception
 logger = get_task_logger(__name__)
 
 
+@worker_process_init.connect
+def warm_hmm_cache(**kwargs):
+    """
+    Build the HMMs in the DB when a worker process
+    starts so that the tasks find them in the HMM cache
+    """
+
+    for db_hmm_model in HMMModel.objects.all():
+        try:
+            hmm_loader.load_hmm(hmm_file=db_hmm_model.file_hmm.name, engine=HMM_ENGINE)
+        except Exception as e:
+            print("{0} Could not load HMM {1} in the HMM cache: {2}".format(ERROR,
+                                                                           db_hmm_model.name,
+                                                                           str(e)))
+
+    print("{0} HMM cache warmed {1}".format(INFO, hmm_loader.hmm_cache_statistics()))
+
+
 @task(name="compute_viterbi_path_task")
 def compute_viterbi_path_task(region_filename, hmm_name, remove_dirs, use_spade):
 
@@ -85,6 +110,8 @@ def compute_group_viterbi_path(task_id, hmm_name, group_tip, remove_dirs, use_sp
                    "test_me": False,
                    "nucleods_path": None,
                    "remove_dirs": remove_dirs,
+                   "spade_n_workers": SPADE_N_WORKERS,
+                   "spade_cache_path": SPADE_CACHE_PATH,
                    "hmm_model_filename": db_hmm_model.file_hmm.name,
                    "region_filename": None, }
 
@@ -101,14 +128,13 @@ def compute_group_viterbi_path(task_id, hmm_name, group_tip, remove_dirs, use_sp
     chromosome = regions[0].chromosome
     out_path = task_path / chromosome
 
-    files_created_map = dict()
-    counter_region_id = 0
-
+    # create the directories and the
+    # inputs of every region in order
+    regions_inputs = []
     for region_model in regions:
 
-        print("{0} Working with region {1}".format(INFO, region_model.file_region.name))
-        files_created_map[counter_region_id] = {}
-        actor_input["region_filename"] = Path(region_model.file_region.name)
+        region_input = dict(actor_input)
+        region_input["region_filename"] = Path(region_model.file_region.name)
 
         # create needed directories
         try:
@@ -127,42 +153,77 @@ def compute_group_viterbi_path(task_id, hmm_name, group_tip, remove_dirs, use_sp
         viterbi_path_filename = make_viterbi_path_filename(task_id=task_id, extra_path=chromosome + "/" + region_model.name)
         tuf_del_tuf_filename = make_tuf_del_tuf_path_filename(task_id=task_id, extra_path=chromosome + "/" + region_model.name)
 
-        actor_input["path"] = path
-        actor_input["viterbi_path_filename"] = viterbi_path_filename
-        actor_input["tuf_del_tuf_filename"] = tuf_del_tuf_filename
+        region_input["path"] = path
+        region_input["viterbi_path_filename"] = viterbi_path_filename
+        region_input["tuf_del_tuf_filename"] = tuf_del_tuf_filename
 
         if use_spade:
-            actor_input["nucleods_path"] = make_viterbi_sequence_path(task_id=task_id,
-                                                                      extra_path=chromosome + "/" + region_model.name)
+            region_input["nucleods_path"] = make_viterbi_sequence_path(task_id=task_id,
+                                                                       extra_path=chromosome + "/" + region_model.name)
+        regions_inputs.append(region_input)
+
+    # build the HMM once and decode all the regions
+    try:
+        hmm_model = hmm_loader.load_hmm(hmm_file=db_hmm_model.file_hmm.name, engine=HMM_ENGINE)
+        viterbi_outputs = compute_group_viterbi_paths(actor_inputs=regions_inputs,
+                                                      hmm_model=hmm_model,
+                                                      n_procs=GROUP_VITERBI_N_PROCS)
+    except Exception as e:
+        print("{0} Exception is thrown {1}".format(ERROR, str(e)))
+        result, computation = update_for_exception(result=result,
+                                                   computation=computation, err_msg=str(e))
 
-            make_viterbi_path
+        computation.save()
+        return result
+
+    # the TUF-DEL-TUF of the regions run concurrently
+    # as every region writes in its own directory
+    spade_outputs = [None] * len(regions_inputs)
+    if use_spade:
         try:
+            spade_outputs = compute_group_spade(actor_inputs=regions_inputs,
+                                                n_workers=GROUP_SPADE_N_WORKERS)
+        except Exception as e:
+            print("{0} Exception is thrown {1}".format(ERROR, str(e)))
+            result, computation = update_for_exception(result=result,
+                                                       computation=computation, err_msg=str(e))
 
-            viterbi_calculator = ViterbiPathCalulation(input=actor_input)
-            viterbi_calculator.start()
+            computation.save()
+            return result
+
+    files_created_map = dict()
+    counter_region_id = 0
+
+    # the regions are visited in chromosome/start order
+    # so that the files are concatenated in this order
+    for region_model, region_input, viterbi_output, spade_output in zip(regions, regions_inputs,
+                                                                         viterbi_outputs, spade_outputs):
+
+        print("{0} Working with region {1}".format(INFO, region_model.file_region.name))
+        files_created_map[counter_region_id] = {}
+
+        try:
 
-            print("{0} Viterbi Output {1}".format(INFO, viterbi_calculator.output))
+            print("{0} Viterbi Output {1}".format(INFO, viterbi_output))
 
             if use_spade:
 
-                spade_calculator = SpadeCalculation(input=actor_input)
-                spade_calculator.start()
-                print("{0} Spade calculator output {1}".format(INFO, spade_calculator.output))
+                print("{0} Spade calculator output {1}".format(INFO, spade_output))
 
-                if spade_calculator.state == JobResultEnum.FAILURE:
+                if spade_output["state"] == JobResultEnum.FAILURE:
                     print("{0} SPADE calculation errored".format(ERROR))
                     result, computation = update_for_exception(result=result,
                                                                computation=computation,
-                                                               err_msg=spade_calculator.output["error_msg"])
+                                                               err_msg=spade_output["error_msg"])
 
                     computation.save()
                     return result
 
-                files_created = spade_calculator.output["files_created"]
+                files_created = spade_output["files_created"]
 
                 build_files_map(files_created=files_created,
                                 files_created_map=files_created_map,
-                                counter_region_id=counter_region_id, path=path)
+                                counter_region_id=counter_region_id, path=region_input["path"])
 
             counter_region_id += 1
             print("{0} Done working with region: {1}".format(INFO, region_model.name))
@@ -257,6 +318,8 @@ def compute_viterbi_path(task_id, region_filename,
                        'path': task_path,
                        "nucleods_path": task_path,
                        "remove_dirs": remove_dirs,
+                       "spade_n_workers": SPADE_N_WORKERS,
+                       "spade_cache_path": SPADE_CACHE_PATH,
                        "hmm_model_filename": db_hmm_model.file_hmm.name,
                        "region_filename": Path(region_model.file_region.name),
                        "tuf_del_tuf_filename": tuf_del_tuf_filename}
@@ -9,6 +9,7 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth.decorators import login_required
 
 from compute_engine.src.windows import WindowType
+from compute_engine.src.viterbi_path_io import ViterbiPathFile, is_viterbi_path_npz
 from compute_engine import OK
 
 from webapp_utils.helpers import make_viterbi_path_filename
@@ -240,8 +241,12 @@ def download_viterbi_result_csv(request, task_id: str, filename: str = 'viterbi_
     result_filename = make_viterbi_path_filename(task_id=task_id)
 
     try:
-        # open file for read
-        path = open(result_filename, 'r')
+        # open file for read. Paths in the binary
+        # format are streamed in the text format
+        if is_viterbi_path_npz(filename=result_filename):
+            path = ViterbiPathFile(filename=result_filename).iter_text_lines()
+        else:
+            path = open(result_filename, 'r')
     except Exception as e:
         raise Http404(str(e))
 